@@ -4,7 +4,8 @@ import os
 import re
 import sys
 
-import jsonschema
+from scriptworker_client.client import verify_json_schema
+from scriptworker_client.exceptions import TaskVerificationError
 
 from balrogscript.constants import VALID_ACTIONS
 
@@ -18,9 +19,9 @@ def validate_task_schema(script_config, task_definition, action):
         schema = json.load(fh)
 
     try:
-        jsonschema.validate(task_definition, schema)
-    except jsonschema.exceptions.ValidationError as exc:
-        log.critical("Can't validate schema!\n{}".format(exc))
+        verify_json_schema(task_definition, schema, cache_dir=script_config.get("schema_cache_dir"))
+    except TaskVerificationError as exc:
+        log.critical(str(exc))
         sys.exit(3)
 
 
@@ -5,6 +5,7 @@ import asyncio
 import base64
 import difflib
 import glob
+import io
 import json
 import logging
 import os
@@ -12,14 +13,11 @@ import re
 import tempfile
 import zipfile
 
-import requests
-from mozpack import mozjar
-from requests_hawk import HawkAuth
-
 from iscript.constants import LANGPACK_AUTOGRAPH_KEY_ID, OMNIJA_AUTOGRAPH_KEY_ID
 from iscript.createprecomplete import generate_precomplete
 from iscript.exceptions import IScriptError
-from scriptworker_client.aio import raise_future_exceptions, retry_async
+from iscript.util import lazy_import
+from scriptworker_client.aio import client_session, raise_future_exceptions, retry_async, semaphore_wrapper
 from scriptworker_client.utils import makedirs, rm
 
 try:
@@ -28,6 +26,11 @@ try:
 except ImportError:
     widevine = None
 
+# Only autograph requests and omni.ja signing use these, so they're imported
+# when first used
+mohawk = lazy_import("mohawk")
+mozjar = lazy_import("mozpack.mozjar")
+
 
 log = logging.getLogger(__name__)
 
@@ -62,6 +65,8 @@ _WIDEVINE_NONBLESSED_FILENAMES = (
 )
 # Langpacks expect the following re to match for addon id
 LANGPACK_RE = re.compile(r"^langpack-[a-zA-Z]+(?:-[a-zA-Z]+){0,2}@(?:firefox|devedition).mozilla.org$")
+# The number of langpacks to sign at once, unless `langpack_concurrency` is set
+DEFAULT_LANGPACK_CONCURRENCY = 10
 
 
 # sign_widevine_dir {{{1
@@ -200,6 +205,10 @@ def remove_extra_files(top_dir, file_list):
 async def call_autograph(url, user, password, request_json):
     """Call autograph and return the json response.
 
+    Inside a ``scriptworker_client.aio.SessionManager``, this reuses its
+    keep-alive connections, and its per-host limit caps the concurrent
+    Autograph calls.
+
     Args:
         url (str): the endpoint url
         user (str): the autograph user
@@ -207,18 +216,29 @@ async def call_autograph(url, user, password, request_json):
         request_json (dict): list of dictionaries, from ``make_signing_req``
 
     Raises:
-        requests.RequestException: on failure
+        aiohttp.ClientError: on failure
 
     Returns:
         dict: the response json
 
     """
-    auth = HawkAuth(id=user, key=password)
-    with requests.Session() as session:
-        r = session.post(url, json=request_json, auth=auth)
-        log.debug("Autograph response: %s", r.text[:120] if len(r.text) >= 120 else r.text)
-        r.raise_for_status()
-        return r.json()
+    data = json.dumps(request_json).encode("utf-8")
+    sender = mohawk.Sender(
+        credentials={"id": user, "key": password, "algorithm": "sha256"},
+        url=url,
+        method="POST",
+        # mohawk pretty-prints a bytes payload into a debug message, which
+        # takes longer than the request for large files; it doesn't for files
+        content=io.BytesIO(data),
+        content_type="application/json",
+    )
+    headers = {"Authorization": sender.request_header, "Content-Type": "application/json"}
+    async with client_session() as session:
+        async with session.post(url, data=data, headers=headers) as resp:
+            text = await resp.text()
+            log.debug("Autograph response: %s", text[:120])
+            resp.raise_for_status()
+            return json.loads(text)
 
 
 def make_signing_req(input_bytes, fmt, keyid=None, extension_id=None):
@@ -264,7 +284,7 @@ async def sign_with_autograph(sign_config, input_bytes, fmt, autograph_method, k
         extension_id (str): which id to send to autograph for the extension (optional)
 
     Raises:
-        Requests.RequestException: on failure
+        aiohttp.ClientError: on failure
 
     Returns:
         bytes: the signed data
@@ -303,14 +323,16 @@ async def sign_file_with_autograph(sign_config, from_, fmt, to=None, keyid=None,
         extension_id (str, optional): the extension id to use when signing.
 
     Raises:
-        Requests.RequestException: on failure
+        aiohttp.ClientError: on failure
 
     Returns:
         str: the path to the signed file
 
     """
     to = to or from_
-    input_bytes = open(from_, "rb").read()
+    loop = asyncio.get_running_loop()
+    # Read and write in a thread, so other signing calls keep uploading
+    input_bytes = await loop.run_in_executor(None, _read_file, from_)
     signed_bytes = base64.b64decode(
         await sign_with_autograph(
             sign_config,
@@ -321,11 +343,30 @@ async def sign_file_with_autograph(sign_config, from_, fmt, to=None, keyid=None,
             extension_id=extension_id,
         )
     )
-    with open(to, "wb") as fout:
-        fout.write(signed_bytes)
+    await loop.run_in_executor(None, _write_file_atomically, to, signed_bytes)
     return to
 
 
+def _read_file(path):
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+def _write_file_atomically(path, data):
+    """Write ``data`` next to ``path``, then move it into place.
+
+    A failed or interrupted write never leaves a truncated ``path``.
+
+    """
+    part_path = f"{path}.part"
+    try:
+        with open(part_path, "wb") as fh:
+            fh.write(data)
+        os.replace(part_path, path)
+    finally:
+        rm(part_path)
+
+
 async def sign_hash_with_autograph(sign_config, hash_, fmt, keyid=None):
     """Signs hash with autograph and returns the result.
 
@@ -336,7 +377,7 @@ async def sign_hash_with_autograph(sign_config, hash_, fmt, keyid=None):
         keyid (str): which key to use on autograph (optional)
 
     Raises:
-        Requests.RequestException: on failure
+        aiohttp.ClientError: on failure
 
     Returns:
         bytes: the signature
@@ -374,7 +415,7 @@ async def sign_omnija_with_autograph(config, sign_config, app_path):
         app_path (str): the path to the .app dir
 
     Raises:
-        Requests.RequestException: on failure
+        aiohttp.ClientError: on failure
 
     Returns:
         str: the path to the signature file
@@ -451,7 +492,7 @@ async def sign_widevine_with_autograph(sign_config, from_, blessed, to=None):
             `{from_}.sig`. Defaults to None.
 
     Raises:
-        Requests.RequestException: on failure
+        aiohttp.ClientError: on failure
 
     Returns:
         str: the path to the signature file
@@ -504,6 +545,9 @@ def langpack_id(app):
 async def sign_langpacks(config, sign_config, all_paths):
     """Signs langpacks that are specified in all_paths.
 
+    Up to ``config["langpack_concurrency"]`` langpacks are signed at once;
+    release tasks sign around 100.
+
     Raises:
         IScriptError if we don't have any valid language packs to sign in any path.
 
@@ -512,16 +556,21 @@ async def sign_langpacks(config, sign_config, all_paths):
         app.check_required_attrs(["orig_path", "formats", "artifact_prefix"])
         if not {"autograph_langpack"} & set(app.formats):
             raise IScriptError(f"{app.formats} does not contain 'autograph_langpack'")
-        app.target_bundle_path = "{}/{}{}".format(config["artifact_dir"], app.artifact_prefix, app.orig_path.split(app.artifact_prefix)[1])
-
-        id = langpack_id(app)
-        log.info("Identified {} as extension id: {}".format(app.orig_path, id))
-        makedirs(os.path.dirname(app.target_bundle_path))
-        await sign_file_with_autograph(
-            sign_config,
-            app.orig_path,
-            "autograph_langpack",
-            to=app.target_bundle_path,
-            keyid=LANGPACK_AUTOGRAPH_KEY_ID[sign_config.get("release_type", "dep")],
-            extension_id=id,
-        )
+    semaphore = asyncio.Semaphore(config.get("langpack_concurrency", DEFAULT_LANGPACK_CONCURRENCY))
+    await raise_future_exceptions([asyncio.ensure_future(semaphore_wrapper(semaphore, _sign_langpack(config, sign_config, app))) for app in all_paths])
+
+
+async def _sign_langpack(config, sign_config, app):
+    app.target_bundle_path = "{}/{}{}".format(config["artifact_dir"], app.artifact_prefix, app.orig_path.split(app.artifact_prefix)[1])
+
+    id = await asyncio.get_running_loop().run_in_executor(None, langpack_id, app)
+    log.info("Identified {} as extension id: {}".format(app.orig_path, id))
+    makedirs(os.path.dirname(app.target_bundle_path))
+    await sign_file_with_autograph(
+        sign_config,
+        app.orig_path,
+        "autograph_langpack",
+        to=app.target_bundle_path,
+        keyid=LANGPACK_AUTOGRAPH_KEY_ID[sign_config.get("release_type", "dep")],
+        extension_id=id,
+    )
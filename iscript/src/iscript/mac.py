@@ -6,8 +6,11 @@ import json
 import logging
 import os
 import plistlib
+import random
 import re
 import shlex
+import time
+from contextlib import asynccontextmanager
 from copy import deepcopy
 from glob import glob
 from itertools import filterfalse
@@ -28,6 +31,22 @@ log = logging.getLogger(__name__)
 
 
 KNOWN_ARTIFACT_PREFIXES = ("public/", "releng/partner/", "private/openh264/")
+# The number of codesign calls to run at once per app, unless
+# `codesign_concurrency` is set in the sign_config
+DEFAULT_CODESIGN_CONCURRENCY = 4
+# The number of apps in each NotarizationPipeline phase at once, unless
+# overridden in `pipeline_concurrency`. Submissions are limited by the
+# `local_notarization_accounts` instead.
+DEFAULT_PIPELINE_CONCURRENCY = {"extract": 4, "sign": 2, "pkg": 2, "zip": 4, "staple": 4, "tar": 4}
+# The seconds a notarization is expected to take, until NotarizationPoller
+# has seen some succeed, unless `notarization_expected_time` is set in the
+# sign_config
+DEFAULT_NOTARIZATION_EXPECTED_TIME = 300
+# How much longer NotarizationPoller waits before each check of a uuid
+# that's still in progress
+POLL_BACKOFF = 1.5
+# The fraction each poll interval is randomly moved by
+POLL_JITTER = 0.2
 
 
 # App {{{1
@@ -85,7 +104,7 @@ class App(object):
                 raise IScriptError("Missing {} attr!".format(att))
 
 
-def _retry_run_cmd_semaphore(semaphore, cmd, cwd, exception=IScriptError):
+def _retry_run_cmd_semaphore(semaphore, cmd, cwd, exception=IScriptError, output_log_on_exception=False):
     return asyncio.ensure_future(
         semaphore_wrapper(
             semaphore,
@@ -95,6 +114,7 @@ def _retry_run_cmd_semaphore(semaphore, cmd, cwd, exception=IScriptError):
                     "cmd": cmd,
                     "cwd": cwd,
                     "exception": exception,
+                    "output_log_on_exception": output_log_on_exception,
                 },
                 retry_exceptions=(exception,),
             ),
@@ -240,59 +260,36 @@ async def sign_single_files(config, sign_config, all_paths):
             )
 
 
-async def _do_sign_file(top_dir, abs_file, file_, sign_command, app_path_len, app_executable):
-    """Avoid flake8 complaining about sign_app being too complex."""
-    # Deal with inner .app's in sign_app, not here.
-    if top_dir[app_path_len:].count(".app") > 0:
-        log.debug("Skipping %s because it's part of an inner app.", abs_file)
-        return
-    # app_executable gets signed with the outer package.
-    if file_ == app_executable:
-        log.debug("Skipping %s because it's the main executable.", abs_file)
-        return
-    dir_ = os.path.dirname(abs_file)
-    await retry_async(
-        run_command,
-        args=[sign_command + [file_]],
-        kwargs={"cwd": dir_, "exception": IScriptError, "output_log_on_exception": True},
-        retry_exceptions=(IScriptError,),
-    )
-
-
 # sign_app {{{1
-async def sign_app(sign_config, app_path, entitlements_path, provisioning_profile_path=None):
-    """Sign the .app.
+def _get_sign_tree(sign_config, app_path, entitlements_path):
+    """Find everything to sign inside ``app_path``, apart from the app itself.
 
-    Largely taken from build-tools' ``dmg_signfile``.
+    Each node is a ``(cwd, sign_command)`` pair and a list of the nodes
+    inside it, which have to be signed first. Files are leaves;
+    ``.framework`` dirs and nested ``.app`` and ``.appex`` bundles contain
+    the nodes inside them. A nested bundle's contents follow its own
+    ``sign_dirs`` and main executable, as if it was signed on its own.
 
     Args:
         sign_config (dict): the running config
-        app_path (str): the path to the app to be signed (extracted)
+        app_path (str): the path to the app
         entitlements_path (str): the path to the entitlements file for signing
-        provisioning_profile_path (str): the path to a provisioning profile to insert
-                                         into the build prior to signing
 
-    Raises:
-        IScriptError: on error.
+    Returns:
+        list: the top level ``((cwd, sign_command), children)`` nodes.
 
     """
-    parent_dir = os.path.dirname(app_path)
-    app_name = os.path.basename(app_path)
-    await run_command(["xattr", "-cr", app_name], cwd=parent_dir, exception=IScriptError)
     identity = sign_config["identity"]
     keychain = sign_config["signing_keychain"]
-    log.debug(f"sign_app: signing {app_name}")
-
     app_executable = get_bundle_executable(app_path)
-    app_path_len = len(app_path)
     contents_dir = os.path.join(app_path, "Contents")
-
-    if provisioning_profile_path:
-        log.debug("inserting provisioning profile into app")
-        copy2(provisioning_profile_path, os.path.join(contents_dir, "embedded.provisionprofile"))
+    nodes = []
+    # dir -> the list of nodes its contents belong to
+    parents = {contents_dir: nodes}
 
     for top_dir, dirs, files in os.walk(contents_dir):
-        for dir_ in dirs:
+        siblings = parents[top_dir]
+        for dir_ in list(dirs):
             abs_dir = os.path.join(top_dir, dir_)
             if top_dir == contents_dir and dir_ not in sign_config["sign_dirs"]:
                 log.debug(f"Skipping {abs_dir} because it's not in `sign_dirs`.")
@@ -303,22 +300,96 @@ async def sign_app(sign_config, app_path, entitlements_path, provisioning_profil
                 dirs.remove(dir_)
                 continue
             if dir_.endswith((".app", ".appex")):
-                await sign_app(sign_config, abs_dir, entitlements_path)
-            if dir_.endswith(".framework"):
-                # Sign the entire .framework folder
+                # Signed like the top level app, but as part of this one
+                dirs.remove(dir_)
+                sign_command = _get_sign_command(identity, keychain, sign_config, entitlements_path=entitlements_path)
+                siblings.append(((top_dir, sign_command + [dir_]), _get_sign_tree(sign_config, abs_dir, entitlements_path)))
+            elif dir_.endswith(".framework"):
+                # Sign the entire .framework folder, after its contents
                 #  codesign cannot determine if it's a Framework or an app bundle if signing the binary directly
                 sign_command = _get_sign_command(identity, keychain, sign_config, file_=dir_, entitlements_path=entitlements_path)
-                abs_file = os.path.join(top_dir, dir_)
-                await _do_sign_file(top_dir, abs_file, dir_, sign_command, app_path_len, app_executable)
-                continue
+                children = []
+                siblings.append(((top_dir, sign_command + [dir_]), children))
+                parents[abs_dir] = children
+            else:
+                parents[abs_dir] = siblings
         if top_dir == contents_dir:
             log.debug("Skipping file iteration in %s because it's the root directory.", top_dir)
             continue
 
         for file_ in files:
-            abs_file = os.path.join(top_dir, file_)
+            # app_executable gets signed with the outer package.
+            if file_ == app_executable:
+                log.debug("Skipping %s because it's the main executable.", os.path.join(top_dir, file_))
+                continue
             sign_command = _get_sign_command(identity, keychain, sign_config, file_=file_, entitlements_path=entitlements_path)
-            await _do_sign_file(top_dir, abs_file, file_, sign_command, app_path_len, app_executable)
+            siblings.append(((top_dir, sign_command + [file_]), []))
+    return nodes
+
+
+def _get_sign_levels(nodes):
+    """Group a sign tree into levels, from the inside out.
+
+    Everything in a level only contains nodes from earlier levels, so each
+    level can be signed in parallel once the previous one is done.
+
+    Args:
+        nodes (list): the nodes from ``_get_sign_tree``
+
+    Returns:
+        list: a list of ``(cwd, sign_command)`` lists, leaves first.
+
+    """
+    levels = []
+
+    def add(node):
+        job, children = node
+        level = max((add(child) + 1 for child in children), default=0)
+        while len(levels) <= level:
+            levels.append([])
+        levels[level].append(job)
+        return level
+
+    for node in nodes:
+        add(node)
+    return levels
+
+
+async def sign_app(sign_config, app_path, entitlements_path, provisioning_profile_path=None):
+    """Sign the .app.
+
+    Largely taken from build-tools' ``dmg_signfile``. Files are signed before
+    the frameworks and nested apps that contain them, and those before the
+    app. Everything at the same level is signed in parallel, up to
+    ``sign_config["codesign_concurrency"]`` codesign calls at once.
+
+    Args:
+        sign_config (dict): the running config
+        app_path (str): the path to the app to be signed (extracted)
+        entitlements_path (str): the path to the entitlements file for signing
+        provisioning_profile_path (str): the path to a provisioning profile to insert
+                                         into the build prior to signing
+
+    Raises:
+        IScriptError: on error.
+
+    """
+    parent_dir = os.path.dirname(app_path)
+    app_name = os.path.basename(app_path)
+    await run_command(["xattr", "-cr", app_name], cwd=parent_dir, exception=IScriptError)
+    identity = sign_config["identity"]
+    keychain = sign_config["signing_keychain"]
+    log.debug(f"sign_app: signing {app_name}")
+
+    contents_dir = os.path.join(app_path, "Contents")
+
+    if provisioning_profile_path:
+        log.debug("inserting provisioning profile into app")
+        copy2(provisioning_profile_path, os.path.join(contents_dir, "embedded.provisionprofile"))
+
+    semaphore = asyncio.Semaphore(sign_config.get("codesign_concurrency", DEFAULT_CODESIGN_CONCURRENCY))
+    for level in _get_sign_levels(_get_sign_tree(sign_config, app_path, entitlements_path)):
+        await raise_future_exceptions([_retry_run_cmd_semaphore(semaphore, cmd, cwd, output_log_on_exception=True) for cwd, cmd in level])
 
     await sign_libclearkey(contents_dir, _get_sign_command(identity, keychain, sign_config, entitlements_path=entitlements_path), app_path)
 
@@ -504,6 +575,41 @@ def filter_apps(all_paths, fmt, inverted=False):
 
 
 # extract_all_apps {{{1
+async def extract_app(config, app, counter):
+    """Extract an app into its own directory, ``work_dir/counter``.
+
+    Args:
+        config (dict): the running config
+        app (App): the app to extract, with its ``orig_path`` set
+        counter (int): the app's index in the task
+
+    Raises:
+        IScriptError: on failure
+
+    """
+    app.check_required_attrs(["orig_path"])
+    app.parent_dir = os.path.join(config["work_dir"], str(counter))
+    rm(app.parent_dir)
+    makedirs(app.parent_dir)
+    if app.orig_path.endswith((".tar.bz2", ".tar.gz", ".tgz")):
+        await run_command(["tar", "xf", app.orig_path], cwd=app.parent_dir, exception=IScriptError, log_level=logging.DEBUG)
+    elif app.orig_path.endswith(".dmg"):
+        unpack_dmg = os.path.join(os.path.dirname(__file__), "data", "unpack-diskimage")
+        unpack_mountpoint = os.path.join("/tmp", f"{config.get('dmg_prefix', 'dmg')}-{counter}-unpack")
+        await run_command(
+            [unpack_dmg, app.orig_path, unpack_mountpoint, app.parent_dir],
+            cwd=app.parent_dir,
+            exception=IScriptError,
+            log_level=logging.DEBUG,
+        )
+        # nuke the softlink to /Applications
+        rm(os.path.join(app.parent_dir, " "))
+    elif app.orig_path.endswith(".zip"):
+        await run_command(["unzip", app.orig_path], cwd=app.parent_dir, exception=IScriptError, log_level=logging.DEBUG)
+    else:
+        raise IScriptError(f"unknown file type {app.orig_path}")
+
+
 async def extract_all_apps(config, all_paths):
     """Extract all the apps into their own directories.
 
@@ -516,46 +622,8 @@ async def extract_all_apps(config, all_paths):
 
     """
     log.info("Extracting all apps")
-    futures = []
-    work_dir = config["work_dir"]
-    unpack_dmg = os.path.join(os.path.dirname(__file__), "data", "unpack-diskimage")
-    for counter, app in enumerate(all_paths):
-        app.check_required_attrs(["orig_path"])
-        app.parent_dir = os.path.join(work_dir, str(counter))
-        rm(app.parent_dir)
-        makedirs(app.parent_dir)
-        if app.orig_path.endswith((".tar.bz2", ".tar.gz", ".tgz")):
-            futures.append(
-                asyncio.ensure_future(
-                    run_command(
-                        ["tar", "xf", app.orig_path],
-                        cwd=app.parent_dir,
-                        exception=IScriptError,
-                        log_level=logging.DEBUG,
-                    )
-                )
-            )
-        elif app.orig_path.endswith(".dmg"):
-            unpack_mountpoint = os.path.join("/tmp", f"{config.get('dmg_prefix', 'dmg')}-{counter}-unpack")
-            futures.append(
-                asyncio.ensure_future(
-                    run_command(
-                        [unpack_dmg, app.orig_path, unpack_mountpoint, app.parent_dir],
-                        cwd=app.parent_dir,
-                        exception=IScriptError,
-                        log_level=logging.DEBUG,
-                    )
-                )
-            )
-        elif app.orig_path.endswith(".zip"):
-            futures.append(asyncio.ensure_future(run_command(["unzip", app.orig_path], cwd=app.parent_dir, exception=IScriptError, log_level=logging.DEBUG)))
-        else:
-            raise IScriptError(f"unknown file type {app.orig_path}")
+    futures = [asyncio.ensure_future(extract_app(config, app, counter)) for counter, app in enumerate(all_paths)]
     await raise_future_exceptions(futures)
-    if app.orig_path.endswith(".dmg"):
-        # nuke the softlink to /Applications
-        for counter, app in enumerate(all_paths):
-            rm(os.path.join(app.parent_dir, " "))
 
 
 # create_all_notarization_zipfiles {{{1
@@ -774,50 +842,7 @@ async def wrap_notarization_with_sudo(config, sign_config, all_paths, path_attr=
     while counter < len(all_paths):
         futures = []
         for account in accounts:
-            app = all_paths[counter]
-            app.notarization_log_path = f"{app.parent_dir}-notarization.log"
-            bundle_id = get_bundle_id(sign_config["base_bundle_id"], counter=str(counter))
-            zip_path = getattr(app, path_attr)
-            # XXX potentially run the notarization + get_uuid_from_log in a
-            #     helper function per app, so we can retry them individually on
-            #     error. That would also let us record the path per UUID,
-            #     should we need that complexity later.
-            #     Not doing that now, so notarization errors are more visible.
-            base_cmdln = " ".join(
-                [
-                    "xcrun",
-                    "altool",
-                    "--notarize-app",
-                    "-f",
-                    zip_path,
-                    "--primary-bundle-id",
-                    '"{}"'.format(bundle_id),
-                    "-u",
-                    sign_config["apple_notarization_account"],
-                    "--asc-provider",
-                    sign_config["apple_asc_provider"],
-                    "--password",
-                ]
-            )
-            cmd = [
-                "sudo",
-                "su",
-                account,
-                "-c",
-                base_cmdln + " {}".format(shlex.quote(sign_config["apple_notarization_password"])),
-            ]
-            log_cmd = ["sudo", "su", account, "-c", base_cmdln + " ********"]
-            futures.append(
-                asyncio.ensure_future(
-                    retry_async(
-                        run_command,
-                        args=[cmd],
-                        kwargs={"log_path": app.notarization_log_path, "log_cmd": log_cmd, "exception": IScriptError},
-                        retry_exceptions=(IScriptError,),
-                        attempts=10,
-                    )
-                )
-            )
+            futures.append(asyncio.ensure_future(_notarize_app_with_sudo(sign_config, all_paths[counter], account, counter, path_attr=path_attr)))
             counter += 1
             if counter >= len(all_paths):
                 break
@@ -827,6 +852,48 @@ async def wrap_notarization_with_sudo(config, sign_config, all_paths, path_attr=
     return uuids
 
 
+async def _notarize_app_with_sudo(sign_config, app, account, counter, path_attr="zip_path"):
+    """Submit one app for notarization as the local ``account``.
+
+    The response is written to ``app.notarization_log_path``.
+
+    """
+    app.notarization_log_path = f"{app.parent_dir}-notarization.log"
+    bundle_id = get_bundle_id(sign_config["base_bundle_id"], counter=str(counter))
+    zip_path = getattr(app, path_attr)
+    base_cmdln = " ".join(
+        [
+            "xcrun",
+            "altool",
+            "--notarize-app",
+            "-f",
+            zip_path,
+            "--primary-bundle-id",
+            '"{}"'.format(bundle_id),
+            "-u",
+            sign_config["apple_notarization_account"],
+            "--asc-provider",
+            sign_config["apple_asc_provider"],
+            "--password",
+        ]
+    )
+    cmd = [
+        "sudo",
+        "su",
+        account,
+        "-c",
+        base_cmdln + " {}".format(shlex.quote(sign_config["apple_notarization_password"])),
+    ]
+    log_cmd = ["sudo", "su", account, "-c", base_cmdln + " ********"]
+    await retry_async(
+        run_command,
+        args=[cmd],
+        kwargs={"log_path": app.notarization_log_path, "log_cmd": log_cmd, "exception": IScriptError},
+        retry_exceptions=(IScriptError,),
+        attempts=10,
+    )
+
+
 # notarize_no_sudo {{{1
 async def notarize_no_sudo(work_dir, sign_config, zip_path):
     """Create a notarization request, without sudo, for a single zip.
@@ -864,43 +931,34 @@ async def notarize_no_sudo(work_dir, sign_config, zip_path):
     return uuids
 
 
-# poll_notarization_uuid {{{1
-async def poll_notarization_uuid(uuid, username, password, timeout, log_path, sleep_time=15):
-    """Poll to see if the notarization for ``uuid`` is complete.
+# get_notarization_status {{{1
+async def get_notarization_status(uuid, username, password, log_path):
+    """Check the status of the notarization ``uuid`` once.
 
     Args:
-        uuid (str): the uuid to poll for
-        username (str): the apple user to poll with
-        password (str): the apple password to poll with
-        timeout (int): the maximum wait time
-        sleep_time (int): the time to sleep between polling
+        uuid (str): the uuid to check
+        username (str): the apple user to check with
+        password (str): the apple password to check with
+        log_path (str): the path to write the response to
 
     Raises:
-        TimeoutError: on timeout
-        InvalidNotarization: if the notarization fails with ``invalid``
-        IScriptError: on unexpected failure
+        IScriptError: if the status can't be checked
+
+    Returns:
+        str: ``success`` or ``invalid``
+        None: if it's still in progress
 
     """
-    start = arrow.utcnow().int_timestamp
-    timeout_time = start + timeout
     base_cmd = ["xcrun", "altool", "--notarization-info", uuid, "-u", username, "--password"]
     log_cmd = base_cmd + ["********"]
-    while 1:
-        await retry_async(
-            run_command,
-            args=[base_cmd + [password]],
-            kwargs={"log_path": log_path, "log_cmd": log_cmd, "exception": IScriptError},
-            retry_exceptions=(IScriptError,),
-            attempts=10,
-        )
-        status = get_notarization_status_from_log(log_path)
-        if status == "success":
-            break
-        if status == "invalid":
-            raise InvalidNotarization("Invalid notarization for uuid {}!".format(uuid))
-        await asyncio.sleep(sleep_time)
-        if arrow.utcnow().int_timestamp > timeout_time:
-            raise TimeoutError("Timed out polling for uuid {}!".format(uuid))
+    await retry_async(
+        run_command,
+        args=[base_cmd + [password]],
+        kwargs={"log_path": log_path, "log_cmd": log_cmd, "exception": IScriptError},
+        retry_exceptions=(IScriptError,),
+        attempts=10,
+    )
+    return get_notarization_status_from_log(log_path)
 
 
 # poll_all_notarization_status {{{1
@@ -916,23 +974,183 @@ async def poll_all_notarization_status(sign_config, poll_uuids):
 
     """
     log.info("Polling for notarization status")
-    futures = []
     # We're going to overwrite the original notification log here.
     # If we want to preserve the logs, we should change this path
-    for uuid, log_path in poll_uuids.items():
-        futures.append(
-            asyncio.ensure_future(
-                poll_notarization_uuid(
-                    uuid,
-                    sign_config["apple_notarization_account"],
-                    sign_config["apple_notarization_password"],
-                    sign_config["notarization_poll_timeout"],
-                    log_path,
-                    sleep_time=15,
-                )
+    async with NotarizationPoller(sign_config) as poller:
+        futures = [asyncio.ensure_future(poller.wait(uuid, log_path)) for uuid, log_path in poll_uuids.items()]
+        await raise_future_exceptions(futures)
+
+
+# NotarizationPoller {{{1
+@attr.s
+class PendingNotarization(object):
+    """Track the polling state of a notarization uuid.
+
+    Attributes:
+        log_path (str): the path to write the status responses to.
+        start (float): the ``time.monotonic()`` when we started waiting.
+        timeout_time (int): the timestamp to give up at.
+        interval (float): the seconds to wait before the next check, before
+            jitter and tightening.
+        next_check (float): the ``time.monotonic()`` of the next check.
+        due (bool): whether it's been expected to finish by now.
+
+    """
+
+    log_path = attr.ib()
+    start = attr.ib()
+    timeout_time = attr.ib()
+    interval = attr.ib()
+    next_check = attr.ib()
+    due = attr.ib(default=False)
+
+
+class NotarizationPoller:
+    """Poll every pending notarization from one loop.
+
+    Notarizations are added as they're submitted, so an app that's submitted
+    early doesn't wait for the others before it's polled. Apps waiting on the
+    same uuid share its result, and a uuid that's already finished isn't
+    checked again.
+
+    Each uuid is checked when it's added, then less and less often, from
+    ``sleep_time`` up to ``max_sleep_time`` seconds apart, tightening towards
+    when it's expected to finish. Between the quickest and slowest times the
+    successful notarizations so far have taken, or from the
+    ``notarization_expected_time`` in the sign_config before any have
+    finished, it's checked every ``sleep_time`` seconds, then backs off
+    again. Every interval is jittered, so apps submitted together don't all
+    spawn their checks at once.
+
+    Use it as an async context manager, which starts and stops the loop.
+
+    Args:
+        sign_config (dict): the config for this signing key
+        sleep_time (int, optional): the fewest seconds between status checks
+            for a uuid. Defaults to 15.
+        max_sleep_time (int, optional): the most seconds between status
+            checks for a uuid. Defaults to 30.
+
+    """
+
+    def __init__(self, sign_config, sleep_time=15, max_sleep_time=30):
+        """Initialize NotarizationPoller."""
+        self.username = sign_config["apple_notarization_account"]
+        self.password = sign_config["apple_notarization_password"]
+        self.timeout = sign_config["notarization_poll_timeout"]
+        self.default_expected_time = sign_config.get("notarization_expected_time", DEFAULT_NOTARIZATION_EXPECTED_TIME)
+        self.sleep_time = sleep_time
+        self.max_sleep_time = max(sleep_time, max_sleep_time)
+        # uuid -> future, including finished ones
+        self.futures = {}
+        # uuid -> PendingNotarization
+        self.pending = {}
+        # how long each successful notarization took
+        self.durations = []
+        self.submitted = asyncio.Event()
+        self.poller = None
+
+    async def __aenter__(self):
+        """Start polling."""
+        self.poller = asyncio.ensure_future(self._poll())
+        return self
+
+    async def __aexit__(self, *excinfo):
+        """Stop polling, and fail anything still waiting."""
+        self.poller.cancel()
+        await asyncio.gather(self.poller, return_exceptions=True)
+        for uuid in self.pending:
+            self.futures[uuid].cancel()
+        self.pending = {}
+
+    @property
+    def expected_times(self):
+        """tuple: the fewest and most seconds a notarization is expected to take."""
+        if self.durations:
+            return min(self.durations), max(self.durations)
+        return self.default_expected_time, self.default_expected_time
+
+    async def wait(self, uuid, log_path):
+        """Wait for the notarization ``uuid`` to succeed.
+
+        Args:
+            uuid (str): the uuid to wait for
+            log_path (str): the path to write the status responses to
+
+        Raises:
+            TimeoutError: on timeout
+            InvalidNotarization: if the notarization fails with ``invalid``
+            IScriptError: on unexpected failure
+
+        """
+        if uuid not in self.futures:
+            now = time.monotonic()
+            self.futures[uuid] = asyncio.get_running_loop().create_future()
+            self.pending[uuid] = PendingNotarization(
+                log_path=log_path,
+                start=now,
+                timeout_time=arrow.utcnow().int_timestamp + self.timeout,
+                interval=self.sleep_time,
+                next_check=now,
             )
-        )
-    await raise_future_exceptions(futures)
+            self.submitted.set()
+        # Don't cancel the other waiters if this one is cancelled
+        await asyncio.shield(self.futures[uuid])
+
+    def _get_interval(self, pending, now):
+        """Get the seconds until the next check of ``pending``."""
+        elapsed = now - pending.start
+        earliest, latest = self.expected_times
+        if elapsed < earliest:
+            # Halve the wait each check as the expected finish approaches
+            interval = min(pending.interval, max(self.sleep_time, (earliest - elapsed) / 2))
+        else:
+            if elapsed <= latest or not pending.due:
+                pending.interval = self.sleep_time
+            pending.due = True
+            interval = pending.interval
+        return interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+    async def _poll(self):
+        while True:
+            now = time.monotonic()
+            due = [(uuid, pending) for uuid, pending in self.pending.items() if pending.next_check <= now]
+            if not due:
+                next_check = min((pending.next_check for pending in self.pending.values()), default=None)
+                self.submitted.clear()
+                try:
+                    await asyncio.wait_for(self.submitted.wait(), None if next_check is None else next_check - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            statuses = await asyncio.gather(
+                *(get_notarization_status(uuid, self.username, self.password, pending.log_path) for uuid, pending in due),
+                return_exceptions=True,
+            )
+            now = time.monotonic()
+            finished = False
+            for (uuid, pending), status in zip(due, statuses):
+                future = self.futures[uuid]
+                if isinstance(status, Exception):
+                    future.set_exception(status)
+                elif status == "success":
+                    log.info(f"Notarization {uuid} succeeded after {now - pending.start:.0f}s")
+                    self.durations.append(now - pending.start)
+                    finished = True
+                    future.set_result(None)
+                elif status == "invalid":
+                    future.set_exception(InvalidNotarization("Invalid notarization for uuid {}!".format(uuid)))
+                elif arrow.utcnow().int_timestamp > pending.timeout_time:
+                    future.set_exception(TimeoutError("Timed out polling for uuid {}!".format(uuid)))
+                else:
+                    pending.next_check = now + self._get_interval(pending, now)
+                    pending.interval = min(pending.interval * POLL_BACKOFF, self.max_sleep_time)
+                    continue
+                del self.pending[uuid]
+            if finished:
+                # The others may be expected to finish sooner now
+                for pending in self.pending.values():
+                    pending.next_check = min(pending.next_check, now + self._get_interval(pending, now))
 
 
 # staple_notarization {{{1
@@ -1179,6 +1397,140 @@ async def download_requirements_plist_file(config, task):
     return to
 
 
+# NotarizationPipeline {{{1
+class NotarizationPipeline:
+    """Sign, notarize and package each app on its own.
+
+    Each app moves through extract, sign, pkg, zip, submit, notarize, staple
+    and tar as soon as it's ready, instead of waiting for every app to finish
+    each phase. Each phase runs up to ``config["pipeline_concurrency"][phase]``
+    apps at once. Each of the ``local_notarization_accounts`` submits one app
+    at a time, and a shared ``NotarizationPoller`` waits for them.
+
+    This is the ``multi_account`` workflow, where each app has its own
+    notarization zipfile.
+
+    Args:
+        config (dict): the running config
+        sign_config (dict): the config for this signing key
+        entitlements_path (str, optional): the path to the entitlements file
+        provisioning_profile_path (str, optional): the path to a provisioning
+            profile to insert into the apps
+        requirements_plist_path (str, optional): the path to a
+            ``requirements.plist`` to pass to productbuild
+        poll_sleep_time (int, optional): the fewest seconds between
+            notarization status checks for an app. Defaults to 15.
+
+    Attributes:
+        timings (dict): the seconds each app spent in each phase, by
+            ``orig_path``. Waiting for a phase's concurrency limit isn't
+            counted.
+
+    """
+
+    def __init__(self, config, sign_config, entitlements_path=None, provisioning_profile_path=None, requirements_plist_path=None, poll_sleep_time=15):
+        """Initialize NotarizationPipeline."""
+        self.config = config
+        self.sign_config = sign_config
+        self.entitlements_path = entitlements_path
+        self.provisioning_profile_path = provisioning_profile_path
+        self.requirements_plist_path = requirements_plist_path
+        self.poll_sleep_time = poll_sleep_time
+        limits = dict(DEFAULT_PIPELINE_CONCURRENCY, **config.get("pipeline_concurrency", {}))
+        self.semaphores = {phase: asyncio.Semaphore(limit) for phase, limit in limits.items()}
+        self.keychain_lock = asyncio.Lock()
+        self.timings = {}
+
+    async def run(self, all_paths):
+        """Sign, notarize and package ``all_paths``.
+
+        Args:
+            all_paths (list): the ``App`` objects to sign
+
+        Raises:
+            IScriptError: on failure
+
+        """
+        self.accounts = asyncio.Queue()
+        for account in self.config["local_notarization_accounts"]:
+            self.accounts.put_nowait(account)
+        start = time.monotonic()
+        try:
+            async with NotarizationPoller(self.sign_config, sleep_time=self.poll_sleep_time) as self.poller:
+                await raise_future_exceptions([asyncio.ensure_future(self._run_app(app, counter)) for counter, app in enumerate(all_paths)])
+        finally:
+            self._log_timings(time.monotonic() - start)
+
+    async def _run_app(self, app, counter):
+        path_attrs = ["app_path"]
+        async with self._phase(app, "extract"):
+            await extract_app(self.config, app, counter)
+        async with self._phase(app, "sign"):
+            await self._sign(app)
+        if self.sign_config["create_pkg"]:
+            path_attrs.append("pkg_path")
+            async with self._phase(app, "pkg"):
+                # Unlock keychain again in case it's locked since previous unlock
+                await self._unlock_keychain()
+                await create_pkg_files(self.config, self.sign_config, [app], requirements_plist_path=self.requirements_plist_path)
+        async with self._phase(app, "zip"):
+            await create_all_notarization_zipfiles([app], path_attrs=path_attrs)
+        account = await self.accounts.get()
+        try:
+            async with self._phase(app, "submit"):
+                await _notarize_app_with_sudo(self.sign_config, app, account, counter)
+        finally:
+            self.accounts.put_nowait(account)
+        async with self._phase(app, "notarize"):
+            await self.poller.wait(get_uuid_from_log(app.notarization_log_path), app.notarization_log_path)
+        async with self._phase(app, "staple"):
+            for path_attr in path_attrs:
+                await staple_notarization([app], path_attr=path_attr)
+        async with self._phase(app, "tar"):
+            await tar_apps(self.config, [app])
+            if self.sign_config["create_pkg"]:
+                await copy_pkgs_to_artifact_dir(self.config, [app])
+
+    async def _sign(self, app):
+        set_app_path_and_name(app)
+        if {"autograph_omnija", "omnija"} & set(app.formats):
+            await sign_omnija_with_autograph(self.config, self.sign_config, app.app_path)
+        if {"autograph_widevine", "widevine"} & set(app.formats):
+            await sign_widevine_dir(self.config, self.sign_config, app.app_path)
+        await self._unlock_keychain()
+        await sign_app(self.sign_config, app.app_path, self.entitlements_path, self.provisioning_profile_path)
+        await verify_app_signature(self.sign_config, app)
+
+    async def _unlock_keychain(self):
+        async with self.keychain_lock:
+            await unlock_keychain(self.sign_config["signing_keychain"], self.sign_config["keychain_password"])
+            await update_keychain_search_path(self.config, self.sign_config["signing_keychain"])
+
+    @asynccontextmanager
+    async def _phase(self, app, phase):
+        semaphore = self.semaphores.get(phase)
+        if semaphore:
+            await semaphore.acquire()
+        log.info(f"{app.orig_path}: starting {phase}")
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings.setdefault(app.orig_path, {})[phase] = time.monotonic() - start
+            if semaphore:
+                semaphore.release()
+
+    def _log_timings(self, elapsed):
+        log.info(f"Notarization pipeline took {elapsed:.1f}s. Seconds per phase:")
+        phases = {}
+        for orig_path, timings in self.timings.items():
+            log.info(f"{orig_path}: " + ", ".join(f"{phase} {seconds:.1f}" for phase, seconds in timings.items()) + f"; total {sum(timings.values()):.1f}")
+            for phase, seconds in timings.items():
+                phases.setdefault(phase, []).append(seconds)
+        for phase, seconds in phases.items():
+            log.info(f"{phase}: total {sum(seconds):.1f}, max {max(seconds):.1f}")
+
+
 # notarize_behavior {{{1
 async def notarize_behavior(config, task):
     """Sign and notarize all mac apps for this task.
@@ -1206,6 +1558,20 @@ async def notarize_behavior(config, task):
         await sign_langpacks(config, sign_config, langpack_apps)
         all_paths = filter_apps(all_paths, fmt="autograph_langpack", inverted=True)
 
+    if sign_config["notarize_type"] == "multi_account":
+        # Each app has its own notarization zipfile, so it can go through
+        # every step on its own
+        pipeline = NotarizationPipeline(
+            config,
+            sign_config,
+            entitlements_path=entitlements_path,
+            provisioning_profile_path=provisioning_profile_path,
+            requirements_plist_path=requirements_plist_path,
+        )
+        await pipeline.run(all_paths)
+        log.info("Done signing and notarizing apps.")
+        return
+
     # app
     await extract_all_apps(config, all_paths)
     await unlock_keychain(sign_config["signing_keychain"], sign_config["keychain_password"])
@@ -1221,12 +1587,8 @@ async def notarize_behavior(config, task):
         await create_pkg_files(config, sign_config, all_paths, requirements_plist_path=requirements_plist_path)
 
     log.info("Notarizing")
-    if sign_config["notarize_type"] == "multi_account":
-        await create_all_notarization_zipfiles(all_paths, path_attrs=path_attrs)
-        poll_uuids = await wrap_notarization_with_sudo(config, sign_config, all_paths, path_attr="zip_path")
-    else:
-        zip_path = await create_one_notarization_zipfile(work_dir, all_paths, sign_config, path_attrs=path_attrs)
-        poll_uuids = await notarize_no_sudo(work_dir, sign_config, zip_path)
+    zip_path = await create_one_notarization_zipfile(work_dir, all_paths, sign_config, path_attrs=path_attrs)
+    poll_uuids = await notarize_no_sudo(work_dir, sign_config, zip_path)
 
     await poll_all_notarization_status(sign_config, poll_uuids)
 
@@ -9,6 +9,7 @@ from iscript.hardened_sign import sign_hardened_behavior
 from iscript.mac import notarize_1_behavior, notarize_3_behavior, notarize_behavior, sign_and_pkg_behavior, sign_behavior, single_file_behavior
 from iscript.macvpn import vpn_behavior
 from iscript.util import get_sign_config
+from scriptworker_client.aio import SessionManager
 from scriptworker_client.client import sync_main
 from scriptworker_client.utils import run_command
 
@@ -98,7 +99,10 @@ async def async_main(config, task):
     # Raises if behavior not supported
     behavior = check_dep_behavior(task, behavior, sign_config["supported_behaviors"])
     func, args = get_behavior_function(behavior)
-    await func(config, task, **args)
+    # Share keep-alive connections between Autograph calls and downloads,
+    # with a cap on the concurrent connections to each host
+    async with SessionManager(limit_per_host=config.get("http_connections_per_host", 10)):
+        await func(config, task, **args)
 
 
 def get_default_config(base_dir=None):
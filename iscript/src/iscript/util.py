@@ -7,8 +7,12 @@ Attributes:
 """
 
 import glob
+import importlib.util
 import logging
 import os
+import sys
+import threading
+import types
 from copy import deepcopy
 
 from iscript.constants import PRODUCT_CONFIG
@@ -18,6 +22,69 @@ log = logging.getLogger(__name__)
 
 _CERT_TYPE_TO_KEY_CONFIG = {"dep-signing": "dep", "nightly-signing": "nightly", "release-signing": "release"}
 
+# Held while a lazily imported module is executed, so other threads wait for it
+_LAZY_IMPORT_LOCK = threading.RLock()
+# The ids of the lazily imported modules being executed
+_lazy_loading = set()
+
+
+class _LazyModule(types.ModuleType):
+    """A module that's executed the first time one of its attributes is used.
+
+    Like the modules ``importlib.util.LazyLoader`` creates, but thread-safe:
+    before Python 3.12, other threads could see its attributes missing while
+    the first one was still executing it.
+
+    """
+
+    def __getattribute__(self, attr):
+        """Execute the module, if it hasn't been, and get `attr`."""
+        with _LAZY_IMPORT_LOCK:
+            # The module's own code may use it while it's executing
+            if type(self) is _LazyModule and id(self) not in _lazy_loading:
+                _lazy_loading.add(id(self))
+                try:
+                    spec = types.ModuleType.__getattribute__(self, "__spec__")
+                    spec.loader.exec_module(self)
+                    # Look attributes up directly, without the lock, from now on
+                    self.__class__ = types.ModuleType
+                finally:
+                    _lazy_loading.discard(id(self))
+        # Not super(): once it's executed, this is no longer a _LazyModule
+        return types.ModuleType.__getattribute__(self, attr)
+
+
+def lazy_import(name):
+    """Import module `name` the first time one of its attributes is used.
+
+    Notarization-only tasks never use ``mozpack.mozjar``, which is only
+    needed to sign omni.ja files, but it's one of the slower imports. A lazy
+    module isn't imported until a task uses it; if several threads use it
+    first at once, they wait for it to finish executing.
+
+    Args:
+        name (str): the full name of the module, e.g. ``mozpack.mozjar``
+
+    Returns:
+        module: the module, loaded on first attribute access.
+
+    Raises:
+        ModuleNotFoundError: if the module can't be found.
+
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    module = importlib.util.module_from_spec(spec)
+    module.__class__ = _LazyModule
+    sys.modules[name] = module
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
 
 def task_cert_type(config, task):
     """Get the signing cert type from the task scopes.
@@ -0,0 +1,69 @@
+"""Benchmark concurrent Autograph calls against a fake Autograph with injected latency.
+
+Signs 100 langpack-sized files concurrently, as ``sign_widevine_dir`` signs
+its files, with:
+
+* ``requests``: the old blocking ``requests`` + ``HawkAuth`` call_autograph
+* ``aiohttp``: the aiohttp call_autograph, a new session per call
+* ``aiohttp_pooled``: the same inside a ``SessionManager``
+
+Run with ``ISCRIPT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import pytest
+from conftest import fake_autograph_thread, skip_unless_benchmark
+from scriptworker_client.aio import SessionManager
+
+import iscript.autograph as autograph
+
+NUM_FILES = 100
+LATENCY = 0.05
+CONCURRENCY = 10
+
+
+async def blocking_call_autograph(url, user, password, request_json):
+    """How call_autograph used to work."""
+    requests = pytest.importorskip("requests")
+    requests_hawk = pytest.importorskip("requests_hawk")
+    with requests.Session() as session:
+        r = session.post(url, json=request_json, auth=requests_hawk.HawkAuth(id=user, key=password))
+        r.raise_for_status()
+        return json.loads(r.text)
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("client", ("requests", "aiohttp", "aiohttp_pooled"))
+async def test_bench_autograph(tmp_path, mocker, client):
+    if client == "requests":
+        mocker.patch.object(autograph, "call_autograph", new=blocking_call_autograph)
+    paths = []
+    for i in range(NUM_FILES):
+        path = tmp_path / f"langpack{i}.xpi"
+        path.write_bytes(os.urandom(300 * 1024))
+        paths.append(str(path))
+
+    with fake_autograph_thread(latency=LATENCY) as (url, stats):
+        sign_config = {"langpack_url": url + "/langpack", "langpack_user": "langpack_user", "langpack_pass": "langpack_pass"}
+
+        async def sign_all():
+            await asyncio.gather(*(autograph.sign_file_with_autograph(sign_config, path, "autograph_langpack", to=path + ".signed") for path in paths))
+
+        start = time.monotonic()
+        if client == "aiohttp_pooled":
+            async with SessionManager(limit_per_host=CONCURRENCY):
+                await sign_all()
+        else:
+            await sign_all()
+        elapsed = time.monotonic() - start
+
+    assert stats["requests"] == NUM_FILES
+    print(
+        f"\n{client:>15}: {NUM_FILES} files in {elapsed:.2f}s, {NUM_FILES / elapsed:.1f} files/s, "
+        f"peak {stats['peak_in_flight']} in flight over {len(stats['connections'])} connections"
+    )
@@ -0,0 +1,48 @@
+"""Benchmark signing a release's worth of langpacks against a fake Autograph.
+
+Signs 100 copies of ``tests/data/en-CA.xpi`` with ``sign_langpacks``, one at
+a time (as it used to) and with more and more langpacks signed at once.
+
+Run with ``ISCRIPT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+
+import os
+import shutil
+import time
+
+import pytest
+from conftest import fake_autograph_thread, skip_unless_benchmark
+from scriptworker_client.aio import SessionManager
+
+import iscript.autograph as autograph
+from iscript.mac import App
+
+NUM_LANGPACKS = 100
+LATENCY = 0.2
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("concurrency", (1, 5, 10, 25))
+async def test_bench_langpacks(tmp_path, concurrency):
+    work_dir = tmp_path / "work" / "public" / "build"
+    work_dir.mkdir(parents=True)
+    apps = []
+    for i in range(NUM_LANGPACKS):
+        path = work_dir / f"langpack{i}.xpi"
+        shutil.copyfile(os.path.join(TEST_DATA_DIR, "en-CA.xpi"), path)
+        apps.append(App(orig_path=str(path), formats=["autograph_langpack"], artifact_prefix="public/"))
+    config = {"artifact_dir": str(tmp_path / "artifacts"), "langpack_concurrency": concurrency}
+
+    with fake_autograph_thread(latency=LATENCY) as (url, stats):
+        sign_config = {"langpack_url": url + "/langpack", "langpack_user": "langpack_user", "langpack_pass": "langpack_pass"}
+        start = time.monotonic()
+        async with SessionManager(limit_per_host=concurrency):
+            await autograph.sign_langpacks(config, sign_config, apps)
+        elapsed = time.monotonic() - start
+
+    assert stats["requests"] == NUM_LANGPACKS
+    print(
+        f"\nconcurrency={concurrency:>2}: {NUM_LANGPACKS} langpacks in {elapsed:.2f}s, {NUM_LANGPACKS / elapsed:.1f} langpacks/s, peak {stats['peak_in_flight']} in flight"
+    )
@@ -0,0 +1,81 @@
+"""Benchmark polling notarization status, per uuid vs one adaptive loop.
+
+Submits 12 zips to a fake ``altool`` (see ``test_mac.fake_mac_tools``),
+each notarization taking 12-60 seconds, then waits for all of them. The
+times are the production defaults scaled down 10x. ``fixed`` runs a
+polling loop per uuid, checking every 1.5s, as
+``poll_all_notarization_status`` used to. ``adaptive`` waits through one
+``NotarizationPoller``, backing off from 1.5s to 3s and expecting
+notarizations to take 30s until some have succeeded. It reports the
+``altool --notarization-info`` processes spawned, and how long after
+finishing each notarization was noticed.
+
+Run with ``ISCRIPT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+
+import asyncio
+import json
+import random
+import statistics
+import time
+
+import pytest
+from conftest import skip_unless_benchmark
+from test_mac import fake_mac_tools, pipeline_configs, read_calls
+
+import iscript.mac as mac
+from scriptworker_client.utils import run_command
+
+NUM_UUIDS = 12
+SLEEP_TIME = 1.5
+MAX_SLEEP_TIME = 3
+EXPECTED_TIME = 30
+
+
+async def submit(tmp_path, name):
+    zip_path = tmp_path / name
+    zip_path.write_bytes(b"zip")
+    log_path = str(tmp_path / f"{name}.log")
+    await run_command(["xcrun", "altool", "--notarize-app", "-f", str(zip_path)], log_path=log_path)
+    return mac.get_uuid_from_log(log_path), log_path
+
+
+async def poll_fixed(sign_config, uuid, log_path):
+    """How poll_all_notarization_status polled each uuid."""
+    while await mac.get_notarization_status(uuid, sign_config["apple_notarization_account"], sign_config["apple_notarization_password"], log_path) is None:
+        await asyncio.sleep(SLEEP_TIME)
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ("fixed", "adaptive"))
+async def test_bench_notarization_poll(tmp_path, monkeypatch, mode):
+    rand = random.Random(0)
+    delays = {f"{i}.zip": rand.uniform(12, 60) for i in range(NUM_UUIDS)}
+    calls_log = fake_mac_tools(tmp_path, monkeypatch, notarization_delays=delays)
+    _, sign_config = pipeline_configs(tmp_path)
+    sign_config["notarization_expected_time"] = EXPECTED_TIME
+    poll_uuids = dict([await submit(tmp_path, name) for name in delays])
+
+    noticed = {}
+
+    async def wait(poll, uuid):
+        await poll(uuid)
+        noticed[uuid] = time.time()
+
+    start = time.monotonic()
+    if mode == "fixed":
+        await asyncio.gather(*(wait(lambda uuid: poll_fixed(sign_config, uuid, poll_uuids[uuid]), uuid) for uuid in poll_uuids))
+    else:
+        async with mac.NotarizationPoller(sign_config, sleep_time=SLEEP_TIME, max_sleep_time=MAX_SLEEP_TIME) as poller:
+            await asyncio.gather(*(wait(lambda uuid: poller.wait(uuid, poll_uuids[uuid]), uuid) for uuid in poll_uuids))
+    elapsed = time.monotonic() - start
+
+    lags = []
+    for uuid in poll_uuids:
+        with open(tmp_path / "fake_mac_tools" / uuid) as fh:
+            name, submitted = json.load(fh)
+        lags.append(noticed[uuid] - submitted - delays[name])
+    checks = [call for call in read_calls(calls_log) if call[2:4] == ["altool", "--notarization-info"]]
+    print(f"\n{mode:>8}: {NUM_UUIDS} notarizations in {elapsed:.1f}s (slowest {max(delays.values()):.1f}s), {len(checks)} status checks")
+    print(f"          noticed after finishing: mean {statistics.mean(lags):.2f}s, max {max(lags):.2f}s")
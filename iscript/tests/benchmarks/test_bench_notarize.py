@@ -0,0 +1,84 @@
+"""Benchmark the multi_account notarization workflow, phased vs pipelined.
+
+Runs 8 apps through signing, pkg creation, notarization, stapling and
+tarring with fake mac tools (see ``test_mac.fake_mac_tools``), each
+notarization taking 2-8 seconds. ``phased`` runs each step for every app
+before the next, as ``notarize_behavior`` used to; ``pipelined`` uses
+``NotarizationPipeline``. Both poll every 0.5s through a
+``NotarizationPoller``.
+
+Run with ``ISCRIPT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+
+import asyncio
+import random
+import time
+
+import pytest
+from conftest import skip_unless_benchmark
+from test_mac import fake_mac_tools, make_app_tarballs, pipeline_configs
+
+import iscript.mac as mac
+
+NUM_APPS = 8
+POLL_SLEEP_TIME = 0.5
+LATENCY = {"codesign": 0.02, "pkgbuild": 0.5, "productbuild": 0.3, "productsign": 0.2, "xcrun": 0.1}
+
+
+async def run_phased(config, sign_config, all_paths):
+    """How notarize_behavior ran the multi_account workflow."""
+    timings = {}
+    start = time.monotonic()
+
+    async def phase(name, coro):
+        phase_start = time.monotonic()
+        await coro
+        timings[name] = time.monotonic() - phase_start
+
+    await phase("extract", mac.extract_all_apps(config, all_paths))
+    await phase("sign", mac.sign_all_apps(config, sign_config, None, all_paths, None))
+    await phase("pkg", mac.create_pkg_files(config, sign_config, all_paths))
+    await phase("zip", mac.create_all_notarization_zipfiles(all_paths, path_attrs=["app_path", "pkg_path"]))
+    poll_uuids = {}
+
+    async def submit():
+        poll_uuids.update(await mac.wrap_notarization_with_sudo(config, sign_config, all_paths))
+
+    await phase("submit", submit())
+
+    async def notarize():
+        async with mac.NotarizationPoller(sign_config, sleep_time=POLL_SLEEP_TIME) as poller:
+            await asyncio.gather(*(poller.wait(uuid, log_path) for uuid, log_path in poll_uuids.items()))
+
+    await phase("notarize", notarize())
+    await phase("staple", mac.staple_notarization(all_paths, path_attr="app_path"))
+    await phase("tar", mac.tar_apps(config, all_paths))
+    await phase("staple pkg", mac.staple_notarization(all_paths, path_attr="pkg_path"))
+    await phase("copy pkg", mac.copy_pkgs_to_artifact_dir(config, all_paths))
+    return time.monotonic() - start, timings
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ("phased", "pipelined"))
+async def test_bench_notarize(tmp_path, monkeypatch, mode):
+    rand = random.Random(0)
+    delays = {f"{i}-upload{i}.zip": rand.uniform(2, 8) for i in range(NUM_APPS)}
+    fake_mac_tools(tmp_path, monkeypatch, latency=LATENCY, notarization_delays=delays)
+    config, sign_config = pipeline_configs(tmp_path)
+    all_paths = make_app_tarballs(tmp_path, NUM_APPS, files=[f"Contents/MacOS/lib{i}.dylib" for i in range(40)])
+
+    if mode == "phased":
+        elapsed, timings = await run_phased(config, sign_config, all_paths)
+    else:
+        pipeline = mac.NotarizationPipeline(config, sign_config, poll_sleep_time=POLL_SLEEP_TIME)
+        start = time.monotonic()
+        await pipeline.run(all_paths)
+        elapsed = time.monotonic() - start
+        timings = {}
+        for app_timings in pipeline.timings.values():
+            for name, seconds in app_timings.items():
+                timings[name] = max(timings.get(name, 0), seconds)
+
+    print(f"\n{mode:>9}: {NUM_APPS} apps in {elapsed:.1f}s (slowest notarization {max(delays.values()):.1f}s)")
+    print("    " + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in timings.items()))
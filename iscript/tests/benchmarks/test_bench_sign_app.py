@@ -0,0 +1,66 @@
+"""Benchmark ``sign_app`` on a large bundle with a fake ``codesign``.
+
+The bundle has 1000 files to sign, across the app, frameworks and nested
+apps. ``codesign`` and ``xattr`` are shell scripts on the ``PATH``;
+``codesign`` sleeps for ``ISCRIPT_BENCHMARK_CODESIGN_LATENCY`` seconds
+(default 0.02), so this runs on Linux. ``codesign_concurrency=1`` signs one
+file at a time, as ``sign_app`` used to.
+
+Run with ``ISCRIPT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+
+import os
+import time
+
+import pytest
+from conftest import skip_unless_benchmark
+from test_mac import make_bundle
+
+import iscript.mac as mac
+
+LATENCY = float(os.environ.get("ISCRIPT_BENCHMARK_CODESIGN_LATENCY", "0.02"))
+
+
+def make_large_bundle(app_path):
+    """Make a bundle with 1000 files to sign: 500 in the app, 300 in 30 frameworks, and 200 in 4 nested apps."""
+    files = ["Contents/MacOS/firefox"]
+    files += [f"Contents/MacOS/lib{i}.dylib" for i in range(500)]
+    files += [f"Contents/Frameworks/F{i}.framework/Versions/A/lib{j}.dylib" for i in range(30) for j in range(9)]
+    make_bundle(app_path, "firefox", files)
+    for i in range(4):
+        helper = f"Contents/MacOS/helper{i}.app"
+        make_bundle(os.path.join(app_path, helper), "helper", ["Contents/MacOS/helper"] + [f"Contents/MacOS/lib{j}.dylib" for j in range(49)])
+
+
+def fake_tools(bin_dir):
+    bin_dir.mkdir()
+    for name, body in (("codesign", f"sleep {LATENCY}"), ("xattr", "")):
+        path = bin_dir / name
+        path.write_text(f"#!/bin/sh\n{body}\n")
+        path.chmod(0o755)
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("concurrency", (1, 4, 8, 16))
+async def test_bench_sign_app(tmp_path, monkeypatch, concurrency):
+    fake_tools(tmp_path / "bin")
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}")
+    app_path = str(tmp_path / "Firefox.app")
+    make_large_bundle(app_path)
+    sign_config = {
+        "identity": "id",
+        "signing_keychain": "keychain",
+        "designated_requirements": "",
+        "sign_dirs": ("MacOS", "Library", "Frameworks"),
+        "skip_dirs": (),
+        "codesign_concurrency": concurrency,
+    }
+    levels = mac._get_sign_levels(mac._get_sign_tree(sign_config, app_path, None))
+
+    start = time.monotonic()
+    await mac.sign_app(sign_config, app_path, None)
+    elapsed = time.monotonic() - start
+
+    calls = sum(len(level) for level in levels) + 1
+    print(f"\nconcurrency={concurrency:>2}: {calls} codesign calls in {len(levels) + 1} levels in {elapsed:.2f}s, {calls / elapsed:.0f} calls/s")
@@ -0,0 +1,98 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+import aiohttp.web
+import mohawk
+import pytest
+
+AUTOGRAPH_CREDENTIALS = {"widevine_user": "widevine_pass", "langpack_user": "langpack_pass"}
+
+
+@asynccontextmanager
+async def fake_autograph(latency=0, statuses=None):
+    """Serve a fake Autograph on localhost.
+
+    It checks the Hawk signature of every request, waits ``latency`` seconds,
+    and "signs" by echoing the input back. Each of ``statuses`` is returned
+    instead, by one request in turn.
+
+    Yields:
+        tuple: the url, and a dict counting the ``requests``, ``connections``
+            and ``peak_in_flight`` requests.
+
+    """
+    statuses = list(statuses or [])
+    stats = {"requests": 0, "in_flight": 0, "peak_in_flight": 0, "connections": set()}
+
+    async def sign(request):
+        body = await request.read()
+        mohawk.Receiver(
+            lambda user: {"id": user, "key": AUTOGRAPH_CREDENTIALS[user], "algorithm": "sha256"},
+            request.headers["Authorization"],
+            str(request.url),
+            request.method,
+            content=io.BytesIO(body),
+            content_type=request.headers["Content-Type"],
+        )
+        stats["requests"] += 1
+        stats["connections"].add(request.transport.get_extra_info("peername"))
+        stats["in_flight"] += 1
+        stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            stats["in_flight"] -= 1
+        if statuses:
+            return aiohttp.web.Response(status=statuses.pop(0), text="error")
+        key = "signed_file" if request.match_info["method"] == "file" else "signature"
+        response = [{key: base64.b64encode(base64.b64decode(req["input"])).decode("ascii")} for req in json.loads(body)]
+        return aiohttp.web.json_response(response)
+
+    app = aiohttp.web.Application()
+    app.router.add_post("/{prefix:.*}sign/{method}", sign)
+    runner = aiohttp.web.AppRunner(app)
+    await runner.setup()
+    site = aiohttp.web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield "http://127.0.0.1:{}".format(port), stats
+    finally:
+        await runner.cleanup()
+
+
+@contextmanager
+def fake_autograph_thread(**kwargs):
+    """Run ``fake_autograph`` on its own event loop, so blocking clients can reach it."""
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    stop = None
+    result = {}
+
+    async def serve():
+        nonlocal stop
+        stop = asyncio.Event()
+        async with fake_autograph(**kwargs) as (url, stats):
+            result.update(url=url, stats=stats)
+            started.set()
+            await stop.wait()
+
+    thread = threading.Thread(target=loop.run_until_complete, args=(serve(),))
+    thread.start()
+    started.wait()
+    try:
+        yield result["url"], result["stats"]
+    finally:
+        loop.call_soon_threadsafe(stop.set)
+        thread.join()
+        loop.close()
+
+
+def skip_unless_benchmark(function):
+    """Skip a benchmark unless ``ISCRIPT_BENCHMARK`` is set."""
+    return pytest.mark.skipif(os.environ.get("ISCRIPT_BENCHMARK", "false").lower() not in ("1", "true", "yes"), reason="Benchmarks are skipped")(function)
@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import os
 import os.path
@@ -5,7 +6,10 @@ import shutil
 from contextlib import contextmanager
 from hashlib import sha256
 
+import aiohttp
 import pytest
+from conftest import fake_autograph
+from scriptworker_client.aio import SessionManager
 from scriptworker_client.utils import makedirs
 
 import iscript.autograph as autograph
@@ -42,52 +46,79 @@ def noop_sync(*args, **kwargs): ...
 
 # sign_file_with_autograph {{{1
 @pytest.mark.asyncio
-@pytest.mark.parametrize("to,expected,format,options", ((None, "from", "autograph_widevine", None), ("to", "to", "autograph_widevine", None)))
-async def test_sign_file_with_autograph(sign_config, mocker, to, expected, format, options):
-    open_mock = mocker.mock_open(read_data=b"0xdeadbeef")
-    mocker.patch("builtins.open", open_mock, create=True)
-
-    session_mock = mocker.MagicMock()
-    session_mock.post.return_value.json.return_value = [{"signed_file": "bW96aWxsYQ=="}]
-
-    Session_mock = mocker.Mock()
-    Session_mock.return_value.__enter__ = mocker.Mock(return_value=session_mock)
-    Session_mock.return_value.__exit__ = mocker.Mock()
-    mocker.patch("iscript.autograph.requests.Session", Session_mock, create=True)
-
-    assert await autograph.sign_file_with_autograph(sign_config, "from", format, to=to) == expected
-    open_mock.assert_called()
-    kwargs = {"input": "MHhkZWFkYmVlZg=="}
-    if options:
-        kwargs["options"] = options
-    session_mock.post.assert_called_with("https://autograph-hsm.dev.mozaws.net/sign/file", auth=mocker.ANY, json=[kwargs])
+@pytest.mark.parametrize("to,expected", ((None, "from"), ("to", "to")))
+async def test_sign_file_with_autograph(sign_config, tmp_path, to, expected):
+    from_ = tmp_path / "from"
+    from_.write_bytes(b"0xdeadbeef")
+    to = to and str(tmp_path / to)
+    async with fake_autograph() as (url, stats):
+        sign_config["widevine_url"] = url
+        assert await autograph.sign_file_with_autograph(sign_config, str(from_), "autograph_widevine", to=to) == str(tmp_path / expected)
+    assert (tmp_path / expected).read_bytes() == b"0xdeadbeef"
+    assert stats["requests"] == 1
 
 
 @pytest.mark.asyncio
-@pytest.mark.parametrize("to,expected", ((None, "from"), ("to", "to")))
-async def test_sign_file_with_autograph_raises_http_error(sign_config, mocker, to, expected):
-    open_mock = mocker.mock_open(read_data=b"0xdeadbeef")
-    mocker.patch("builtins.open", open_mock, create=True)
+async def test_sign_file_with_autograph_shares_connections(sign_config, tmp_path):
+    """Concurrent calls in a SessionManager reuse its connections, up to its per-host limit."""
+    from_ = tmp_path / "from"
+    from_.write_bytes(b"0xdeadbeef")
+    async with fake_autograph(latency=0.05) as (url, stats):
+        sign_config["langpack_url"] = url + "/langpack"
+        async with SessionManager(limit_per_host=2):
+            await asyncio.gather(
+                *(autograph.sign_file_with_autograph(sign_config, str(from_), "autograph_langpack", to=str(tmp_path / f"to{i}")) for i in range(6))
+            )
+    assert stats["requests"] == 6
+    assert stats["peak_in_flight"] == 2
+    assert len(stats["connections"]) == 2
 
-    session_mock = mocker.MagicMock()
-    post_mock_response = session_mock.post.return_value
-    post_mock_response.raise_for_status.side_effect = autograph.requests.exceptions.RequestException
-    post_mock_response.json.return_value = [{"signed_file": "bW96aWxsYQ=="}]
 
-    @contextmanager
-    def session_context():
-        yield session_mock
+@pytest.mark.asyncio
+async def test_sign_file_with_autograph_retries(sign_config, tmp_path, mocker):
+    mocker.patch.object(asyncio, "sleep", new=noop_async)
+    from_ = tmp_path / "from"
+    from_.write_bytes(b"0xdeadbeef")
+    async with fake_autograph(statuses=[503, 503]) as (url, stats):
+        sign_config["widevine_url"] = url
+        await autograph.sign_file_with_autograph(sign_config, str(from_), "autograph_widevine")
+    assert stats["requests"] == 3
 
-    mocker.patch("iscript.autograph.requests.Session", session_context)
 
-    async def fake_retry_async(func, args=(), attempts=5, sleeptime_kwargs=None):
-        await func(*args)
+@pytest.mark.asyncio
+async def test_sign_file_with_autograph_raises_http_error(sign_config, tmp_path, mocker):
+    mocker.patch.object(asyncio, "sleep", new=noop_async)
+    from_ = tmp_path / "from"
+    from_.write_bytes(b"0xdeadbeef")
+    to = tmp_path / "to"
+    to.write_bytes(b"previous")
+    async with fake_autograph(statuses=[500, 500, 500]) as (url, stats):
+        sign_config["widevine_url"] = url
+        with pytest.raises(aiohttp.ClientResponseError):
+            await autograph.sign_file_with_autograph(sign_config, str(from_), "autograph_widevine", to=str(to))
+    assert stats["requests"] == 3
+    assert to.read_bytes() == b"previous"
+
+
+def test_write_file_atomically(tmp_path, mocker):
+    path = tmp_path / "signed"
+    path.write_bytes(b"previous")
+    autograph._write_file_atomically(str(path), b"signed")
+    assert path.read_bytes() == b"signed"
+
+    mocker.patch.object(autograph.os, "replace", side_effect=OSError("disk full"))
+    with pytest.raises(OSError):
+        autograph._write_file_atomically(str(path), b"truncat")
+    assert path.read_bytes() == b"signed"
+    assert os.listdir(tmp_path) == ["signed"]
 
-    mocker.patch.object(autograph, "retry_async", new=fake_retry_async)
 
-    with pytest.raises(autograph.requests.exceptions.RequestException):
-        await autograph.sign_file_with_autograph(sign_config, "from", "autograph_widevine", to=to)
-    open_mock.assert_called()
+@pytest.mark.asyncio
+async def test_call_autograph_bad_credentials(sign_config, tmp_path):
+    async with fake_autograph() as (url, stats):
+        with pytest.raises(aiohttp.ClientResponseError):
+            await autograph.call_autograph(url + "/sign/file", "widevine_user", "wrong_pass", [{"input": ""}])
+    assert stats["requests"] == 0
 
 
 # sign_widevine_dir {{{1
@@ -443,3 +474,24 @@ async def test_langpack_sign_wrong_format(sign_config, mocker, tmp_path):
     with pytest.raises(IScriptError):
         await autograph.sign_langpacks(config, sign_config, [langpack_app])
     assert not mock_ever_called[0]
+
+
+@pytest.mark.asyncio
+async def test_langpack_sign_concurrently(sign_config, tmp_path):
+    """Langpacks are signed in parallel, up to ``langpack_concurrency`` at once."""
+    work_dir = tmp_path / "work" / "public" / "build"
+    makedirs(work_dir)
+    apps = []
+    for i in range(6):
+        path = work_dir / f"en-CA{i}.xpi"
+        shutil.copyfile(os.path.join(TEST_DATA_DIR, "en-CA.xpi"), path)
+        apps.append(App(orig_path=str(path), formats=["autograph_langpack"], artifact_prefix="public/"))
+    config = {"artifact_dir": str(tmp_path / "artifacts"), "langpack_concurrency": 2}
+    async with fake_autograph(latency=0.05) as (url, stats):
+        sign_config["langpack_url"] = url + "/langpack"
+        await autograph.sign_langpacks(config, sign_config, apps)
+    assert stats["requests"] == 6
+    assert stats["peak_in_flight"] == 2
+    for i, app in enumerate(apps):
+        assert app.target_bundle_path == str(tmp_path / "artifacts" / "public" / "build" / f"en-CA{i}.xpi")
+        assert open(app.target_bundle_path, "rb").read() == open(app.orig_path, "rb").read()
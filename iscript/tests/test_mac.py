@@ -3,8 +3,12 @@
 """Test iscript.mac
 """
 import asyncio
+import json
 import os
 import plistlib
+import sys
+import tarfile
+import time
 from functools import partial
 from shutil import copy2
 
@@ -191,6 +195,94 @@ async def test_sign_app(mocker, tmpdir, sign_with_entitlements, has_clearkey, sk
     await mac.sign_app(sign_config, app_path, entitlements_path, "test")
 
 
+def make_bundle(app_path, executable, files):
+    """Create an app bundle with an Info.plist, and an empty file at each relative path in ``files``."""
+    makedirs(os.path.join(app_path, "Contents"))
+    with open(os.path.join(app_path, "Contents", "Info.plist"), "wb") as fh:
+        plistlib.dump({"CFBundleExecutable": executable}, fh)
+    for path in files:
+        touch(os.path.join(app_path, path))
+
+
+@pytest.mark.asyncio
+async def test_sign_app_inside_out(mocker, tmpdir):
+    """``sign_app`` signs each file, framework and nested app once, after
+    everything inside it, and signs the same level in parallel."""
+    sign_config = {
+        "identity": "id",
+        "signing_keychain": "keychain",
+        "designated_requirements": "",
+        "sign_dirs": ("MacOS", "Library", "Frameworks"),
+        "skip_dirs": ("skipme",),
+        "codesign_concurrency": 2,
+    }
+    app_path = os.path.join(tmpdir, "foo.app")
+    make_bundle(
+        app_path,
+        "foo",
+        (
+            "Contents/MacOS/foo",
+            "Contents/MacOS/libxul.dylib",
+            "Contents/MacOS/libmozglue.dylib",
+            "Contents/MacOS/skipme/libskipped.dylib",
+            "Contents/Frameworks/Bar.framework/Versions/A/Bar",
+            "Contents/Frameworks/Bar.framework/Versions/A/Frameworks/Baz.framework/Baz",
+            "Contents/Resources/gmp-clearkey/0.1/libclearkey.dylib",
+            "Contents/Resources/omni.ja",
+        ),
+    )
+    make_bundle(
+        os.path.join(app_path, "Contents/MacOS/plugin-container.app"),
+        "plugin-container",
+        ("Contents/MacOS/plugin-container", "Contents/MacOS/libhelper.dylib", "Contents/Resources/ignored"),
+    )
+    make_bundle(
+        os.path.join(app_path, "Contents/Library/LaunchServices/updater.app"),
+        "updater",
+        ("Contents/MacOS/updater", "Contents/Frameworks/Up.framework/Up"),
+    )
+    calls = []
+    in_flight = [0, 0]
+
+    async def fake_run_command(cmd, cwd, **kwargs):
+        if cmd[0] != "codesign":
+            return
+        path = os.path.relpath(os.path.join(cwd, cmd[-1]), tmpdir)
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        start = len(calls)
+        await asyncio.sleep(0.01)
+        in_flight[0] -= 1
+        calls.append((path, start))
+
+    mocker.patch.object(mac, "run_command", new=fake_run_command)
+    await mac.sign_app(sign_config, app_path, os.path.join(tmpdir, "entitlements"))
+
+    signed = [path for path, _ in calls]
+    assert sorted(signed) == sorted(
+        [
+            "foo.app/Contents/MacOS/libxul.dylib",
+            "foo.app/Contents/MacOS/libmozglue.dylib",
+            "foo.app/Contents/MacOS/plugin-container.app/Contents/MacOS/libhelper.dylib",
+            "foo.app/Contents/MacOS/plugin-container.app",
+            "foo.app/Contents/Frameworks/Bar.framework/Versions/A/Bar",
+            "foo.app/Contents/Frameworks/Bar.framework/Versions/A/Frameworks/Baz.framework/Baz",
+            "foo.app/Contents/Frameworks/Bar.framework/Versions/A/Frameworks/Baz.framework",
+            "foo.app/Contents/Frameworks/Bar.framework",
+            "foo.app/Contents/Library/LaunchServices/updater.app/Contents/Frameworks/Up.framework/Up",
+            "foo.app/Contents/Library/LaunchServices/updater.app/Contents/Frameworks/Up.framework",
+            "foo.app/Contents/Library/LaunchServices/updater.app",
+            "foo.app/Contents/Resources/gmp-clearkey/0.1/libclearkey.dylib",
+            "foo.app",
+        ]
+    )
+    # Everything inside a bundle finished before the bundle was started
+    for path, start in calls:
+        assert all(index < start for index, (inner, _) in enumerate(calls) if inner.startswith(path + "/"))
+    assert signed[-1] == "foo.app"
+    assert in_flight[1] == 2
+
+
 # verify_app_signature {{{1
 @pytest.mark.asyncio
 async def test_verify_app_signature_noop(mocker):
@@ -619,23 +711,20 @@ async def test_notarize_no_sudo(mocker, tmpdir, raises):
         assert await mac.notarize_no_sudo(work_dir, sign_config, zip_path) == expected
 
 
-# poll_notarization_uuid {{{1
+# get_notarization_status {{{1
 @pytest.mark.parametrize(
-    "statuses, exception",
+    "status, exception",
     (
-        (["success"], None),
-        ([None, "success"], None),
-        ([None], IScriptError),
-        (["invalid"], InvalidNotarization),
-        ([None, None, None, None, None, None, None, None, None, None, None], TimeoutError),
+        ("success", None),
+        ("invalid", None),
+        (None, None),
+        (None, IScriptError),
     ),
 )
 @pytest.mark.asyncio
-async def test_poll_notarization_uuid(mocker, tmpdir, statuses, exception):
-    """``poll_notarization_uuid``: returns ``None`` on success; raises a
-    ``TimeoutError`` on timeout; raises ``IScriptError`` on failure; and raises
-    ``InvalidNotarization`` on ``invalid`` status from Apple. Also, it doesn't
-    log passwords.
+async def test_get_notarization_status(mocker, status, exception):
+    """``get_notarization_status`` returns the status from the log; raises
+    ``IScriptError`` on failure. Also, it doesn't log passwords.
 
     """
     pw = "test_apple_password"
@@ -643,8 +732,10 @@ async def test_poll_notarization_uuid(mocker, tmpdir, statuses, exception):
     async def fake_retry_async(_, args, kwargs, **kw):
         cmd = args[0]
         end = len(cmd) - 1
-        assert cmd[0] == "xcrun"
+        assert cmd[0:3] == ["xcrun", "altool", "--notarization-info"]
+        assert cmd[3] == "uuid"
         log_cmd = kwargs["log_cmd"]
+        assert kwargs["log_path"] == "/dev/null"
         assert cmd[0:end] == log_cmd[0:end]
         assert cmd[end] != log_cmd[end]
         assert cmd[end] == pw
@@ -652,17 +743,13 @@ async def test_poll_notarization_uuid(mocker, tmpdir, statuses, exception):
         if exception is IScriptError:
             raise IScriptError("foo")
 
-    def fake_get_notarization_status_from_log(path):
-        status = statuses.pop(0)
-        return status
-
     mocker.patch.object(mac, "retry_async", new=fake_retry_async)
-    mocker.patch.object(mac, "get_notarization_status_from_log", new=fake_get_notarization_status_from_log)
+    mocker.patch.object(mac, "get_notarization_status_from_log", return_value=status)
     if exception:
         with pytest.raises(exception):
-            await mac.poll_notarization_uuid("uuid", "user", pw, 0.5, "/dev/null", sleep_time=0.1)
+            await mac.get_notarization_status("uuid", "user", pw, "/dev/null")
     else:
-        assert await mac.poll_notarization_uuid("uuid", "user", pw, 1, "/dev/null", sleep_time=0.1) is None
+        assert await mac.get_notarization_status("uuid", "user", pw, "/dev/null") == status
 
 
 # poll_all_notarization_status {{{1
@@ -671,8 +758,8 @@ async def test_poll_notarization_uuid(mocker, tmpdir, statuses, exception):
 )
 @pytest.mark.asyncio
 async def test_poll_all_notarization_status(mocker, tmpdir, poll_uuids, raises):
-    """```poll_all_notarization_status`` concurrently runs a number of
-    ``poll_notarization_uuid`` calls, and raises if any of those calls raise.
+    """```poll_all_notarization_status`` waits for every uuid through one
+    ``NotarizationPoller``, and raises if any of those waits raise.
 
     """
 
@@ -689,8 +776,12 @@ async def test_poll_all_notarization_status(mocker, tmpdir, poll_uuids, raises):
         "notarization_poll_timeout": 1,
     }
 
+    async def fake_get_notarization_status(uuid, username, password, log_path):
+        assert log_path == poll_uuids[uuid]
+        return "success"
+
     mocker.patch.object(mac, "raise_future_exceptions", new=fake_raise_future_exceptions)
-    mocker.patch.object(mac, "poll_notarization_uuid", new=noop_async)
+    mocker.patch.object(mac, "get_notarization_status", new=fake_get_notarization_status)
     if raises:
         with pytest.raises(IScriptError):
             await mac.poll_all_notarization_status(sign_config, poll_uuids)
@@ -699,6 +790,105 @@ async def test_poll_all_notarization_status(mocker, tmpdir, poll_uuids, raises):
         assert await mac.poll_all_notarization_status(sign_config, poll_uuids) is None
 
 
+# NotarizationPoller {{{1
+@pytest.mark.asyncio
+async def test_notarization_poller(mocker):
+    """``NotarizationPoller`` checks every pending uuid, including ones added
+    while it's polling, and shares and caches results between waiters."""
+    statuses = {"fast": [None, "success"], "slow": [None, None, None, "success"], "bad": ["invalid"]}
+    checks = []
+
+    async def fake_get_notarization_status(uuid, username, password, log_path):
+        assert (username, password) == ("user", "pw")
+        checks.append(uuid)
+        return statuses[uuid].pop(0)
+
+    mocker.patch.object(mac, "get_notarization_status", new=fake_get_notarization_status)
+    sign_config = {"apple_notarization_account": "user", "apple_notarization_password": "pw", "notarization_poll_timeout": 60}
+    async with mac.NotarizationPoller(sign_config, sleep_time=0.01) as poller:
+        slow = asyncio.ensure_future(poller.wait("slow", "slow.log"))
+        await asyncio.sleep(0)
+        await asyncio.gather(poller.wait("fast", "fast.log"), poller.wait("fast", "fast.log"))
+        with pytest.raises(InvalidNotarization):
+            await poller.wait("bad", "bad.log")
+        await slow
+        assert not poller.pending
+        # Finished uuids are cached
+        await poller.wait("fast", "fast.log")
+        with pytest.raises(InvalidNotarization):
+            await poller.wait("bad", "bad.log")
+    assert checks.count("fast") == 2
+    assert checks.count("slow") == 4
+    assert checks.count("bad") == 1
+
+
+@pytest.mark.asyncio
+async def test_notarization_poller_errors(mocker):
+    async def fake_get_notarization_status(uuid, *args):
+        if uuid == "broken":
+            raise IScriptError("altool failed")
+
+    mocker.patch.object(mac, "get_notarization_status", new=fake_get_notarization_status)
+    sign_config = {"apple_notarization_account": "user", "apple_notarization_password": "pw", "notarization_poll_timeout": -1}
+    async with mac.NotarizationPoller(sign_config, sleep_time=0.01) as poller:
+        with pytest.raises(IScriptError, match="altool failed"):
+            await poller.wait("broken", "broken.log")
+        with pytest.raises(TimeoutError):
+            await poller.wait("in-progress", "in-progress.log")
+
+
+@pytest.mark.asyncio
+async def test_notarization_poller_backoff(mocker):
+    """Checks of a uuid get further apart, up to ``max_sleep_time``."""
+    checks = []
+
+    async def fake_get_notarization_status(uuid, *args):
+        checks.append(time.monotonic())
+        return "success" if len(checks) == 8 else None
+
+    mocker.patch.object(mac, "get_notarization_status", new=fake_get_notarization_status)
+    sign_config = {"apple_notarization_account": "user", "apple_notarization_password": "pw", "notarization_poll_timeout": 60}
+    async with mac.NotarizationPoller(sign_config, sleep_time=0.02, max_sleep_time=0.1) as poller:
+        await poller.wait("uuid", "uuid.log")
+    intervals = [b - a for a, b in zip(checks, checks[1:])]
+    assert intervals[0] < 0.05
+    assert intervals[-1] > 0.06
+    assert poller.durations == [pytest.approx(checks[-1] - checks[0], abs=0.05)]
+
+
+def test_notarization_poller_intervals(mocker):
+    """Checks tighten towards the expected finish, are every ``sleep_time``
+    while it's expected, then back off again."""
+    mocker.patch.object(mac.random, "uniform", return_value=1)
+    sign_config = {
+        "apple_notarization_account": "user",
+        "apple_notarization_password": "pw",
+        "notarization_poll_timeout": 900,
+        "notarization_expected_time": 300,
+    }
+    poller = mac.NotarizationPoller(sign_config, sleep_time=10, max_sleep_time=60)
+    pending = mac.PendingNotarization(log_path="log", start=0, timeout_time=900, interval=60, next_check=0)
+    assert poller._get_interval(pending, 100) == 60
+    assert poller._get_interval(pending, 250) == 25
+    assert poller._get_interval(pending, 295) == 10
+    assert not pending.due
+    assert poller._get_interval(pending, 301) == 10
+    assert pending.due
+    pending.interval = 15
+    assert poller._get_interval(pending, 311) == 15
+    # Once some have succeeded, they set the expected times
+    poller.durations = [100, 120, 200]
+    assert poller.expected_times == (100, 200)
+    pending = mac.PendingNotarization(log_path="log", start=0, timeout_time=900, interval=60, next_check=0)
+    assert poller._get_interval(pending, 40) == 30
+    pending.interval = 40
+    assert poller._get_interval(pending, 150) == 10
+    pending.interval = 40
+    assert poller._get_interval(pending, 190) == 10
+    pending.interval = 40
+    assert poller._get_interval(pending, 210) == 40
+
+
 # staple_notarization {{{1
 @pytest.mark.parametrize("raises", (True, False))
 @pytest.mark.asyncio
@@ -1067,6 +1257,177 @@ async def test_sign_and_pkg_behavior(mocker, tmpdir, use_langpack):
     await mac.sign_and_pkg_behavior(config, task)
 
 
+# NotarizationPipeline {{{1
+# Stands in for the mac signing and notarization tools, logging each call as
+# a JSON line. A notarization succeeds once its zip's delay in
+# FAKE_NOTARIZATION_DELAYS has passed.
+FAKE_MAC_TOOL = """\
+#!{python}
+import json
+import os
+import sys
+import time
+import uuid
+
+state_dir = os.environ["FAKE_MAC_TOOLS_DIR"]
+tool, args = os.path.basename(sys.argv[0]), sys.argv[1:]
+with open(os.path.join(state_dir, "calls.log"), "a") as fh:
+    fh.write(json.dumps([time.time(), tool] + args) + "\\n")
+if tool == "sudo":
+    # sudo su <account> -c <command>
+    os.execvp("sh", ["sh", "-c", args[3]])
+time.sleep(json.loads(os.environ.get("FAKE_MAC_TOOLS_LATENCY", "{{}}")).get(tool, 0))
+if args[:2] == ["altool", "--notarize-app"]:
+    request_uuid = str(uuid.uuid4())
+    with open(os.path.join(state_dir, request_uuid), "w") as fh:
+        json.dump([os.path.basename(args[3]), time.time()], fh)
+    print(f"RequestUUID = {{request_uuid}}")
+elif args[:2] == ["altool", "--notarization-info"]:
+    with open(os.path.join(state_dir, args[2])) as fh:
+        zip_name, submitted = json.load(fh)
+    delay = json.loads(os.environ.get("FAKE_NOTARIZATION_DELAYS", "{{}}")).get(zip_name, 0)
+    print("Status: success" if time.time() - submitted >= delay else "Status: in progress")
+elif tool in ("pkgbuild", "productbuild", "productsign"):
+    open(args[-1], "w").close()
+"""
+FAKE_MAC_TOOLS = ("codesign", "xattr", "security", "sudo", "xcrun", "pkgbuild", "productbuild", "productsign")
+
+
+def fake_mac_tools(tmp_path, monkeypatch, latency=None, notarization_delays=None):
+    """Put fake mac signing tools on the PATH.
+
+    Args:
+        latency (dict, optional): the seconds each tool takes, by name
+        notarization_delays (dict, optional): the seconds each notarization
+            takes, by zip file name
+
+    Returns:
+        str: the path to the JSON lines log of the tool calls
+
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    state_dir = tmp_path / "fake_mac_tools"
+    state_dir.mkdir()
+    for name in FAKE_MAC_TOOLS:
+        path = bin_dir / name
+        path.write_text(FAKE_MAC_TOOL.format(python=sys.executable))
+        path.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_MAC_TOOLS_DIR", str(state_dir))
+    monkeypatch.setenv("FAKE_MAC_TOOLS_LATENCY", json.dumps(latency or {}))
+    monkeypatch.setenv("FAKE_NOTARIZATION_DELAYS", json.dumps(notarization_delays or {}))
+    return str(state_dir / "calls.log")
+
+
+def make_app_tarballs(tmp_path, count, files=("Contents/MacOS/libxul.dylib",)):
+    """Create ``count`` tarballs of an app, and their ``App`` objects."""
+    all_paths = []
+    for i in range(count):
+        build_dir = tmp_path / "build" / str(i)
+        make_bundle(str(build_dir / "Firefox.app"), "firefox", ("Contents/MacOS/firefox",) + tuple(files))
+        orig_path = tmp_path / "cot" / "task1" / "public" / "build" / str(i) / "target.tar.gz"
+        makedirs(orig_path.parent)
+        with tarfile.open(orig_path, "w:gz") as tar:
+            tar.add(build_dir / "Firefox.app", arcname="Firefox.app")
+        all_paths.append(mac.App(orig_path=str(orig_path), formats=["macapp"], artifact_prefix="public/"))
+    return all_paths
+
+
+def pipeline_configs(tmp_path):
+    config = {
+        "work_dir": str(tmp_path / "work"),
+        "artifact_dir": str(tmp_path / "artifacts"),
+        "local_notarization_accounts": ["acct0", "acct1"],
+        "default_keychains": [],
+    }
+    sign_config = {
+        "identity": "id",
+        "signing_keychain": "keychain",
+        "keychain_password": "keychain_password",
+        "designated_requirements": "",
+        "sign_dirs": ("MacOS", "Library", "Frameworks"),
+        "skip_dirs": (),
+        "base_bundle_id": "org.test",
+        "pkg_cert_id": "cert_id",
+        "apple_notarization_account": "apple_account",
+        "apple_notarization_password": "apple_password",
+        "apple_asc_provider": "apple_asc_provider",
+        "notarization_poll_timeout": 60,
+        "create_pkg": True,
+    }
+    return config, sign_config
+
+
+def read_calls(log_path):
+    with open(log_path) as fh:
+        return [json.loads(line) for line in fh]
+
+
+@pytest.mark.asyncio
+async def test_notarization_pipeline(tmp_path, monkeypatch):
+    """Each app is notarized, stapled and packaged as soon as it's ready."""
+    log_path = fake_mac_tools(tmp_path, monkeypatch, notarization_delays={"0-upload0.zip": 2.5})
+    config, sign_config = pipeline_configs(tmp_path)
+    all_paths = make_app_tarballs(tmp_path, 3)
+    pipeline = mac.NotarizationPipeline(config, sign_config, poll_sleep_time=0.1)
+    await pipeline.run(all_paths)
+
+    for i in range(3):
+        with tarfile.open(tmp_path / "artifacts" / "public" / "build" / str(i) / "target.tar.gz") as tar:
+            assert "Firefox.app/Contents/MacOS/libxul.dylib" in tar.getnames()
+        assert (tmp_path / "artifacts" / "public" / "build" / str(i) / "target.pkg").exists()
+    for app in all_paths:
+        assert list(pipeline.timings[app.orig_path]) == ["extract", "sign", "pkg", "zip", "submit", "notarize", "staple", "tar"]
+    assert pipeline.timings[all_paths[0].orig_path]["notarize"] > 2
+
+    calls = read_calls(log_path)
+    staples = [timestamp for timestamp, tool, *args in calls if tool == "xcrun" and args[0] == "stapler"]
+    assert len(staples) == 6
+    # The quick apps were stapled while the slow one was still being notarized
+    last_status_check = max(timestamp for timestamp, tool, *args in calls if tool == "xcrun" and args[1] == "--notarization-info")
+    assert len([timestamp for timestamp in staples if timestamp < last_status_check]) == 4
+    # Each of the 2 accounts submitted 1 app at a time
+    accounts = [args[1] for _, tool, *args in calls if tool == "sudo"]
+    assert len(accounts) == 3
+    assert set(accounts) == {"acct0", "acct1"}
+
+
+@pytest.mark.asyncio
+async def test_notarization_pipeline_phase_limits(tmp_path, monkeypatch):
+    fake_mac_tools(tmp_path, monkeypatch)
+    config, sign_config = pipeline_configs(tmp_path)
+    config["pipeline_concurrency"] = {"sign": 1}
+    sign_config["create_pkg"] = False
+    all_paths = make_app_tarballs(tmp_path, 3)
+    signing = [0, 0]
+    sign_app = mac.sign_app
+
+    async def counting_sign_app(*args, **kwargs):
+        signing[0] += 1
+        signing[1] = max(signing)
+        await asyncio.sleep(0.05)
+        await sign_app(*args, **kwargs)
+        signing[0] -= 1
+
+    monkeypatch.setattr(mac, "sign_app", counting_sign_app)
+    pipeline = mac.NotarizationPipeline(config, sign_config, poll_sleep_time=0.1)
+    await pipeline.run(all_paths)
+    assert signing[1] == 1
+    assert "pkg" not in pipeline.timings[all_paths[0].orig_path]
+
+
+@pytest.mark.asyncio
+async def test_notarization_pipeline_invalid(tmp_path, monkeypatch, mocker):
+    fake_mac_tools(tmp_path, monkeypatch)
+    config, sign_config = pipeline_configs(tmp_path)
+    all_paths = make_app_tarballs(tmp_path, 2)
+    mocker.patch.object(mac, "get_notarization_status_from_log", return_value="invalid")
+    with pytest.raises(InvalidNotarization):
+        await mac.NotarizationPipeline(config, sign_config, poll_sleep_time=0.1).run(all_paths)
+    assert not (tmp_path / "artifacts" / "public" / "build" / "0" / "target.tar.gz").exists()
+
+
 # notarize_behavior {{{1
 @pytest.mark.parametrize("notarize_type,use_langpack,create_pkg", zip(("multi_account", "single_account", "single_zip"), (False, True), (False, True)))
 @pytest.mark.asyncio
@@ -1115,9 +1476,9 @@ async def test_notarize_behavior(mocker, tmpdir, notarize_type, use_langpack, cr
     mocker.patch.object(mac, "run_command", new=noop_async)
     mocker.patch.object(mac, "unlock_keychain", new=noop_async)
     mocker.patch.object(mac, "get_bundle_executable", return_value="bundle_executable")
-    mocker.patch.object(mac, "poll_notarization_uuid", new=noop_async)
     mocker.patch.object(mac, "get_app_dir", return_value=os.path.join(work_dir, "foo/bar.app"))
-    mocker.patch.object(mac, "get_notarization_status_from_log", return_value=None)
+    # Both workflows poll through NotarizationPoller
+    mocker.patch.object(mac, "get_notarization_status_from_log", return_value="success")
     mocker.patch.object(mac, "get_uuid_from_log", return_value="uuid")
     mocker.patch.object(mac, "copy_pkgs_to_artifact_dir", new=noop_async)
     mocker.patch.object(mac, "get_sign_config", return_value=config["mac_config"]["dep"])
@@ -1286,7 +1647,7 @@ async def test_single_file_behavior(mocker, tmpdir, use_langpack, filename, form
             print(f"touch {app.parent_dir}/{filename}")
             print(os.path.exists(os.path.join(app.parent_dir, filename)))
 
-    mocker.patch.object(mac, "poll_notarization_uuid", new=noop_async)
+    mocker.patch.object(mac, "get_notarization_status_from_log", return_value="success")
     mocker.patch.object(mac, "get_uuid_from_log", return_value="uuid")
     mocker.patch.object(mac, "extract_all_apps", new=fake_extract)
     mocker.patch.object(mac, "run_command", new=noop_async)
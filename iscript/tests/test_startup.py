@@ -0,0 +1,86 @@
+"""Check the time importing iscript's entry point takes.
+
+``python -X importtime`` logs how long each module takes to import;
+``import_time_report`` summarizes that per top-level package. The import
+budget is wall-clock time, so like the benchmarks it only runs with
+``ISCRIPT_BENCHMARK=true``; run it with ``pytest -s`` to see the report.
+"""
+
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from conftest import skip_unless_benchmark
+
+# Imported when a task first needs them, not at startup
+DEFERRED_MODULES = ("mohawk", "mozbuild.util", "mozpack.mozjar")
+# What iscript may add to the import time of scriptworker_client and aiohttp,
+# which every task needs. Deferring the modules above cut what importing
+# iscript.script itself takes from ~60ms to ~30ms on a developer machine; this
+# is loose enough for that to vary, and catches new slow imports.
+IMPORT_BUDGET_MS = float(os.environ.get("ISCRIPT_IMPORT_BUDGET_MS", 100))
+RUNS = 3
+
+
+def parse_importtime(stderr):
+    """Parse ``-X importtime`` output into ``(module, self_us, cumulative_us)`` tuples."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def import_times(statement):
+    """Run ``statement`` in a new interpreter, and parse its import times."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True, check=True)
+    return parse_importtime(result.stderr)
+
+
+def total_ms(entries):
+    return sum(self_us for _, self_us, _ in entries) / 1000
+
+
+def import_time_report(entries, top=10):
+    """Summarize import times per top-level package, slowest first."""
+    per_package = defaultdict(int)
+    for name, self_us, _ in entries:
+        per_package[name.split(".")[0]] += self_us
+    lines = [f"{len(entries)} modules imported in {total_ms(entries):.0f}ms"]
+    for package, self_us in sorted(per_package.items(), key=lambda item: -item[1])[:top]:
+        lines.append(f"{self_us / 1000:8.1f}ms {package}")
+    return "\n".join(lines)
+
+
+def test_parse_importtime():
+    stderr = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        120 |   mozpack",
+            "import time:       300 |        300 |     mozbuild.util",
+            "import time:        50 |        470 |   mozpack.mozjar",
+            "some other output",
+        ]
+    )
+    entries = parse_importtime(stderr)
+    assert entries == [("mozpack", 120, 120), ("mozbuild.util", 300, 300), ("mozpack.mozjar", 50, 470)]
+    assert import_time_report(entries) == "3 modules imported in 0ms\n     0.3ms mozbuild\n     0.2ms mozpack"
+
+
+def test_deferred_imports():
+    imported = {name for name, _, _ in import_times("import iscript.script")}
+    assert "iscript.autograph" in imported
+    assert not imported.intersection(DEFERRED_MODULES)
+
+
+@skip_unless_benchmark
+def test_import_budget():
+    baseline = min((import_times("import aiohttp, scriptworker_client.client") for _ in range(RUNS)), key=total_ms)
+    entries = min((import_times("import iscript.script") for _ in range(RUNS)), key=total_ms)
+    report = import_time_report(entries)
+    print(f"\n{report}")
+    extra_ms = total_ms(entries) - total_ms(baseline)
+    assert extra_ms < IMPORT_BUDGET_MS, f"iscript adds {extra_ms:.0f}ms to startup, over the {IMPORT_BUDGET_MS:.0f}ms budget\n{report}"
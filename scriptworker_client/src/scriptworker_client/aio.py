@@ -2,10 +2,12 @@
 """Async helper functions."""
 
 import asyncio
+import contextvars
 import fcntl
 import logging
 import os
 import random
+import re
 import sys
 
 import aiohttp
@@ -16,6 +18,7 @@ else:
     import asyncio as async_timeout
 
 from scriptworker_client.exceptions import Download404, DownloadError, LockfileError, RetryError, TaskError, TimeoutError
+from scriptworker_client.fileio import hash_file
 from scriptworker_client.utils import makedirs, rm
 
 if sys.version_info < (3, 7):  # pragma: no cover
@@ -26,6 +29,14 @@ else:  # pragma: no cover
 
 log = logging.getLogger(__name__)
 
+# The size of the chunks download_file reads and writes
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# download_file won't split a file into ranges smaller than this
+DOWNLOAD_MIN_RANGE_SIZE = 16 * 1024 * 1024
+
+# The SessionManager ``request`` and ``download_file`` use by default
+_current_session_manager = contextvars.ContextVar("session_manager", default=None)
+
 
 # raise_future_exceptions {{{1
 async def raise_future_exceptions(futures, timeout=None):
@@ -319,6 +330,126 @@ async def retry_async(
             await asyncio.sleep(sleep_time)
 
 
+# SessionManager {{{1
+class SessionManager:
+    """Share keep-alive ``aiohttp.ClientSession`` s between requests.
+
+    Every ``aiohttp.ClientSession`` has its own connection pool and DNS cache,
+    so a new session per request means a new TCP connection, DNS lookup and
+    TLS handshake every time. A ``SessionManager`` keeps one session per
+    event loop, and while it's entered with ``async with``, ``request`` and
+    ``download_file`` use it by default::
+
+        async with SessionManager(limit_per_host=20):
+            await request(url1)
+            await download_file(url2, path)
+
+    Args:
+        limit (int, optional): the most open connections. Defaults to 100.
+        limit_per_host (int, optional): the most open connections to the
+            same host. 0 means no limit. Defaults to 10.
+        ttl_dns_cache (int, optional): the seconds to cache DNS lookups.
+            Defaults to 300.
+        keepalive_timeout (float, optional): the seconds to keep an idle
+            connection open. Defaults to 15.
+        timeout (aiohttp.ClientTimeout, optional): the default timeout for
+            the session's requests. If ``None``, use aiohttp's default.
+            ``request`` and ``download_file`` set their own timeouts.
+        **session_kwargs: other kwargs to pass to ``aiohttp.ClientSession``.
+
+    """
+
+    def __init__(self, limit=100, limit_per_host=10, ttl_dns_cache=300, keepalive_timeout=15, timeout=None, **session_kwargs):
+        """Initialize SessionManager."""
+        self.connector_kwargs = {
+            "limit": limit,
+            "limit_per_host": limit_per_host,
+            "ttl_dns_cache": ttl_dns_cache,
+            "keepalive_timeout": keepalive_timeout,
+        }
+        self.session_kwargs = session_kwargs
+        if timeout is not None:
+            self.session_kwargs["timeout"] = timeout
+        self._sessions = {}
+        self._tokens = []
+
+    def get_session(self):
+        """Get the session for the running event loop, creating it if needed.
+
+        Returns:
+            aiohttp.ClientSession: the session.
+
+        """
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(**self.connector_kwargs)
+            session = aiohttp.ClientSession(connector=connector, **self.session_kwargs)
+            self._sessions[loop] = session
+        return session
+
+    async def close(self):
+        """Close the session for the running event loop.
+
+        Sessions for loops that have since closed are dropped too.
+
+        """
+        loop = asyncio.get_running_loop()
+        session = self._sessions.pop(loop, None)
+        self._sessions = {key: value for key, value in self._sessions.items() if not key.is_closed()}
+        if session is not None:
+            await session.close()
+
+    async def __aenter__(self):
+        """Make this the default ``SessionManager``."""
+        self._tokens.append(_current_session_manager.set(self))
+        return self
+
+    async def __aexit__(self, *args):
+        """Close the session and restore the previous default ``SessionManager``."""
+        _current_session_manager.reset(self._tokens.pop())
+        await self.close()
+
+
+def get_session_manager():
+    """Get the ``SessionManager`` that's currently entered, if any.
+
+    Returns:
+        SessionManager: the innermost ``SessionManager`` entered with
+            ``async with``, or ``None``.
+
+    """
+    return _current_session_manager.get()
+
+
+@asynccontextmanager
+async def client_session(session=None):
+    """Yield ``session``, the current ``SessionManager`` session, or a new session.
+
+    Only a new session is closed afterwards, so callers can use this the same
+    way whether or not a ``SessionManager`` is active::
+
+        async with client_session() as session:
+            async with session.get(url) as resp:
+                ...
+
+    Args:
+        session (aiohttp.ClientSession, optional): the session to use, if
+            any. Defaults to ``None``.
+
+    Yields:
+        aiohttp.ClientSession: the session.
+
+    """
+    if session is None and get_session_manager() is not None:
+        session = get_session_manager().get_session()
+    if session is not None:
+        yield session
+        return
+    async with aiohttp.ClientSession() as session:
+        yield session
+
+
 # request {{{1
 async def request(
     url,
@@ -329,6 +460,7 @@ async def request(
     return_type="text",
     num_attempts=1,
     sterilized_url=None,
+    session=None,
     **kwargs,
 ):
     """Async aiohttp request wrapper.
@@ -348,6 +480,9 @@ async def request(
         sterilized_url (str, optional): If set, log using this url instead of
             the real url. This can help avoid logging credentials or tokens.
             If ``None``, log the real url. Defaults to ``None``.
+        session (aiohttp.ClientSession, optional): the session to use. If
+            ``None``, use the current ``SessionManager``'s session, or a new
+            session if there isn't one. Defaults to ``None``.
         **kwargs: the kwargs to send to the aiohttp request function.
 
     Returns:
@@ -361,7 +496,7 @@ async def request(
 
     """
     sterilized_url = sterilized_url or url
-    async with aiohttp.ClientSession() as session:
+    async with client_session(session) as session:
         async with async_timeout.timeout(timeout):
             log.debug("{} {}".format(method.upper(), sterilized_url))
 
@@ -399,40 +534,236 @@ async def _log_download_error(resp, log_url, msg):
         )
 
 
-async def download_file(url, abs_filename, log_url=None, chunk_size=128, timeout=300):
+def _parse_content_range(value):
+    """Parse a ``Content-Range: bytes start-end/total`` header.
+
+    Returns:
+        tuple: ``(start, total)``; ``total`` is ``None`` if it's ``*``.
+
+    Raises:
+        DownloadError: if the header can't be parsed.
+
+    """
+    match = re.match(r"^bytes (\d+)-\d+/(\d+|\*)$", value or "")
+    if not match:
+        raise DownloadError("Can't parse Content-Range {}!".format(value))
+    total = match.group(2)
+    return int(match.group(1)), None if total == "*" else int(total)
+
+
+async def _download_range(session, url, log_url, fh, start, end, chunk_size, timeout, attempts):
+    """Download bytes ``start`` to ``end`` of ``url`` into the same offsets of ``fh``.
+
+    If the connection drops or times out partway, request the rest with an
+    HTTP ``Range`` header, up to ``attempts`` times in a row without
+    progress.
+
+    Responses are requested without ``Content-Encoding``, as ``Range`` offsets
+    and ``Content-Length`` count encoded bytes, while aiohttp decodes the
+    body. If the server encodes the response anyway, its size isn't checked,
+    and it isn't resumed.
+
+    Args:
+        session (aiohttp.ClientSession): the session to use
+        url (str): the url to download
+        log_url (str): the url to log
+        fh (file): the file to write to
+        start (int): the first byte to download
+        end (int): the byte to stop before, or ``None`` to download to the
+            end of the file
+        chunk_size (int): the chunk size to read from the response at a time
+        timeout (aiohttp.ClientTimeout): the timeout for each request
+        attempts (int): the number of attempts to make without progress
+
+    Returns:
+        int: the size of the whole file, or ``None`` if the server didn't say
+            or encoded the response.
+
+    Raises:
+        Download404: on a 404
+        DownloadError: on any other bad status, if the server ignores the
+            ``Range`` of a partial download, if an encoded response fails
+            partway, or on too many failed attempts.
+
+    """
+    offset = start
+    failures = 0
+    encoding = None
+    while True:
+        headers = {"Accept-Encoding": "identity"}
+        if offset > 0 or end is not None:
+            headers["Range"] = "bytes={}-{}".format(offset, "" if end is None else end - 1)
+        progress = offset
+        try:
+            async with session.get(url, headers=headers, timeout=timeout) as resp:
+                if resp.status == 404:
+                    await _log_download_error(resp, log_url, "404 downloading %(url)s: %(status)s; body=%(body)s")
+                    raise Download404("{} status {}!".format(log_url, resp.status))
+                elif resp.status not in (200, 206):
+                    await _log_download_error(
+                        resp,
+                        log_url,
+                        "Failed to download %(url)s: %(status)s; body=%(body)s",
+                    )
+                    raise DownloadError("{} status {} is not 200!".format(log_url, resp.status))
+                encoding = _get_content_encoding(resp)
+                if encoding and "Range" in headers:
+                    raise DownloadError("{} sent a {}-encoded response to a Range request!".format(log_url, encoding))
+                if resp.status == 206:
+                    range_start, size = _parse_content_range(resp.headers.get("Content-Range"))
+                    if range_start != offset:
+                        raise DownloadError("{} returned bytes from {}, not {}!".format(log_url, range_start, offset))
+                elif "Range" in headers:
+                    if end is not None:
+                        raise DownloadError("{} doesn't support Range requests!".format(log_url))
+                    log.warning("%s doesn't support Range requests; restarting the download", log_url)
+                    offset = 0
+                    fh.truncate(0)
+                    size = resp.content_length
+                else:
+                    size = resp.content_length
+                fh.seek(offset)
+                while True:
+                    chunk = await resp.content.read(chunk_size)
+                    if not chunk:
+                        break
+                    fh.write(chunk)
+                    offset += len(chunk)
+            # The Content-Length of an encoded response isn't the size of the file
+            return None if encoding else size
+        except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+            if encoding:
+                raise DownloadError("Failed to download {}, and can't resume a {}-encoded response: {}".format(log_url, encoding, exc)) from exc
+            failures = 1 if offset > progress else failures + 1
+            if failures >= attempts:
+                raise DownloadError("Failed to download {} after {} attempts: {}".format(log_url, attempts, exc)) from exc
+            log.warning("Resuming %s at byte %s after %s", log_url, offset, repr(exc))
+            await asyncio.sleep(calculate_sleep_time(failures - 1, delay_factor=1.0, max_delay=30))
+
+
+def _get_content_encoding(resp):
+    """Get the ``Content-Encoding`` of ``resp``, or ``None`` if it isn't encoded."""
+    encoding = resp.headers.get("Content-Encoding", "").strip().lower()
+    return None if encoding in ("", "identity") else encoding
+
+
+async def _get_range_size(session, url, timeout):
+    """Get the size of ``url`` if the server supports Range requests for it, else ``None``."""
+    try:
+        async with session.head(url, headers={"Accept-Encoding": "identity"}, timeout=timeout, allow_redirects=True) as resp:
+            if resp.status == 200 and resp.headers.get("Accept-Ranges") == "bytes" and not _get_content_encoding(resp):
+                return resp.content_length
+    except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+        log.debug("HEAD %s failed: %s", url, repr(exc))
+    return None
+
+
+async def _download_ranges(session, url, log_url, path, size, num_ranges, chunk_size, timeout, attempts):
+    """Download ``url`` to ``path`` as ``num_ranges`` concurrent ranges."""
+    range_size = -(-size // num_ranges)
+    with open(path, "wb") as fh:
+        fh.truncate(size)
+
+    async def download_one(start):
+        with open(path, "r+b") as fh:
+            await _download_range(session, url, log_url, fh, start, min(start + range_size, size), chunk_size, timeout, attempts)
+
+    futures = [asyncio.ensure_future(download_one(start)) for start in range(0, size, range_size)]
+    try:
+        await asyncio.gather(*futures)
+    finally:
+        for future in futures:
+            future.cancel()
+        await asyncio.gather(*futures, return_exceptions=True)
+
+
+async def _verify_download(path, log_url, size, expected_size, expected_hashes):
+    """Make sure ``path`` is the size and has the hashes we expect.
+
+    Raises:
+        DownloadError: on a mismatch.
+
+    """
+    actual_size = os.path.getsize(path)
+    for expected in (size, expected_size):
+        if expected is not None and actual_size != expected:
+            raise DownloadError("{} is {} bytes, not {}!".format(log_url, actual_size, expected))
+    if expected_hashes:
+        hashes = await asyncio.get_running_loop().run_in_executor(None, hash_file, path, list(expected_hashes))
+        for hash_type, expected in expected_hashes.items():
+            if hashes[hash_type] != expected:
+                raise DownloadError("{} {} is {}, not {}!".format(log_url, hash_type, hashes[hash_type], expected))
+
+
+async def download_file(
+    url,
+    abs_filename,
+    log_url=None,
+    chunk_size=DOWNLOAD_CHUNK_SIZE,
+    timeout=300,
+    session=None,
+    attempts=5,
+    num_ranges=1,
+    min_range_size=DOWNLOAD_MIN_RANGE_SIZE,
+    expected_size=None,
+    expected_hashes=None,
+):
     """Download a file, async.
 
+    The file is downloaded to ``abs_filename`` + ``.part`` and moved into
+    place once it's complete and verified. If the connection drops partway,
+    the download resumes where it stopped with an HTTP ``Range`` request.
+
     Args:
         url (str): the url to download
         abs_filename (str): the path to download to
         log_url (str, optional): the url to log, should ``url`` contain sensitive information.
             If ``None``, use ``url``. Defaults to ``None``
         chunk_size (int, optional): the chunk size to read from the response
-            at a time. Default is 128.
-        timeout (int, optional): seconds to time out the request. Default is 300.
+            at a time. Default is ``DOWNLOAD_CHUNK_SIZE``.
+        timeout (int, optional): seconds to wait to connect, or for more data,
+            before giving up on a request. Default is 300.
+        session (aiohttp.ClientSession, optional): the session to use. If
+            ``None``, use the current ``SessionManager``'s session, or a new
+            session if there isn't one. Defaults to ``None``.
+        attempts (int, optional): the number of times to try each range
+            without making progress. Defaults to 5.
+        num_ranges (int, optional): if more than 1 and the server supports
+            Range requests, download files of at least ``min_range_size`` as
+            up to this many concurrent ranges. Defaults to 1.
+        min_range_size (int, optional): the smallest range to download
+            concurrently. Defaults to ``DOWNLOAD_MIN_RANGE_SIZE``.
+        expected_size (int, optional): the size the file should be. If
+            ``None``, only check against the size the server sends.
+            Defaults to ``None``.
+        expected_hashes (dict, optional): the hexdigest the file should have,
+            per ``hashlib`` algorithm. Defaults to ``None``.
+
+    Raises:
+        Download404: on a 404
+        DownloadError: on any other failure, or if the file doesn't match
+            ``expected_size`` or ``expected_hashes``.
 
     """
-    aiohttp_timeout = aiohttp.ClientTimeout(total=timeout)
-    async with aiohttp.ClientSession(timeout=aiohttp_timeout) as session:
-        log_url = log_url or url
+    aiohttp_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    log_url = log_url or url
+    part_path = "{}.part".format(abs_filename)
+    async with client_session(session) as session:
         log.info("Downloading %s", log_url)
-        parent_dir = os.path.dirname(abs_filename)
-        async with session.get(url) as resp:
-            if resp.status == 404:
-                await _log_download_error(resp, log_url, "404 downloading %(url)s: %(status)s; body=%(body)s")
-                raise Download404("{} status {}!".format(log_url, resp.status))
-            elif resp.status != 200:
-                await _log_download_error(
-                    resp,
-                    log_url,
-                    "Failed to download %(url)s: %(status)s; body=%(body)s",
-                )
-                raise DownloadError("{} status {} is not 200!".format(log_url, resp.status))
-            makedirs(parent_dir)
-            with open(abs_filename, "wb") as fd:
-                while True:
-                    chunk = await resp.content.read(chunk_size)
-                    if not chunk:
-                        break
-                    fd.write(chunk)
+        size = None
+        if num_ranges > 1:
+            size = await _get_range_size(session, url, aiohttp_timeout)
+        makedirs(os.path.dirname(abs_filename))
+        try:
+            if size is not None and size >= 2 * min_range_size:
+                num_ranges = min(num_ranges, size // min_range_size)
+                log.debug("Downloading %s as %s ranges", log_url, num_ranges)
+                await _download_ranges(session, url, log_url, part_path, size, num_ranges, chunk_size, aiohttp_timeout, attempts)
+            else:
+                with open(part_path, "wb") as fh:
+                    size = await _download_range(session, url, log_url, fh, 0, None, chunk_size, aiohttp_timeout, attempts)
+            await _verify_download(part_path, log_url, size, expected_size, expected_hashes)
+            os.replace(part_path, abs_filename)
+        finally:
+            rm(part_path)
         log.info("Done")
@@ -7,6 +7,8 @@ Attributes:
 """
 
 import asyncio
+import hashlib
+import json
 import logging
 import os
 import sys
@@ -19,6 +21,11 @@ from scriptworker_client.utils import load_json_or_yaml
 
 log = logging.getLogger(__name__)
 
+# Compiled validators, per schema digest
+_VALIDATORS = {}
+# Loaded schema files, per path: ``((mtime, size), schema)``
+_SCHEMA_FILES = {}
+
 
 def get_task(config):
     """Read the task.json from work_dir.
@@ -39,7 +46,44 @@ def get_task(config):
     return contents
 
 
-def verify_json_schema(data, schema, name="task"):
+def get_schema_validator(schema, cache_dir=None):
+    """Get a compiled validator for ``schema``, reusing it across calls.
+
+    Checking a schema against its metaschema costs far more than validating
+    a task against it, so each schema is only checked once per process.
+    With ``cache_dir``, the digests of schemas that passed are also recorded
+    there, so later processes can skip the check.
+
+    Args:
+        schema (dict): the jsonschema to compile.
+        cache_dir (str, optional): the directory to record checked schemas
+            in. If ``None``, only cache in memory. Defaults to ``None``.
+
+    Returns:
+        jsonschema.protocols.Validator: the validator.
+
+    Raises:
+        jsonschema.exceptions.SchemaError: if ``schema`` is invalid.
+
+    """
+    digest = hashlib.sha256(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest()
+    validator = _VALIDATORS.get(digest)
+    if validator is None:
+        cls = jsonschema.validators.validator_for(schema)
+        marker = cache_dir and os.path.join(cache_dir, "{}.checked".format(digest))
+        if not (marker and os.path.exists(marker)):
+            cls.check_schema(schema)
+            if marker:
+                try:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    open(marker, "w").close()
+                except OSError as exc:
+                    log.warning("Can't write to schema cache {}: {}".format(cache_dir, exc))
+        validator = _VALIDATORS[digest] = cls(schema)
+    return validator
+
+
+def verify_json_schema(data, schema, name="task", cache_dir=None):
     """Given data and a jsonschema, let's verify it.
 
     This happens for tasks and chain of trust artifacts.
@@ -49,20 +93,34 @@ def verify_json_schema(data, schema, name="task"):
         schema (dict): the jsonschema to verify against.
         name (str, optional): the name of the json, for exception messages.
             Defaults to "task".
+        cache_dir (str, optional): passed to ``get_schema_validator``.
+            Defaults to ``None``.
 
     Raises:
         TaskVerificationError: on failure
 
     """
-    try:
-        jsonschema.validate(data, schema)
-    except jsonschema.exceptions.ValidationError as exc:
-        raise TaskVerificationError("Can't verify {} schema!\n{}".format(name, str(exc))) from exc
+    error = jsonschema.exceptions.best_match(get_schema_validator(schema, cache_dir=cache_dir).iter_errors(data))
+    if error is not None:
+        raise TaskVerificationError("Can't verify {} schema!\n{}".format(name, str(error))) from error
+
+
+def _load_schema(path):
+    """Load the schema at ``path``, reusing it until the file changes."""
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _SCHEMA_FILES.get(path)
+    if cached is None or cached[0] != key:
+        cached = _SCHEMA_FILES[path] = (key, load_json_or_yaml(path, is_path=True))
+    return cached[1]
 
 
 def verify_task_schema(config, task, schema_key="schema_file"):
     """Verify the task definition.
 
+    Schemas are compiled once per process, and also recorded in
+    ``config["schema_cache_dir"]`` if it's set; see ``get_schema_validator``.
+
     Args:
         config (dict): the running config
         task (dict): the running task
@@ -79,10 +137,10 @@ def verify_task_schema(config, task, schema_key="schema_file"):
         for key in schema_keys:
             schema_path = schema_path[key]
 
-        task_schema = load_json_or_yaml(schema_path, is_path=True)
+        task_schema = _load_schema(schema_path)
         log.debug("Task is verified against this schema: {}".format(task_schema))
 
-        verify_json_schema(task, task_schema)
+        verify_json_schema(task, task_schema, cache_dir=config.get("schema_cache_dir"))
     except (KeyError, OSError) as e:
         raise TaskVerificationError("Cannot verify task against schema. Task: {}.".format(task)) from e
 
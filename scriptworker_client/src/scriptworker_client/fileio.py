@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""File hashing and copying helpers for large artifacts.
+
+Hashing reads large files through ``mmap``, and smaller ones with a large
+reusable buffer, computing any number of digests in one pass. Copying uses
+``os.copy_file_range`` or ``os.sendfile`` where the platform has them, so the
+data never passes through Python. ``copy_and_hash`` copies and hashes a file
+in a single pass.
+
+Attributes:
+    log (logging.Logger): the log object for the module
+    DEFAULT_BUFFER_SIZE (int): the default read and hash block size, in bytes
+    MMAP_THRESHOLD (int): files at least this large are hashed through ``mmap``
+
+"""
+
+import errno
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+from typing import Dict, Sequence
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+MMAP_THRESHOLD = DEFAULT_BUFFER_SIZE
+
+# The errors copy_file_range and sendfile fail with when the files or the
+# filesystem don't support them
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF}
+
+
+# hash_file {{{1
+def hash_file(path: str, hash_types: Sequence[str] = ("sha512",), buffer_size: int = DEFAULT_BUFFER_SIZE, use_mmap: bool = True) -> Dict[str, str]:
+    """Hash a file with one or more algorithms, reading it once.
+
+    Args:
+        path (str): the path to hash
+        hash_types (list, optional): the ``hashlib`` algorithms to use.
+            Defaults to ``("sha512",)``.
+        buffer_size (int, optional): the block size to read and hash.
+            Defaults to ``DEFAULT_BUFFER_SIZE``.
+        use_mmap (bool, optional): hash files of at least ``MMAP_THRESHOLD``
+            bytes through ``mmap``. Defaults to True.
+
+    Returns:
+        dict: the hexdigest per hash type.
+
+    Raises:
+        OSError: if ``path`` can't be read
+        ValueError: on an unknown hash type
+
+    """
+    hashes = [hashlib.new(hash_type) for hash_type in hash_types]
+    with open(path, "rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if use_mmap and size >= MMAP_THRESHOLD:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                _advise_sequential(mapped)
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, size, buffer_size):
+                        block = view[offset : offset + buffer_size]
+                        for h in hashes:
+                            h.update(block)
+                        block.release()
+                finally:
+                    view.release()
+        else:
+            buf = bytearray(buffer_size)
+            view = memoryview(buf)
+            while True:
+                length = fh.readinto(buf)
+                if not length:
+                    break
+                for h in hashes:
+                    h.update(view[:length])
+    return {hash_type: h.hexdigest() for hash_type, h in zip(hash_types, hashes)}
+
+
+def _advise_sequential(mapped: mmap.mmap) -> None:
+    """Tell the kernel the mapping will be read in order, where supported."""
+    if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+
+
+# copy_file {{{1
+def copy_file(source: str, target: str, buffer_size: int = DEFAULT_BUFFER_SIZE) -> int:
+    """Copy the contents of ``source`` to ``target`` in the kernel where possible.
+
+    Tries ``os.copy_file_range``, then ``os.sendfile``, then falls back to
+    reading and writing ``buffer_size`` blocks. ``target`` is overwritten;
+    its permissions aren't copied.
+
+    Args:
+        source (str): the path to copy from
+        target (str): the path to copy to
+        buffer_size (int, optional): the block size for the fallback copy.
+            Defaults to ``DEFAULT_BUFFER_SIZE``.
+
+    Returns:
+        int: the number of bytes copied.
+
+    Raises:
+        OSError: on failure
+
+    """
+    with open(source, "rb") as fsrc, open(target, "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        for copy in (_copy_file_range, _sendfile):
+            copied = copy(fsrc.fileno(), fdst.fileno(), size)
+            if copied is not None:
+                return copied
+        shutil.copyfileobj(fsrc, fdst, buffer_size)
+        return fdst.tell()
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, size: int):
+    """Copy with ``os.copy_file_range``, or return None if it isn't supported here."""
+    if not hasattr(os, "copy_file_range"):
+        return None
+    return _kernel_copy(lambda count: os.copy_file_range(src_fd, dst_fd, count), size)
+
+
+def _sendfile(src_fd: int, dst_fd: int, size: int):
+    """Copy with ``os.sendfile``, or return None if it isn't supported here."""
+    if not hasattr(os, "sendfile"):
+        return None
+    return _kernel_copy(lambda count: os.sendfile(dst_fd, src_fd, None, count), size)
+
+
+def _kernel_copy(copy_range, size: int):
+    """Call ``copy_range(count)`` until ``size`` bytes are copied.
+
+    Returns None if the first call fails because the files or filesystem
+    don't support it, so the caller can fall back. Both calls copy from and
+    to the current file offsets.
+
+    """
+    copied = 0
+    # Large, but below the 2GB per-call limit some kernels have
+    block_size = min(max(size, 1), 1024 * 1024 * 1024)
+    while True:
+        try:
+            sent = copy_range(block_size)
+        except OSError as exc:
+            if copied == 0 and exc.errno in _UNSUPPORTED_ERRNOS:
+                return None
+            raise
+        if sent == 0:
+            return copied
+        copied += sent
+
+
+# copy_and_hash {{{1
+def copy_and_hash(source: str, target: str, hash_types: Sequence[str] = ("sha512",), buffer_size: int = DEFAULT_BUFFER_SIZE) -> Dict[str, str]:
+    """Copy ``source`` to ``target`` and hash it, reading it once.
+
+    Args:
+        source (str): the path to copy from
+        target (str): the path to copy to
+        hash_types (list, optional): the ``hashlib`` algorithms to use.
+            Defaults to ``("sha512",)``.
+        buffer_size (int, optional): the block size to read, hash and write.
+            Defaults to ``DEFAULT_BUFFER_SIZE``.
+
+    Returns:
+        dict: the hexdigest per hash type.
+
+    Raises:
+        OSError: on failure
+        ValueError: on an unknown hash type
+
+    """
+    hashes = [hashlib.new(hash_type) for hash_type in hash_types]
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(source, "rb") as fsrc, open(target, "wb") as fdst:
+        while True:
+            length = fsrc.readinto(buf)
+            if not length:
+                break
+            block = view[:length]
+            for h in hashes:
+                h.update(block)
+            fdst.write(block)
+    return {hash_type: h.hexdigest() for hash_type, h in zip(hash_types, hashes)}
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Benchmark ``aio.download_file`` against a local server.
+
+* ``chunk_size``: the old 128-byte reads vs ``DOWNLOAD_CHUNK_SIZE``
+* ``ranges``: one stream vs concurrent ranges
+* ``disconnects``: resuming with Range requests vs restarting from zero, as
+  retrying the old ``download_file`` did
+
+Loopback has no per-connection bandwidth limit, so concurrent ranges only
+help against remote servers that throttle each connection.
+
+Run with ``SCRIPTWORKER_CLIENT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+import os
+import time
+
+import pytest
+
+import scriptworker_client.aio as aio
+from scriptworker_client.exceptions import DownloadError
+from tests.conftest import skip_unless_benchmark
+from tests.test_aio import range_server
+
+SIZE = 256 * 1024 * 1024
+NUM_DISCONNECTS = 3
+
+
+@pytest.fixture(scope="module")
+def data():
+    return os.urandom(SIZE)
+
+
+async def timed_download(data, path, cuts=None, **kwargs):
+    async with range_server(data, cuts=cuts) as (url, seen):
+        start = time.monotonic()
+        await aio.download_file(url, path, **kwargs)
+        elapsed = time.monotonic() - start
+    assert os.path.getsize(path) == len(data)
+    return elapsed, len(seen)
+
+
+def report(name, elapsed, requests):
+    print(f"\n{name:>24}: {SIZE / 1024**2:.0f}MB in {elapsed:6.2f}s, {SIZE / 1024**2 / elapsed:6.0f}MB/s, {requests} requests")
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("chunk_size", (128, aio.DOWNLOAD_CHUNK_SIZE))
+async def test_bench_chunk_size(tmp_path, data, chunk_size):
+    elapsed, requests = await timed_download(data, str(tmp_path / "file"), chunk_size=chunk_size)
+    report(f"chunk_size={chunk_size}", elapsed, requests)
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("num_ranges", (1, 4))
+async def test_bench_ranges(tmp_path, data, num_ranges):
+    elapsed, requests = await timed_download(data, str(tmp_path / "file"), num_ranges=num_ranges)
+    report(f"num_ranges={num_ranges}", elapsed, requests)
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("resume", (False, True))
+async def test_bench_disconnects(tmp_path, data, resume):
+    # Each disconnect happens 3/4 of the way through what's left
+    cuts = [SIZE * 3 // 4 // 4**i for i in range(NUM_DISCONNECTS)] if resume else [SIZE * 3 // 4] * NUM_DISCONNECTS
+    path = str(tmp_path / "file")
+    if resume:
+        elapsed, requests = await timed_download(data, path, cuts=cuts)
+    else:
+        async with range_server(data, cuts=cuts) as (url, seen):
+            start = time.monotonic()
+            # How callers retried: from zero, on a DownloadError
+            for _ in range(NUM_DISCONNECTS + 1):
+                try:
+                    await aio.download_file(url, path, attempts=1)
+                    break
+                except DownloadError:
+                    pass
+            elapsed, requests = time.monotonic() - start, len(seen)
+    report(f"resume={resume}", elapsed, requests)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Benchmark scriptworker_client.fileio against the hashing and copying the scripts do today.
+
+* ``get_hash_4k``: signingscript's ``get_hash``, 4kB reads, one digest per pass
+* ``get_hash_1m``: beetmoverscript's ``get_hash``, 1MB reads, one digest per pass
+* ``copy_then_hash``: ``shutil.copyfile``, then hashing the copy
+
+Every case computes sha256 and sha512, as checksums files do. The page cache
+is warm, so this measures CPU and syscall overhead rather than the disk.
+
+Run with ``SCRIPTWORKER_CLIENT_BENCHMARK=true pytest -s tests/benchmarks``. Set
+``SCRIPTWORKER_CLIENT_BENCHMARK_MAX_MB`` to add a larger file size, e.g. 2048.
+"""
+import functools
+import hashlib
+import os
+import shutil
+import time
+
+import pytest
+
+from scriptworker_client import fileio
+from tests.conftest import skip_unless_benchmark
+
+HASH_TYPES = ("sha256", "sha512")
+SIZES = [1024, 1024**2, 64 * 1024**2]
+MAX_MB = int(os.environ.get("SCRIPTWORKER_CLIENT_BENCHMARK_MAX_MB", "0"))
+if MAX_MB:
+    SIZES.append(MAX_MB * 1024**2)
+
+
+def get_hash(path, hash_type, block_size):
+    h = hashlib.new(hash_type)
+    with open(path, "rb") as f:
+        for chunk in iter(functools.partial(f.read, block_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_separately(path, block_size):
+    return {hash_type: get_hash(path, hash_type, block_size) for hash_type in HASH_TYPES}
+
+
+def copy_then_hash(source, target):
+    shutil.copyfile(source, target)
+    return hash_separately(target, 1024 * 1024)
+
+
+def make_file(path, size):
+    with open(path, "wb") as fh:
+        block = os.urandom(min(size, 1024**2))
+        for offset in range(0, size, len(block)):
+            fh.write(block[: size - offset])
+
+
+def best_of(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.monotonic()
+        result = func()
+        timings.append(time.monotonic() - start)
+    return min(timings), result
+
+
+def report(name, size, elapsed):
+    print(f"\n{name:>16} {size / 1024**2:>9.3f}MB: {elapsed * 1000:9.2f}ms, {size / 1024**2 / max(elapsed, 1e-9):8.0f}MB/s")
+
+
+@skip_unless_benchmark
+@pytest.mark.parametrize("size", SIZES)
+def test_bench_hash(tmp_path, size):
+    path = str(tmp_path / "file")
+    make_file(path, size)
+    runs = 3 if size > 64 * 1024**2 else 10
+    cases = {
+        "get_hash_4k": lambda: hash_separately(path, 4096),
+        "get_hash_1m": lambda: hash_separately(path, 1024 * 1024),
+        "hash_file": lambda: fileio.hash_file(path, HASH_TYPES, use_mmap=False),
+        "hash_file_mmap": lambda: fileio.hash_file(path, HASH_TYPES),
+    }
+    results = {}
+    for name, func in cases.items():
+        elapsed, results[name] = best_of(func, runs)
+        report(name, size, elapsed)
+    assert all(result == results["get_hash_4k"] for result in results.values())
+
+
+@skip_unless_benchmark
+@pytest.mark.parametrize("size", SIZES)
+def test_bench_copy(tmp_path, size):
+    source = str(tmp_path / "source")
+    target = str(tmp_path / "target")
+    make_file(source, size)
+    runs = 3 if size > 64 * 1024**2 else 10
+    cases = {
+        "shutil.copyfile": lambda: shutil.copyfile(source, target),
+        "copy_file": lambda: fileio.copy_file(source, target),
+        "copy_then_hash": lambda: copy_then_hash(source, target),
+        "copy_and_hash": lambda: fileio.copy_and_hash(source, target, HASH_TYPES),
+    }
+    results = {}
+    for name, func in cases.items():
+        elapsed, results[name] = best_of(func, runs)
+        report(name, size, elapsed)
+    assert results["copy_then_hash"] == results["copy_and_hash"]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Benchmark the time from ``sync_main`` entry to ``async_main`` with and without the schema cache.
+
+* in-process: a long-running worker calling ``sync_main`` for task after task,
+  vs the same with the validator cache cleared every time
+* fresh process: a new interpreter per task, with and without
+  ``schema_cache_dir``. This includes neither the interpreter startup nor
+  the imports.
+
+Run with ``SCRIPTWORKER_CLIENT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import pytest
+
+import scriptworker_client.client as client
+from tests.conftest import skip_unless_benchmark
+
+NUM_RUNS = 200
+NUM_PROCESSES = 20
+SCHEMA = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "basic_schema.json")
+TASK = {"this_is_a_task": True, "payload": {"payload_required_property": "..."}}
+
+# Prints the milliseconds from sync_main entry to async_main
+SCRIPT = """
+import sys, time
+import scriptworker_client.client as client
+
+async def async_main(config, task):
+    print((time.perf_counter() - start) * 1000)
+
+start = time.perf_counter()
+client.sync_main(async_main, config_path=sys.argv[1])
+"""
+
+
+def write_config(tmp_path, **kwargs):
+    work_dir = tmp_path / "work"
+    work_dir.mkdir(exist_ok=True)
+    (work_dir / "task.json").write_text(json.dumps(TASK))
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps(dict(work_dir=str(work_dir), schema_file=SCHEMA, **kwargs)))
+    return str(config_path)
+
+
+def new_event_loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+def report(name, timings):
+    print(f"\n{name:>28}: median {statistics.median(timings):.3f}ms, min {min(timings):.3f}ms")
+
+
+@skip_unless_benchmark
+@pytest.mark.parametrize("cached", (False, True))
+def test_bench_sync_main(tmp_path, mocker, cached):
+    config_path = write_config(tmp_path)
+    timings = []
+
+    async def async_main(config, task):
+        timings.append((time.perf_counter() - start) * 1000)
+
+    mocker.patch.object(client, "_init_logging")
+    for _ in range(NUM_RUNS):
+        if not cached:
+            mocker.patch.object(client, "_VALIDATORS", new={})
+            mocker.patch.object(client, "_SCHEMA_FILES", new={})
+        start = time.perf_counter()
+        client.sync_main(async_main, config_path=config_path, loop_function=new_event_loop)
+    report(f"in-process cached={cached}", timings)
+
+
+@skip_unless_benchmark
+@pytest.mark.parametrize("cache_dir", (False, True))
+def test_bench_sync_main_process(tmp_path, cache_dir):
+    kwargs = {"schema_cache_dir": str(tmp_path / "cache")} if cache_dir else {}
+    config_path = write_config(tmp_path, **kwargs)
+    timings = []
+    for _ in range(NUM_PROCESSES):
+        output = subprocess.run([sys.executable, "-c", SCRIPT, config_path], check=True, capture_output=True, text=True).stdout
+        timings.append(float(output))
+    report(f"new process cache_dir={cache_dir}", timings)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Benchmark many small ``aio.request`` calls with and without a ``SessionManager``.
+
+The server is a local aiohttp app, so this measures the client-side cost of
+a new session and connection per request; against a remote TLS host the
+handshakes make the difference larger.
+
+Run with ``SCRIPTWORKER_CLIENT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+import asyncio
+import time
+
+import pytest
+from tests.conftest import skip_unless_benchmark
+from tests.test_aio import local_server
+
+import scriptworker_client.aio as aio
+
+NUM_REQUESTS = 2000
+CONCURRENCY = 10
+
+
+async def make_requests(url):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    futures = [asyncio.ensure_future(aio.semaphore_wrapper(semaphore, aio.request(url))) for _ in range(NUM_REQUESTS)]
+    return await aio.raise_future_exceptions(futures)
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("reuse", (False, True))
+async def test_bench_session(reuse):
+    async with local_server() as (url, ports):
+        start = time.monotonic()
+        if reuse:
+            async with aio.SessionManager(limit_per_host=CONCURRENCY):
+                results = await make_requests(url)
+        else:
+            results = await make_requests(url)
+        elapsed = time.monotonic() - start
+    assert results == ["ok"] * NUM_REQUESTS
+    print(f"\nreuse={reuse}: {NUM_REQUESTS} requests in {elapsed:.2f}s, {NUM_REQUESTS / elapsed:.0f} requests/s, {len(set(ports))} connections")
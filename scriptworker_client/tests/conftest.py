@@ -0,0 +1,10 @@
+import os
+
+import pytest
+
+
+def skip_unless_benchmark(function):
+    """Skip a benchmark unless ``SCRIPTWORKER_CLIENT_BENCHMARK`` is set."""
+    return pytest.mark.skipif(os.environ.get("SCRIPTWORKER_CLIENT_BENCHMARK", "false").lower() not in ("1", "true", "yes"), reason="Benchmarks are skipped")(
+        function
+    )
@@ -3,6 +3,10 @@
 """Test scriptworker_client.aio
 """
 import asyncio
+import gzip
+import hashlib
+import json
+import logging
 import os
 import re
 import shutil
@@ -11,6 +15,7 @@ import time
 from datetime import datetime
 
 import aiohttp
+import aiohttp.web
 import mock
 import pytest
 
@@ -68,6 +73,8 @@ class FakeSession:
             self.statuses = url.split(",")
         resp = mock.MagicMock()
         resp.status = int(self.statuses.pop(0))
+        resp.headers = {}
+        resp.content_length = None
         resp.text = _fake_text
         resp.json = _fake_json
         # Fake download: will give `firstsecond`
@@ -330,6 +337,123 @@ async def test_retry_async_always_fail():
     assert retry_count["always_fail"] == 5
 
 
+# SessionManager {{{1
+@asynccontextmanager
+async def local_server():
+    """Serve ``/`` on localhost, yielding its url and the client ports it saw."""
+    ports = []
+
+    async def handler(request):
+        ports.append(request.transport.get_extra_info("peername")[1])
+        return aiohttp.web.Response(text="ok")
+
+    app = aiohttp.web.Application()
+    app.router.add_get("/", handler)
+    runner = aiohttp.web.AppRunner(app)
+    await runner.setup()
+    site = aiohttp.web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield "http://127.0.0.1:{}/".format(port), ports
+    finally:
+        await runner.cleanup()
+
+
+@asynccontextmanager
+async def range_server(data, ranges=True, cuts=None):
+    """Serve ``data`` at ``/`` on localhost, yielding its url and the Range headers it saw.
+
+    If ``ranges``, honor Range requests. Each of ``cuts`` drops the
+    connection of the next response after that many bytes of its body.
+
+    """
+    cuts = list(cuts or [])
+    seen = []
+
+    async def handler(request):
+        headers = {"Accept-Ranges": "bytes"} if ranges else {}
+        start, end, status = 0, len(data), 200
+        if ranges and "Range" in request.headers:
+            http_range = request.http_range
+            start = http_range.start or 0
+            end = len(data) if http_range.stop is None else min(http_range.stop, len(data))
+            status = 206
+            headers["Content-Range"] = "bytes {}-{}/{}".format(start, end - 1, len(data))
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(data))
+            return aiohttp.web.Response(status=status, headers=headers)
+        seen.append(request.headers.get("Range"))
+        resp = aiohttp.web.StreamResponse(status=status, headers=headers)
+        resp.content_length = end - start
+        await resp.prepare(request)
+        if cuts:
+            await resp.write(data[start : start + cuts.pop(0)])
+            request.transport.close()
+            return resp
+        await resp.write(data[start:end])
+        await resp.write_eof()
+        return resp
+
+    app = aiohttp.web.Application()
+    app.router.add_get("/", handler)
+    runner = aiohttp.web.AppRunner(app)
+    await runner.setup()
+    site = aiohttp.web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield "http://127.0.0.1:{}/".format(port), seen
+    finally:
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_session_manager(tmpdir):
+    """Requests and downloads inside a SessionManager share a connection."""
+    async with local_server() as (url, ports):
+        assert aio.get_session_manager() is None
+        async with aio.SessionManager(limit_per_host=1) as manager:
+            assert aio.get_session_manager() is manager
+            session = manager.get_session()
+            assert manager.get_session() is session
+            for _ in range(3):
+                assert await aio.request(url) == "ok"
+            await aio.download_file(url, os.path.join(tmpdir, "foo"))
+        assert session.closed
+        assert aio.get_session_manager() is None
+        assert len(ports) == 4
+        assert len(set(ports)) == 1
+
+
+@pytest.mark.asyncio
+async def test_session_manager_nested():
+    """The innermost SessionManager is the default; the outer one is restored on exit."""
+    async with aio.SessionManager() as outer:
+        async with aio.SessionManager() as inner:
+            assert aio.get_session_manager() is inner
+        assert aio.get_session_manager() is outer
+        assert not outer.get_session().closed
+
+
+@pytest.mark.asyncio
+async def test_request_without_session_manager():
+    """Without a SessionManager, every request gets a new connection."""
+    async with local_server() as (url, ports):
+        for _ in range(2):
+            assert await aio.request(url) == "ok"
+        assert len(set(ports)) == 2
+
+
+@pytest.mark.asyncio
+async def test_request_session(mocker):
+    """An explicit session is used, and not closed."""
+    session = FakeSession()
+    mocker.patch.object(aiohttp, "ClientSession", side_effect=AssertionError("no new sessions"))
+    async with aio.SessionManager():
+        assert await aio.request("200", method="expected", session=session) == "expected"
+
+
 # request {{{1
 @pytest.mark.parametrize(
     "url,method,return_type,expected,exception,num_attempts",
@@ -380,3 +504,149 @@ async def test_download_file(tmpdir, url, expected, raises, mocker):
         with open(path, "r") as fh:
             contents = fh.read()
         assert contents == expected
+
+
+@pytest.mark.parametrize(
+    "ranges,cuts,num_ranges,expected_ranges",
+    (
+        # Downloaded in one go
+        (True, [], 1, [None]),
+        # Resumed after each disconnect
+        (True, [1000, 5000], 1, [None, "bytes=1000-", "bytes=6000-"]),
+        # Restarted if the server doesn't support ranges
+        (False, [1000], 1, [None, "bytes=1000-"]),
+        # Split into concurrent ranges, one of which is resumed
+        (True, [], 4, ["bytes=0-4999", "bytes=5000-9999", "bytes=10000-14999", "bytes=15000-19999"]),
+        (True, [100], 2, ["bytes=0-9999", "bytes=10000-19999", "bytes=100-9999"]),
+        # Not split if the server doesn't support ranges
+        (False, [], 4, [None]),
+    ),
+)
+@pytest.mark.asyncio
+async def test_download_file_resume(tmpdir, ranges, cuts, num_ranges, expected_ranges):
+    data = os.urandom(20000)
+    path = os.path.join(tmpdir, "dir", "foo")
+    async with range_server(data, ranges=ranges, cuts=cuts) as (url, seen):
+        await aio.download_file(
+            url,
+            path,
+            chunk_size=1024,
+            num_ranges=num_ranges,
+            min_range_size=5000,
+            expected_size=len(data),
+            expected_hashes={"sha256": hashlib.sha256(data).hexdigest()},
+        )
+    with open(path, "rb") as fh:
+        assert fh.read() == data
+    assert sorted(seen, key=str) == sorted(expected_ranges, key=str)
+    assert os.listdir(os.path.dirname(path)) == ["foo"]
+
+
+@pytest.mark.parametrize("ranges", (True, False))
+@pytest.mark.asyncio
+async def test_download_range_plain(tmpdir, caplog, ranges):
+    """A plain download isn't mistaken for an ignored Range request."""
+    data = os.urandom(20000)
+    path = os.path.join(tmpdir, "foo")
+    async with range_server(data, ranges=ranges) as (url, seen):
+        async with aiohttp.ClientSession() as session:
+            with open(path, "wb") as fh:
+                wrapped = mock.Mock(wraps=fh)
+                size = await aio._download_range(session, url, url, wrapped, 0, None, 1024, aiohttp.ClientTimeout(total=30), 1)
+    assert size == len(data)
+    assert seen == [None]
+    wrapped.truncate.assert_not_called()
+    assert [record for record in caplog.records if record.levelno >= logging.WARNING] == []
+    with open(path, "rb") as fh:
+        assert fh.read() == data
+
+
+@pytest.mark.asyncio
+async def test_download_file_too_many_failures(tmpdir, mocker):
+    mocker.patch.object(asyncio, "sleep", new=noop_async)
+    path = os.path.join(tmpdir, "foo")
+    async with range_server(b"x" * 20000, cuts=[0, 0, 0]) as (url, seen):
+        with pytest.raises(DownloadError, match="after 3 attempts"):
+            await aio.download_file(url, path, attempts=3)
+    assert len(seen) == 3
+    assert os.listdir(tmpdir) == []
+
+
+@asynccontextmanager
+async def gzip_server(data, cut=None):
+    """Serve ``data`` gzipped at ``/`` on localhost, whatever the request's
+    Accept-Encoding, yielding its url and the Accept-Encoding headers it saw.
+
+    If ``cut``, drop the connection after that many bytes of the body.
+
+    """
+    body = gzip.compress(data)
+    seen = []
+
+    async def handler(request):
+        headers = {"Accept-Ranges": "bytes", "Content-Encoding": "gzip", "Content-Type": "application/json"}
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            return aiohttp.web.Response(headers=headers)
+        seen.append(request.headers.get("Accept-Encoding"))
+        resp = aiohttp.web.StreamResponse(headers=headers)
+        resp.content_length = len(body)
+        await resp.prepare(request)
+        if cut is not None:
+            await resp.write(body[:cut])
+            request.transport.close()
+            return resp
+        await resp.write(body)
+        await resp.write_eof()
+        return resp
+
+    app = aiohttp.web.Application()
+    app.router.add_get("/", handler)
+    runner = aiohttp.web.AppRunner(app)
+    await runner.setup()
+    site = aiohttp.web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield "http://127.0.0.1:{}/".format(port), seen
+    finally:
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_download_file_gzip(tmpdir):
+    """A gzip-encoded response is saved decoded, without checking it against
+    its Content-Length, and isn't split into ranges."""
+    data = json.dumps({"key": "value" * 1000}).encode("utf-8")
+    path = os.path.join(tmpdir, "foo.json")
+    async with gzip_server(data) as (url, seen):
+        await aio.download_file(url, path, num_ranges=4, min_range_size=10, expected_size=len(data))
+    with open(path, "rb") as fh:
+        assert fh.read() == data
+    assert seen == ["identity"]
+
+
+@pytest.mark.asyncio
+async def test_download_file_gzip_no_resume(tmpdir):
+    path = os.path.join(tmpdir, "foo.json")
+    async with gzip_server(os.urandom(20000), cut=1000) as (url, seen):
+        with pytest.raises(DownloadError, match="can't resume a gzip-encoded response"):
+            await aio.download_file(url, path)
+    assert len(seen) == 1
+    assert os.listdir(tmpdir) == []
+
+
+@pytest.mark.parametrize(
+    "kwargs,match",
+    (
+        ({"expected_size": 10}, "is 20000 bytes, not 10"),
+        ({"expected_hashes": {"sha256": "bad"}}, "sha256 is"),
+    ),
+)
+@pytest.mark.asyncio
+async def test_download_file_verify(tmpdir, kwargs, match):
+    path = os.path.join(tmpdir, "foo")
+    async with range_server(b"x" * 20000) as (url, _):
+        with pytest.raises(DownloadError, match=match):
+            await aio.download_file(url, path, **kwargs)
+    assert os.listdir(tmpdir) == []
@@ -8,6 +8,7 @@ import os
 import sys
 from copy import deepcopy
 
+import jsonschema
 import mock
 import pytest
 
@@ -41,6 +42,52 @@ def test_get_task(tmpdir):
     assert client.get_task(config) == expected
 
 
+# get_schema_validator {{{1
+@pytest.fixture
+def empty_schema_cache(mocker):
+    mocker.patch.object(client, "_VALIDATORS", new={})
+    mocker.patch.object(client, "_SCHEMA_FILES", new={})
+
+
+def test_get_schema_validator(empty_schema_cache, mocker):
+    """Each schema is checked and compiled once."""
+    check_schema = mocker.spy(jsonschema.validators.validator_for(FAKE_SCHEMA), "check_schema")
+    validator = client.get_schema_validator(FAKE_SCHEMA)
+    assert client.get_schema_validator(deepcopy(FAKE_SCHEMA)) is validator
+    assert client.get_schema_validator(dict(FAKE_SCHEMA, title="bar")) is not validator
+    assert check_schema.call_count == 2
+    assert validator.is_valid({"list-of-strings": ["a"]})
+
+
+def test_get_schema_validator_invalid(empty_schema_cache, tmpdir):
+    """An invalid schema raises, and isn't cached."""
+    schema = {"type": "not-a-type"}
+    for _ in range(2):
+        with pytest.raises(jsonschema.exceptions.SchemaError):
+            client.get_schema_validator(schema, cache_dir=str(tmpdir))
+    assert os.listdir(tmpdir) == []
+
+
+def test_get_schema_validator_cache_dir(empty_schema_cache, mocker, tmpdir):
+    """Schemas checked in an earlier process aren't checked again."""
+    cache_dir = os.path.join(tmpdir, "cache")
+    client.get_schema_validator(FAKE_SCHEMA, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    # A new process
+    mocker.patch.object(client, "_VALIDATORS", new={})
+    check_schema = mocker.spy(jsonschema.validators.validator_for(FAKE_SCHEMA), "check_schema")
+    client.get_schema_validator(FAKE_SCHEMA, cache_dir=cache_dir)
+    check_schema.assert_not_called()
+
+
+def test_get_schema_validator_bad_cache_dir(empty_schema_cache, tmpdir, caplog):
+    """An unwritable cache dir only warns."""
+    path = os.path.join(tmpdir, "file")
+    open(path, "w").close()
+    assert client.get_schema_validator(FAKE_SCHEMA, cache_dir=path)
+    assert "Can't write to schema cache" in caplog.text
+
+
 # verify_json_schema {{{1
 @pytest.mark.parametrize(
     "data,schema,raises",
@@ -75,6 +122,21 @@ def test_verify_task_schema(tmpdir):
         client.verify_task_schema(config, {"list-of-strings": ["a", "a"]}, "nonexistent_path")
 
 
+def test_verify_task_schema_reload(empty_schema_cache, tmpdir):
+    """``verify_task_schema`` picks up changes to the schema file."""
+    path = os.path.join(tmpdir, "schema.json")
+    with open(path, "w") as fh:
+        fh.write(json.dumps(FAKE_SCHEMA))
+    config = {"schema_file": path, "schema_cache_dir": os.path.join(tmpdir, "cache")}
+    client.verify_task_schema(config, {"list-of-strings": ["a"]})
+    with open(path, "w") as fh:
+        fh.write(json.dumps(dict(FAKE_SCHEMA, required=["other"])))
+    os.utime(path, ns=(0, 0))
+    with pytest.raises(TaskVerificationError):
+        client.verify_task_schema(config, {"list-of-strings": ["a"]})
+    assert len(os.listdir(config["schema_cache_dir"])) == 2
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("should_verify_task", (True, False))
 async def test_sync_main_runs_fully(tmpdir, should_verify_task):
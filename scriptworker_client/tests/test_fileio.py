@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Test scriptworker_client.fileio
+"""
+import contextlib
+import errno
+import hashlib
+import os
+
+import mock
+import pytest
+
+import scriptworker_client.fileio as fileio
+
+SIZES = (0, 1, 1024, fileio.MMAP_THRESHOLD - 1, fileio.MMAP_THRESHOLD, fileio.MMAP_THRESHOLD * 2 + 3)
+
+
+def make_file(path, size):
+    data = os.urandom(size)
+    with open(path, "wb") as fh:
+        fh.write(data)
+    return data
+
+
+def expected_hashes(data, hash_types):
+    return {hash_type: hashlib.new(hash_type, data).hexdigest() for hash_type in hash_types}
+
+
+# hash_file {{{1
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("use_mmap", (True, False))
+def test_hash_file(tmp_path, size, use_mmap):
+    path = tmp_path / "file"
+    data = make_file(path, size)
+    hash_types = ("sha256", "sha512")
+    assert fileio.hash_file(str(path), hash_types, buffer_size=1024 * 1024, use_mmap=use_mmap) == expected_hashes(data, hash_types)
+
+
+def test_hash_file_default(tmp_path):
+    path = tmp_path / "file"
+    data = make_file(path, 100)
+    assert fileio.hash_file(str(path)) == {"sha512": hashlib.sha512(data).hexdigest()}
+
+
+def test_hash_file_errors(tmp_path):
+    path = tmp_path / "file"
+    make_file(path, 100)
+    with pytest.raises(ValueError):
+        fileio.hash_file(str(path), ("not-a-hash",))
+    with pytest.raises(OSError):
+        fileio.hash_file(str(tmp_path / "missing"))
+
+
+# copy_file {{{1
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize(
+    "unsupported",
+    (
+        (),
+        ("copy_file_range",),
+        ("copy_file_range", "sendfile"),
+    ),
+)
+def test_copy_file(tmp_path, size, unsupported):
+    source = tmp_path / "source"
+    target = tmp_path / "target"
+    data = make_file(source, size)
+    target.write_bytes(b"x" * (size + 10))
+
+    def fail(*args):
+        raise OSError(errno.ENOSYS, "Not supported")
+
+    with contextlib.ExitStack() as stack:
+        for name in unsupported:
+            if hasattr(os, name):
+                stack.enter_context(mock.patch.object(os, name, new=fail))
+        assert fileio.copy_file(str(source), str(target), buffer_size=1024) == size
+    assert target.read_bytes() == data
+
+
+def test_copy_file_error(tmp_path):
+    source = tmp_path / "source"
+    make_file(source, 100)
+
+    def fail(*args):
+        raise OSError(errno.EIO, "I/O error")
+
+    with mock.patch.object(os, "copy_file_range" if hasattr(os, "copy_file_range") else "sendfile", new=fail):
+        with pytest.raises(OSError):
+            fileio.copy_file(str(source), str(tmp_path / "target"))
+
+
+# copy_and_hash {{{1
+@pytest.mark.parametrize("size", SIZES)
+def test_copy_and_hash(tmp_path, size):
+    source = tmp_path / "source"
+    target = tmp_path / "target"
+    data = make_file(source, size)
+    hash_types = ("sha1", "sha256", "sha512")
+    assert fileio.copy_and_hash(str(source), str(target), hash_types, buffer_size=1024 * 1024) == expected_hashes(data, hash_types)
+    assert target.read_bytes() == data
@@ -0,0 +1,247 @@
+"""Authenticode signing helpers: signature detection and a bounded scheduler.
+
+``is_signed`` checks PE and MSI files for an existing Authenticode signature
+in-process, rather than running ``osslsigncode extract-signature`` for every
+file. It returns None for anything it can't parse, so callers can fall back
+to osslsigncode.
+
+``winsign.sign.sign_file`` runs osslsigncode synchronously, so awaiting it
+blocks the event loop, and starting it for every file of a zip at once queues
+hundreds of files behind each other. ``AuthenticodeScheduler`` runs each
+call in a worker thread with its own event loop instead, with separate
+limits on the files doing local (osslsigncode) work, the hash signing
+requests to autograph, and the files timestamping their signature.
+
+Attributes:
+    DEFAULT_AUTOGRAPH_LIMIT (int): the default cap on concurrent autograph requests.
+    DEFAULT_TIMESTAMP_LIMIT (int): the default cap on files timestamping at once.
+
+"""
+
+import asyncio
+import logging
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+DEFAULT_AUTOGRAPH_LIMIT = 8
+DEFAULT_TIMESTAMP_LIMIT = 4
+
+_PE_SECURITY_DIRECTORY = 4
+_CFB_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+_CFB_END_OF_CHAIN = 0xFFFFFFFE
+_CFB_FREE_SECTOR = 0xFFFFFFFF
+_CFB_STREAM = 2
+_MSI_SIGNATURE_STREAM = "\x05DigitalSignature"
+
+
+# is_signed {{{1
+def is_signed(path):
+    """Check whether a PE or MSI file has an Authenticode signature, without osslsigncode.
+
+    Args:
+        path (str): the file to check
+
+    Returns:
+        bool: whether the file is signed, or None if it isn't a PE or MSI
+            file that can be parsed
+
+    """
+    try:
+        with open(path, "rb") as fh:
+            magic = fh.read(len(_CFB_MAGIC))
+            if magic.startswith(b"MZ"):
+                return _is_pe_signed(fh)
+            if magic == _CFB_MAGIC:
+                return _is_msi_signed(fh)
+    except (OSError, struct.error, ValueError):
+        log.debug("Couldn't parse %s", path, exc_info=True)
+    return None
+
+
+def _read_at(fh, offset, size):
+    fh.seek(offset)
+    data = fh.read(size)
+    if len(data) != size:
+        raise ValueError("Unexpected end of file")
+    return data
+
+
+def _is_pe_signed(fh):
+    """Check the certificate table entry of a PE file's data directories."""
+    file_size = os.fstat(fh.fileno()).st_size
+    (pe_offset,) = struct.unpack("<I", _read_at(fh, 0x3C, 4))
+    if _read_at(fh, pe_offset, 4) != b"PE\0\0":
+        return None
+    # The optional header follows the 20 byte COFF header
+    (optional_header_size,) = struct.unpack("<H", _read_at(fh, pe_offset + 20, 2))
+    optional_header = pe_offset + 24
+    (magic,) = struct.unpack("<H", _read_at(fh, optional_header, 2))
+    if magic == 0x10B:
+        directories_offset = 96
+    elif magic == 0x20B:
+        directories_offset = 112
+    else:
+        return None
+    (num_directories,) = struct.unpack("<I", _read_at(fh, optional_header + directories_offset - 4, 4))
+    entry_offset = directories_offset + _PE_SECURITY_DIRECTORY * 8
+    if num_directories <= _PE_SECURITY_DIRECTORY or entry_offset + 8 > optional_header_size:
+        return False
+    # For the certificate table, the address is a file offset
+    address, size = struct.unpack("<II", _read_at(fh, optional_header + entry_offset, 8))
+    if not address or not size:
+        return False
+    if address + size > file_size:
+        return None
+    return True
+
+
+def _is_msi_signed(fh):
+    """Look for the signature stream in the directory of an MSI's compound file."""
+    header = _read_at(fh, 0, 512)
+    (sector_shift,) = struct.unpack_from("<H", header, 0x1E)
+    sector_size = 1 << sector_shift
+    num_fat_sectors, first_directory_sector = struct.unpack_from("<II", header, 0x2C)
+    first_difat_sector, num_difat_sectors = struct.unpack_from("<II", header, 0x44)
+    file_size = os.fstat(fh.fileno()).st_size
+    max_sectors = file_size // sector_size
+
+    def read_sector(sector):
+        if sector >= max_sectors:
+            raise ValueError("Sector out of range")
+        return _read_at(fh, (sector + 1) * sector_size, sector_size)
+
+    fat_sectors = list(struct.unpack_from("<109I", header, 0x4C))
+    sector = first_difat_sector
+    for _ in range(num_difat_sectors):
+        difat = struct.unpack(f"<{sector_size // 4}I", read_sector(sector))
+        fat_sectors.extend(difat[:-1])
+        sector = difat[-1]
+    fat = []
+    for sector in fat_sectors[:num_fat_sectors]:
+        fat.extend(struct.unpack(f"<{sector_size // 4}I", read_sector(sector)))
+
+    sector = first_directory_sector
+    # Bound the walk, in case of a loop in the chain
+    for _ in range(max_sectors):
+        if sector in (_CFB_END_OF_CHAIN, _CFB_FREE_SECTOR):
+            return False
+        data = read_sector(sector)
+        for entry in range(0, sector_size, 128):
+            name_size, entry_type = struct.unpack_from("<HB", data, entry + 64)
+            name = data[entry : entry + max(name_size - 2, 0)].decode("utf-16-le", errors="replace")
+            if entry_type == _CFB_STREAM and name == _MSI_SIGNATURE_STREAM:
+                return True
+        sector = fat[sector]
+    raise ValueError("Directory chain doesn't end")
+
+
+# AuthenticodeScheduler {{{1
+class AuthenticodeScheduler:
+    """Bound the concurrent authenticode signing work of a task.
+
+    A file holds a CPU slot while it runs local work, i.e. until it asks
+    autograph for a signature, and again afterwards until it's done. It holds
+    an autograph slot while that request is in flight, and a timestamp slot
+    from then on if it's timestamped. At most ``max_workers`` files are in
+    flight, each with its own worker thread, so files never wait for a thread
+    while holding a slot.
+
+    Args:
+        cpu_limit (int, optional): files running local work at once. Defaults
+            to the number of CPUs.
+        autograph_limit (int, optional): hash signing requests in flight.
+            Defaults to ``DEFAULT_AUTOGRAPH_LIMIT``.
+        timestamp_limit (int, optional): files timestamping at once. Defaults
+            to ``DEFAULT_TIMESTAMP_LIMIT``.
+
+    """
+
+    def __init__(self, cpu_limit=None, autograph_limit=DEFAULT_AUTOGRAPH_LIMIT, timestamp_limit=DEFAULT_TIMESTAMP_LIMIT):
+        """Initialize AuthenticodeScheduler."""
+        self.cpu_limit = cpu_limit or os.cpu_count() or 1
+        self.cpu = asyncio.Semaphore(self.cpu_limit)
+        self.autograph = asyncio.Semaphore(autograph_limit)
+        self.timestamp = asyncio.Semaphore(timestamp_limit)
+        # Every file that got past its first CPU slot may need a thread
+        self.max_workers = self.cpu_limit + autograph_limit + timestamp_limit
+        self.files = asyncio.Semaphore(self.max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="authenticode")
+
+    async def run_local(self, func, *args):
+        """Run the blocking `func` in a worker thread, holding a CPU slot.
+
+        Returns:
+            the return value of `func`
+
+        """
+        async with self.files, self.cpu:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def run(self, func, signer, timestamp=False):
+        """Run `func(signer)` in a worker thread, in its own event loop.
+
+        Args:
+            func (callable): returns the coroutine to run, e.g. a call to
+                ``winsign.sign.sign_file``, given the signer to use
+            signer (coroutine function): signs ``(digest, digest_algo)``. It's
+                run in the current event loop, holding an autograph slot.
+            timestamp (bool, optional): whether the signature is timestamped
+                after signing. Defaults to False.
+
+        Returns:
+            the return value of the coroutine
+
+        """
+        loop = asyncio.get_running_loop()
+        held = []
+
+        async def acquire(semaphore):
+            await semaphore.acquire()
+            held.append(semaphore)
+
+        def release(semaphore):
+            held.remove(semaphore)
+            semaphore.release()
+
+        async def bounded_signer(digest, digest_algo):
+            release(self.cpu)
+            async with self.autograph:
+                signature = await signer(digest, digest_algo)
+            if timestamp:
+                await acquire(self.timestamp)
+            await acquire(self.cpu)
+            return signature
+
+        # Signing requests from the thread, cancelled if this gets cancelled
+        # before the thread is done
+        lock = threading.Lock()
+        requests = []
+        done = False
+
+        async def thread_signer(digest, digest_algo):
+            with lock:
+                if done:
+                    raise asyncio.CancelledError()
+                request = asyncio.run_coroutine_threadsafe(bounded_signer(digest, digest_algo), loop)
+                requests.append(request)
+            return await asyncio.wrap_future(request)
+
+        async with self.files:
+            await acquire(self.cpu)
+            try:
+                return await loop.run_in_executor(self.executor, lambda: asyncio.run(func(thread_signer)))
+            finally:
+                with lock:
+                    done = True
+                    for request in requests:
+                        request.cancel()
+                for semaphore in list(held):
+                    release(semaphore)
+
+    def close(self):
+        """Shut down the worker threads."""
+        self.executor.shutdown(wait=False)
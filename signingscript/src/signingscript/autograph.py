@@ -0,0 +1,234 @@
+"""A pooled, health-aware Autograph client.
+
+``AutographClient`` is built from the output of
+``utils.load_autograph_configs``. It keeps one keep-alive connection pool per
+Autograph server URL, caps the number of in-flight requests per server, and
+tracks an exponentially weighted moving average (EWMA) of each server's
+latency and error rate. When several ``Autograph`` entries support a format,
+requests go to the healthiest server first and fail over to the others.
+
+Attributes:
+    DEFAULT_MAX_IN_FLIGHT (int): the default cap on concurrent requests per server.
+    EWMA_ALPHA (float): the weight of the newest sample in the EWMAs.
+    UNHEALTHY_ERROR_RATE (float): servers with an error EWMA above this are
+        only used once every healthy server has failed.
+
+"""
+
+import asyncio
+import logging
+import time
+
+import aiohttp
+from scriptworker.utils import retry_async
+
+from signingscript.exceptions import SigningScriptError
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = 8
+EWMA_ALPHA = 0.3
+UNHEALTHY_ERROR_RATE = 0.5
+
+
+class AutographServerPool:
+    """The connection pool, concurrency cap and health stats for one Autograph URL.
+
+    Args:
+        url (str): the Autograph server URL
+        max_in_flight (int): the maximum number of concurrent requests
+
+    """
+
+    def __init__(self, url, max_in_flight):
+        """Initialize AutographServerPool."""
+        self.url = url
+        self.max_in_flight = max_in_flight
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.session = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.latency_ewma = 0.0
+        self.error_ewma = 0.0
+
+    @property
+    def healthy(self):
+        """bool: whether the recent error rate is acceptable."""
+        return self.error_ewma <= UNHEALTHY_ERROR_RATE
+
+    def sort_key(self):
+        """Return the sort key used to pick a server; lower is better.
+
+        Healthy servers come first, then the ones with the lowest expected
+        wait, estimated as the latency EWMA times the requests ahead of us.
+        """
+        return (not self.healthy, self.latency_ewma * (self.in_flight + 1) / self.max_in_flight)
+
+    def record(self, latency, error):
+        """Update the stats with the result of a request.
+
+        Args:
+            latency (float): the request duration in seconds
+            error (bool): whether the request failed
+
+        """
+        self.requests += 1
+        self.error_ewma += EWMA_ALPHA * (float(error) - self.error_ewma)
+        if error:
+            self.errors += 1
+        elif self.latency_ewma:
+            self.latency_ewma += EWMA_ALPHA * (latency - self.latency_ewma)
+        else:
+            self.latency_ewma = latency
+
+    def get_session(self):
+        """Return the keep-alive session for this server, creating it on first use."""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def call(self, server, func, *args, **kwargs):
+        """Call ``func(session, server, *args, **kwargs)`` once a request slot is free.
+
+        Args:
+            server (Autograph): the Autograph entry to use; its url must be `self.url`
+            func (coroutine function): makes a single request to `server`
+            *args: passed through to `func`
+            **kwargs: passed through to `func`
+
+        Returns:
+            the result of `func`
+
+        """
+        async with self.semaphore:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            start = time.monotonic()
+            try:
+                result = await func(self.get_session(), server, *args, **kwargs)
+            except Exception:
+                self.record(time.monotonic() - start, error=True)
+                raise
+            finally:
+                self.in_flight -= 1
+        self.record(time.monotonic() - start, error=False)
+        return result
+
+    def stats(self):
+        """Return a dict of this server's counters and EWMAs."""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_ewma": self.latency_ewma,
+            "error_ewma": self.error_ewma,
+            "peak_in_flight": self.peak_in_flight,
+        }
+
+    async def close(self):
+        """Close the session, if one was opened."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class AutographClient:
+    """Send requests to the healthiest suitable Autograph server, failing over to the others.
+
+    Use as an async context manager, or call ``close`` when done.
+
+    Args:
+        autograph_configs (dict): the cert type to list of ``Autograph``
+            mapping from ``utils.load_autograph_configs``
+        max_in_flight (int, optional): the maximum number of concurrent
+            requests per server URL. Defaults to ``DEFAULT_MAX_IN_FLIGHT``.
+        attempts (int, optional): how many times to try every suitable server
+            before giving up. Defaults to 3.
+
+    """
+
+    def __init__(self, autograph_configs, max_in_flight=DEFAULT_MAX_IN_FLIGHT, attempts=3):
+        """Initialize AutographClient."""
+        self.autograph_configs = autograph_configs or {}
+        self.attempts = attempts
+        self.pools = {}
+        for servers in self.autograph_configs.values():
+            for server in servers:
+                if server.url not in self.pools:
+                    self.pools[server.url] = AutographServerPool(server.url, max_in_flight)
+
+    async def __aenter__(self):
+        """Return self."""
+        return self
+
+    async def __aexit__(self, *excinfo):
+        """Close all sessions."""
+        await self.close()
+
+    def get_servers(self, cert_type, fmt):
+        """Return the ``Autograph`` entries for `cert_type` that support `fmt`, best first.
+
+        Args:
+            cert_type (str): the signing cert type
+            fmt (str): the signing format
+
+        Returns:
+            list: the suitable ``Autograph`` entries. Ties keep config order.
+
+        """
+        servers = [a for a in self.autograph_configs.get(cert_type, []) if a and fmt in a.formats]
+        return sorted(servers, key=lambda a: self.pools[a.url].sort_key())
+
+    async def call(self, cert_type, fmt, func, *args, **kwargs):
+        """Call ``func(session, server, *args, **kwargs)``, trying every suitable server in turn before retrying.
+
+        `func` should make a single request, e.g. ``sign_with_autograph`` with
+        ``attempts=1``; retries and failover are handled here.
+
+        Args:
+            cert_type (str): the signing cert type
+            fmt (str): the format to sign with
+            func (coroutine function): makes a single request to a server
+            *args: passed through to `func`
+            **kwargs: passed through to `func`
+
+        Raises:
+            SigningScriptError: when no suitable signing server is found for fmt
+            Exception: the last error, when every attempt on every server failed
+
+        Returns:
+            the result of `func`
+
+        """
+        if not self.get_servers(cert_type, fmt):
+            raise SigningScriptError(f"No autograph config found with cert type {cert_type} and formats {[fmt]}")
+        return await retry_async(
+            self._call_with_failover,
+            args=(cert_type, fmt, func, *args),
+            kwargs=kwargs,
+            attempts=self.attempts,
+            sleeptime_kwargs={"delay_factor": 2.0},
+        )
+
+    async def _call_with_failover(self, cert_type, fmt, func, *args, **kwargs):
+        error = None
+        for server in self.get_servers(cert_type, fmt):
+            try:
+                return await self.pools[server.url].call(server, func, *args, **kwargs)
+            except Exception as e:
+                log.warning("Autograph request to %s failed, trying the next server: %s", server.url, e)
+                error = e
+        raise error
+
+    def stats(self):
+        """Return the stats of every server pool, keyed by URL."""
+        return {url: pool.stats() for url, pool in self.pools.items()}
+
+    async def close(self):
+        """Log the per-server stats and close all sessions."""
+        for url, pool in self.pools.items():
+            if pool.requests:
+                log.info("Autograph %s: %s", url, pool.stats())
+            await pool.close()
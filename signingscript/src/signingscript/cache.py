@@ -0,0 +1,194 @@
+"""A content-addressed on-disk cache of signing results.
+
+Entries are keyed by a digest of the input's SHA-256, the signing format, the
+key id and the Autograph signer identity, so a byte-identical input signed
+the same way is only sent to Autograph once. Each entry file holds the
+SHA-256 of its payload followed by the payload, and is checked on every read.
+Entries are written atomically, and the least recently used ones are evicted
+once the cache grows past its size limit.
+
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from scriptworker.utils import rm
+
+from signingscript.utils import mkdir
+
+log = logging.getLogger(__name__)
+
+_DIGEST_SIZE = hashlib.sha256().digest_size
+_READ_BLOCK_SIZE = 1024 * 1024
+
+
+class SigningCache:
+    """A size-bounded LRU cache of signed outputs on disk.
+
+    Args:
+        cache_dir (str): the directory to keep entries in. Created if missing.
+        max_size (int): evict least recently used entries once the entries
+            add up to more than this many bytes.
+
+    """
+
+    def __init__(self, cache_dir, max_size):
+        """Initialize SigningCache."""
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.corrupt = 0
+        self.evictions = 0
+        mkdir(cache_dir)
+
+    @staticmethod
+    def make_key(input_sha256, fmt, keyid, signer, **extra):
+        """Return the cache key for a signing request.
+
+        Args:
+            input_sha256 (str): the hex SHA-256 of the input
+            fmt (str): the signing format
+            keyid (str): the Autograph key id, if any
+            signer (str): identifies the Autograph server and credentials
+            **extra: anything else that changes the signed output
+
+        Returns:
+            str: the hex key
+
+        """
+        key = json.dumps({"input": input_sha256, "format": fmt, "keyid": keyid, "signer": signer, "extra": extra}, sort_keys=True)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key, to):
+        """Copy the cached payload for `key` to `to`, if it exists and is intact.
+
+        `to` is replaced atomically and left untouched on a miss.
+
+        Args:
+            key (str): the cache key
+            to (str): the path to write the payload to
+
+        Returns:
+            bool: whether there was a hit
+
+        """
+        path = self._entry_path(key)
+        try:
+            src = open(path, "rb")
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        fd, tmp_path = tempfile.mkstemp(prefix=".signingcache", dir=os.path.dirname(os.path.abspath(to)))
+        try:
+            with src, os.fdopen(fd, "wb") as dst:
+                expected = src.read(_DIGEST_SIZE)
+                h = hashlib.sha256()
+                for chunk in iter(lambda: src.read(_READ_BLOCK_SIZE), b""):
+                    h.update(chunk)
+                    dst.write(chunk)
+            if h.digest() != expected:
+                log.warning("Signing cache entry %s is corrupt; discarding it", key)
+                self.corrupt += 1
+                self.misses += 1
+                rm(path)
+                rm(tmp_path)
+                return False
+            os.replace(tmp_path, to)
+        except BaseException:
+            rm(tmp_path)
+            raise
+        # Bump the mtime, which eviction uses as the last use time
+        os.utime(path)
+        self.hits += 1
+        log.info("Signing cache hit for %s", to)
+        return True
+
+    def get_bytes(self, key):
+        """Return the cached payload for `key`, or None on a miss.
+
+        Args:
+            key (str): the cache key
+
+        Returns:
+            bytes: the payload, or None
+
+        """
+        with tempfile.TemporaryDirectory(dir=self.cache_dir) as tmp_dir:
+            tmp_path = os.path.join(tmp_dir, "payload")
+            if self.get(key, tmp_path):
+                with open(tmp_path, "rb") as fh:
+                    return fh.read()
+        return None
+
+    def put(self, key, from_):
+        """Store the contents of `from_` under `key`, then evict if needed.
+
+        Args:
+            key (str): the cache key
+            from_ (str): the path of the signed output
+
+        """
+        h = hashlib.sha256()
+        with open(from_, "rb") as fh:
+            for chunk in iter(lambda: fh.read(_READ_BLOCK_SIZE), b""):
+                h.update(chunk)
+        fd, tmp_path = tempfile.mkstemp(prefix=".signingcache", dir=self.cache_dir)
+        try:
+            with open(from_, "rb") as src, os.fdopen(fd, "wb") as dst:
+                dst.write(h.digest())
+                for chunk in iter(lambda: src.read(_READ_BLOCK_SIZE), b""):
+                    dst.write(chunk)
+            os.replace(tmp_path, self._entry_path(key))
+        except BaseException:
+            rm(tmp_path)
+            raise
+        self.evict()
+
+    def put_bytes(self, key, data):
+        """Store `data` under `key`, then evict if needed.
+
+        Args:
+            key (str): the cache key
+            data (bytes): the signed output
+
+        """
+        fd, tmp_path = tempfile.mkstemp(prefix=".signingcache", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as dst:
+                dst.write(hashlib.sha256(data).digest())
+                dst.write(data)
+            os.replace(tmp_path, self._entry_path(key))
+        except BaseException:
+            rm(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in ``max_size``."""
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            rm(path)
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        """Return a dict of the hit, miss, corrupt entry and eviction counters."""
+        return {"hits": self.hits, "misses": self.misses, "corrupt": self.corrupt, "evictions": self.evictions}
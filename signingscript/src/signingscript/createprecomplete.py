@@ -10,41 +10,101 @@ import os
 import sys
 
 
+def _include_file(rel_path_file):
+    """Whether a file belongs in the precomplete file."""
+    return not (
+        rel_path_file.endswith("channel-prefs.js")
+        or rel_path_file.endswith("update-settings.ini")
+        or "/ChannelPrefs.framework/" in rel_path_file
+        or rel_path_file.startswith("ChannelPrefs.framework/")
+        or "/UpdateSettings.framework/" in rel_path_file
+        or rel_path_file.startswith("UpdateSettings.framework/")
+        or "distribution/" in rel_path_file
+    )
+
+
+def _include_dir(rel_path_dir):
+    """Whether a directory, with a trailing slash, belongs in the precomplete file."""
+    return rel_path_dir.find("distribution/") == -1
+
+
+def walk_build_paths(root_path):
+    """Returns the "/" separated paths of everything under root_path, relative
+    to it, from a single sorted walk. Directories have a trailing "/".
+    Symlinks to directories are listed as directories but not followed, like
+    os.walk does.
+    """
+    rel_paths = []
+    stack = [("", root_path)]
+    while stack:
+        rel_dir, dir_path = stack.pop()
+        with os.scandir(dir_path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        subdirs = []
+        for entry in entries:
+            rel_path = rel_dir + entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                rel_paths.append(rel_path + "/")
+                if not entry.is_symlink():
+                    subdirs.append((rel_path + "/", entry.path))
+            else:
+                rel_paths.append(rel_path)
+        # Then each subdirectory, depth first, in order
+        stack.extend(reversed(subdirs))
+    return rel_paths
+
+
 def get_build_entries(root_path):
     """Iterates through the root_path, creating a list for each file and
     directory. Excludes any file paths ending with channel-prefs.js.
     """
+    return get_build_entries_from_paths(walk_build_paths(root_path))
+
+
+def get_build_entries_from_paths(rel_paths):
+    """Like get_build_entries, for a list of "/" separated paths relative to
+    the root, such as the member names of an archive. Paths ending in "/" are
+    directories; the parent directories of every path are included too.
+    """
     rel_file_path_set = set()
     rel_dir_path_set = set()
-    for root, dirs, files in os.walk(root_path):
-        for file_name in files:
-            parent_dir_rel_path = root[len(root_path) + 1 :]
-            rel_path_file = os.path.join(parent_dir_rel_path, file_name)
-            rel_path_file = rel_path_file.replace("\\", "/")
-            if not (
-                rel_path_file.endswith("channel-prefs.js")
-                or rel_path_file.endswith("update-settings.ini")
-                or "/ChannelPrefs.framework/" in rel_path_file
-                or rel_path_file.startswith("ChannelPrefs.framework/")
-                or "/UpdateSettings.framework/" in rel_path_file
-                or rel_path_file.startswith("UpdateSettings.framework/")
-                or "distribution/" in rel_path_file
-            ):
-                rel_file_path_set.add(rel_path_file)
-
-        for dir_name in dirs:
-            parent_dir_rel_path = root[len(root_path) + 1 :]
-            rel_path_dir = os.path.join(parent_dir_rel_path, dir_name)
-            rel_path_dir = rel_path_dir.replace("\\", "/") + "/"
-            if rel_path_dir.find("distribution/") == -1:
+    for rel_path in rel_paths:
+        if not rel_path.endswith("/"):
+            if _include_file(rel_path):
+                rel_file_path_set.add(rel_path)
+        parts = rel_path.rstrip("/").split("/")
+        last = len(parts) if rel_path.endswith("/") else len(parts) - 1
+        for i in range(1, last + 1):
+            rel_path_dir = "/".join(parts[:i]) + "/"
+            if _include_dir(rel_path_dir):
                 rel_dir_path_set.add(rel_path_dir)
 
-    rel_file_path_list = list(rel_file_path_set)
-    rel_file_path_list.sort(reverse=True)
-    rel_dir_path_list = list(rel_dir_path_set)
-    rel_dir_path_list.sort(reverse=True)
+    return sorted(rel_file_path_set, reverse=True), sorted(rel_dir_path_set, reverse=True)
+
+
+def format_precomplete(rel_file_path_list, rel_dir_path_list):
+    """Returns the contents of a precomplete file, as bytes."""
+    lines = ['remove "{}"\n'.format(rel_file_path) for rel_file_path in rel_file_path_list]
+    lines.extend('rmdir "{}"\n'.format(rel_dir_path) for rel_dir_path in rel_dir_path_list)
+    return "".join(lines).encode("utf-8")
 
-    return rel_file_path_list, rel_dir_path_list
+
+def diff_precomplete(before, after):
+    """Compares two lists of precomplete lines in linear time, returning a
+    dict of the "removed" and "added" lines, each in their original order,
+    and the number of "unchanged" lines.
+    """
+    before_set = set(before)
+    after_set = set(after)
+    return {
+        "removed": [line for line in before if line not in after_set],
+        "added": [line for line in after if line not in before_set],
+        "unchanged": len(before_set & after_set),
+    }
 
 
 def generate_precomplete(root_path):
@@ -63,12 +123,7 @@ def generate_precomplete(root_path):
     # in binary mode to prevent OS specific line endings.
     precomplete_file = open(precomplete_file_path, "wb")
     rel_file_path_list, rel_dir_path_list = get_build_entries(root_path)
-    for rel_file_path in rel_file_path_list:
-        precomplete_file.write('remove "{}"\n'.format(rel_file_path).encode("utf-8"))
-
-    for rel_dir_path in rel_dir_path_list:
-        precomplete_file.write('rmdir "{}"\n'.format(rel_dir_path).encode("utf-8"))
-
+    precomplete_file.write(format_precomplete(rel_file_path_list, rel_dir_path_list))
     precomplete_file.close()
 
 
@@ -0,0 +1,104 @@
+"""Single-pass MAR signature injection.
+
+``mardor.writer.add_signature_block`` plus ``MarReader.calculate_hashes``
+write the MAR with a dummy signature, then read it back to hash it, and the
+whole MAR is written again once the real signature is known.
+
+A signature only covers the MAR minus the signature bytes themselves, and
+their size is fixed by the algorithm, so the layout of the signed MAR is
+known up front. ``write_mar_with_placeholder_signature`` writes it once,
+hashing it on the way, and ``inject_mar_signature`` overwrites the
+placeholder in place. The output is byte for byte what
+``add_signature_block`` would write.
+
+"""
+
+from mardor.format import extras_header, index_header, mar, mar_header, sigs_header
+from mardor.signing import make_dummy_signature, make_hasher, verify_signature
+from mardor.utils import file_iter, takeexactly
+
+from signingscript.exceptions import SigningScriptError
+
+MAR_SIGNING_ALGORITHMS = {"sha1": 1, "sha384": 2}
+
+
+# write_mar_with_placeholder_signature {{{1
+def write_mar_with_placeholder_signature(src_fileobj, dest_fileobj, hash_algo):
+    """Copy a MAR, replacing its signatures with a single placeholder signature.
+
+    Productversion and channel are preserved, as with ``add_signature_block``.
+
+    Args:
+        src_fileobj (file object): the MAR file to copy
+        dest_fileobj (file object): the file to write the new MAR file to
+        hash_algo (str): one of 'sha1' or 'sha384'
+
+    Returns:
+        tuple: the digest to sign (bytes), and the offset of the
+            placeholder signature in `dest_fileobj` (int)
+
+    """
+    algo_id = MAR_SIGNING_ALGORITHMS[hash_algo]
+    placeholder = make_dummy_signature(algo_id)
+    src_fileobj.seek(0)
+    mardata = mar.parse_stream(src_fileobj)
+
+    def build_sigs(filesize):
+        return sigs_header.build(dict(filesize=filesize, count=1, sigs=[dict(algorithm_id=algo_id, size=len(placeholder), signature=placeholder)]))
+
+    extras = extras_header.build(mardata.additional)
+    # The sizes of the headers don't depend on the values in them
+    data_offset = mar_header.sizeof() + len(build_sigs(0)) + len(extras)
+    for e in mardata.index.entries:
+        e.offset += data_offset - mardata.data_offset
+    index = index_header.build(mardata.index)
+    mardata.header.index_offset = data_offset + mardata.data_length
+    header = mar_header.build(mardata.header)
+    sigs = build_sigs(mardata.header.index_offset + len(index))
+
+    hasher = make_hasher(algo_id)
+
+    def write(data):
+        dest_fileobj.write(data)
+        hasher.update(data)
+
+    write(header)
+    # Everything but the signature itself is signed
+    write(sigs[: -len(placeholder)])
+    signature_offset = dest_fileobj.tell()
+    dest_fileobj.write(placeholder)
+    write(extras)
+    src_fileobj.seek(mardata.data_offset)
+    for block in takeexactly(file_iter(src_fileobj), mardata.data_length):
+        write(block)
+    write(index)
+    return hasher.finalize(), signature_offset
+
+
+# inject_mar_signature {{{1
+def inject_mar_signature(dest_fileobj, signature_offset, signature, digest, hash_algo, verify_key=None):
+    """Overwrite the placeholder signature written by ``write_mar_with_placeholder_signature``.
+
+    Args:
+        dest_fileobj (file object): the MAR file, open in r+b or w+b mode
+        signature_offset (int): the offset of the placeholder signature
+        signature (bytes): the signature over `digest`
+        digest (bytes): the digest returned by ``write_mar_with_placeholder_signature``
+        hash_algo (str): one of 'sha1' or 'sha384'
+        verify_key (bytes, optional): the PEM encoded public key to verify
+            `signature` with before writing it. Defaults to None.
+
+    Raises:
+        SigningScriptError: if `signature` is the wrong length, or doesn't
+            verify with `verify_key`
+
+    """
+    expected_length = len(make_dummy_signature(MAR_SIGNING_ALGORITHMS[hash_algo]))
+    if len(signature) != expected_length:
+        raise SigningScriptError(
+            "signed mar hash signature has invalid length for hash algo {}. Got {} expected {}.".format(hash_algo, len(signature), expected_length)
+        )
+    if verify_key is not None and not verify_signature(verify_key, signature, digest, hash_algo):
+        raise SigningScriptError("mar signature doesn't verify with the expected key")
+    dest_fileobj.seek(signature_offset)
+    dest_fileobj.write(signature)
@@ -0,0 +1,168 @@
+"""Pipelined Apple notarization.
+
+Notarizing a bundle means submitting it, waiting minutes for Apple's notary
+service to accept it, then stapling the ticket to it. ``NotarizationScheduler``
+submits every bundle at once, up to a limit, checks the status of every
+pending submission from one shared polling loop, and staples each bundle as
+soon as its own submission is accepted, so the total time is close to the
+slowest notarization rather than the sum of all of them.
+
+Attributes:
+    DEFAULT_CONCURRENCY (int): the default cap on concurrent rcodesign calls.
+    DEFAULT_POLL_INTERVAL (float): the default seconds between the first status checks.
+    DEFAULT_MAX_POLL_INTERVAL (float): the default cap on the seconds between status checks.
+    DEFAULT_TIMEOUT (float): the default seconds to wait for a submission.
+
+"""
+
+import asyncio
+import logging
+import time
+
+from scriptworker.utils import retry_async
+
+from signingscript.rcodesign import RCodesignError, rcodesign_notarize, rcodesign_notary_status, rcodesign_staple
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_POLL_INTERVAL = 10
+DEFAULT_MAX_POLL_INTERVAL = 60
+DEFAULT_TIMEOUT = 3600
+
+ATTEMPTS = 5
+# How much longer to wait before the next status check, each time no
+# submission finished
+POLL_BACKOFF = 1.5
+
+
+# NotarizationScheduler {{{1
+class NotarizationScheduler:
+    """Submit, wait for and staple notarizations concurrently.
+
+    While nothing finishes, the polling interval grows from `poll_interval` to
+    `max_poll_interval`. Once a submission finishes, others submitted around
+    the same time are likely close behind, so it drops back to
+    `poll_interval`.
+
+    Args:
+        creds_path (str): the path to the App Store Connect API key
+        concurrency (int, optional): the rcodesign submissions, status checks
+            and staples to run at once. Defaults to ``DEFAULT_CONCURRENCY``.
+        poll_interval (float, optional): the seconds between the first status
+            checks. Defaults to ``DEFAULT_POLL_INTERVAL``.
+        max_poll_interval (float, optional): the most seconds between status
+            checks. Defaults to ``DEFAULT_MAX_POLL_INTERVAL``.
+        timeout (float, optional): the seconds to wait for a submission before
+            giving up on it. Defaults to ``DEFAULT_TIMEOUT``.
+
+    """
+
+    def __init__(
+        self,
+        creds_path,
+        concurrency=DEFAULT_CONCURRENCY,
+        poll_interval=DEFAULT_POLL_INTERVAL,
+        max_poll_interval=DEFAULT_MAX_POLL_INTERVAL,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        """Initialize NotarizationScheduler."""
+        self.creds_path = creds_path
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(poll_interval, max_poll_interval)
+        self.timeout = timeout
+        self.rcodesign = asyncio.Semaphore(concurrency)
+        # submission id -> (future, deadline)
+        self.pending = {}
+        self.submitted = asyncio.Event()
+
+    async def notarize(self, paths, staple=True):
+        """Notarize `paths`, stapling each once it's accepted.
+
+        Args:
+            paths (list): the app bundles, pkgs or zips to notarize
+            staple (bool, optional): whether to staple the notarization
+                tickets. Defaults to True.
+
+        Raises:
+            RCodesignError: if a notarization fails or times out. The others
+                are cancelled.
+
+        """
+        poller = asyncio.create_task(self._poll())
+        tasks = [asyncio.create_task(self._notarize_one(path, staple)) for path in paths]
+        try:
+            if tasks:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            # Raise the first failure, if any
+            for task in tasks:
+                if task.done():
+                    task.result()
+        finally:
+            for task in tasks + [poller]:
+                task.cancel()
+            await asyncio.gather(*tasks, poller, return_exceptions=True)
+
+    async def _notarize_one(self, path, staple):
+        async with self.rcodesign:
+            submission_id = await retry_async(
+                func=rcodesign_notarize,
+                args=(path, self.creds_path),
+                attempts=ATTEMPTS,
+                retry_exceptions=RCodesignError,
+            )
+        log.info(f"Submitted {path} for notarization. Submission ID {submission_id}")
+        status = await self._wait(submission_id)
+        if status != "Accepted":
+            raise RCodesignError(f"Notarization failed! Submission {submission_id} for {path} is {status}")
+        if not staple:
+            return
+        async with self.rcodesign:
+            await retry_async(
+                func=rcodesign_staple,
+                args=[path],
+                attempts=ATTEMPTS,
+                retry_exceptions=RCodesignError,
+            )
+
+    async def _wait(self, submission_id):
+        future = asyncio.get_running_loop().create_future()
+        self.pending[submission_id] = (future, time.monotonic() + self.timeout)
+        self.submitted.set()
+        try:
+            return await future
+        finally:
+            self.pending.pop(submission_id, None)
+
+    async def _check(self, submission_id):
+        async with self.rcodesign:
+            return await retry_async(
+                func=rcodesign_notary_status,
+                args=(submission_id, self.creds_path),
+                attempts=ATTEMPTS,
+                retry_exceptions=RCodesignError,
+            )
+
+    async def _poll(self):
+        interval = self.poll_interval
+        while True:
+            if not self.pending:
+                self.submitted.clear()
+                await self.submitted.wait()
+                interval = self.poll_interval
+            await asyncio.sleep(interval)
+            pending = list(self.pending.items())
+            statuses = await asyncio.gather(*(self._check(submission_id) for submission_id, _ in pending), return_exceptions=True)
+            finished = False
+            for (submission_id, (future, deadline)), status in zip(pending, statuses):
+                if future.done():
+                    continue
+                if isinstance(status, Exception):
+                    future.set_exception(status)
+                elif status != "InProgress":
+                    log.info(f"Submission {submission_id} is {status}")
+                    future.set_result(status)
+                    finished = True
+                elif time.monotonic() > deadline:
+                    future.set_exception(RCodesignError(f"Timed out waiting for submission {submission_id}"))
+            interval = self.poll_interval if finished else min(interval * POLL_BACKOFF, self.max_poll_interval)
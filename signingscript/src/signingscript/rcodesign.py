@@ -9,6 +9,8 @@ from signingscript.exceptions import SigningScriptError
 
 log = logging.getLogger(__name__)
 
+RE_POLL_STATE = re.compile(r"^poll state after.*: (\w+)$")
+
 
 class RCodesignError(SigningScriptError):
     pass
@@ -112,6 +114,51 @@ async def rcodesign_notary_wait(submission_id, creds_path):
     return
 
 
+async def rcodesign_notary_status(submission_id, creds_path):
+    """Polls Apple services for notarization status once, without waiting
+    Args:
+        submission_id (str): Notary submission id
+        creds_path (str): Path to credentials
+
+    Returns:
+        (str) The submission status, e.g. InProgress, Accepted or Invalid
+    """
+    # notary-wait polls once before checking whether it's waited long enough
+    command = [
+        "rcodesign",
+        "notary-wait",
+        "--max-wait-seconds",
+        "0",
+        "--api-key-path",
+        creds_path,
+        submission_id,
+    ]
+    exitcode, logs = await _execute_command(command)
+    status = find_poll_state(logs)
+    if status is None:
+        raise RCodesignError(f"Error polling notary service. Exit code {exitcode}")
+    # Still in progress, notary-wait exits with an error as it timed out
+    if exitcode > 0 and status != "InProgress":
+        raise RCodesignError(f"Error polling notary service. Exit code {exitcode}")
+    return status
+
+
+def find_poll_state(logs):
+    """Given notary-wait logs, find and return the last polled state
+    Args:
+        logs (list<str>): Polling logs
+
+    Returns:
+        (str) The last state, or None if there isn't one
+    """
+    state = None
+    for line in logs:
+        match = RE_POLL_STATE.search(line)
+        if match:
+            state = match.group(1)
+    return state
+
+
 async def rcodesign_check_result(logs):
     """Checks notarization results
     rcodesign cli call can exit with 0 even though the notarization has failed
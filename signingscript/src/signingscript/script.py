@@ -1,20 +1,37 @@
 #!/usr/bin/env python
 """Signing script."""
 
+import asyncio
+import contextlib
 import json
 import logging
 import os
+import time
 from dataclasses import asdict
 
 import aiohttp
 import scriptworker.client
+from scriptworker.utils import raise_future_exceptions, semaphore_wrapper
 
+from signingscript.autograph import DEFAULT_MAX_IN_FLIGHT, AutographClient
+from signingscript.cache import SigningCache
 from signingscript.exceptions import SigningScriptError
-from signingscript.task import apple_notarize_stacked, build_filelist_dict, sign, task_cert_type, task_signing_formats
+from signingscript.task import (
+    apple_notarize_stacked,
+    build_filelist_dict,
+    can_sign_concurrently,
+    sign,
+    signs_detached_only,
+    task_cert_type,
+    task_signing_formats,
+)
 from signingscript.utils import copy_to_dir, load_apple_notarization_configs, load_autograph_configs
 
 log = logging.getLogger(__name__)
 
+DEFAULT_DETACHED_CONCURRENCY_LIMIT = 16
+DEFAULT_SIGNING_CACHE_MAX_SIZE = 10 * 1024**3
+
 
 # async_main {{{1
 async def async_main(context):
@@ -45,24 +62,32 @@ async def async_main(context):
         context.session = session
         context.autograph_configs = load_autograph_configs(context.config["autograph_configs"])
 
-        # TODO: Make task.sign take in the whole filelist_dict and return a dict of output files.
-        #       That would likely mean changing all behaviors to accept and deal with multiple files at once.
-
         filelist_dict = build_filelist_dict(context)
+        signing_dict = {}
         for path, path_dict in filelist_dict.items():
             if path_dict["formats"] == ["apple_notarization_stacked"]:
                 # Skip if only format is notarization_stacked - handled below
                 continue
             if "apple_notarization_stacked" in path_dict["formats"]:
                 raise SigningScriptError("apple_notarization_stacked cannot be mixed with other signing types")
-            copy_to_dir(path_dict["full_path"], context.config["work_dir"], target=path)
-            log.info("signing %s", path)
-            output_files = await sign(context, os.path.join(work_dir, path), path_dict["formats"], authenticode_comment=path_dict.get("comment"))
-            for source in output_files:
-                source = os.path.relpath(source, work_dir)
-                copy_to_dir(os.path.join(work_dir, source), context.config["artifact_dir"], target=source)
-            if {"autograph_gpg", "stage_autograph_gpg"}.intersection(set(path_dict["formats"])):
-                copy_to_dir(context.config["gpg_pubkey"], context.config["artifact_dir"], target="public/build/KEY")
+            signing_dict[path] = path_dict
+        if context.config.get("signing_cache_dir"):
+            context.signing_cache = SigningCache(
+                context.config["signing_cache_dir"], context.config.get("signing_cache_max_size", DEFAULT_SIGNING_CACHE_MAX_SIZE)
+            )
+        max_in_flight = context.config.get("autograph_max_in_flight", DEFAULT_MAX_IN_FLIGHT)
+        try:
+            async with AutographClient(context.autograph_configs, max_in_flight=max_in_flight) as context.autograph_client:
+                await sign_filelist(context, signing_dict)
+        finally:
+            # The client is closed; sign over context.session from here on
+            context.autograph_client = None
+            scheduler = getattr(context, "authenticode_scheduler", None)
+            if scheduler is not None:
+                scheduler.close()
+                context.authenticode_scheduler = None
+        if context.config.get("signing_cache_dir"):
+            log.info("Signing cache: %s", context.signing_cache.stats())
 
         # notarization_stacked is a special format that takes in all files at once instead of sequentially like other formats
         # Should be fixed in https://github.com/mozilla-releng/scriptworker-scripts/issues/980
@@ -76,6 +101,64 @@ async def async_main(context):
     log.info("Done!")
 
 
+# sign_filelist {{{1
+async def sign_filelist(context, filelist_dict):
+    """Sign every file in ``filelist_dict``, signing independent files concurrently.
+
+    The formats of a single file are still applied in order. At most
+    ``concurrency_limit`` files are signed at once, and files that use a
+    signing function from ``NON_CONCURRENT_SIGNING_FUNCTIONS`` are signed one
+    at a time. Files that only get detached signatures, e.g. checksums files
+    signed with ``autograph_gpg``, are cheap to sign, so they're batched
+    separately, up to ``detached_concurrency_limit`` at once.
+
+    Args:
+        context (Context): the signing context.
+        filelist_dict (dict): the relative path to ``full_path`` and
+            ``formats`` dict, as returned by ``build_filelist_dict``.
+
+    Returns:
+        dict: the relative path to the wall-clock seconds spent signing it.
+
+    """
+    semaphore = asyncio.Semaphore(context.config.get("concurrency_limit", 4))
+    detached_semaphore = asyncio.Semaphore(context.config.get("detached_concurrency_limit", DEFAULT_DETACHED_CONCURRENCY_LIMIT))
+    non_concurrent_lock = asyncio.Lock()
+    timings = {}
+
+    async def _sign_path(path, path_dict):
+        lock = contextlib.nullcontext() if can_sign_concurrently(path_dict["formats"]) else non_concurrent_lock
+        async with lock:
+            start = time.monotonic()
+            await _sign_path_and_copy_artifacts(context, path, path_dict)
+            timings[path] = time.monotonic() - start
+            log.info("Signed %s in %.2fs", path, timings[path])
+
+    start = time.monotonic()
+    futures = [
+        asyncio.ensure_future(semaphore_wrapper(detached_semaphore if signs_detached_only(path_dict["formats"]) else semaphore, _sign_path(path, path_dict)))
+        for path, path_dict in filelist_dict.items()
+    ]
+    await raise_future_exceptions(futures)
+    if timings:
+        log.info("Signed %d files in %.2fs (%.2fs of per-file signing time)", len(timings), time.monotonic() - start, sum(timings.values()))
+    return timings
+
+
+async def _sign_path_and_copy_artifacts(context, path, path_dict):
+    work_dir = context.config["work_dir"]
+    loop = asyncio.get_running_loop()
+    # In a thread, so copying a large file doesn't hold up the other files
+    await loop.run_in_executor(None, copy_to_dir, path_dict["full_path"], work_dir, path)
+    log.info("signing %s", path)
+    output_files = await sign(context, os.path.join(work_dir, path), path_dict["formats"], authenticode_comment=path_dict.get("comment"))
+    for source in output_files:
+        source = os.path.relpath(source, work_dir)
+        await loop.run_in_executor(None, copy_to_dir, os.path.join(work_dir, source), context.config["artifact_dir"], source)
+    if {"autograph_gpg", "stage_autograph_gpg"}.intersection(set(path_dict["formats"])):
+        copy_to_dir(context.config["gpg_pubkey"], context.config["artifact_dir"], target="public/build/KEY")
+
+
 def get_default_config(base_dir=None):
     """Create the default config to work from.
 
@@ -97,6 +180,9 @@ def get_default_config(base_dir=None):
         "hfsplus": "hfsplus",
         "gpg_pubkey": None,
         "widevine_cert": None,
+        "concurrency_limit": 4,
+        "detached_concurrency_limit": DEFAULT_DETACHED_CONCURRENCY_LIMIT,
+        "autograph_max_in_flight": DEFAULT_MAX_IN_FLIGHT,
     }
     return default_config
 
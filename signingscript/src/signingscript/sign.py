@@ -3,37 +3,50 @@
 
 import asyncio
 import base64
-import difflib
 import fnmatch
 import glob
 import hashlib
 import json
 import logging
 import lzma
+import mmap
 import os
 import re
 import resource
 import shutil
+import struct
 import subprocess
 import sys
 import tarfile
 import tempfile
 import time
 import zipfile
-from functools import wraps
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial, wraps
 from io import BytesIO
 
 import mohawk
-import winsign.sign
 from mardor.reader import MarReader
 from mardor.writer import add_signature_block
 from scriptworker.utils import get_single_item_from_sequence, makedirs, raise_future_exceptions, retry_async, rm
-from winsign.crypto import load_pem_certs
 
-from signingscript import task, utils
-from signingscript.createprecomplete import generate_precomplete
+from signingscript import authenticode, task, utils
+from signingscript.authenticode import DEFAULT_AUTOGRAPH_LIMIT as DEFAULT_AUTHENTICODE_AUTOGRAPH_LIMIT
+from signingscript.authenticode import DEFAULT_TIMESTAMP_LIMIT as DEFAULT_AUTHENTICODE_TIMESTAMP_LIMIT
+from signingscript.authenticode import AuthenticodeScheduler
+from signingscript.createprecomplete import diff_precomplete, format_precomplete, get_build_entries_from_paths, walk_build_paths
 from signingscript.exceptions import SigningScriptError
+from signingscript.mar import inject_mar_signature, write_mar_with_placeholder_signature
+from signingscript.notarization import DEFAULT_CONCURRENCY as DEFAULT_NOTARIZATION_CONCURRENCY
+from signingscript.notarization import DEFAULT_MAX_POLL_INTERVAL as DEFAULT_NOTARIZATION_MAX_POLL_INTERVAL
+from signingscript.notarization import DEFAULT_POLL_INTERVAL as DEFAULT_NOTARIZATION_POLL_INTERVAL
+from signingscript.notarization import DEFAULT_TIMEOUT as DEFAULT_NOTARIZATION_TIMEOUT
+from signingscript.notarization import NotarizationScheduler
 from signingscript.rcodesign import RCodesignError, rcodesign_notarize, rcodesign_notary_wait, rcodesign_staple
+from signingscript.xz import DEFAULT_BLOCK_SIZE as DEFAULT_XZ_BLOCK_SIZE
+from signingscript.xz import ParallelXZWriter
 
 log = logging.getLogger(__name__)
 
@@ -46,8 +59,13 @@ except ImportError:
 
 sys.path.append(os.path.abspath(os.path.join(os.path.realpath(os.path.dirname(__file__)), "vendored", "mozbuild")))  # append the mozbuild vendor
 
-from mozbuild.action.tooltool import safe_extract  # noqa  # isort:skip
-from mozpack import mozjar  # noqa  # isort:skip
+# These take longer to import than the rest of signingscript, and only some
+# formats use them, so they're imported when first used
+tooltool = utils.lazy_import("mozbuild.action.tooltool")
+mozjar = utils.lazy_import("mozpack.mozjar")
+winsign_crypto = utils.lazy_import("winsign.crypto")
+winsign_osslsigncode = utils.lazy_import("winsign.osslsigncode")
+winsign_sign = utils.lazy_import("winsign.sign")
 
 # These files load the Widevine CDM and therefore need a .sig file to be
 # generated.
@@ -278,6 +296,10 @@ async def sign_widevine_zip(context, orig_path, fmt):
     The blessed files should be signed with the `widevine_blessed` format.
     Then append the sigfiles to the zipfile.
 
+    By default the whole zipfile is extracted and recreated. With the
+    `widevine_zip_append` config option, only the files to sign are
+    extracted, and the sigfiles are appended to the original zipfile.
+
     Args:
         context (Context): the signing context
         orig_path (str): the source file to sign
@@ -295,7 +317,9 @@ async def sign_widevine_zip(context, orig_path, fmt):
     all_files = await _get_zipfile_files(orig_path)
     files_to_sign = _get_widevine_signing_files(all_files)
     log.debug("Widevine files to sign: %s", files_to_sign)
-    if files_to_sign:
+    if files_to_sign and context.config.get("widevine_zip_append"):
+        await _sign_widevine_zip_append(context, orig_path, fmt, files_to_sign, tmp_dir)
+    elif files_to_sign:
         # Extract all files so we can create `precomplete` with the full
         # file list
         all_files = await _extract_zipfile(context, orig_path, tmp_dir=tmp_dir)
@@ -315,6 +339,77 @@ async def sign_widevine_zip(context, orig_path, fmt):
     return orig_path
 
 
+async def _sign_widevine_zip_append(context, orig_path, fmt, files_to_sign, tmp_dir):
+    """Sign `files_to_sign` and append their sigfiles to the zipfile at `orig_path`.
+
+    Existing members are left as they are; only the central directory is
+    rewritten, along with a new `precomplete`. The old `precomplete` data is
+    left in the zipfile, but is no longer referenced by the central directory.
+    """
+    await _extract_zipfile(context, orig_path, files=list(files_to_sign), tmp_dir=tmp_dir)
+    tasks = []
+    sig_files = {}
+    for name, blessed in files_to_sign.items():
+        from_ = os.path.join(tmp_dir, name)
+        to = f"{from_}.sig"
+        tasks.append(asyncio.ensure_future(sign_widevine_with_autograph(context, from_, blessed, fmt, to=to)))
+        sig_files[f"{name}.sig"] = to
+    await raise_future_exceptions(tasks)
+    _append_to_zipfile_with_precomplete(context, orig_path, sig_files)
+
+
+def _append_to_zipfile_with_precomplete(context, to, files):
+    """Append `files` (arcname: path) to the zipfile `to` and regenerate its `precomplete`."""
+    log.info("Appending %s to %s", sorted(files), to)
+    try:
+        with zipfile.ZipFile(to, mode="a", compression=zipfile.ZIP_DEFLATED) as z:
+            old_info = get_single_item_from_sequence(
+                z.infolist(),
+                condition=lambda info: os.path.basename(info.filename) == "precomplete",
+                ErrorClass=SigningScriptError,
+                no_item_error_message=f'No `precomplete` file found in "{to}"',
+                too_many_item_error_message=f'More than one `precomplete` file in "{to}"',
+            )
+            before = z.read(old_info).decode("utf-8").splitlines(keepends=True)
+            after = _get_precomplete_from_names(old_info.filename, z.namelist() + list(files))
+
+            # Drop the old precomplete from the central directory, so the new one replaces it
+            z.filelist.remove(old_info)
+            del z.NameToInfo[old_info.filename]
+            new_info = zipfile.ZipInfo(old_info.filename, date_time=old_info.date_time)
+            new_info.external_attr = old_info.external_attr
+            new_info.compress_type = zipfile.ZIP_DEFLATED
+            z.writestr(new_info, after)
+            for arcname, path in files.items():
+                z.write(path, arcname=arcname)
+    except SigningScriptError:
+        raise
+    except Exception as e:
+        raise SigningScriptError(e)
+    _write_precomplete_diff(context, before, after.decode("utf-8").splitlines(keepends=True))
+
+
+def _get_precomplete_from_names(precomplete_name, names):
+    """Return the `precomplete` contents for the archive member `names`.
+
+    Args:
+        precomplete_name (str): the member name of the `precomplete` file
+        names (list): the "/" separated member names, with a trailing "/"
+            for directories
+
+    Returns:
+        bytes: the new `precomplete` contents
+
+    """
+    root = os.path.dirname(precomplete_name)
+    # Inside a mac bundle, precomplete lives in Contents/Resources
+    if os.path.basename(root) == "Resources":
+        root = os.path.dirname(os.path.dirname(root))
+    prefix = f"{root}/" if root else ""
+    rel_paths = [name[len(prefix) :] for name in names if name.startswith(prefix) and name != prefix]
+    return format_precomplete(*get_build_entries_from_paths(rel_paths))
+
+
 # sign_widevine_tar {{{1
 @time_async_function
 async def sign_widevine_tar(context, orig_path, fmt):
@@ -326,7 +421,9 @@ async def sign_widevine_tar(context, orig_path, fmt):
     Then recreate the tarball.
 
     Ideally we would be able to append the sigfiles to the original tarball,
-    but that's not possible with compressed tarballs.
+    but that's not possible with compressed tarballs. With the `tar_streaming`
+    config option, the tarball is rewritten in a single pass instead, only
+    extracting the files to sign; see `_stream_resign_tarfile`.
 
     Args:
         context (Context): the signing context
@@ -346,7 +443,10 @@ async def sign_widevine_tar(context, orig_path, fmt):
     all_files = await _get_tarfile_files(orig_path, compression)
     files_to_sign = _get_widevine_signing_files(all_files)
     log.debug("Widevine files to sign: %s", files_to_sign)
-    if files_to_sign:
+    if files_to_sign and context.config.get("tar_streaming"):
+        sign_member = partial(_sign_widevine_tar_member, context, fmt, files_to_sign)
+        await _stream_resign_tarfile(context, orig_path, compression, tmp_dir, files_to_sign, sign_member, precomplete=True)
+    elif files_to_sign:
         # Extract all files so we can create `precomplete` with the full
         # file list
         all_files = await _extract_tarfile(context, orig_path, compression, tmp_dir=tmp_dir)
@@ -450,7 +550,8 @@ async def sign_omnija_tar(context, orig_path, fmt):
 
     Extract the files to sign, then sign them with autograph, recreating the omni.ja
     from the original to preserve performance tweeks but adding signing info.
-    Then recreate the tarball.
+    Then recreate the tarball, or with the `tar_streaming` config option,
+    rewrite it in a single pass; see `_stream_resign_tarfile`.
 
     Args:
         context (Context): the signing context
@@ -470,7 +571,10 @@ async def sign_omnija_tar(context, orig_path, fmt):
     all_files = await _get_tarfile_files(orig_path, compression)
     files_to_sign = _get_omnija_signing_files(all_files)
     log.debug("Omnija files to sign: %s", files_to_sign)
-    if files_to_sign:
+    if files_to_sign and context.config.get("tar_streaming"):
+        sign_member = partial(_sign_omnija_tar_member, context, fmt)
+        await _stream_resign_tarfile(context, orig_path, compression, tmp_dir, files_to_sign, sign_member, in_place=True)
+    elif files_to_sign:
         # Extract all files so we can create `precomplete` with the full
         # file list
         all_files = await _extract_tarfile(context, orig_path, compression, tmp_dir=tmp_dir)
@@ -487,6 +591,20 @@ async def sign_omnija_tar(context, orig_path, fmt):
     return orig_path
 
 
+async def _sign_widevine_tar_member(context, fmt, files_to_sign, name, path):
+    """Widevine sign the tarball member `name`, extracted to `path`, for `_stream_resign_tarfile`."""
+    to = f"{path}.sig"
+    await sign_widevine_with_autograph(context, path, files_to_sign[name], fmt, to=to)
+    # Move the sig location on mac. This should be noop on linux.
+    return {_get_mac_sigpath(name): to}
+
+
+async def _sign_omnija_tar_member(context, fmt, name, path):
+    """Omnija sign the tarball member `name`, extracted to `path`, in place for `_stream_resign_tarfile`."""
+    await sign_omnija_with_autograph(context, path, fmt)
+    return {}
+
+
 # _should_sign_windows {{{1
 def _should_sign_windows(filename):
     """Return True if filename should be signed."""
@@ -579,32 +697,55 @@ def _get_omnija_signing_files(file_list):
 
 # _run_generate_precomplete {{{1
 def _run_generate_precomplete(context, tmp_dir):
-    """Regenerate `precomplete` file with widevine sig paths for complete mar."""
+    """Regenerate `precomplete` file with widevine sig paths for complete mar.
+
+    `tmp_dir` is walked once, both to find the `precomplete` file and to list
+    the files and directories it should remove.
+
+    """
     log.info("Generating `precomplete` file...")
-    path = _ensure_one_precomplete(tmp_dir, "before")
+    rel_paths = walk_build_paths(tmp_dir)
+    precomplete_name = _ensure_one_precomplete(tmp_dir, [rel_path for rel_path in rel_paths if rel_path.split("/")[-1] == "precomplete"])
+    path = os.path.join(tmp_dir, precomplete_name)
     with open(path, "r") as fh:
         before = fh.readlines()
-    generate_precomplete(os.path.dirname(path))
-    path = _ensure_one_precomplete(tmp_dir, "after")
-    with open(path, "r") as fh:
-        after = fh.readlines()
-    # Create diff file
+    after = _get_precomplete_from_names(precomplete_name, rel_paths)
+    with open(path, "wb") as fh:
+        fh.write(after)
+    _write_precomplete_diff(context, before, after.decode("utf-8").splitlines(keepends=True))
+
+
+def _write_precomplete_diff(context, before, after):
+    """Write the changes to the `precomplete` lines as artifacts.
+
+    `public/logs/precomplete.diff` lists the removed lines, prefixed with
+    "- ", then the added lines, prefixed with "+ ". `public/logs/precomplete-diff.json`
+    has them as the "removed" and "added" lists, along with the number of
+    "unchanged" lines.
+
+    """
+    diff = diff_precomplete(before, after)
+    log.info("`precomplete`: %d lines removed, %d added, %d unchanged", len(diff["removed"]), len(diff["added"]), diff["unchanged"])
     diff_path = os.path.join(context.config["work_dir"], "precomplete.diff")
     with open(diff_path, "w") as fh:
-        for line in difflib.ndiff(before, after):
-            fh.write(line)
+        fh.writelines(f"- {line}" for line in diff["removed"])
+        fh.writelines(f"+ {line}" for line in diff["added"])
     utils.copy_to_dir(diff_path, context.config["artifact_dir"], target="public/logs/precomplete.diff")
+    summary_path = os.path.join(context.config["work_dir"], "precomplete-diff.json")
+    with open(summary_path, "w") as fh:
+        json.dump({key: [line.rstrip("\n") for line in value] if isinstance(value, list) else value for key, value in diff.items()}, fh, indent=2)
+    utils.copy_to_dir(summary_path, context.config["artifact_dir"], target="public/logs/precomplete-diff.json")
 
 
 # _ensure_one_precomplete {{{1
-def _ensure_one_precomplete(tmp_dir, adj):
-    """Ensure we only have one `precomplete` file in `tmp_dir`."""
+def _ensure_one_precomplete(tmp_dir, precomplete_names):
+    """Ensure we only have one `precomplete` file in `tmp_dir`, given the names found."""
     return get_single_item_from_sequence(
-        glob.glob(os.path.join(tmp_dir, "**", "precomplete"), recursive=True),
+        precomplete_names,
         condition=lambda _: True,
         ErrorClass=SigningScriptError,
         no_item_error_message='No `precomplete` file found in "{}"'.format(tmp_dir),
-        too_many_item_error_message='More than one `precomplete` file {} in "{}"'.format(adj, tmp_dir),
+        too_many_item_error_message='More than one `precomplete` file in "{}"'.format(tmp_dir),
     )
 
 
@@ -732,7 +873,7 @@ async def _extract_tarfile(context, from_, compression, tmp_dir=None):
         rm(tmp_dir)
         utils.mkdir(tmp_dir)
         with tarfile.open(from_, mode="r:{}".format(compression)) as t:
-            safe_extract(t, path=tmp_dir)
+            tooltool.safe_extract(t, path=tmp_dir)
             for name in t.getnames():
                 path = os.path.join(tmp_dir, name)
                 os.path.isfile(path) and files.append(path)
@@ -751,18 +892,43 @@ def _owner_filter(tarinfo_obj):
     return tarinfo_obj
 
 
-def _create_xz_tarfile(to, files, rel_dir):
-    """Creates an xz tarball with max compression"""
+def _open_xz_writer(fh, preset=9 | lzma.PRESET_EXTREME, threads=1, block_size=DEFAULT_XZ_BLOCK_SIZE):
+    """Return a file object that xz compresses everything written to it into `fh`.
+
+    With more than one thread, the data is compressed in independent
+    blocks of `block_size` bytes on a thread pool.
+    """
     filters = [
-        {"id": lzma.FILTER_LZMA2, "preset": 9 | lzma.PRESET_EXTREME},
+        {"id": lzma.FILTER_LZMA2, "preset": preset},
     ]
-    with lzma.open(to, "wb", filters=filters) as dest, tarfile.open(mode="w|", fileobj=dest) as tf:
-        for f in files:
-            relpath = os.path.relpath(f, rel_dir)
-            tf.add(f, arcname=relpath, filter=_owner_filter)
+    if threads > 1:
+        return ParallelXZWriter(fh, filters, threads, block_size)
+    return lzma.LZMAFile(fh, "wb", filters=filters)
+
+
+def _create_xz_tarfile(to, files, rel_dir, preset=9 | lzma.PRESET_EXTREME, threads=1, block_size=DEFAULT_XZ_BLOCK_SIZE):
+    """Creates an xz tarball, with max compression by default.
+
+    With more than one thread, the tarball is compressed in independent
+    blocks of `block_size` bytes on a thread pool.
+    """
+    with open(to, "wb") as fh:
+        dest = _open_xz_writer(fh, preset=preset, threads=threads, block_size=block_size)
+        with dest, tarfile.open(mode="w|", fileobj=dest) as tf:
+            for f in files:
+                relpath = os.path.relpath(f, rel_dir)
+                tf.add(f, arcname=relpath, filter=_owner_filter)
     return to
 
 
+def _get_xz_tarfile_kwargs(config):
+    """Return the `_create_xz_tarfile` compression kwargs for the `xz_*` config options."""
+    preset = config.get("xz_preset", 9)
+    if config.get("xz_extreme", True):
+        preset |= lzma.PRESET_EXTREME
+    return {"preset": preset, "threads": config.get("xz_threads", 1), "block_size": config.get("xz_block_size", DEFAULT_XZ_BLOCK_SIZE)}
+
+
 # _create_tarfile {{{1
 @time_async_function
 async def _create_tarfile(context, to, files, compression, tmp_dir=None):
@@ -772,7 +938,7 @@ async def _create_tarfile(context, to, files, compression, tmp_dir=None):
     try:
         log.info("Creating tarfile {}...".format(to))
         if compression == "xz":
-            return _create_xz_tarfile(to, files, tmp_dir)
+            return _create_xz_tarfile(to, files, tmp_dir, **_get_xz_tarfile_kwargs(context.config))
 
         with tarfile.open(to, mode="w:{}".format(compression)) as t:
             for f in files:
@@ -783,14 +949,167 @@ async def _create_tarfile(context, to, files, compression, tmp_dir=None):
         raise SigningScriptError(e)
 
 
+# _stream_resign_tarfile {{{1
+class _TeeReader:
+    """Read from `fileobj`, copying everything read to `copy`."""
+
+    def __init__(self, fileobj, copy):
+        """Initialize _TeeReader."""
+        self.fileobj = fileobj
+        self.copy = copy
+
+    def read(self, size=-1):
+        """Read up to `size` bytes from `fileobj`, and write them to `copy`."""
+        data = self.fileobj.read(size)
+        self.copy.write(data)
+        return data
+
+
+@contextmanager
+def _open_tarfile_writer(to, compression, config):
+    """Open `to` to write a tarball as a stream, compressed as `_create_tarfile` would."""
+    with open(to, "wb") as fh:
+        if compression == "xz":
+            dest = _open_xz_writer(fh, **_get_xz_tarfile_kwargs(config))
+            with dest, tarfile.open(mode="w|", fileobj=dest) as tf:
+                yield tf
+        else:
+            with tarfile.open(mode="w|{}".format(compression), fileobj=fh) as tf:
+                yield tf
+
+
+@time_async_function
+async def _stream_resign_tarfile(context, orig_path, compression, tmp_dir, files_to_sign, sign_member, in_place=False, precomplete=False):
+    """Sign members of a tarball, rewriting it in a single pass.
+
+    Members are read one at a time from the compressed `orig_path`, and
+    written straight to a new tarball next to it, which then replaces it.
+    Only the members in `files_to_sign` are extracted, to `tmp_dir`, and
+    passed to `sign_member`. The new members it returns, such as sigfiles,
+    are appended. Every member goes through `_owner_filter`.
+
+    Unlike `_extract_tarfile` and `_create_tarfile`, this keeps directory,
+    symlink and other non-file members, and only ever needs about one more
+    tarball's worth of disk space.
+
+    Args:
+        context (Context): the signing context
+        orig_path (str): the tarball to sign
+        compression (str): the tarball compression, e.g. ".gz"
+        tmp_dir (str): the directory to extract the members to sign to
+        files_to_sign (collection): the names of the members to sign
+        sign_member (function): the coroutine function that signs a member,
+            called with its name and the path it was extracted to. Returns
+            a dict of arcname: path of the new members to add.
+        in_place (bool, optional): whether `sign_member` modifies the
+            extracted file, which then replaces the member. Either way,
+            members are signed concurrently in the background while the rest
+            of the tarball is written. Members signed in place are written
+            after the others, in their original order. Defaults to False.
+        precomplete (bool, optional): whether to regenerate the `precomplete`
+            member from the final list of members. It's moved to the end of
+            the tarball. Defaults to False.
+
+    Raises:
+        SigningScriptError: on failure
+
+    Returns:
+        str: `orig_path`
+
+    """
+    compression = _get_tarfile_compression(compression)
+    fd, to = tempfile.mkstemp(prefix="resigned", suffix=".tar.{}".format(compression), dir=os.path.dirname(os.path.abspath(orig_path)))
+    os.close(fd)
+    log.info("Streaming %s to %s...", orig_path, to)
+    tasks = []
+    in_place_members = []
+    extracted = []
+    names = []
+    precompletes = []
+    try:
+        with tarfile.open(orig_path, mode="r|{}".format(compression)) as tf_in, _open_tarfile_writer(to, compression, context.config) as tf_out:
+            for member in tf_in:
+                names.append(f"{member.name}/" if member.isdir() else member.name)
+                if not member.isfile():
+                    tf_out.addfile(_owner_filter(member))
+                elif precomplete and os.path.basename(member.name) == "precomplete":
+                    # Written last, once we know every member name
+                    precompletes.append((member, tf_in.extractfile(member).read()))
+                elif member.name in files_to_sign:
+                    # Extract by basename only, so member names can't point outside `tmp_dir`
+                    path = os.path.join(tmp_dir, str(len(extracted)), os.path.basename(member.name))
+                    makedirs(os.path.dirname(path))
+                    extracted.append(path)
+                    if in_place:
+                        # Written once it's signed
+                        with open(path, "wb") as fh:
+                            shutil.copyfileobj(tf_in.extractfile(member), fh)
+                        in_place_members.append((member, path))
+                    else:
+                        with open(path, "wb") as fh:
+                            tf_out.addfile(_owner_filter(member), _TeeReader(tf_in.extractfile(member), fh))
+                    tasks.append(asyncio.ensure_future(sign_member(member.name, path)))
+                else:
+                    tf_out.addfile(_owner_filter(member), tf_in.extractfile(member))
+                # Let the signing tasks make progress
+                await asyncio.sleep(0)
+
+            results = await raise_future_exceptions(tasks)
+            for member, path in in_place_members:
+                member.size = os.path.getsize(path)
+                with open(path, "rb") as fh:
+                    tf_out.addfile(_owner_filter(member), fh)
+            for new_members in results:
+                for arcname, path in new_members.items():
+                    log.debug("Adding %s to %s", arcname, orig_path)
+                    tf_out.add(path, arcname=arcname, filter=_owner_filter)
+                    names.append(arcname)
+
+            if precomplete:
+                member, data = get_single_item_from_sequence(
+                    precompletes,
+                    condition=lambda _: True,
+                    ErrorClass=SigningScriptError,
+                    no_item_error_message='No `precomplete` file found in "{}"'.format(orig_path),
+                    too_many_item_error_message='More than one `precomplete` file in "{}"'.format(orig_path),
+                )
+                after = _get_precomplete_from_names(member.name, names)
+                member.size = len(after)
+                tf_out.addfile(_owner_filter(member), BytesIO(after))
+        os.replace(to, orig_path)
+    except Exception as e:
+        for task in tasks:
+            task.cancel()
+        rm(to)
+        if isinstance(e, SigningScriptError):
+            raise
+        raise SigningScriptError(e)
+    finally:
+        for path in extracted:
+            rm(os.path.dirname(path))
+    if precomplete:
+        _write_precomplete_diff(context, data.decode("utf-8").splitlines(keepends=True), after.decode("utf-8").splitlines(keepends=True))
+    return orig_path
+
+
+# Read input in multiples of 3 bytes, so each block base64-encodes without padding
+_B64_ENCODE_BLOCK_SIZE = 3 * 64 * 1024
+_AUTOGRAPH_RESPONSE_CHUNK_SIZE = 256 * 1024
+_READ_BLOCK_SIZE = 1024 * 1024
+_JSON_STRING_SPECIAL_RE = re.compile(rb'["\\]')
+
+
 def write_signing_req_to_disk(fp, signing_req):
     """Write signing_req to fp.
 
     Does proper base64 and json encoding.
-    Tries not to hold onto a lot of memory.
+    Tries not to hold onto a lot of memory, and only ever appends to `fp`, so
+    the request body can be hashed as it is written.
     """
     fp.write(b"[{")
-    for k, v in signing_req.items():
+    for i, (k, v) in enumerate(signing_req.items()):
+        if i:
+            fp.write(b",")
         fp.write(json.dumps(k).encode("utf8"))
         fp.write(b":")
         if hasattr(v, "read"):
@@ -799,7 +1118,7 @@ def write_signing_req_to_disk(fp, signing_req):
             v.seek(0)
             fp.write(b'"')
             while True:
-                block = v.read(1020)
+                block = v.read(_B64_ENCODE_BLOCK_SIZE)
                 if not block:
                     break
                 e = b64encode(block).encode("utf8")
@@ -807,24 +1126,51 @@ def write_signing_req_to_disk(fp, signing_req):
             fp.write(b'"')
         else:
             fp.write(json.dumps(v).encode("utf8"))
-        fp.write(b",")
-    fp.seek(-1, 1)
     fp.write(b"}]")
 
 
-def get_hawk_content_hash(request_body, content_type):
-    """Generate the content hash of the given request."""
+class HashingWriter:
+    """A minimal writable file wrapper that hashes everything written through it.
+
+    Args:
+        fp (file object): the file to write to
+        h (hashlib hash): the hash to update
+
+    """
+
+    def __init__(self, fp, h):
+        """Initialize HashingWriter."""
+        self.fp = fp
+        self.h = h
+
+    def write(self, data):
+        """Hash and write `data`."""
+        self.h.update(data)
+        return self.fp.write(data)
+
+
+def _new_hawk_content_hash(content_type):
     h = hashlib.new("sha256")
     h.update(b"hawk.1.payload\n")
     h.update(content_type.encode("utf8"))
     h.update(b"\n")
+    return h
+
+
+def _finish_hawk_content_hash(h):
+    h.update(b"\n")
+    return b64encode(h.digest())
+
+
+def get_hawk_content_hash(request_body, content_type):
+    """Generate the content hash of the given request."""
+    h = _new_hawk_content_hash(content_type)
     while True:
         block = request_body.read(1024)
         if not block:
             break
         h.update(block)
-    h.update(b"\n")
-    return b64encode(h.digest())
+    return _finish_hawk_content_hash(h)
 
 
 def get_hawk_header(url, user, password, content_type, content_hash):
@@ -837,20 +1183,168 @@ def get_hawk_header(url, user, password, content_type, content_hash):
     return auth_header
 
 
+class AutographResponseDecoder:
+    """Incrementally decode an Autograph JSON response.
+
+    The base64 value of the first ``payload_key`` key is decoded straight to
+    ``output_file`` as the response is fed in, so the signed payload is never
+    held in memory. The rest of the response is small, and is parsed as JSON
+    once the response is complete.
+
+    Args:
+        output_file (file object): the file to write the decoded payload to
+        payload_key (str): the key of the payload, e.g. ``signed_file``
+
+    """
+
+    def __init__(self, output_file, payload_key):
+        """Initialize AutographResponseDecoder."""
+        self.output_file = output_file
+        self.payload_key = payload_key
+        self.payload_found = False
+        self.payload_size = 0
+        self._json = bytearray()
+        self._in_string = False
+        self._streaming = False
+        self._string = bytearray()
+        self._escape = None
+        self._last_string = None
+        self._key = None
+        self._b64_remainder = b""
+
+    def feed(self, data):
+        """Decode the next chunk of the response body.
+
+        Args:
+            data (bytes): the next chunk of the response body
+
+        """
+        pos, size = 0, len(data)
+        while pos < size:
+            if self._escape is not None:
+                self._escape += data[pos : pos + 1]
+                pos += 1
+                if len(self._escape) == 6 or (len(self._escape) == 2 and self._escape != b"\\u"):
+                    self._end_escape()
+            elif self._in_string:
+                m = _JSON_STRING_SPECIAL_RE.search(data, pos)
+                end = m.start() if m else size
+                self._add_string_data(data[pos:end])
+                pos = end + 1
+                if m is None:
+                    break
+                if data[end : end + 1] == b'"':
+                    self._end_string()
+                else:
+                    self._escape = b"\\"
+            else:
+                char = data[pos : pos + 1]
+                pos += 1
+                if char == b'"':
+                    self._start_string()
+                    continue
+                if char == b":":
+                    self._key = self._last_string
+                elif not char.isspace():
+                    self._key = None
+                self._json += char
+
+    def finish(self):
+        """Finish decoding the response.
+
+        Raises:
+            SigningScriptError: if the response is truncated or has no payload
+
+        Returns:
+            list: the parsed response, with the payload value replaced by an
+                empty string
+
+        """
+        if self._in_string or self._escape is not None:
+            raise SigningScriptError("Truncated autograph response")
+        if not self.payload_found:
+            raise SigningScriptError(f"No {self.payload_key} found in autograph response")
+        return json.loads(self._json)
+
+    def _start_string(self):
+        self._in_string = True
+        self._string = bytearray()
+        self._json += b'"'
+        if self._key == self.payload_key and not self.payload_found:
+            self.payload_found = True
+            self._streaming = True
+        self._key = None
+
+    def _add_string_data(self, data):
+        if self._streaming:
+            self._write_payload(data)
+        else:
+            self._string += data
+            self._json += data
+
+    def _end_escape(self):
+        escape, self._escape = self._escape, None
+        if self._streaming:
+            self._write_payload(json.loads(b'"' + escape + b'"').encode("ascii"))
+        else:
+            self._string += escape
+            self._json += escape
+
+    def _end_string(self):
+        if self._streaming:
+            if self._b64_remainder:
+                raise SigningScriptError("Invalid base64 payload in autograph response")
+            self._streaming = False
+        else:
+            self._last_string = self._string.decode("utf8")
+        self._in_string = False
+        self._json += b'"'
+
+    def _write_payload(self, data):
+        if self._b64_remainder:
+            data = self._b64_remainder + data
+        usable = len(data) - len(data) % 4
+        self._b64_remainder = data[usable:]
+        if usable:
+            decoded = base64.b64decode(data[:usable])
+            self.output_file.write(decoded)
+            self.payload_size += len(decoded)
+
+
 @time_async_function
-async def call_autograph(session, url, user, password, sign_req):
-    """Call autograph and return the json response."""
+async def call_autograph(session, url, user, password, sign_req, output_file=None, output_key="signed_file"):
+    """Call autograph and return the json response.
+
+    The request body is written to a temporary file and hashed for the hawk
+    header in the same pass, in a worker thread.
+
+    Args:
+        session (aiohttp.ClientSession): client session object
+        url (str): the autograph endpoint to POST to
+        user (str): the hawk user
+        password (str): the hawk password
+        sign_req (dict): the signing request, from ``make_signing_req``
+        output_file (file object, optional): if set, stream the base64-decoded
+            `output_key` value of the response to this file instead of loading
+            it into memory. Defaults to None.
+        output_key (str, optional): the response key to stream to
+            `output_file`. Defaults to ``signed_file``.
+
+    Returns:
+        list: the autograph response. If `output_file` is set, the payload
+            value is replaced by an empty string.
+
+    """
     content_type = "application/json"
 
     request_body = tempfile.TemporaryFile("w+b")
-    write_signing_req_to_disk(request_body, sign_req)
-    request_body.seek(0)
-
-    content_hash = get_hawk_content_hash(request_body, content_type)
+    h = _new_hawk_content_hash(content_type)
+    # In a thread, so base64 encoding a large input doesn't hold up other requests
+    await asyncio.get_running_loop().run_in_executor(None, write_signing_req_to_disk, HashingWriter(request_body, h), sign_req)
+    content_hash = _finish_hawk_content_hash(h)
 
     auth_header = get_hawk_header(url, user, password, content_type, content_hash)
 
-    request_body.seek(0, 2)
     req_size = request_body.tell()
     log.debug("req_size: %s", req_size)
     request_body.seek(0)
@@ -861,10 +1355,18 @@ async def call_autograph(session, url, user, password, sign_req):
     else:
         log.error("Autograph response: %s, %s", resp.status, await resp.text())
     resp.raise_for_status()
-    # TODO: Write this out to temporary file. The responses can be large,
-    # especially in the case of APK/omnija signing where the entire file is
-    # being sent and returned.
-    return await resp.json()
+    if output_file is None:
+        return await resp.json()
+
+    # We may be retrying; start from an empty file
+    output_file.seek(0)
+    output_file.truncate()
+    decoder = AutographResponseDecoder(output_file, output_key)
+    async for chunk in resp.content.iter_chunked(_AUTOGRAPH_RESPONSE_CHUNK_SIZE):
+        decoder.feed(chunk)
+    response = decoder.finish()
+    log.debug("Streamed %s bytes of autograph %s to disk", decoder.payload_size, decoder.payload_key)
+    return response
 
 
 def b64encode(input_bytes):
@@ -927,7 +1429,7 @@ def _xpi_signing_options(fmt):
 
 
 @time_async_function
-async def sign_with_autograph(session, server, input_file, fmt, autograph_method, keyid=None, extension_id=None):
+async def sign_with_autograph(session, server, input_file, fmt, autograph_method, keyid=None, extension_id=None, output_file=None, attempts=3):
     """Signs data with autograph and returns the result.
 
     Args:
@@ -939,13 +1441,16 @@ async def sign_with_autograph(session, server, input_file, fmt, autograph_method
                                 one of 'file', 'hash', or 'data'
         keyid (str): which key to use on autograph (optional)
         extension_id (str): which id to send to autograph for the extension (optional)
+        output_file (file object): if set, stream the decoded signed data to
+                                   this file rather than returning it (optional)
+        attempts (int): how many times to try the request. Defaults to 3.
 
     Raises:
         aiohttp.ClientError: on failure
         SigningScriptError: when no suitable signing server is found for fmt
 
     Returns:
-        bytes: the signed data
+        bytes: the signed data, or None if `output_file` is set
 
     """
     if autograph_method not in {"file", "hash", "data"}:
@@ -958,15 +1463,35 @@ async def sign_with_autograph(session, server, input_file, fmt, autograph_method
 
     log.debug(f"sign_with_autograph: url: {url}, keyid: {keyid}, client_id: {server.client_id}")
     sign_resp = await retry_async(
-        call_autograph, args=(session, url, server.client_id, server.access_key, sign_req), attempts=3, sleeptime_kwargs={"delay_factor": 2.0}
+        call_autograph,
+        args=(session, url, server.client_id, server.access_key, sign_req),
+        kwargs={"output_file": output_file, "output_key": "signed_file" if autograph_method == "file" else "signature"},
+        attempts=attempts,
+        sleeptime_kwargs={"delay_factor": 2.0},
     )
 
+    if output_file is not None:
+        return None
     if autograph_method == "file":
         return sign_resp[0]["signed_file"]
     else:
         return sign_resp[0]["signature"]
 
 
+async def _sign_with_context_autograph(context, cert_type, server, input_file, fmt, autograph_method, **kwargs):
+    """Sign through ``context.autograph_client`` if there is one, otherwise with `server` over ``context.session``."""
+    autograph_client = getattr(context, "autograph_client", None)
+    if autograph_client is not None:
+        return await autograph_client.call(cert_type, fmt, sign_with_autograph, input_file, fmt, autograph_method, attempts=1, **kwargs)
+    return await sign_with_autograph(context.session, server, input_file, fmt, autograph_method, **kwargs)
+
+
+def _signing_cache_key(context, cert_type, server, input_sha256, fmt, keyid=None, **extra):
+    """Return the ``context.signing_cache`` key for a request."""
+    signer = f"{cert_type}:{server.url}:{server.client_id}"
+    return context.signing_cache.make_key(input_sha256, fmt, keyid or server.key_id, signer, **extra)
+
+
 @time_async_function
 async def sign_file_with_autograph(context, from_, fmt, to=None, extension_id=None):
     """Signs file with autograph and writes the results to a file.
@@ -992,13 +1517,39 @@ async def sign_file_with_autograph(context, from_, fmt, to=None, extension_id=No
     a = get_autograph_config(context.autograph_configs, cert_type, [fmt], raise_on_empty=True)
     log.debug(f"got autograph config: url: {a.url}, id: {a.client_id}, formats: {a.formats}, key_id: {a.key_id}")
     to = to or from_
-    input_file = open(from_, "rb")
-    signed_bytes = base64.b64decode(await sign_with_autograph(context.session, a, input_file, fmt, "file", extension_id=extension_id))
-    with open(to, "wb") as fout:
-        fout.write(signed_bytes)
+    cache_key = None
+    if getattr(context, "signing_cache", None) is not None:
+        cache_key = _signing_cache_key(context, cert_type, a, utils.get_hash(from_, "sha256"), fmt, extension_id=extension_id)
+        if context.signing_cache.get(cache_key, to):
+            return to
+    if context.config.get("autograph_streaming"):
+        await _sign_file_with_autograph_streaming(context, cert_type, a, from_, fmt, to, extension_id)
+    else:
+        input_file = open(from_, "rb")
+        signed_bytes = base64.b64decode(await _sign_with_context_autograph(context, cert_type, a, input_file, fmt, "file", extension_id=extension_id))
+        with open(to, "wb") as fout:
+            fout.write(signed_bytes)
+    if cache_key:
+        context.signing_cache.put(cache_key, to)
     return to
 
 
+async def _sign_file_with_autograph_streaming(context, cert_type, server, from_, fmt, to, extension_id):
+    """Sign `from_` without holding the file or the signed file in memory.
+
+    The signed file is streamed into a temporary file next to `to`, which is
+    then atomically moved into place.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=".autograph", dir=os.path.dirname(os.path.abspath(to)))
+    try:
+        with open(from_, "rb") as input_file, os.fdopen(fd, "w+b") as output_file:
+            await _sign_with_context_autograph(context, cert_type, server, input_file, fmt, "file", extension_id=extension_id, output_file=output_file)
+        os.replace(tmp_path, to)
+    except BaseException:
+        rm(tmp_path)
+        raise
+
+
 @time_async_function
 async def sign_gpg_with_autograph(context, from_, fmt, **kwargs):
     """Signs file with autograph and writes the results to a file.
@@ -1019,10 +1570,9 @@ async def sign_gpg_with_autograph(context, from_, fmt, **kwargs):
     cert_type = task.task_cert_type(context)
     a = get_autograph_config(context.autograph_configs, cert_type, [fmt], raise_on_empty=True)
     to = f"{from_}.asc"
-    input_file = open(from_, "rb")
-    signature = await sign_with_autograph(context.session, a, input_file, fmt, "data")
-    with open(to, "w") as fout:
-        fout.write(signature)
+    with open(from_, "rb") as input_file:
+        signature = await _sign_with_context_autograph(context, cert_type, a, input_file, fmt, "data")
+    _write_detached_signature(to, signature.encode("utf-8"))
     return [from_, to]
 
 
@@ -1046,8 +1596,16 @@ async def sign_hash_with_autograph(context, hash_, fmt, keyid=None):
     """
     cert_type = task.task_cert_type(context)
     a = get_autograph_config(context.autograph_configs, cert_type, [fmt], raise_on_empty=True)
+    cache_key = None
+    if getattr(context, "signing_cache", None) is not None:
+        cache_key = _signing_cache_key(context, cert_type, a, hashlib.sha256(hash_).hexdigest(), fmt, keyid)
+        signature = context.signing_cache.get_bytes(cache_key)
+        if signature is not None:
+            return signature
     input_file = BytesIO(hash_)
-    signature = base64.b64decode(await sign_with_autograph(context.session, a, input_file, fmt, "hash", keyid))
+    signature = base64.b64decode(await _sign_with_context_autograph(context, cert_type, a, input_file, fmt, "hash", keyid=keyid))
+    if cache_key:
+        context.signing_cache.put_bytes(cache_key, signature)
     return signature
 
 
@@ -1068,19 +1626,38 @@ async def sign_file_detached(context, file_, fmt, keyid=None, **kwargs):
     Returns:
         list: path to the original file and its detached signature named `file.sig`.
     """
-    h = hashlib.sha256()
-    with open(file_, "rb") as fh:
-        h.update(fh.read())
+    # In a thread, so hashing a large file doesn't hold up other files
+    digest = await asyncio.get_running_loop().run_in_executor(None, _sha256_digest, file_)
 
-    signature = await sign_hash_with_autograph(context, h.digest(), fmt, keyid=keyid)
+    signature = await sign_hash_with_autograph(context, digest, fmt, keyid=keyid)
     detached_signature = f"{file_}.sig"
-    with open(detached_signature, "wb") as fh:
-        fh.write(signature)
+    _write_detached_signature(detached_signature, signature)
 
     log.info(f"Wrote autograph detached signature to {detached_signature}")
     return [file_, detached_signature]
 
 
+def _sha256_digest(path):
+    """Return the SHA-256 digest of the file at `path`, read in blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(_READ_BLOCK_SIZE), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+def _write_detached_signature(path, signature):
+    """Write the `signature` bytes to `path` atomically, so a partial signature is never left behind."""
+    fd, tmp_path = tempfile.mkstemp(prefix=".detached", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(signature)
+        os.replace(tmp_path, path)
+    except BaseException:
+        rm(tmp_path)
+        raise
+
+
 def get_mar_verification_key(cert_type, fmt, keyid):
     """Get the public key file for the format/cert_type.
 
@@ -1136,10 +1713,58 @@ def verify_mar_signature(cert_type, fmt, mar, keyid=None):
         raise SigningScriptError(e)
 
 
+async def _sign_mar_with_autograph_hash_single_pass(context, cert_type, from_, fmt, keyid, hash_algo, to=None):
+    """Sign a mar's hash with autograph, writing the signed mar in a single pass.
+
+    The mar is written once with a placeholder signature, hashing it on the
+    way. The autograph signature of that hash is verified in-process against
+    the mar verification key, then written over the placeholder.
+
+    Args:
+        context (Context): the signing context
+        cert_type (str): the cert scope string
+        from_ (str): the source file to sign
+        fmt (str): the format to sign with, without a key id
+        keyid (str): the key id to use (can be None)
+        hash_algo (str): the mar signature hash algorithm
+        to (str, optional): the target path to sign to. If None, overwrite
+            `from_`. Defaults to None.
+
+    Raises:
+        SigningScriptError: if the signature is invalid
+
+    Returns:
+        str: the path to the signed file
+
+    """
+    to = to or from_
+    with open(get_mar_verification_key(cert_type, fmt, keyid), "rb") as fh:
+        verify_key = fh.read()
+    # Write next to `to` rather than to it, in case it's `from_`
+    fd, tmp_path = tempfile.mkstemp(prefix="mar", dir=os.path.dirname(os.path.abspath(to)))
+    try:
+        with os.fdopen(fd, "w+b") as dst:
+            with open(from_, "rb") as src:
+                h, signature_offset = write_mar_with_placeholder_signature(src, dst, hash_algo)
+            signature = await sign_hash_with_autograph(context, h, fmt, keyid)
+            inject_mar_signature(dst, signature_offset, signature, h, hash_algo, verify_key=verify_key)
+        shutil.copymode(from_, tmp_path)
+        os.replace(tmp_path, to)
+    except BaseException:
+        rm(tmp_path)
+        raise
+    log.info("Verified signature.")
+    log.info("wrote mar with autograph signed hash %s to %s", from_, to)
+    return to
+
+
 @time_async_function
 async def sign_mar384_with_autograph_hash(context, from_, fmt, to=None, **kwargs):
     """Signs a hash with autograph, injects it into the file, and writes the result to arg `to` or `from_` if `to` is None.
 
+    With the `mar_single_pass` config option, the signed mar is written once
+    and verified in-process; see `_sign_mar_with_autograph_hash_single_pass`.
+
     Args:
         context (Context): the signing context
         from_ (str): the source file to sign
@@ -1163,6 +1788,9 @@ async def sign_mar384_with_autograph_hash(context, from_, fmt, to=None, **kwargs
 
     hash_algo, expected_signature_length = "sha384", 512
 
+    if context.config.get("mar_single_pass"):
+        return await _sign_mar_with_autograph_hash_single_pass(context, cert_type, from_, fmt, keyid, hash_algo, to=to)
+
     # Add a dummy signature into a temporary file (TODO: dedup with mardor.cli do_hash)
     with tempfile.TemporaryFile() as tmp:
         with open(from_, "rb") as f:
@@ -1262,12 +1890,119 @@ async def sign_omnija_with_autograph(context, from_, fmt):
 
     await sign_file_with_autograph(context, from_, fmt, to=signed_out, extension_id="omni.ja@mozilla.org")
     await merge_omnija_files(orig=from_, signed=signed_out, to=merged_out)
-    with open(from_, "wb") as fout:
-        with open(merged_out, "rb") as fin:
-            fout.write(fin.read())
+    rm(signed_out)
+    # Move the merged copy into place, rather than copying it back
+    shutil.copymode(from_, merged_out)
+    shutil.move(merged_out, from_)
     return from_
 
 
+# The fixed size parts of zip local file headers and central directory entries
+_JAR_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_JAR_CDIR_ENTRY = struct.Struct("<IHHHHHHIIIHHHHHII")
+# January 1st, 2010. See bug 592369.
+_JAR_LASTMOD_DATE = ((2010 - 1980) << 9) | (1 << 5) | 1
+
+
+def _get_jar_member(name, compression, crc32, compressed_size, uncompressed_size):
+    """Return the header fields `mozjar.JarWriter.add` would write for a member.
+
+    Args:
+        name (str): the member name
+        compression (int): the compression method of the data, `mozjar.JAR_STORED`
+            if it isn't compressed
+        crc32 (int): the crc32 of the uncompressed data
+        compressed_size (int): the size of the data
+        uncompressed_size (int): the size of the uncompressed data
+
+    Returns:
+        tuple: the fields, for `_serialize_jar_local_header` and `_serialize_jar_cdir_entry`
+
+    """
+    if compression != mozjar.JAR_STORED:
+        min_version, general_flag = 20, 2
+    else:
+        min_version, general_flag = 10, 0
+    return (min_version, general_flag, compression, crc32, compressed_size, uncompressed_size, name.encode("utf-8"))
+
+
+def _serialize_jar_local_header(member):
+    """Return the local file header for the `_get_jar_member` fields."""
+    min_version, general_flag, compression, crc32, compressed_size, uncompressed_size, name = member
+    return (
+        _JAR_LOCAL_HEADER.pack(
+            mozjar.JarLocalFileHeader.MAGIC,
+            min_version,
+            general_flag,
+            compression,
+            0,
+            _JAR_LASTMOD_DATE,
+            crc32,
+            compressed_size,
+            uncompressed_size,
+            len(name),
+            0,
+        )
+        + name
+    )
+
+
+def _serialize_jar_cdir_entry(member, offset):
+    """Return the central directory entry for the `_get_jar_member` fields, with the local header at `offset`."""
+    min_version, general_flag, compression, crc32, compressed_size, uncompressed_size, name = member
+    return (
+        _JAR_CDIR_ENTRY.pack(
+            mozjar.JarCdirEntry.MAGIC,
+            # Unix, so the default u+rw, g+r, o+r regular file mode is honored
+            20 | 3 << 8,
+            min_version,
+            general_flag,
+            compression,
+            0,
+            _JAR_LASTMOD_DATE,
+            crc32,
+            compressed_size,
+            uncompressed_size,
+            len(name),
+            0,
+            0,
+            0,
+            0,
+            0o100644 << 16,
+            offset,
+        )
+        + name
+    )
+
+
+def _copy_file_range(src_fd, dst_fd, offset, length):
+    """Copy `length` bytes at `offset` in `src_fd` to the current position of `dst_fd`.
+
+    The copy happens in the kernel where possible.
+
+    Raises:
+        SigningScriptError: if `src_fd` is too short
+
+    """
+    try:
+        while length > 0:
+            copied = os.copy_file_range(src_fd, dst_fd, length, offset)
+            if not copied:
+                break
+            offset += copied
+            length -= copied
+    except (AttributeError, OSError):
+        # Not on Linux, or not between these files
+        pass
+    while length > 0:
+        data = os.pread(src_fd, min(length, _READ_BLOCK_SIZE), offset)
+        if not data:
+            raise SigningScriptError("Unexpected end of file copying {} bytes at {}".format(length, offset))
+        written = os.write(dst_fd, data)
+        offset += written
+        length -= written
+
+
 @time_async_function
 async def merge_omnija_files(orig, signed, to):
     """Merge multiple omnijar files together.
@@ -1277,6 +2012,10 @@ async def merge_omnija_files(orig, signed, to):
     then adds data from the "signed" copy (the META-INF folder)
     and finally writes it all out to a new omni.ja file.
 
+    The new omni.ja is what `mozjar.JarWriter` would write, but members of
+    the original are copied as raw compressed data, in as few ranges of the
+    file as possible, without reading the rest of it into memory.
+
     Args:
         context (Context): the signing context
         orig (str): the source file to sign
@@ -1287,29 +2026,245 @@ async def merge_omnija_files(orig, signed, to):
         bool: always True if function succeeded.
 
     """
-    orig_jarreader = mozjar.JarReader(orig)
-    with mozjar.JarWriter(to, compress=orig_jarreader.compression) as to_writer:
-        for origjarfile in orig_jarreader:
-            to_writer.add(origjarfile.filename, origjarfile, compress=origjarfile.compress)
+    # name: (header fields, local file header, compressed data or the
+    # (offset, local file header) of the member in the original)
+    contents = OrderedDict()
+    with open(orig, "rb") as orig_fh, open(to, "wb") as to_fh:
+        with mmap.mmap(orig_fh.fileno(), 0, access=mmap.ACCESS_READ) as orig_data:
+            with memoryview(orig_data) as orig_view:
+                orig_jarreader = mozjar.JarReader(data=orig_view)
+                compression = orig_jarreader.compression
+                last_preloaded = orig_jarreader.last_preloaded
+                for name, orig_entry in orig_jarreader.entries.items():
+                    offset = orig_entry["offset"]
+                    magic, _, _, orig_compression, _, _, crc32, compressed_size, uncompressed_size, name_size, extra_size = _JAR_LOCAL_HEADER.unpack_from(
+                        orig_data, offset
+                    )
+                    if magic != mozjar.JarLocalFileHeader.MAGIC:
+                        raise mozjar.JarReaderError("Bad magic")
+                    if (crc32, compressed_size, uncompressed_size) != (orig_entry["crc32"], orig_entry["compressed_size"], orig_entry["uncompressed_size"]):
+                        raise mozjar.JarReaderError("Central directory and file header mismatch. Corrupted archive?")
+                    member = _get_jar_member(name, orig_compression, crc32, compressed_size, uncompressed_size)
+                    orig_header = orig_data[offset : offset + _JAR_LOCAL_HEADER.size + name_size + extra_size]
+                    contents[name] = member, _serialize_jar_local_header(member), (offset, orig_header)
+                orig_jarreader.close()
+
         # Use ZipFile here because mozjar can't read the signed copies
         signed_zip = zipfile.ZipFile(signed, "r")
         for fname in signed_zip.namelist():
             if fname.startswith("META-INF"):
-                to_writer.add(fname, signed_zip.open(fname, "r"))
-        if orig_jarreader.last_preloaded:
-            jarlog = list(orig_jarreader.entries.keys())
-            preloads = jarlog[: jarlog.index(orig_jarreader.last_preloaded) + 1]
-            to_writer.preload(preloads)
+                if fname in contents:
+                    raise mozjar.JarWriterError("File %s already in JarWriter" % fname)
+                deflater = mozjar.Deflater(compression)
+                deflater.write(signed_zip.open(fname, "r").read())
+                member = _get_jar_member(
+                    fname, deflater.compress if deflater.compressed else mozjar.JAR_STORED, deflater.crc32, deflater.compressed_size, deflater.uncompressed_size
+                )
+                contents[fname] = member, _serialize_jar_local_header(member), deflater.compressed_data
+
+        # Lay the members out as `mozjar.JarWriter.finish` does. The preloaded
+        # members come first in the original already.
+        offsets = []
+        offset = 0
+        preload_size = 0
+        for name, (member, header, _) in contents.items():
+            offsets.append(offset)
+            offset += len(header) + member[4]
+            if name == last_preloaded:
+                preload_size = offset
+        cdir_offset = 0
+        if preload_size:
+            cdir_offset = 4
+            end_size = mozjar.JarCdirEnd().size
+        cdir = b"".join(_serialize_jar_cdir_entry(member, 0) for member, _, _ in contents.values())
+        end = mozjar.JarCdirEnd()
+        end["disk_entries"] = len(contents)
+        end["cdir_entries"] = end["disk_entries"]
+        end["cdir_size"] = len(cdir)
+        if preload_size:
+            end["cdir_offset"] = cdir_offset
+            offset = end["cdir_size"] + end["cdir_offset"] + end_size
+            preload_size += offset
+            to_fh.write(struct.pack("<I", preload_size))
+            for (member, _, _), member_offset in zip(contents.values(), offsets):
+                to_fh.write(_serialize_jar_cdir_entry(member, member_offset + offset))
+            to_fh.write(end.serialize())
+
+        # Copy runs of adjacent, unchanged members of the original in one go
+        pending_range = None
+
+        def copy_pending_range():
+            if pending_range:
+                to_fh.flush()
+                _copy_file_range(orig_fh.fileno(), to_fh.fileno(), *pending_range)
+
+        for member, header, content in contents.values():
+            if isinstance(content, bytes):
+                chunks, data_range = [header, content], None
+            elif header == content[1]:
+                chunks, data_range = [], [content[0], len(header) + member[4]]
+            else:
+                chunks, data_range = [header], [content[0] + len(content[1]), member[4]]
+            if pending_range and not chunks and sum(pending_range) == data_range[0]:
+                pending_range[1] += data_range[1]
+                continue
+            copy_pending_range()
+            for chunk in chunks:
+                to_fh.write(chunk)
+            pending_range = data_range
+        copy_pending_range()
+
+        if not preload_size:
+            end["cdir_offset"] = offset
+            for (member, _, _), member_offset in zip(contents.values(), offsets):
+                to_fh.write(_serialize_jar_cdir_entry(member, member_offset))
+        to_fh.write(end.serialize())
     return True
 
 
 # sign_authenticode_file {{{1
 async def _winsign_helper(error_message, *args, **kwargs):
     """Raise an exception if winsign.sign.sign_file returns False to enable retries."""
-    if not await winsign.sign.sign_file(*args, **kwargs):
+    if not await winsign_sign.sign_file(*args, **kwargs):
         raise SigningScriptError(error_message)
 
 
+# AuthenticodeSigner {{{1
+@dataclass(frozen=True)
+class AuthenticodeSigner:
+    """The authenticode signing settings for one signing format.
+
+    These only depend on the format and the config, so
+    `get_authenticode_signer` loads them once per task rather than once per
+    file.
+    """
+
+    fmt: str
+    keyid: str
+    certs: tuple
+    cafile: str
+    timestampfile: str
+    url: str
+    crosscert: str
+    timestamp_style: str
+    timestamp_url: str
+
+    @classmethod
+    def from_config(cls, config, fmt):
+        """Load the authenticode settings for `fmt` from `config`.
+
+        Args:
+            config (dict): the signingscript config
+            fmt (str): the format to sign with, optionally with a key id
+
+        Returns:
+            AuthenticodeSigner: the settings. `fmt` is the format to request
+                signatures from autograph with.
+
+        """
+        fmt, keyid = utils.split_autograph_format(fmt)
+
+        cafile_key = "authenticode_ca"
+        cert_key = "authenticode_cert"
+
+        if fmt in ("autograph_authenticode_ev", "stage_autograph_authenticode_ev"):
+            cafile_key = f"{cafile_key}_ev"
+            cert_key = f"{cert_key}_ev"
+        elif fmt.startswith(("autograph_authenticode_202404", "stage_autograph_authenticode_202404")):
+            cafile_key += "_202404"
+            cert_key += "_202404"
+
+        if keyid:
+            # Sometimes a given keyid may chain up to a shared intermediate, and
+            # sometimes it may not. Check if a ca.crt with the given keyid exists
+            # and fallback to the regular one if it doesn't.
+            cafile = config.get(f"{cafile_key}_{keyid}", config[cafile_key])
+            cert_path = config[f"{cert_key}_{keyid}"]
+        else:
+            cafile = config[cafile_key]
+            cert_path = config[cert_key]
+        with open(cert_path, "rb") as fh:
+            certs = tuple(winsign_crypto.load_pem_certs(fh.read()))
+
+        if fmt in ("autograph_authenticode_sha2_rfc3161_stub", "stage_autograph_authenticode_sha2_rfc3161_stub"):
+            fmt = fmt.removesuffix("_rfc3161_stub")
+            timestamp_style = "rfc3161"
+        else:
+            timestamp_style = config["authenticode_timestamp_style"]
+        if fmt.endswith(("authenticode_stub", "authenticode_sha2_stub", "authenticode_202404_stub")):
+            crosscert = config["authenticode_cross_cert"]
+        else:
+            crosscert = None
+
+        return cls(
+            fmt=fmt,
+            keyid=keyid,
+            certs=certs,
+            cafile=cafile,
+            timestampfile=config["authenticode_ca_timestamp"],
+            url=config["authenticode_url"],
+            crosscert=crosscert,
+            timestamp_style=timestamp_style,
+            timestamp_url=config["authenticode_timestamp_url"],
+        )
+
+
+def get_authenticode_signer(context, fmt):
+    """Get the `AuthenticodeSigner` for `fmt`, loading it on first use in the task.
+
+    The signers are kept in ``context.authenticode_signers``. Loading them
+    doesn't await, so the concurrent `sign_authenticode_file` calls of a
+    task never load the same signer twice.
+
+    Args:
+        context (Context): the signing context
+        fmt (str): the format to sign with, optionally with a key id
+
+    Returns:
+        AuthenticodeSigner: the settings for `fmt`
+
+    """
+    signers = getattr(context, "authenticode_signers", None)
+    if signers is None:
+        signers = context.authenticode_signers = {}
+    if fmt not in signers:
+        signers[fmt] = AuthenticodeSigner.from_config(context.config, fmt)
+    return signers[fmt]
+
+
+def get_authenticode_scheduler(context):
+    """Get the task's `AuthenticodeScheduler`, creating it on first use.
+
+    The limits come from the `authenticode_cpu_limit`,
+    `authenticode_autograph_limit` and `authenticode_timestamp_limit` config
+    options. The scheduler is kept in ``context.authenticode_scheduler``, so
+    the limits hold across every file signed in the task.
+
+    Args:
+        context (Context): the signing context
+
+    Returns:
+        AuthenticodeScheduler: the scheduler
+
+    """
+    scheduler = getattr(context, "authenticode_scheduler", None)
+    if scheduler is None:
+        scheduler = context.authenticode_scheduler = AuthenticodeScheduler(
+            cpu_limit=context.config.get("authenticode_cpu_limit"),
+            autograph_limit=context.config.get("authenticode_autograph_limit", DEFAULT_AUTHENTICODE_AUTOGRAPH_LIMIT),
+            timestamp_limit=context.config.get("authenticode_timestamp_limit", DEFAULT_AUTHENTICODE_TIMESTAMP_LIMIT),
+        )
+    return scheduler
+
+
+async def _is_authenticode_signed(context, path):
+    """Check whether `path` is signed, in-process if possible and with osslsigncode otherwise."""
+    signed = authenticode.is_signed(path)
+    if signed is None:
+        signed = await get_authenticode_scheduler(context).run_local(winsign_osslsigncode.is_signed, path)
+    return signed
+
+
 @time_async_function
 async def sign_authenticode_file(context, orig_path, fmt, *, authenticode_comment=None):
     """Sign a file in-place with authenticode, using autograph as a backend.
@@ -1326,15 +2281,15 @@ async def sign_authenticode_file(context, orig_path, fmt, *, authenticode_commen
         True on success, False otherwise
 
     """
-    if winsign.osslsigncode.is_signed(orig_path):
+    if await _is_authenticode_signed(context, orig_path):
         log.info("%s is already signed", orig_path)
         return True
 
-    fmt, keyid = utils.split_autograph_format(fmt)
+    authenticode_signer = get_authenticode_signer(context, fmt)
 
     async def signer(digest, digest_algo):
         try:
-            return await sign_hash_with_autograph(context, digest, fmt, keyid)
+            return await sign_hash_with_autograph(context, digest, authenticode_signer.fmt, authenticode_signer.keyid)
         except Exception:
             log.exception("Error signing authenticode hash with autograph")
             raise
@@ -1343,40 +2298,6 @@ async def sign_authenticode_file(context, orig_path, fmt, *, authenticode_commen
     outfile = orig_path + "-new"
     digest_algo = "sha256"
 
-    timestampfile = context.config["authenticode_ca_timestamp"]
-
-    cafile_key = "authenticode_ca"
-    cert_key = "authenticode_cert"
-
-    if fmt in ("autograph_authenticode_ev", "stage_autograph_authenticode_ev"):
-        cafile_key = f"{cafile_key}_ev"
-        cert_key = f"{cert_key}_ev"
-    elif fmt.startswith(("autograph_authenticode_202404", "stage_autograph_authenticode_202404")):
-        cafile_key += "_202404"
-        cert_key += "_202404"
-
-    if keyid:
-        # Sometimes a given keyid may chain up to a shared intermediate, and
-        # sometimes it may not. Check if a ca.crt with the given keyid exists
-        # and fallback to the regular one if it doesn't.
-        cafile = context.config.get(f"{cafile_key}_{keyid}", context.config[cafile_key])
-        certs = load_pem_certs(open(context.config[f"{cert_key}_{keyid}"], "rb").read())
-    else:
-        cafile = context.config[cafile_key]
-        certs = load_pem_certs(open(context.config[cert_key], "rb").read())
-
-    url = context.config["authenticode_url"]
-    if fmt in ("autograph_authenticode_sha2_rfc3161_stub", "stage_autograph_authenticode_sha2_rfc3161_stub"):
-        fmt = fmt.removesuffix("_rfc3161_stub")
-        timestamp_style = "rfc3161"
-    else:
-        timestamp_style = context.config["authenticode_timestamp_style"]
-    timestamp_url = context.config["authenticode_timestamp_url"]
-    if fmt.endswith(("authenticode_stub", "authenticode_sha2_stub", "authenticode_202404_stub")):
-        crosscert = context.config["authenticode_cross_cert"]
-    else:
-        crosscert = None
-
     if authenticode_comment and orig_path.endswith(".msi"):
         log.info("Using comment '%s' to sign %s", authenticode_comment, orig_path)
     elif authenticode_comment:
@@ -1384,20 +2305,25 @@ async def sign_authenticode_file(context, orig_path, fmt, *, authenticode_commen
         authenticode_comment = None
 
     winsign_kwargs = {
-        "cafile": cafile,
-        "timestampfile": timestampfile,
-        "url": url,
+        "cafile": authenticode_signer.cafile,
+        "timestampfile": authenticode_signer.timestampfile,
+        "url": authenticode_signer.url,
         "comment": authenticode_comment,
-        "crosscert": crosscert,
-        "timestamp_style": timestamp_style,
-        "timestamp_url": timestamp_url,
+        "crosscert": authenticode_signer.crosscert,
+        "timestamp_style": authenticode_signer.timestamp_style,
+        "timestamp_url": authenticode_signer.timestamp_url,
     }
     log.info(f"running winsign.sign.sign_file with kwargs {winsign_kwargs}...")
+
+    def winsign_helper(signer):
+        # winsign adds the cross cert to `certs`, so it gets its own copy
+        return _winsign_helper(f"Couldn't sign {orig_path}", infile, outfile, digest_algo, list(authenticode_signer.certs), signer, **winsign_kwargs)
+
     # Retry winsign.sign.sign_file, because the timestamp server can hiccup
     await retry_async(
-        _winsign_helper,
-        args=(f"Couldn't sign {orig_path}", infile, outfile, digest_algo, certs, signer),
-        kwargs=winsign_kwargs,
+        get_authenticode_scheduler(context).run,
+        args=(winsign_helper, signer),
+        kwargs={"timestamp": bool(authenticode_signer.timestamp_style)},
     )
     os.rename(outfile, infile)
 
@@ -1413,6 +2339,8 @@ async def sign_authenticode(context, orig_path, fmt, *, authenticode_comment=Non
 
     If a zip is passed in, extract it and only sign unsigned files that don't
     match certain patterns (see `_should_sign_windows`). Then recreate the zip.
+    The files are signed concurrently, within the limits of the task's
+    `AuthenticodeScheduler`.
 
     Args:
         context (Context): the signing context
@@ -1444,6 +2372,10 @@ async def sign_authenticode(context, orig_path, fmt, *, authenticode_comment=Non
     # Sign the appropriate inner files
     tasks = [asyncio.create_task(sign_authenticode_file(context, file_, fmt, authenticode_comment=authenticode_comment)) for file_ in files_to_sign]
     done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    # Don't leave the other files signing in the scheduler's threads
+    for f in pending:
+        f.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
     [f.result() for f in done]
     if file_extension == ".zip":
         # Recreate the zipfile
@@ -1487,6 +2419,24 @@ async def _notarize_single(path, creds_path, staple=True):
     )
 
 
+async def _notarize_paths(context, paths, staple=True):
+    """Notarize `paths` concurrently with a `NotarizationScheduler`.
+
+    The scheduler is configured by the `apple_notarization_concurrency`,
+    `apple_notarization_poll_interval`, `apple_notarization_max_poll_interval`
+    and `apple_notarization_timeout` config options.
+
+    """
+    scheduler = NotarizationScheduler(
+        context.apple_credentials_path,
+        concurrency=context.config.get("apple_notarization_concurrency", DEFAULT_NOTARIZATION_CONCURRENCY),
+        poll_interval=context.config.get("apple_notarization_poll_interval", DEFAULT_NOTARIZATION_POLL_INTERVAL),
+        max_poll_interval=context.config.get("apple_notarization_max_poll_interval", DEFAULT_NOTARIZATION_MAX_POLL_INTERVAL),
+        timeout=context.config.get("apple_notarization_timeout", DEFAULT_NOTARIZATION_TIMEOUT),
+    )
+    await scheduler.notarize(paths, staple=staple)
+
+
 async def _notarize_pkg(context, path, workdir):
     """Notarizes a .pkg file"""
     # Copy pkg to notarization_workdir
@@ -1537,8 +2487,7 @@ async def _notarize_all(context, path, workdir):
         raise SigningScriptError("No supported files found")
 
     # Notarize
-    for file in supported_files:
-        await _notarize_single(os.path.join(workdir, file), context.apple_credentials_path)
+    await _notarize_paths(context, [os.path.join(workdir, file) for file in supported_files])
 
     # List all files from workdir for tarball
     all_files = []
@@ -1585,10 +2534,8 @@ async def apple_notarize_geckodriver(context, path, *args, **kwargs):
 async def apple_notarize_stacked(context, filelist_dict):
     """
     Notarizes multiple packages using rcodesign.
-    Submits everything before polling for status.
+    Submits everything concurrently, polling for status in a shared loop.
     """
-    ATTEMPTS = 5
-
     relpath_index_map = {}
     paths_to_notarize = []
     task_index = 0
@@ -1617,34 +2564,8 @@ async def apple_notarize_stacked(context, filelist_dict):
         else:
             raise SigningScriptError(f"Unsupported file extension: {extension} for file {relpath}")
 
-    # notarization submissions map (path -> submission_id)
-    submissions_map = {}
-    # Submit to notarization one by one
-    for path in paths_to_notarize:
-        submissions_map[path] = await retry_async(
-            func=rcodesign_notarize,
-            args=(path, context.apple_credentials_path),
-            attempts=ATTEMPTS,
-            retry_exceptions=RCodesignError,
-        )
-
-    # Notary wait all files
-    for path, submission_id in submissions_map.items():
-        await retry_async(
-            func=rcodesign_notary_wait,
-            args=(submission_id, context.apple_credentials_path),
-            attempts=ATTEMPTS,
-            retry_exceptions=RCodesignError,
-        )
-
-    # Staple files
-    for path in submissions_map.keys():
-        await retry_async(
-            func=rcodesign_staple,
-            args=[path],
-            attempts=ATTEMPTS,
-            retry_exceptions=RCodesignError,
-        )
+    # Submit everything, stapling each file as soon as it's accepted
+    await _notarize_paths(context, paths_to_notarize)
 
     # Wrap up
     stapled_files = []
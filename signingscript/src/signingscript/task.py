@@ -5,6 +5,10 @@ Attributes:
     FORMAT_TO_SIGNING_FUNCTION (immutabledict): a mapping between signing format
         and signing function. If not specified, use the `default` signing
         function.
+    NON_CONCURRENT_SIGNING_FUNCTIONS (tuple): signing functions that use fixed
+        paths under `work_dir`, and so must not run concurrently with each other.
+    DETACHED_SIGNING_FUNCTIONS (tuple): signing functions that only write a
+        detached signature next to the file, leaving the file itself as is.
 
 """
 
@@ -62,6 +66,9 @@ FORMAT_TO_SIGNING_FUNCTION = immutabledict(
     }
 )
 
+NON_CONCURRENT_SIGNING_FUNCTIONS = (apple_notarize, apple_notarize_geckodriver)
+DETACHED_SIGNING_FUNCTIONS = (sign_file_detached, sign_gpg_with_autograph)
+
 
 # task_cert_type {{{1
 def task_cert_type(context):
@@ -148,8 +155,7 @@ async def sign(context, path, signing_formats, **kwargs):
     """
     output = path
     # Loop through the formats and sign one by one.
-    for fmt in signing_formats:
-        signing_func = _get_signing_function_from_format(fmt)
+    for fmt, signing_func in build_signing_pipeline(signing_formats):
         try:
             size = os.path.getsize(output)
         except OSError:
@@ -162,6 +168,51 @@ async def sign(context, path, signing_formats, **kwargs):
     return output
 
 
+# build_signing_pipeline {{{1
+def build_signing_pipeline(signing_formats):
+    """Map each signing format of a single file to its signing function.
+
+    Args:
+        signing_formats (list): the formats to sign with, in signing order
+
+    Returns:
+        list: the ``(format, signing function)`` tuples, in signing order
+
+    """
+    return [(fmt, _get_signing_function_from_format(fmt)) for fmt in signing_formats]
+
+
+# can_sign_concurrently {{{1
+def can_sign_concurrently(signing_formats):
+    """Determine whether a file can be signed concurrently with other files.
+
+    Args:
+        signing_formats (list): the formats the file will be signed with
+
+    Returns:
+        bool: False if any of the signing functions in the pipeline is in
+            ``NON_CONCURRENT_SIGNING_FUNCTIONS``
+
+    """
+    return not any(fn in NON_CONCURRENT_SIGNING_FUNCTIONS for _, fn in build_signing_pipeline(signing_formats))
+
+
+# signs_detached_only {{{1
+def signs_detached_only(signing_formats):
+    """Determine whether a file only gets detached signatures.
+
+    Args:
+        signing_formats (list): the formats the file will be signed with
+
+    Returns:
+        bool: True if every signing function in the pipeline is in
+            ``DETACHED_SIGNING_FUNCTIONS``
+
+    """
+    pipeline = build_signing_pipeline(signing_formats)
+    return bool(pipeline) and all(fn in DETACHED_SIGNING_FUNCTIONS for _, fn in pipeline)
+
+
 def _get_signing_function_from_format(fmt_and_key_id):
     fmt, _ = split_autograph_format(fmt_and_key_id)
 
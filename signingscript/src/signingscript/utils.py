@@ -3,9 +3,13 @@
 import asyncio
 import functools
 import hashlib
+import importlib.util
 import json
 import logging
 import os
+import sys
+import threading
+import types
 from asyncio.subprocess import PIPE, STDOUT
 from dataclasses import dataclass
 from shutil import copyfile
@@ -35,6 +39,71 @@ class AppleNotarization:
     private_key: str
 
 
+# Held while a lazily imported module is executed, so other threads wait for it
+_LAZY_IMPORT_LOCK = threading.RLock()
+# The ids of the lazily imported modules being executed
+_lazy_loading = set()
+
+
+class _LazyModule(types.ModuleType):
+    """A module that's executed the first time one of its attributes is used.
+
+    Like the modules ``importlib.util.LazyLoader`` creates, but thread-safe:
+    before Python 3.12, other threads could see its attributes missing while
+    the first one was still executing it.
+
+    """
+
+    def __getattribute__(self, attr):
+        """Execute the module, if it hasn't been, and get `attr`."""
+        with _LAZY_IMPORT_LOCK:
+            # The module's own code may use it while it's executing
+            if type(self) is _LazyModule and id(self) not in _lazy_loading:
+                _lazy_loading.add(id(self))
+                try:
+                    spec = types.ModuleType.__getattribute__(self, "__spec__")
+                    spec.loader.exec_module(self)
+                    # Look attributes up directly, without the lock, from now on
+                    self.__class__ = types.ModuleType
+                finally:
+                    _lazy_loading.discard(id(self))
+        # Not super(): once it's executed, this is no longer a _LazyModule
+        return types.ModuleType.__getattribute__(self, attr)
+
+
+def lazy_import(name):
+    """Import module `name` the first time one of its attributes is used.
+
+    Some dependencies take longer to import than the rest of signingscript,
+    but only some formats use them. This defers their import until a task
+    actually needs them. The first use may come from several threads at once,
+    e.g. the ``AuthenticodeScheduler`` workers; they wait for the module to
+    finish executing.
+
+    Args:
+        name (str): the full name of the module, e.g. `winsign.sign`
+
+    Returns:
+        module: the module, loaded on first attribute access.
+
+    Raises:
+        ModuleNotFoundError: if the module can't be found.
+
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    module = importlib.util.module_from_spec(spec)
+    module.__class__ = _LazyModule
+    sys.modules[name] = module
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
 def mkdir(path):
     """Equivalent to `mkdir -p`.
 
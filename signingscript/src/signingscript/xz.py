@@ -0,0 +1,93 @@
+"""Block-parallel xz compression.
+
+``ParallelXZWriter`` is a write-only file object that splits its input into
+fixed-size blocks and compresses each one as an independent xz stream on a
+thread pool (liblzma releases the GIL). The streams are written out in
+order. Concatenated xz streams are a valid ``.xz`` file, which ``xz``,
+``lzma.open`` and ``tarfile`` all read as one.
+
+Independent blocks don't share a dictionary, so the output is slightly
+larger than single-threaded compression; larger blocks narrow the gap.
+
+"""
+
+import lzma
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_BLOCK_SIZE = 32 * 1024 * 1024
+
+
+class ParallelXZWriter:
+    """Compress everything written to it into `fileobj` as xz, using several threads.
+
+    Args:
+        fileobj (file object): the binary file to write the compressed data to
+        filters (list): the lzma filter chain, as for ``lzma.compress``
+        threads (int): the number of compression threads
+        block_size (int, optional): the uncompressed size of each block.
+            Defaults to ``DEFAULT_BLOCK_SIZE``.
+
+    """
+
+    def __init__(self, fileobj, filters, threads, block_size=DEFAULT_BLOCK_SIZE):
+        """Initialize ParallelXZWriter."""
+        self.fileobj = fileobj
+        self.filters = filters
+        self.threads = threads
+        self.block_size = block_size
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="xz")
+        self.pending = []
+        self.buffer = bytearray()
+        self.closed = False
+
+    def __enter__(self):
+        """Return self."""
+        return self
+
+    def __exit__(self, exc_type, *excinfo):
+        """Finish writing, or just shut down on error."""
+        if exc_type is None:
+            self.close()
+        else:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.closed = True
+
+    def _compress(self, data):
+        return lzma.compress(data, format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC64, filters=self.filters)
+
+    def _submit(self, data):
+        self.pending.append(self.executor.submit(self._compress, data))
+        # Bound memory by only keeping a couple of blocks per thread in flight
+        while len(self.pending) > 2 * self.threads:
+            self.fileobj.write(self.pending.pop(0).result())
+
+    def write(self, data):
+        """Buffer `data`, compressing every full block.
+
+        Returns:
+            int: the number of bytes written
+
+        """
+        if self.closed:
+            raise ValueError("write to closed ParallelXZWriter")
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[: self.block_size]))
+            del self.buffer[: self.block_size]
+        return len(data)
+
+    def close(self):
+        """Compress the remaining data and write out every block in order."""
+        if self.closed:
+            return
+        if self.buffer or not self.pending:
+            # Always write at least one stream, so empty input is still valid xz
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        try:
+            for future in self.pending:
+                self.fileobj.write(future.result())
+        finally:
+            self.pending = []
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.closed = True
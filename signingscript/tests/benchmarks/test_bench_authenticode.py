@@ -0,0 +1,72 @@
+"""Benchmark the per-file overhead of authenticode signing a directory of PE files.
+
+winsign and Autograph are mocked out, so this measures the signingscript
+side only: loading the certificate chain and signing settings, once per file
+vs once per task.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+
+import os
+import shutil
+import statistics
+import time
+
+import pytest
+import winsign.osslsigncode
+import winsign.sign
+from conftest import TEST_DATA_DIR, skip_unless_benchmark
+from test_authenticode import make_pe
+from test_sign import set_authenticode_config
+
+from signingscript import sign
+
+NUM_FILES = 300
+CHAIN_LENGTH = 3
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("shared_signer", (False, True))
+async def test_bench_authenticode(context, mocker, tmp_path, shared_signer):
+    set_authenticode_config(context)
+    chain = tmp_path / "chain.crt"
+    with open(os.path.join(TEST_DATA_DIR, "windows.crt"), "rb") as fh:
+        chain.write_bytes(fh.read() * CHAIN_LENGTH)
+    context.config["authenticode_cert"] = str(chain)
+
+    async def fake_winsign(infile, outfile, digest_algo, certs, signer, **kwargs):
+        await signer(b"0" * 32, digest_algo)
+        shutil.copyfile(infile, outfile)
+        return True
+
+    async def fake_sign_hash(context, h, fmt, keyid=None):
+        return b"0" * 256
+
+    mocker.patch.object(winsign.sign, "sign_file", new=fake_winsign)
+    mocker.patch.object(winsign.osslsigncode, "is_signed", return_value=False)
+    mocker.patch.object(sign, "sign_hash_with_autograph", new=fake_sign_hash)
+    if not shared_signer:
+        # How every file used to load its settings
+        mocker.patch.object(sign, "get_authenticode_signer", new=lambda context, fmt: sign.AuthenticodeSigner.from_config(context.config, fmt))
+
+    build_dir = tmp_path / "build"
+    build_dir.mkdir()
+    paths = []
+    for i in range(NUM_FILES):
+        path = build_dir / f"lib{i}.dll"
+        make_pe(path, size=64 * 1024)
+        paths.append(str(path))
+
+    timings = []
+    start = time.monotonic()
+    for path in paths:
+        file_start = time.monotonic()
+        await sign.sign_authenticode_file(context, path, "autograph_authenticode_sha2_stub")
+        timings.append(time.monotonic() - file_start)
+    elapsed = time.monotonic() - start
+
+    print(
+        f"\nshared_signer={shared_signer}: {NUM_FILES} PE files in {elapsed:.2f}s; "
+        f"per file median {statistics.median(timings) * 1000:.2f}ms, max {max(timings) * 1000:.2f}ms"
+    )
@@ -0,0 +1,134 @@
+"""Benchmark authenticode signing a zip of PE files, unbounded vs with ``AuthenticodeScheduler``.
+
+winsign is replaced by a stand-in that runs a stub ``osslsigncode`` twice
+per file, synchronously as winsign does, asks Autograph (a sleep) for the
+signature and fetches a timestamp from a local stub server. Unbounded is
+how files used to be signed: every file started at once, on the event
+loop, checking for an existing signature with osslsigncode.
+
+Reports the elapsed time and the peak number of concurrent stub
+osslsigncode processes and timestamp requests.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import time
+import zipfile
+
+import aiohttp
+import pytest
+import winsign.osslsigncode
+import winsign.sign
+from aiohttp import web
+from conftest import skip_unless_benchmark
+from test_authenticode import Tracker, make_pe
+from test_sign import set_authenticode_config
+
+from signingscript import authenticode, sign
+
+NUM_FILES = 500
+OSSLSIGNCODE_SECONDS = 0.01
+AUTOGRAPH_SECONDS = 0.02
+TIMESTAMP_SECONDS = 0.03
+
+
+class InlineScheduler:
+    """Run everything in the event loop, unbounded, as before ``AuthenticodeScheduler``."""
+
+    async def run_local(self, func, *args):
+        return func(*args)
+
+    async def run(self, func, signer, timestamp=False):
+        return await func(signer)
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("bounded", (False, True))
+async def test_bench_authenticode_fanout(context, mocker, tmp_path, bounded):
+    set_authenticode_config(context)
+    tracker = Tracker()
+    osslsigncode = [sys.executable, "-c", f"import time; time.sleep({OSSLSIGNCODE_SECONDS})"]
+
+    def run_osslsigncode():
+        tracker.enter("processes")
+        try:
+            subprocess.run(osslsigncode, check=True)
+        finally:
+            tracker.exit("processes")
+
+    async def timestamp_handler(request):
+        tracker.enter("timestamps")
+        try:
+            await asyncio.sleep(TIMESTAMP_SECONDS)
+            return web.Response(body=b"timestamp")
+        finally:
+            tracker.exit("timestamps")
+
+    app = web.Application()
+    app.router.add_post("/", timestamp_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    timestamp_url = f"http://127.0.0.1:{runner.addresses[0][1]}/"
+
+    async def fake_winsign(infile, outfile, digest_algo, certs, signer, timestamp_url=None, **kwargs):
+        # The dummy signature, the real one, a timestamp and attaching it
+        run_osslsigncode()
+        await signer(b"0" * 32, digest_algo)
+        async with aiohttp.request("POST", timestamp_url, data=b"request") as resp:
+            await resp.read()
+        run_osslsigncode()
+        shutil.copyfile(infile, outfile)
+        return True
+
+    def fake_is_signed(filename):
+        run_osslsigncode()
+        return False
+
+    async def fake_sign_hash(context, h, fmt, keyid=None):
+        await asyncio.sleep(AUTOGRAPH_SECONDS)
+        return b"0" * 256
+
+    mocker.patch.object(winsign.sign, "sign_file", new=fake_winsign)
+    mocker.patch.object(winsign.osslsigncode, "is_signed", new=fake_is_signed)
+    mocker.patch.object(sign, "sign_hash_with_autograph", new=fake_sign_hash)
+    context.config["authenticode_timestamp_url"] = timestamp_url
+    if not bounded:
+        mocker.patch.object(sign, "get_authenticode_scheduler", return_value=InlineScheduler())
+        mocker.patch.object(authenticode, "is_signed", return_value=None)
+
+    archive_dir = tmp_path / "archives"
+    archive_dir.mkdir()
+    build_dir = tmp_path / "build"
+    build_dir.mkdir()
+    path = str(archive_dir / "target.zip")
+    with zipfile.ZipFile(path, "w") as z:
+        for i in range(NUM_FILES):
+            pe = build_dir / f"lib{i}.dll"
+            make_pe(pe, size=64 * 1024)
+            z.write(pe, pe.name)
+
+    start = time.monotonic()
+    try:
+        await sign.sign_authenticode(context, path, "autograph_authenticode_sha2")
+    finally:
+        elapsed = time.monotonic() - start
+        if bounded:
+            context.authenticode_scheduler.close()
+        await runner.cleanup()
+
+    limits = "unbounded"
+    if bounded:
+        scheduler = context.authenticode_scheduler
+        limits = f"cpu {scheduler.cpu_limit}, autograph {scheduler.autograph._value}, timestamp {scheduler.timestamp._value}"
+    print(
+        f"\nbounded={bounded} ({limits}): {NUM_FILES} PE files in {elapsed:.2f}s on {os.cpu_count()} CPUs; "
+        f"peak osslsigncode processes {tracker.peak['processes']}, peak timestamp requests {tracker.peak['timestamps']}"
+    )
@@ -0,0 +1,76 @@
+"""Load test ``AutographClient`` against two local fake Autograph servers.
+
+The first server is slower and fails some requests; retries sleep 50ms.
+Compares a plain shared ``aiohttp.ClientSession`` hitting the first
+configured server with the pooled client, which caps in-flight requests per
+server and routes by health.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+
+import asyncio
+import functools
+import time
+from io import BytesIO
+
+import aiohttp
+import pytest
+from conftest import TEST_CERT_TYPE, skip_unless_benchmark
+from fake_autograph import FakeAutograph
+from scriptworker.utils import retry_async
+
+from signingscript import autograph, sign
+from signingscript.autograph import AutographClient
+from signingscript.utils import Autograph
+
+NUM_REQUESTS = 400
+CONCURRENCY = 64
+
+
+async def run_load(sign_one):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            try:
+                await sign_one(BytesIO(str(i).encode()))
+            except Exception:
+                failures += 1
+
+    start = time.monotonic()
+    await asyncio.gather(*(one(i) for i in range(NUM_REQUESTS)))
+    return time.monotonic() - start, failures
+
+
+def report(name, elapsed, failures, servers):
+    print(f"\n{name}: {NUM_REQUESTS} hash requests in {elapsed:.2f}s ({NUM_REQUESTS / elapsed:.0f}/s), {failures} failed")
+    for label, server in servers.items():
+        print(
+            f"  {label}: {server.requests['hash']} requests, {server.errors} errors, "
+            f"max in-flight {server.max_in_flight}, {len(server.connections)} connections"
+        )
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_in_flight", (None, 4, 16))
+async def test_bench_autograph_client(mocker, max_in_flight):
+    fast_retry_async = functools.partial(retry_async, sleeptime_callback=lambda *args, **kwargs: 0.05)
+    mocker.patch.object(sign, "retry_async", new=fast_retry_async)
+    mocker.patch.object(autograph, "retry_async", new=fast_retry_async)
+    async with FakeAutograph(latency=0.05, jitter=0.05, error_rate=0.2) as flaky, FakeAutograph(latency=0.02, jitter=0.01) as fast:
+        servers = [Autograph(flaky.url, "user", "secret", ["autograph_hash"]), Autograph(fast.url, "user", "secret", ["autograph_hash"])]
+        fmt = "autograph_hash"
+        if max_in_flight is None:
+            name = "shared session, first server only"
+            async with aiohttp.ClientSession() as session:
+                elapsed, failures = await run_load(lambda f: sign.sign_with_autograph(session, servers[0], f, fmt, "hash"))
+        else:
+            name = f"AutographClient, max_in_flight={max_in_flight}"
+            async with AutographClient({TEST_CERT_TYPE: servers}, max_in_flight=max_in_flight) as client:
+                elapsed, failures = await run_load(lambda f: client.call(TEST_CERT_TYPE, fmt, sign.sign_with_autograph, f, fmt, "hash", attempts=1))
+                assert flaky.max_in_flight <= max_in_flight
+                assert fast.max_in_flight <= max_in_flight
+        report(name, elapsed, failures, {"flaky": flaky, "fast": fast})
@@ -0,0 +1,40 @@
+"""Benchmark peak memory of signing a large file with and without Autograph streaming.
+
+Uses the RSS that ``time_async_function`` logs for ``sign_file_with_autograph``.
+RSS is the process high-water mark, so the streaming case runs first.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``; set
+``SIGNINGSCRIPT_BENCHMARK_SIZE_MB`` to change the artifact size (default 500).
+"""
+
+import logging
+import os
+
+import aiohttp
+import pytest
+from conftest import TEST_CERT_TYPE, skip_unless_benchmark
+from fake_autograph import FakeAutograph
+
+from signingscript import sign
+from signingscript.utils import Autograph
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("streaming", (True, False))
+async def test_bench_autograph_streaming(context, tmp_path, caplog, streaming):
+    size_mb = int(os.environ.get("SIGNINGSCRIPT_BENCHMARK_SIZE_MB", "500"))
+    from_ = tmp_path / "target.bin"
+    with open(from_, "wb") as fh:
+        for _ in range(size_mb):
+            fh.write(os.urandom(1024 * 1024))
+    context.config["autograph_streaming"] = streaming
+    caplog.set_level(logging.DEBUG, logger="signingscript.sign")
+
+    async with FakeAutograph(streaming=True) as server, aiohttp.ClientSession() as session:
+        context.session = session
+        context.autograph_configs = {TEST_CERT_TYPE: [Autograph(server.url, "user", "secret", ["autograph_mar"])]}
+        await sign.sign_file_with_autograph(context, str(from_), "autograph_mar", to=str(tmp_path / "signed.bin"))
+
+    timing = [r.getMessage() for r in caplog.records if r.getMessage().startswith("sign_file_with_autograph took")]
+    print(f"\nstreaming={streaming}, {size_mb} MB: {timing[-1]}")
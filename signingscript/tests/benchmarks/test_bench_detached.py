@@ -0,0 +1,73 @@
+"""Benchmark detached signing of several hundred small files and a few huge ones.
+
+Files that only get detached signatures (``autograph_gpg`` and
+``autograph_rsa``) are signed up to ``detached_concurrency_limit`` at a time;
+a limit of ``concurrency_limit`` is how they used to be signed. The huge
+files are hashed, base64 encoded and copied in worker threads, so they don't
+hold up the small ones.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``; set
+``SIGNINGSCRIPT_BENCHMARK_SIZE_MB`` to change the huge file size (default 64).
+"""
+
+import os
+import time
+
+import aiohttp
+import pytest
+from conftest import TEST_CERT_TYPE, skip_unless_benchmark
+
+from signingscript import script
+from signingscript.utils import Autograph
+
+NUM_SMALL = 300
+SMALL_SIZE = 4096
+HUGE_FORMATS = (["autograph_rsa"], ["autograph_rsa"], ["autograph_gpg"])
+
+
+def make_file(context, path, size, formats):
+    full_path = os.path.join(context.config["work_dir"], "cot", "upstream-task-id", path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "wb") as fh:
+        for _ in range(size // SMALL_SIZE):
+            fh.write(os.urandom(SMALL_SIZE))
+    return {"full_path": full_path, "formats": formats}
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("detached_concurrency_limit", (4, 16, 64))
+async def test_bench_detached(context, fake_autograph, tmp_path, detached_concurrency_limit):
+    size = int(os.environ.get("SIGNINGSCRIPT_BENCHMARK_SIZE_MB", "64")) * 1024 * 1024
+    fake_autograph.latency = 0.05
+    fake_autograph.jitter = 0.02
+    gpg_pubkey = tmp_path / "KEY"
+    gpg_pubkey.write_text("KEY")
+    context.config["gpg_pubkey"] = str(gpg_pubkey)
+    context.config["concurrency_limit"] = 4
+    context.config["detached_concurrency_limit"] = detached_concurrency_limit
+    context.autograph_configs = {TEST_CERT_TYPE: [Autograph(fake_autograph.url, "user", "secret", ["autograph_rsa", "autograph_gpg"])]}
+    filelist_dict = {}
+    # The huge files first, as they'd be listed in a release task
+    for i, formats in enumerate(HUGE_FORMATS):
+        filelist_dict[f"public/build/huge{i}.bin"] = make_file(context, f"public/build/huge{i}.bin", size, formats)
+    for i in range(NUM_SMALL):
+        formats = ["autograph_gpg"] if i % 2 else ["autograph_rsa"]
+        filelist_dict[f"public/build/SHA256SUMS{i}"] = make_file(context, f"public/build/SHA256SUMS{i}", SMALL_SIZE, formats)
+
+    async with aiohttp.ClientSession() as session:
+        context.session = session
+        start = time.monotonic()
+        timings = await script.sign_filelist(context, filelist_dict)
+        elapsed = time.monotonic() - start
+
+    for path, path_dict in filelist_dict.items():
+        suffix = ".asc" if path_dict["formats"] == ["autograph_gpg"] else ".sig"
+        assert os.path.exists(os.path.join(context.config["artifact_dir"], path + suffix))
+    small = sorted(timing for path, timing in timings.items() if "SHA256SUMS" in path)
+    huge = sorted(timing for path, timing in timings.items() if "huge" in path)
+    print(
+        f"\ndetached_concurrency_limit={detached_concurrency_limit}: {NUM_SMALL} small and {len(huge)} {size // 1024**2}MB files in {elapsed:.2f}s; "
+        f"small per-file median/max {small[len(small) // 2]:.3f}/{small[-1]:.3f}s, huge max {huge[-1]:.2f}s; "
+        f"max in-flight requests {fake_autograph.max_in_flight}"
+    )
@@ -0,0 +1,236 @@
+"""End-to-end benchmark of ``async_main`` against a local fake Autograph, per signing format.
+
+For every format in ``FORMAT_TO_SIGNING_FUNCTION``, a task with
+``NUM_ARTIFACTS`` synthetic upstream artifacts is signed by
+``script.async_main``. The fake Autograph signs ``/sign/hash`` and
+``/sign/data`` requests with a local test key, so MAR signatures verify for
+real, and echoes ``/sign/file`` requests back. Formats that need services or
+tools that aren't available here are reported as skipped.
+
+Each format's results are printed as a JSON line, and appended to the file
+named by ``SIGNINGSCRIPT_BENCHMARK_RESULTS`` if it's set: wall time, peak RSS,
+bytes read and written by the process, and Autograph requests and bytes per
+endpoint.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``. Set
+``SIGNINGSCRIPT_BENCHMARK_SIZE_MB`` to change the artifact size (default 8),
+``SIGNINGSCRIPT_BENCHMARK_LATENCY``, ``SIGNINGSCRIPT_BENCHMARK_JITTER`` and
+``SIGNINGSCRIPT_BENCHMARK_ERROR_RATE`` to configure the fake Autograph, and
+``SIGNINGSCRIPT_BENCHMARK_CONFIG`` to a JSON object of extra signingscript
+config, e.g. ``{"mar_single_pass": true}``.
+"""
+
+import functools
+import io
+import json
+import os
+import resource
+import tarfile
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import pytest
+from conftest import DEFAULT_SCOPE_PREFIX, PUB_KEY_PATH, TEST_CERT_TYPE, skip_unless_benchmark
+from fake_autograph import FakeAutograph
+from scriptworker.context import Context
+from scriptworker.utils import retry_async
+from test_bench_omnija_merge import get_io
+from test_mar import PRIVATE_KEY, PUBLIC_KEY, make_mar
+
+from signingscript import autograph, script, sign
+from signingscript.task import FORMAT_TO_SIGNING_FUNCTION
+
+NUM_ARTIFACTS = 4
+UPSTREAM_TASK_ID = "upstream-task-id"
+
+SKIPPED_FORMATS = {
+    "apple_notarization": "needs Apple's notary service",
+    "apple_notarization_geckodriver": "needs Apple's notary service",
+    **{fmt: "needs osslsigncode and Authenticode certificates" for fmt in FORMAT_TO_SIGNING_FUNCTION if "authenticode" in fmt},
+}
+
+
+def make_data(size):
+    # Half random, half compressible
+    return os.urandom(size // 2) + bytes(size - size // 2)
+
+
+def make_blob(path, fmt, size):
+    path.write_bytes(make_data(size))
+
+
+def make_mar_artifact(path, fmt, size):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path.write_bytes(make_mar(Path(tmp_dir), num_files=4, size=size // 4))
+
+
+def make_widevine_zip(path, fmt, size):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as z:
+        z.writestr("firefox/precomplete", b"")
+        for name in ("firefox/firefox", "firefox/libxul.so", "firefox/plugin-container"):
+            z.writestr(name, make_data(size // 4))
+        z.writestr("firefox/libfoo.so", make_data(size // 4))
+
+
+def make_omnija_zip(path, fmt, size):
+    # Without the preload optimization, as the echoed omni.ja has to be
+    # readable by ZipFile, like Autograph's are
+    omnija = path.parent / "omni.ja"
+    with sign.mozjar.JarWriter(str(omnija)) as writer:
+        for i in range(size // 2 // 8192):
+            writer.add(f"chrome/browser/content/file{i}.js", make_data(8192))
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as z:
+        z.write(omnija, "firefox/omni.ja")
+        z.write(omnija, "firefox/browser/omni.ja")
+    omnija.unlink()
+
+
+def make_xpi(path, fmt, size):
+    manifest = {"manifest_version": 2, "name": "benchmark", "version": "1.0"}
+    if "langpack" in fmt:
+        manifest.update(
+            {
+                "browser_specific_settings": {"gecko": {"id": "langpack-en-CA@firefox.mozilla.org"}},
+                "languages": {"en-CA": {"chrome_resources": {}, "version": "1.0"}},
+                "langpack_id": "en-CA",
+            }
+        )
+    else:
+        manifest["browser_specific_settings"] = {"gecko": {"id": "benchmark@mozilla.org"}}
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as z:
+        z.writestr("manifest.json", json.dumps(manifest))
+        z.writestr("resources/data.bin", make_data(size))
+
+
+def make_app_tarball(path, fmt, size):
+    with tarfile.open(path, "w:gz", compresslevel=1) as t:
+        for name, data in (("Firefox.app/Contents/MacOS/firefox", make_data(size // 2)), ("Firefox.app/Contents/Resources/omni.ja", make_data(size // 2))):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            t.addfile(info, io.BytesIO(data))
+
+
+ARTIFACT_MAKERS = {
+    sign.sign_mar384_with_autograph_hash: ("update{}.mar", make_mar_artifact),
+    sign.sign_gpg_with_autograph: ("target{}.bin", make_blob),
+    sign.sign_widevine: ("target{}.zip", make_widevine_zip),
+    sign.sign_omnija: ("target{}.zip", make_omnija_zip),
+    sign.sign_xpi: ("target{}.xpi", make_xpi),
+    sign.sign_file_detached: ("target{}.bin", make_blob),
+    sign.sign_macapp: ("target{}.tar.gz", make_app_tarball),
+    sign.sign_file: ("target{}.bin", make_blob),
+}
+
+
+def make_artifacts(context, fmt, size):
+    name, make_artifact = ARTIFACT_MAKERS[FORMAT_TO_SIGNING_FUNCTION[fmt]]
+    paths = []
+    for i in range(NUM_ARTIFACTS):
+        path = f"public/build/{name.format(i)}"
+        full_path = os.path.join(context.config["work_dir"], "cot", UPSTREAM_TASK_ID, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        make_artifact(Path(full_path), fmt, size)
+        paths.append(path)
+    return paths
+
+
+def make_context(tmp_path, server):
+    autograph_configs = tmp_path / "autograph_configs.json"
+    autograph_configs.write_text(json.dumps({TEST_CERT_TYPE: [[server.url, "user", "secret", list(FORMAT_TO_SIGNING_FUNCTION)]]}))
+    widevine_cert = tmp_path / "widevine.crt"
+    widevine_cert.write_bytes(os.urandom(512))
+    context = Context()
+    context.config = script.get_default_config(base_dir=str(tmp_path))
+    context.config.update(
+        {
+            "artifact_dir": str(tmp_path / "artifact_dir"),
+            "autograph_configs": str(autograph_configs),
+            "taskcluster_scope_prefixes": [DEFAULT_SCOPE_PREFIX],
+            "gpg_pubkey": PUB_KEY_PATH,
+            "widevine_cert": str(widevine_cert),
+        }
+    )
+    context.config.update(json.loads(os.environ.get("SIGNINGSCRIPT_BENCHMARK_CONFIG", "{}")))
+    os.makedirs(context.config["work_dir"])
+    os.makedirs(context.config["artifact_dir"])
+    return context
+
+
+def report(result):
+    line = json.dumps(result, sort_keys=True)
+    print(f"\n{line}")
+    results_path = os.environ.get("SIGNINGSCRIPT_BENCHMARK_RESULTS")
+    if results_path:
+        with open(results_path, "a") as fh:
+            fh.write(f"{line}\n")
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fmt", sorted(FORMAT_TO_SIGNING_FUNCTION))
+async def test_bench_e2e(mocker, tmp_path, fmt):
+    result = {"benchmark": "e2e", "format": fmt, "num_artifacts": NUM_ARTIFACTS}
+    skip_reason = SKIPPED_FORMATS.get(fmt)
+    if FORMAT_TO_SIGNING_FUNCTION[fmt] is sign.sign_widevine and not sign.widevine:
+        skip_reason = "needs the widevine module"
+    if skip_reason:
+        report(dict(result, skipped=skip_reason))
+        pytest.skip(skip_reason)
+
+    fast_retry_async = functools.partial(retry_async, sleeptime_callback=lambda *args, **kwargs: 0.05)
+    mocker.patch.object(sign, "retry_async", new=fast_retry_async)
+    mocker.patch.object(autograph, "retry_async", new=fast_retry_async)
+    # The fake Autograph signs MAR hashes with the test key
+    key_path = tmp_path / "mar_key.pem"
+    key_path.write_bytes(PUBLIC_KEY)
+    mocker.patch.object(sign, "get_mar_verification_key", return_value=str(key_path))
+
+    size = int(os.environ.get("SIGNINGSCRIPT_BENCHMARK_SIZE_MB", "8")) * 1024 * 1024
+    server = FakeAutograph(
+        latency=float(os.environ.get("SIGNINGSCRIPT_BENCHMARK_LATENCY", "0.05")),
+        jitter=float(os.environ.get("SIGNINGSCRIPT_BENCHMARK_JITTER", "0.02")),
+        error_rate=float(os.environ.get("SIGNINGSCRIPT_BENCHMARK_ERROR_RATE", "0")),
+        signing_key=PRIVATE_KEY,
+    )
+    async with server:
+        context = make_context(tmp_path, server)
+        paths = make_artifacts(context, fmt, size)
+        context.task = {
+            "scopes": [TEST_CERT_TYPE],
+            "payload": {"upstreamArtifacts": [{"taskId": UPSTREAM_TASK_ID, "paths": paths, "formats": [fmt]}]},
+        }
+        artifact_bytes = sum(os.path.getsize(os.path.join(context.config["work_dir"], "cot", UPSTREAM_TASK_ID, path)) for path in paths)
+
+        start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start_io = get_io()
+        start = time.monotonic()
+        try:
+            await script.async_main(context)
+        except Exception as exc:
+            # e.g. with a high error rate; still worth recording
+            report(dict(result, failed=f"{type(exc).__name__}: {exc}", requests=server.requests, request_errors=server.errors))
+            raise
+        elapsed = time.monotonic() - start
+        end_io = get_io()
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    for path in paths:
+        assert os.path.exists(os.path.join(context.config["artifact_dir"], path))
+    result.update(
+        {
+            "artifact_bytes": artifact_bytes,
+            "wall_time_s": round(elapsed, 3),
+            # ru_maxrss is in kB on Linux, and only ever grows
+            "max_rss_kb": max_rss,
+            "max_rss_growth_kb": max_rss - start_rss,
+            "requests": server.requests,
+            "request_errors": server.errors,
+            "autograph_bytes_received": server.bytes_received,
+            "autograph_bytes_sent": server.bytes_sent,
+        }
+    )
+    if start_io and end_io:
+        result.update({f"io_{key}": int(end_io[key]) - int(start_io[key]) for key in ("rchar", "wchar", "read_bytes", "write_bytes")})
+    report(result)
@@ -0,0 +1,61 @@
+"""Benchmark signing a batch of MARs, with ``mar -v`` vs in a single pass.
+
+Autograph is replaced by a local key, so this measures the MAR rewriting and
+verification only. Partial update tasks sign hundreds of small MARs.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``; set
+``SIGNINGSCRIPT_BENCHMARK_SIZE_MB`` to change the size of each MAR (default 4).
+"""
+
+import os
+import statistics
+import time
+
+import pytest
+from conftest import TEST_CERT_TYPE, skip_unless_benchmark
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, utils
+from mardor.signing import get_privatekey
+from test_mar import PRIVATE_KEY, PUBLIC_KEY, make_mar
+
+from signingscript import sign
+from signingscript.utils import Autograph
+
+NUM_MARS = 50
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("single_pass", (False, True))
+async def test_bench_mar(context, mocker, tmp_path, single_pass):
+    # Load the key once, as Autograph would
+    private_key = get_privatekey(PRIVATE_KEY)
+
+    async def fake_sign_hash(context, h, fmt, keyid):
+        return private_key.sign(h, padding.PKCS1v15(), utils.Prehashed(hashes.SHA384()))
+
+    mocker.patch.object(sign, "sign_hash_with_autograph", new=fake_sign_hash)
+    key_path = tmp_path / "key.pem"
+    key_path.write_bytes(PUBLIC_KEY)
+    mocker.patch.object(sign, "get_mar_verification_key", return_value=str(key_path))
+    context.autograph_configs = {TEST_CERT_TYPE: [Autograph("https://autograph.invalid", "user", "secret", ["autograph_hash_only_mar384"])]}
+    context.config["mar_single_pass"] = single_pass
+
+    size_mb = int(os.environ.get("SIGNINGSCRIPT_BENCHMARK_SIZE_MB", "4"))
+    data = make_mar(tmp_path, num_files=4, size=size_mb * 1024 * 1024 // 4)
+    paths = []
+    for i in range(NUM_MARS):
+        path = tmp_path / f"partial{i}.mar"
+        path.write_bytes(data)
+        paths.append(str(path))
+
+    timings = []
+    for path in paths:
+        start = time.monotonic()
+        await sign.sign_mar384_with_autograph_hash(context, path, "autograph_hash_only_mar384")
+        timings.append(time.monotonic() - start)
+
+    print(
+        f"\nsingle_pass={single_pass}: {NUM_MARS} x {len(data) / 1024**2:.1f}MB MARs in {sum(timings):.2f}s; "
+        f"per MAR median {statistics.median(timings) * 1000:.1f}ms, max {max(timings) * 1000:.1f}ms"
+    )
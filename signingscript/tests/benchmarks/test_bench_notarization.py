@@ -0,0 +1,49 @@
+"""Benchmark stacked Apple notarization, one file after another vs with ``NotarizationScheduler``.
+
+A fake rcodesign notarizes each file in a random delay. One after another
+is how ``apple_notarize_stacked`` used to work: submit every file, then wait
+for each submission in turn, then staple every file.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+
+import random
+import time
+
+import pytest
+from conftest import skip_unless_benchmark
+from test_notarization import make_fake_rcodesign, read_calls
+
+from signingscript.notarization import NotarizationScheduler
+from signingscript.rcodesign import rcodesign_notarize, rcodesign_notary_wait, rcodesign_staple
+
+NUM_FILES = 8
+MIN_DELAY = 1
+MAX_DELAY = 4
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("pipelined", (False, True))
+async def test_bench_notarization(tmp_path, monkeypatch, pipelined):
+    rng = random.Random(0)
+    notarizations = {f"app{i}.app": (rng.uniform(MIN_DELAY, MAX_DELAY), "Accepted") for i in range(NUM_FILES)}
+    paths, log_path = make_fake_rcodesign(tmp_path, monkeypatch, notarizations)
+
+    start = time.time()
+    if pipelined:
+        await NotarizationScheduler("creds.json", poll_interval=0.25, max_poll_interval=1).notarize(paths)
+    else:
+        submission_ids = [await rcodesign_notarize(path, "creds.json") for path in paths]
+        for submission_id in submission_ids:
+            await rcodesign_notary_wait(submission_id, "creds.json")
+        for path in paths:
+            await rcodesign_staple(path)
+    elapsed = time.time() - start
+
+    staple_times = [timestamp - start for timestamp, command, _ in read_calls(log_path) if command == "staple"]
+    polls = sum(1 for _, command, _ in read_calls(log_path) if command == "notary-wait")
+    print(
+        f"\npipelined={pipelined}: {NUM_FILES} files notarized in {elapsed:.2f}s (slowest notarization {max(d for d, _ in notarizations.values()):.2f}s); "
+        f"first stapled after {min(staple_times):.2f}s; {polls} notary-wait calls"
+    )
@@ -0,0 +1,82 @@
+"""Benchmark merging signed omni.ja files, with mozjar's JarWriter vs raw copying.
+
+I/O is from ``/proc/self/io`` where available. ``rchar``/``wchar`` count
+the bytes passed through read and write calls, and data copied with
+``copy_file_range`` may or may not be counted, depending on the filesystem.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``; set
+``SIGNINGSCRIPT_BENCHMARK_SIZE_MB`` to change the omni.ja size (default 40).
+"""
+
+import os
+import time
+import tracemalloc
+import zipfile
+
+import pytest
+from conftest import skip_unless_benchmark
+from test_sign import make_signed_omnija, mozjar_merge_omnija_files
+
+from signingscript import sign
+
+RUNS = 5
+
+
+def get_io():
+    try:
+        with open("/proc/self/io") as fh:
+            return dict(line.split(": ") for line in fh.read().splitlines())
+    except OSError:
+        return None
+
+
+def make_large_omnija(path, size_mb):
+    # 8kB files, half compressible
+    members = {}
+    for i in range(size_mb * 128):
+        members[f"chrome/browser/content/file{i}.js"] = os.urandom(4096) + f"// file {i}\n".encode() * 256
+    with sign.mozjar.JarWriter(str(path)) as writer:
+        for name, data in members.items():
+            writer.add(name, data)
+        writer.preload(list(members)[: len(members) // 4])
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("raw_copy", (False, True))
+async def test_bench_omnija_merge(tmp_path, raw_copy):
+    size_mb = int(os.environ.get("SIGNINGSCRIPT_BENCHMARK_SIZE_MB", "40"))
+    orig = tmp_path / "omni.ja"
+    make_large_omnija(orig, size_mb)
+    signed = tmp_path / "signed.ja"
+    make_signed_omnija(signed, orig)
+
+    async def merge(to):
+        if raw_copy:
+            await sign.merge_omnija_files(str(orig), str(signed), to)
+        else:
+            mozjar_merge_omnija_files(str(orig), str(signed), to)
+
+    timings = []
+    start_io = get_io()
+    for i in range(RUNS):
+        to = str(tmp_path / f"merged{i}.ja")
+        start = time.monotonic()
+        await merge(to)
+        timings.append(time.monotonic() - start)
+    end_io = get_io()
+    # Separately, as tracing slows everything down
+    tracemalloc.start()
+    await merge(to)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    with zipfile.ZipFile(signed) as z:
+        assert sign.mozjar.JarReader(to)["META-INF/cose.sig"].read() == z.read("META-INF/cose.sig")
+    io_stats = "unknown I/O"
+    if start_io and end_io:
+        io_stats = ", ".join(f"{key} {(int(end_io[key]) - int(start_io[key])) / RUNS / 1024**2:.1f}MB" for key in ("rchar", "wchar"))
+    print(
+        f"\nraw_copy={raw_copy}: {os.path.getsize(orig) / 1024**2:.1f}MB omni.ja merged in "
+        f"median {sorted(timings)[RUNS // 2] * 1000:.0f}ms per file; per file {io_stats}; peak Python memory {peak_memory / 1024**2:.1f}MB"
+    )
@@ -0,0 +1,85 @@
+"""Benchmark regenerating ``precomplete`` for a synthetic 50k file tree, as before vs with a single walk.
+
+Before, ``_run_generate_precomplete`` globbed the tree for ``precomplete``
+twice, walked it again with ``os.walk`` to regenerate it, and wrote the diff
+with ``difflib.ndiff``. The tree gains and loses ``NUM_CHANGED`` files
+between the old ``precomplete`` and the new one, spread across the tree.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``; set
+``SIGNINGSCRIPT_BENCHMARK_NUM_FILES`` to change the tree size (default 50000).
+"""
+
+import difflib
+import glob
+import os
+import time
+
+import pytest
+from conftest import skip_unless_benchmark
+
+from signingscript import sign
+from signingscript.createprecomplete import format_precomplete
+
+NUM_CHANGED = 500
+FILES_PER_DIR = 50
+
+
+def old_get_build_entries(root_path):
+    rel_file_path_set = set()
+    rel_dir_path_set = set()
+    for root, dirs, files in os.walk(root_path):
+        for file_name in files:
+            rel_file_path_set.add(os.path.join(root[len(root_path) + 1 :], file_name))
+        for dir_name in dirs:
+            rel_dir_path_set.add(os.path.join(root[len(root_path) + 1 :], dir_name) + "/")
+    return sorted(rel_file_path_set, reverse=True), sorted(rel_dir_path_set, reverse=True)
+
+
+def old_run_generate_precomplete(context, tmp_dir):
+    (path,) = glob.glob(os.path.join(tmp_dir, "**", "precomplete"), recursive=True)
+    with open(path, "r") as fh:
+        before = fh.readlines()
+    with open(path, "wb") as fh:
+        fh.write(format_precomplete(*old_get_build_entries(os.path.dirname(path))))
+    (path,) = glob.glob(os.path.join(tmp_dir, "**", "precomplete"), recursive=True)
+    with open(path, "r") as fh:
+        after = fh.readlines()
+    with open(os.path.join(context.config["work_dir"], "precomplete.diff"), "w") as fh:
+        for line in difflib.ndiff(before, after):
+            fh.write(line)
+
+
+def make_tree(root, num_files):
+    names = [f"dir{i // FILES_PER_DIR // 20}/sub{i // FILES_PER_DIR % 20}/file{i}.js" for i in range(num_files)]
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    # The old precomplete has files that are gone, and misses ones that are
+    # new, spread across the tree
+    step = max(num_files // NUM_CHANGED, 1)
+    old_names = [name.replace("/file", "/gone") if i % step == 0 else name for i, name in enumerate(names)] + ["precomplete"]
+    (root / "precomplete").write_bytes(format_precomplete(sorted(old_names, reverse=True), []))
+
+
+@skip_unless_benchmark
+@pytest.mark.parametrize("single_walk", (False, True))
+def test_bench_precomplete(context, tmp_path, single_walk):
+    num_files = int(os.environ.get("SIGNINGSCRIPT_BENCHMARK_NUM_FILES", "50000"))
+    tmp_dir = tmp_path / "unpacked"
+    make_tree(tmp_dir / "firefox", num_files)
+
+    start = time.monotonic()
+    if single_walk:
+        sign._run_generate_precomplete(context, str(tmp_dir))
+    else:
+        old_run_generate_precomplete(context, str(tmp_dir))
+    elapsed = time.monotonic() - start
+
+    with open(tmp_dir / "firefox" / "precomplete") as fh:
+        lines = fh.read().splitlines()
+    assert len([line for line in lines if line.startswith("remove")]) == num_files + 1
+    print(
+        f"\nsingle_walk={single_walk}: precomplete for {num_files} files regenerated in {elapsed:.2f}s; "
+        f"diff {os.path.getsize(os.path.join(context.config['work_dir'], 'precomplete.diff')) / 1024:.0f}kB"
+    )
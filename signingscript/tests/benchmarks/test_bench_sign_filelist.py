@@ -0,0 +1,53 @@
+"""Benchmark concurrent whole-task signing against a fake Autograph with latency.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+
+import os
+import time
+
+import aiohttp
+import pytest
+from conftest import TEST_CERT_TYPE, skip_unless_benchmark
+
+from signingscript import script
+from signingscript.utils import Autograph
+
+
+def make_filelist(context, num_files, size, formats=("autograph_gpg",)):
+    filelist_dict = {}
+    for i in range(num_files):
+        path = f"public/build/target{i}.bin"
+        full_path = os.path.join(context.config["work_dir"], "cot", "upstream-task-id", path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as fh:
+            fh.write(os.urandom(size))
+        filelist_dict[path] = {"full_path": full_path, "formats": list(formats)}
+    return filelist_dict
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("concurrency_limit", (1, 4, 10, 40))
+async def test_bench_sign_filelist(context, fake_autograph, concurrency_limit, tmp_path):
+    fake_autograph.latency = 0.2
+    fake_autograph.jitter = 0.05
+    gpg_pubkey = tmp_path / "KEY"
+    gpg_pubkey.write_text("KEY")
+    context.config["gpg_pubkey"] = str(gpg_pubkey)
+    context.config["concurrency_limit"] = concurrency_limit
+    context.autograph_configs = {TEST_CERT_TYPE: [Autograph(fake_autograph.url, "user", "secret", ["autograph_rsa", "autograph_gpg"])]}
+    filelist_dict = make_filelist(context, 40, 64 * 1024)
+
+    async with aiohttp.ClientSession() as session:
+        context.session = session
+        start = time.monotonic()
+        timings = await script.sign_filelist(context, filelist_dict)
+        elapsed = time.monotonic() - start
+
+    per_file = sorted(timings.values())
+    print(
+        f"\nconcurrency_limit={concurrency_limit}: {len(timings)} files in {elapsed:.2f}s, "
+        f"per-file min/median/max {per_file[0]:.2f}/{per_file[len(per_file) // 2]:.2f}/{per_file[-1]:.2f}s, "
+        f"sum {sum(per_file):.2f}s, max in-flight requests {fake_autograph.max_in_flight}"
+    )
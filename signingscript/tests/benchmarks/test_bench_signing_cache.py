@@ -0,0 +1,44 @@
+"""Benchmark a retried signing task with and without the signing cache.
+
+Each run signs the same files again, as a rerun of a task would, against a
+fake Autograph with latency. With the cache, only the first run hits
+Autograph.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``.
+"""
+
+import time
+
+import aiohttp
+import pytest
+from conftest import TEST_CERT_TYPE, skip_unless_benchmark
+from test_bench_sign_filelist import make_filelist
+
+from signingscript import script
+from signingscript.cache import SigningCache
+from signingscript.utils import Autograph
+
+RUNS = 3
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_cache", (False, True))
+async def test_bench_signing_cache(context, fake_autograph, tmp_path, use_cache):
+    fake_autograph.latency = 0.3
+    fake_autograph.jitter = 0.1
+    context.autograph_configs = {TEST_CERT_TYPE: [Autograph(fake_autograph.url, "user", "secret", ["autograph_mar"])]}
+    if use_cache:
+        context.signing_cache = SigningCache(str(tmp_path / "cache"), 1024**3)
+
+    filelist_dict = make_filelist(context, 20, 1024 * 1024, formats=["autograph_mar"])
+    timings = []
+    async with aiohttp.ClientSession() as session:
+        context.session = session
+        for _ in range(RUNS):
+            start = time.monotonic()
+            await script.sign_filelist(context, filelist_dict)
+            timings.append(time.monotonic() - start)
+
+    stats = context.signing_cache.stats() if use_cache else {}
+    print(f"\nuse_cache={use_cache}: runs took {', '.join(f'{t:.2f}s' for t in timings)}; autograph requests {fake_autograph.requests['file']}; {stats}")
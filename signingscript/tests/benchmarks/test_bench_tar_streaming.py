@@ -0,0 +1,96 @@
+"""Benchmark widevine signing of a large tarball, extracting it vs streaming it.
+
+Autograph is mocked out, so this measures the archive handling only. The
+peak disk usage of the work dir and the tarball's dir is sampled from a
+thread while signing.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``; set
+``SIGNINGSCRIPT_BENCHMARK_SIZE_MB`` to change the tarball size (default 300).
+"""
+
+import io
+import os
+import tarfile
+import threading
+import time
+
+import pytest
+from conftest import skip_unless_benchmark
+
+from signingscript import sign
+
+
+def get_dir_size(path):
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+class PeakDiskUsage(threading.Thread):
+    def __init__(self, paths, interval=0.05):
+        super().__init__(daemon=True)
+        self.paths = paths
+        self.interval = interval
+        self.peak = 0
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.is_set():
+            self.peak = max(self.peak, sum(get_dir_size(path) for path in self.paths))
+            self.done.wait(self.interval)
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+
+def make_tar(path, size_mb):
+    # Half random, half compressible, so compression still has work to do
+    chunk = os.urandom(512 * 1024) + bytes(512 * 1024)
+
+    def add(t, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        t.addfile(info, io.BytesIO(data))
+
+    with tarfile.open(path, "w:gz", compresslevel=1) as t:
+        add(t, "firefox/precomplete", b"")
+        for name in ("firefox/firefox", "firefox/libxul.so", "firefox/plugin-container"):
+            add(t, name, chunk)
+        for i in range(size_mb):
+            add(t, f"firefox/lib/file{i}.dat", chunk)
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("streaming", (False, True))
+async def test_bench_tar_streaming(context, mocker, tmp_path, streaming):
+    async def fake_sign_widevine_with_autograph(_, from_, blessed, fmt, to=None):
+        with open(to, "wb") as fh:
+            fh.write(b"x" * 256)
+
+    mocker.patch.object(sign, "sign_widevine_with_autograph", new=fake_sign_widevine_with_autograph)
+    size_mb = int(os.environ.get("SIGNINGSCRIPT_BENCHMARK_SIZE_MB", "300"))
+    archive_dir = tmp_path / "archives"
+    archive_dir.mkdir()
+    path = archive_dir / "target.tar.gz"
+    make_tar(path, size_mb)
+    context.config["tar_streaming"] = streaming
+
+    orig_size = os.path.getsize(path)
+    monitor = PeakDiskUsage([context.config["work_dir"], str(archive_dir)])
+    monitor.start()
+    start = time.monotonic()
+    await sign.sign_widevine_tar(context, str(path), "autograph_widevine")
+    elapsed = time.monotonic() - start
+    monitor.stop()
+
+    print(
+        f"\nstreaming={streaming}: {orig_size / 1024**2:.0f}MB tarball signed in {elapsed:.2f}s, "
+        f"peak disk usage {monitor.peak / 1024**2:.0f}MB ({monitor.peak / orig_size:.1f}x the tarball)"
+    )
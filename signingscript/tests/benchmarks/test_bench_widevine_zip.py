@@ -0,0 +1,63 @@
+"""Benchmark widevine signing of a large zip, recreating it vs appending to it.
+
+Autograph is mocked out, so this measures the archive handling only. Disk
+writes come from ``/proc/self/io`` where available.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``; set
+``SIGNINGSCRIPT_BENCHMARK_SIZE_MB`` to change the zip size (default 300).
+"""
+
+import os
+import time
+import zipfile
+
+import pytest
+from conftest import skip_unless_benchmark
+
+from signingscript import sign
+
+
+def get_write_bytes():
+    try:
+        with open("/proc/self/io") as fh:
+            for line in fh:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def make_zip(path, size_mb):
+    chunk = os.urandom(1024 * 1024)
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr("firefox/precomplete", b"")
+        for name in ("firefox/firefox.exe", "firefox/xul.dll", "firefox/plugin-container.exe"):
+            z.writestr(name, chunk)
+        for i in range(size_mb):
+            z.writestr(f"firefox/lib/file{i}.dat", chunk)
+
+
+@skip_unless_benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("append", (False, True))
+async def test_bench_widevine_zip(context, mocker, tmp_path, append):
+    async def fake_sign_widevine_with_autograph(_, from_, blessed, fmt, to=None):
+        with open(to, "wb") as fh:
+            fh.write(b"x" * 256)
+
+    mocker.patch.object(sign, "sign_widevine_with_autograph", new=fake_sign_widevine_with_autograph)
+    size_mb = int(os.environ.get("SIGNINGSCRIPT_BENCHMARK_SIZE_MB", "300"))
+    path = tmp_path / "target.zip"
+    make_zip(path, size_mb)
+    context.config["widevine_zip_append"] = append
+
+    orig_size = os.path.getsize(path)
+    start_write_bytes = get_write_bytes()
+    start = time.monotonic()
+    await sign.sign_widevine_zip(context, str(path), "autograph_widevine")
+    elapsed = time.monotonic() - start
+    end_write_bytes = get_write_bytes()
+
+    written = f"{(end_write_bytes - start_write_bytes) / 1024**2:.1f}MB" if start_write_bytes is not None else "unknown"
+    print(f"\nappend={append}: {orig_size / 1024**2:.0f}MB zip signed in {elapsed:.2f}s, {written} written to disk")
@@ -0,0 +1,54 @@
+"""Benchmark single-threaded vs block-parallel xz tarball creation.
+
+The tarball is built from files of the running Python installation, which,
+like a Firefox build, mixes text and shared libraries.
+
+Run with ``SIGNINGSCRIPT_BENCHMARK=true pytest -s tests/benchmarks``; set
+``SIGNINGSCRIPT_BENCHMARK_SIZE_MB`` to change the input size (default 64).
+"""
+
+import lzma
+import os
+import sys
+import time
+
+import pytest
+from conftest import skip_unless_benchmark
+
+from signingscript import sign
+
+
+def collect_files(size):
+    files = []
+    total = 0
+    for root, _, names in os.walk(sys.base_prefix):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            if not os.path.isfile(path) or os.path.islink(path):
+                continue
+            files.append(path)
+            total += os.path.getsize(path)
+            if total >= size:
+                return files, total
+    return files, total
+
+
+@skip_unless_benchmark
+@pytest.mark.parametrize("threads,block_size_mb", ((1, None), (2, 16), (4, 16), (os.cpu_count(), 16), (os.cpu_count(), 64)))
+def test_bench_xz_tarfile(tmp_path, threads, block_size_mb):
+    size_mb = int(os.environ.get("SIGNINGSCRIPT_BENCHMARK_SIZE_MB", "64"))
+    files, total = collect_files(size_mb * 1024 * 1024)
+    to = str(tmp_path / "target.tar.xz")
+    kwargs = {"preset": 9 | lzma.PRESET_EXTREME, "threads": threads}
+    if block_size_mb:
+        kwargs["block_size"] = block_size_mb * 1024 * 1024
+
+    start = time.monotonic()
+    sign._create_xz_tarfile(to, files, sys.base_prefix, **kwargs)
+    elapsed = time.monotonic() - start
+
+    out_size = os.path.getsize(to)
+    print(
+        f"\nthreads={threads} block_size={block_size_mb or '-'}MB: {total / 1024**2:.0f}MB in {elapsed:.2f}s "
+        f"({total / 1024**2 / elapsed:.1f}MB/s), {out_size / 1024**2:.2f}MB out ({out_size / total:.1%}), {os.cpu_count()} CPUs"
+    )
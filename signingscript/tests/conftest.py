@@ -4,6 +4,8 @@ from contextlib import contextmanager
 from distutils.util import strtobool
 
 import pytest
+import pytest_asyncio
+from fake_autograph import FakeAutograph
 from scriptworker.context import Context
 
 from signingscript.exceptions import SigningScriptError
@@ -72,3 +74,13 @@ def skip_when_no_autograph_server(function):
     return pytest.mark.skipif(not strtobool(os.environ.get("AUTOGRAPH_INTEGRATION", "false")), reason="Tests requiring an Autograph server are skipped")(
         function
     )
+
+
+def skip_unless_benchmark(function):
+    return pytest.mark.skipif(not strtobool(os.environ.get("SIGNINGSCRIPT_BENCHMARK", "false")), reason="Benchmarks are skipped")(function)
+
+
+@pytest_asyncio.fixture(scope="function")
+async def fake_autograph():
+    async with FakeAutograph() as server:
+        yield server
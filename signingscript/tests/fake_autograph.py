@@ -0,0 +1,167 @@
+"""A local stand-in for the Autograph signing service.
+
+Used by tests and benchmarks to exercise the real request/response path
+(hawk headers, request bodies, response parsing) without a real Autograph.
+Responses are fake but well-formed: ``/sign/file`` echoes the input back,
+``/sign/hash`` returns a 512 byte signature derived from the input, and
+``/sign/data`` returns an armored text signature. With a ``signing_key``,
+hashes and data are signed with it for real, so signatures verify against
+the matching public key. ``connections`` holds the client address of every
+connection used, to check keep-alive.
+
+With ``streaming=True``, ``/sign/file`` echoes the input back without ever
+holding the request or response body in memory, so memory benchmarks only
+measure the client.
+"""
+
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import random
+import tempfile
+
+from aiohttp import web
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, utils
+
+# Prehashed digests are signed with the algorithm their size implies
+DIGEST_ALGORITHMS = {20: hashes.SHA1, 32: hashes.SHA256, 48: hashes.SHA384, 64: hashes.SHA512}
+
+
+class FakeAutograph:
+    """A fake Autograph server with injectable latency and errors.
+
+    Args:
+        latency (float, optional): seconds to sleep before responding. Defaults to 0.
+        jitter (float, optional): up to this many seconds of random extra latency. Defaults to 0.
+        error_rate (float, optional): the fraction of requests that get a 503. Defaults to 0.
+        streaming (bool, optional): stream ``/sign/file`` requests and responses. Defaults to False.
+        signing_key (bytes, optional): a PEM encoded RSA private key to sign
+            ``/sign/hash`` and ``/sign/data`` requests with. Defaults to None.
+
+    """
+
+    STREAM_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, latency=0, jitter=0, error_rate=0, streaming=False, signing_key=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.streaming = streaming
+        self.signing_key = serialization.load_pem_private_key(signing_key, password=None) if signing_key else None
+        self.requests = {"file": 0, "hash": 0, "data": 0}
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.connections = set()
+        self.url = None
+        self._runner = None
+
+    async def start(self):
+        app = web.Application(client_max_size=1024**4)
+        app.router.add_post("/sign/{method}", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *excinfo):
+        await self.stop()
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        if method not in self.requests:
+            raise web.HTTPNotFound()
+        self.requests[method] += 1
+        self.connections.add(request.transport.get_extra_info("peername"))
+        self.in_flight += 1
+        self.max_in_flight = max(self.in_flight, self.max_in_flight)
+        try:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+            if self.error_rate and random.random() < self.error_rate:
+                self.errors += 1
+                raise web.HTTPServiceUnavailable()
+            if method == "file" and self.streaming:
+                return await self.stream_file(request)
+            body = await request.read()
+            self.bytes_received += len(body)
+            resp = web.json_response([self.sign(method, req) for req in json.loads(body)])
+            self.bytes_sent += len(resp.body)
+            return resp
+        finally:
+            self.in_flight -= 1
+
+    async def stream_file(self, request):
+        """Echo the base64 ``input`` of a single signing request back as ``signed_file``.
+
+        The input is spooled to a temporary file rather than memory. This
+        relies on ``input`` being the first key of the request, as it is in
+        ``make_signing_req``.
+        """
+        prefix = b'[{"input":"'
+        head = b""
+        done = False
+        with tempfile.TemporaryFile() as spool:
+            async for chunk in request.content.iter_chunked(self.STREAM_CHUNK_SIZE):
+                self.bytes_received += len(chunk)
+                if done:
+                    continue
+                if len(head) < len(prefix):
+                    head += chunk
+                    if len(head) < len(prefix):
+                        continue
+                    assert head.startswith(prefix)
+                    chunk = head[len(prefix) :]
+                end = chunk.find(b'"')
+                if end >= 0:
+                    chunk = chunk[:end]
+                    done = True
+                spool.write(chunk)
+            spool.seek(0)
+            resp = web.StreamResponse(headers={"Content-Type": "application/json"})
+            await resp.prepare(request)
+            for chunk in itertools.chain([b'[{"ref":"fake","signed_file":"'], iter(lambda: spool.read(self.STREAM_CHUNK_SIZE), b""), [b'"}]']):
+                self.bytes_sent += len(chunk)
+                await resp.write(chunk)
+            await resp.write_eof()
+        return resp
+
+    def sign(self, method, req):
+        resp = {"ref": "fake", "signer_id": req.get("keyid", "fake_signer")}
+        data = base64.b64decode(req["input"])
+        if method == "file":
+            resp["signed_file"] = req["input"]
+        elif method == "hash":
+            if self.signing_key:
+                signature = self.sign_with_key(data, prehashed=True)
+            else:
+                signature = hashlib.sha512(data).digest() * 8
+            resp["signature"] = base64.b64encode(signature).decode("ascii")
+        else:
+            if self.signing_key:
+                signature = base64.b64encode(self.sign_with_key(data)).decode("ascii")
+            else:
+                signature = hashlib.sha256(data).hexdigest()
+            resp["signature"] = f"-----BEGIN PGP SIGNATURE-----\n\n{signature}\n-----END PGP SIGNATURE-----\n"
+        return resp
+
+    def sign_with_key(self, data, prehashed=False):
+        """Sign `data`, or the digest in `data` if `prehashed`, with PKCS#1 v1.5."""
+        if prehashed and len(data) in DIGEST_ALGORITHMS:
+            return self.signing_key.sign(data, padding.PKCS1v15(), utils.Prehashed(DIGEST_ALGORITHMS[len(data)]()))
+        return self.signing_key.sign(data, padding.PKCS1v15(), hashes.SHA256())
@@ -0,0 +1,178 @@
+import asyncio
+import os
+import struct
+import threading
+import time
+
+import pytest
+
+from signingscript.authenticode import AuthenticodeScheduler, is_signed
+
+FREE_SECTOR = 0xFFFFFFFF
+END_OF_CHAIN = 0xFFFFFFFE
+
+
+def make_pe(path, size=4096, pe32_plus=False, certificate_table=None):
+    # A DOS stub pointing at a PE signature, a COFF header and an optional
+    # header with 16 data directories
+    directories = [(0, 0)] * 16
+    if certificate_table:
+        directories[4] = certificate_table
+    magic, directories_offset = (0x20B, 112) if pe32_plus else (0x10B, 96)
+    optional_header = struct.pack("<H", magic) + bytes(directories_offset - 6) + struct.pack("<I", 16)
+    optional_header += b"".join(struct.pack("<II", *directory) for directory in directories)
+    header = b"MZ" + bytes(58) + struct.pack("<I", 64) + b"PE\0\0" + struct.pack("<HHIIIHH", 0x8664, 0, 0, 0, 0, len(optional_header), 0x22)
+    header += optional_header
+    path.write_bytes(header + os.urandom(size - len(header)))
+
+
+def make_msi(path, stream_names):
+    # A version 3 compound file: the FAT in sector 0, the directory in sector 1
+    header = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + bytes(16) + struct.pack("<HHHHH", 0x3E, 3, 0xFFFE, 9, 6) + bytes(6)
+    header += struct.pack("<IIIIIIIII", 0, 1, 1, 0, 4096, END_OF_CHAIN, 0, END_OF_CHAIN, 0)
+    header += struct.pack("<109I", 0, *[FREE_SECTOR] * 108)
+    fat = struct.pack("<128I", 0xFFFFFFFD, END_OF_CHAIN, *[FREE_SECTOR] * 126)
+    directory = b""
+    for name, entry_type in [("Root Entry", 5)] + [(name, 2) for name in stream_names]:
+        encoded = (name + "\0").encode("utf-16-le")
+        directory += encoded.ljust(64, b"\0") + struct.pack("<HB", len(encoded), entry_type) + bytes(61)
+    path.write_bytes(header + fat + directory.ljust(512, b"\0"))
+
+
+@pytest.mark.parametrize("pe32_plus", (False, True))
+@pytest.mark.parametrize(
+    "certificate_table,expected",
+    (
+        (None, False),
+        ((3000, 1096), True),
+        ((3000, 2000), None),
+    ),
+)
+def test_is_signed_pe(tmp_path, pe32_plus, certificate_table, expected):
+    path = tmp_path / "test.dll"
+    make_pe(path, pe32_plus=pe32_plus, certificate_table=certificate_table)
+    assert is_signed(str(path)) is expected
+
+
+@pytest.mark.parametrize(
+    "stream_names,expected",
+    (
+        ([], False),
+        (["\x05SummaryInformation"], False),
+        (["\x05SummaryInformation", "\x05DigitalSignature"], True),
+    ),
+)
+def test_is_signed_msi(tmp_path, stream_names, expected):
+    path = tmp_path / "test.msi"
+    make_msi(path, stream_names)
+    assert is_signed(str(path)) is expected
+
+
+@pytest.mark.parametrize(
+    "data",
+    (
+        b"",
+        b"not a PE file",
+        b"MZ" + bytes(100),
+        b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + bytes(100),
+    ),
+    ids=("empty", "text", "truncated_pe", "truncated_msi"),
+)
+def test_is_signed_unknown(tmp_path, data):
+    path = tmp_path / "test.exe"
+    path.write_bytes(data)
+    assert is_signed(str(path)) is None
+
+
+def test_is_signed_missing(tmp_path):
+    assert is_signed(str(tmp_path / "missing.exe")) is None
+
+
+class Tracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = {}
+        self.peak = {}
+
+    def enter(self, name):
+        with self.lock:
+            self.current[name] = self.current.get(name, 0) + 1
+            self.peak[name] = max(self.peak.get(name, 0), self.current[name])
+
+    def exit(self, name):
+        with self.lock:
+            self.current[name] -= 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("timestamp", (False, True))
+async def test_authenticode_scheduler_limits(timestamp):
+    scheduler = AuthenticodeScheduler(cpu_limit=2, autograph_limit=3, timestamp_limit=1)
+    tracker = Tracker()
+    main_thread = threading.get_ident()
+
+    async def signer(digest, digest_algo):
+        assert threading.get_ident() == main_thread
+        tracker.enter("autograph")
+        await asyncio.sleep(0.01)
+        tracker.exit("autograph")
+        return digest + b"-signed"
+
+    async def sign_file(i, signer):
+        assert threading.get_ident() != main_thread
+        tracker.enter("cpu")
+        time.sleep(0.005)
+        tracker.exit("cpu")
+        signature = await signer(str(i).encode(), "sha256")
+        tracker.enter("timestamp")
+        time.sleep(0.005)
+        tracker.exit("timestamp")
+        return signature
+
+    try:
+        results = await asyncio.gather(*(scheduler.run(lambda signer, i=i: sign_file(i, signer), signer, timestamp=timestamp) for i in range(12)))
+    finally:
+        scheduler.close()
+    assert results == [f"{i}-signed".encode() for i in range(12)]
+    assert tracker.peak["cpu"] <= 2
+    assert tracker.peak["autograph"] <= 3
+    # The timestamp phase holds a CPU slot too
+    assert tracker.peak["timestamp"] <= (1 if timestamp else 2)
+    assert scheduler.cpu._value == 2
+    assert scheduler.autograph._value == 3
+    assert scheduler.timestamp._value == 1
+
+
+@pytest.mark.asyncio
+async def test_authenticode_scheduler_cancel():
+    scheduler = AuthenticodeScheduler(cpu_limit=2, autograph_limit=1, timestamp_limit=1)
+    signing = asyncio.Event()
+
+    async def signer(digest, digest_algo):
+        signing.set()
+        await asyncio.sleep(10)
+
+    async def sign_file(signer):
+        return await signer(b"digest", "sha256")
+
+    try:
+        tasks = [asyncio.create_task(scheduler.run(sign_file, signer, timestamp=True)) for _ in range(3)]
+        await signing.wait()
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        scheduler.close()
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert scheduler.cpu._value == 2
+    assert scheduler.autograph._value == 1
+    assert scheduler.files._value == scheduler.max_workers
+
+
+@pytest.mark.asyncio
+async def test_authenticode_scheduler_run_local():
+    scheduler = AuthenticodeScheduler(cpu_limit=1)
+    try:
+        assert await scheduler.run_local(threading.get_ident) != threading.get_ident()
+    finally:
+        scheduler.close()
@@ -0,0 +1,139 @@
+import asyncio
+import base64
+import functools
+import hashlib
+from io import BytesIO
+
+import pytest
+from conftest import TEST_CERT_TYPE
+from fake_autograph import FakeAutograph
+from mardor.signing import verify_signature
+from scriptworker.utils import retry_async
+from test_mar import PRIVATE_KEY, PUBLIC_KEY
+
+from signingscript import autograph, sign
+from signingscript.autograph import AutographClient, AutographServerPool
+from signingscript.exceptions import SigningScriptError
+from signingscript.utils import Autograph
+
+
+def expected_hash_signature(data):
+    return hashlib.sha512(data).digest() * 8
+
+
+async def sign_hash(client, input_file):
+    return await client.call(TEST_CERT_TYPE, "autograph_hash", sign.sign_with_autograph, input_file, "autograph_hash", "hash", attempts=1)
+
+
+# AutographServerPool {{{1
+def test_server_pool_record():
+    pool = AutographServerPool("https://autograph", 2)
+    assert pool.sort_key() == (False, 0.0)
+    pool.record(1.0, error=False)
+    assert pool.latency_ewma == 1.0
+    pool.record(2.0, error=False)
+    assert pool.latency_ewma == pytest.approx(1.3)
+    assert pool.healthy
+    pool.record(0.01, error=True)
+    pool.record(0.01, error=True)
+    # errors don't count towards latency
+    assert pool.latency_ewma == pytest.approx(1.3)
+    assert pool.error_ewma > 0.5
+    assert not pool.healthy
+    assert pool.stats() == {"requests": 4, "errors": 2, "latency_ewma": pool.latency_ewma, "error_ewma": pool.error_ewma, "peak_in_flight": 0}
+
+
+# AutographClient {{{1
+def test_get_servers():
+    configs = {
+        TEST_CERT_TYPE: [
+            Autograph("https://a", "user", "pass", ["autograph_gpg"]),
+            Autograph("https://b", "user", "pass", ["autograph_gpg", "autograph_mar"]),
+            Autograph("https://a", "user2", "pass", ["autograph_mar"]),
+        ]
+    }
+    client = AutographClient(configs)
+    assert set(client.pools) == {"https://a", "https://b"}
+    assert [a.url for a in client.get_servers(TEST_CERT_TYPE, "autograph_gpg")] == ["https://a", "https://b"]
+    assert [a.client_id for a in client.get_servers(TEST_CERT_TYPE, "autograph_mar")] == ["user", "user2"]
+    assert client.get_servers(TEST_CERT_TYPE, "autograph_apk") == []
+    assert client.get_servers("other", "autograph_gpg") == []
+
+    client.pools["https://a"].record(1.0, error=False)
+    client.pools["https://b"].record(0.1, error=False)
+    assert [a.url for a in client.get_servers(TEST_CERT_TYPE, "autograph_gpg")] == ["https://b", "https://a"]
+    client.pools["https://b"].record(0.1, error=True)
+    client.pools["https://b"].record(0.1, error=True)
+    assert [a.url for a in client.get_servers(TEST_CERT_TYPE, "autograph_gpg")] == ["https://a", "https://b"]
+
+
+@pytest.mark.asyncio
+async def test_autograph_client_no_server():
+    async with AutographClient({}) as client:
+        with pytest.raises(SigningScriptError):
+            await client.call(TEST_CERT_TYPE, "autograph_gpg", sign.sign_with_autograph, BytesIO(b"data"), "autograph_gpg", "data")
+
+
+@pytest.mark.asyncio
+async def test_autograph_client_keepalive_and_limit():
+    async with FakeAutograph(latency=0.02) as server:
+        configs = {TEST_CERT_TYPE: [Autograph(server.url, "user", "secret", ["autograph_hash"])]}
+        async with AutographClient(configs, max_in_flight=3) as client:
+            data = [str(i).encode() for i in range(20)]
+            results = await asyncio.gather(*(sign_hash(client, BytesIO(d)) for d in data))
+            assert [base64.b64decode(r) for r in results] == [expected_hash_signature(d) for d in data]
+            assert client.stats()[server.url]["requests"] == 20
+            assert client.stats()[server.url]["peak_in_flight"] == 3
+        assert server.max_in_flight == 3
+        assert len(server.connections) <= 3
+
+
+@pytest.mark.asyncio
+async def test_autograph_client_failover():
+    async with FakeAutograph(error_rate=1) as bad, FakeAutograph() as good:
+        configs = {
+            TEST_CERT_TYPE: [
+                Autograph(bad.url, "user", "secret", ["autograph_hash"]),
+                Autograph(good.url, "user", "secret", ["autograph_hash"]),
+            ]
+        }
+        async with AutographClient(configs) as client:
+            for i in range(5):
+                result = await sign_hash(client, BytesIO(b"data"))
+                assert base64.b64decode(result) == expected_hash_signature(b"data")
+            # The failing server is demoted after two errors
+            assert bad.requests["hash"] == 2
+            assert good.requests["hash"] == 5
+            assert not client.pools[bad.url].healthy
+
+
+@pytest.mark.asyncio
+async def test_autograph_client_all_fail(mocker):
+    mocker.patch.object(autograph, "retry_async", new=functools.partial(retry_async, sleeptime_callback=lambda *args, **kwargs: 0))
+    async with FakeAutograph(error_rate=1) as server:
+        configs = {TEST_CERT_TYPE: [Autograph(server.url, "user", "secret", ["autograph_hash"])]}
+        async with AutographClient(configs, attempts=2) as client:
+            with pytest.raises(Exception):
+                await sign_hash(client, BytesIO(b"data"))
+        assert server.requests["hash"] == 2
+
+
+@pytest.mark.asyncio
+async def test_sign_hash_with_autograph_client(context, fake_autograph):
+    context.autograph_configs = {TEST_CERT_TYPE: [Autograph(fake_autograph.url, "user", "secret", ["autograph_hash"])]}
+    context.session = None
+    async with AutographClient(context.autograph_configs) as context.autograph_client:
+        signature = await sign.sign_hash_with_autograph(context, b"data", "autograph_hash")
+    assert signature == expected_hash_signature(b"data")
+    assert fake_autograph.requests["hash"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fake_autograph_signing_key():
+    h = hashlib.sha384(b"data").digest()
+    async with FakeAutograph(signing_key=PRIVATE_KEY) as server:
+        configs = {TEST_CERT_TYPE: [Autograph(server.url, "user", "secret", ["autograph_hash"])]}
+        async with AutographClient(configs) as client:
+            signature = base64.b64decode(await sign_hash(client, BytesIO(h)))
+    assert verify_signature(PUBLIC_KEY, signature, h, "sha384")
+    assert server.bytes_sent > len(signature)
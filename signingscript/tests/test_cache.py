@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from signingscript.cache import SigningCache
+
+
+@pytest.fixture(scope="function")
+def cache(tmp_path):
+    return SigningCache(str(tmp_path / "cache"), 1024)
+
+
+# make_key {{{1
+def test_make_key():
+    key = SigningCache.make_key("abc", "autograph_mar", None, "signer")
+    assert key == SigningCache.make_key("abc", "autograph_mar", None, "signer")
+    assert len(key) == 64
+    others = {
+        SigningCache.make_key("abd", "autograph_mar", None, "signer"),
+        SigningCache.make_key("abc", "autograph_gpg", None, "signer"),
+        SigningCache.make_key("abc", "autograph_mar", "key1", "signer"),
+        SigningCache.make_key("abc", "autograph_mar", None, "other_signer"),
+        SigningCache.make_key("abc", "autograph_mar", None, "signer", extension_id="foo"),
+    }
+    assert key not in others
+    assert len(others) == 5
+
+
+# get / put {{{1
+def test_get_put(cache, tmp_path):
+    src = tmp_path / "signed"
+    src.write_bytes(b"signed data")
+    to = tmp_path / "to"
+    assert not cache.get("key", str(to))
+    assert not to.exists()
+    cache.put("key", str(src))
+    assert cache.get("key", str(to))
+    assert to.read_bytes() == b"signed data"
+    assert cache.stats() == {"hits": 1, "misses": 1, "corrupt": 0, "evictions": 0}
+
+
+def test_get_put_bytes(cache):
+    assert cache.get_bytes("key") is None
+    cache.put_bytes("key", b"signature")
+    assert cache.get_bytes("key") == b"signature"
+    assert cache.stats() == {"hits": 1, "misses": 1, "corrupt": 0, "evictions": 0}
+    assert os.listdir(cache.cache_dir) == ["key"]
+
+
+def test_get_corrupt(cache, tmp_path):
+    cache.put_bytes("key", b"signature")
+    entry = os.path.join(cache.cache_dir, "key")
+    with open(entry, "r+b") as fh:
+        fh.seek(-1, os.SEEK_END)
+        fh.write(b"X")
+    to = tmp_path / "to"
+    to.write_bytes(b"original")
+    assert not cache.get("key", str(to))
+    assert to.read_bytes() == b"original"
+    assert not os.path.exists(entry)
+    assert cache.stats() == {"hits": 0, "misses": 1, "corrupt": 1, "evictions": 0}
+    assert sorted(os.listdir(tmp_path)) == ["cache", "to"]
+
+
+# evict {{{1
+def test_evict(cache):
+    for i in range(3):
+        cache.put_bytes(f"key{i}", b"x" * 300)
+        os.utime(os.path.join(cache.cache_dir, f"key{i}"), (i, i))
+    assert cache.evictions == 0
+    # key0 is the oldest, but was just used
+    assert cache.get_bytes("key0") == b"x" * 300
+    cache.put_bytes("key3", b"x" * 300)
+    assert sorted(os.listdir(cache.cache_dir)) == ["key0", "key2", "key3"]
+    assert cache.evictions == 1
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from signingscript.createprecomplete import diff_precomplete, generate_precomplete, get_build_entries, walk_build_paths
+
+
+def os_walk_build_entries(root_path):
+    # The os.walk implementation get_build_entries used to have
+    files = set()
+    dirs = set()
+    for root, dir_names, file_names in os.walk(root_path):
+        parent = root[len(root_path) + 1 :]
+        for name in file_names:
+            rel_path = os.path.join(parent, name).replace("\\", "/")
+            if not (rel_path.endswith("channel-prefs.js") or "distribution/" in rel_path):
+                files.add(rel_path)
+        for name in dir_names:
+            rel_path = os.path.join(parent, name).replace("\\", "/") + "/"
+            if "distribution/" not in rel_path:
+                dirs.add(rel_path)
+    return sorted(files, reverse=True), sorted(dirs, reverse=True)
+
+
+def make_tree(root):
+    for name in (
+        "firefox",
+        "libxul.so",
+        "browser/omni.ja",
+        "browser/features/a.xpi",
+        "defaults/pref/channel-prefs.js",
+        "distribution/extensions/b.xpi",
+        "a-b/c",
+        "a/b",
+    ):
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+    (root / "empty").mkdir()
+    (root / "link-to-dir").symlink_to(root / "browser")
+    (root / "link-to-file").symlink_to(root / "firefox")
+    (root / "broken-link").symlink_to(root / "missing")
+
+
+def test_walk_build_paths(tmp_path):
+    make_tree(tmp_path)
+    rel_paths = walk_build_paths(str(tmp_path))
+    assert "empty/" in rel_paths
+    assert "link-to-dir/" in rel_paths
+    assert "link-to-dir/omni.ja" not in rel_paths
+    assert "broken-link" in rel_paths
+    # Sorted, with each directory's entries before its subdirectories'
+    assert rel_paths.index("a/") < rel_paths.index("a-b/") < rel_paths.index("a/b")
+    assert get_build_entries(str(tmp_path)) == os_walk_build_entries(str(tmp_path))
+
+
+def test_generate_precomplete(tmp_path):
+    make_tree(tmp_path)
+    generate_precomplete(str(tmp_path))
+    lines = (tmp_path / "precomplete").read_text().splitlines()
+    assert 'remove "precomplete"' in lines
+    assert 'remove "browser/omni.ja"' in lines
+    assert 'rmdir "empty/"' in lines
+    assert lines.index('remove "libxul.so"') < lines.index('rmdir "empty/"')
+
+
+@pytest.mark.parametrize(
+    "before,after,expected",
+    (
+        ([], [], {"removed": [], "added": [], "unchanged": 0}),
+        (["a\n", "b\n"], ["a\n", "b\n"], {"removed": [], "added": [], "unchanged": 2}),
+        (["c\n", "b\n", "a\n"], ["d\n", "b\n", "a0\n"], {"removed": ["c\n", "a\n"], "added": ["d\n", "a0\n"], "unchanged": 1}),
+        # Order doesn't matter
+        (["a\n", "b\n"], ["b\n", "a\n"], {"removed": [], "added": [], "unchanged": 2}),
+    ),
+)
+def test_diff_precomplete(before, after, expected):
+    assert diff_precomplete(before, after) == expected
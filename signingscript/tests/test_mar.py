@@ -0,0 +1,70 @@
+import io
+import os
+
+import pytest
+from mardor.reader import MarReader
+from mardor.signing import make_rsa_keypair, sign_hash
+from mardor.writer import MarWriter, add_signature_block
+
+from signingscript.exceptions import SigningScriptError
+from signingscript.mar import inject_mar_signature, write_mar_with_placeholder_signature
+
+PRIVATE_KEY, PUBLIC_KEY = make_rsa_keypair(4096)
+
+
+def make_mar(tmp_path, num_files=3, size=5000, signing_algorithm=None):
+    src_dir = tmp_path / "mar_contents"
+    src_dir.mkdir(exist_ok=True)
+    for i in range(num_files):
+        (src_dir / f"file{i}").write_bytes(os.urandom(size // 2) + bytes(size - size // 2))
+    path = tmp_path / "test.mar"
+    with open(path, "w+b") as fh:
+        with MarWriter(
+            fh, productversion="99.0", channel="release", signing_key=PRIVATE_KEY if signing_algorithm else None, signing_algorithm=signing_algorithm
+        ) as m:
+            m.add(str(src_dir), compress="xz")
+    return path.read_bytes()
+
+
+@pytest.mark.parametrize("signing_algorithm", (None, "sha384"))
+def test_write_mar_with_placeholder_signature(tmp_path, signing_algorithm):
+    hash_algo = "sha384"
+    data = make_mar(tmp_path, signing_algorithm=signing_algorithm)
+    out = io.BytesIO()
+    h, signature_offset = write_mar_with_placeholder_signature(io.BytesIO(data), out, hash_algo)
+
+    # Same as mardor, with a dummy signature
+    expected = io.BytesIO()
+    add_signature_block(io.BytesIO(data), expected, hash_algo)
+    assert out.getvalue() == expected.getvalue()
+    expected.seek(0)
+    with MarReader(expected) as m:
+        assert m.calculate_hashes()[0][1] == h
+
+    # ...and with the real one
+    signature = sign_hash(PRIVATE_KEY, h, hash_algo)
+    inject_mar_signature(out, signature_offset, signature, h, hash_algo, verify_key=PUBLIC_KEY)
+    expected = io.BytesIO()
+    add_signature_block(io.BytesIO(data), expected, hash_algo, signature)
+    assert out.getvalue() == expected.getvalue()
+    out.seek(0)
+    with MarReader(out) as m:
+        assert m.verify(PUBLIC_KEY)
+        assert m.productinfo == ("99.0", "release")
+
+
+@pytest.mark.parametrize(
+    "signature,verify_key",
+    (
+        (b"0" * 511, None),
+        (b"0" * 512, PUBLIC_KEY),
+        (None, make_rsa_keypair(4096)[1]),
+    ),
+)
+def test_inject_mar_signature_errors(tmp_path, signature, verify_key):
+    out = io.BytesIO()
+    h, signature_offset = write_mar_with_placeholder_signature(io.BytesIO(make_mar(tmp_path)), out, "sha384")
+    before = out.getvalue()
+    with pytest.raises(SigningScriptError):
+        inject_mar_signature(out, signature_offset, signature or sign_hash(PRIVATE_KEY, h, "sha384"), h, "sha384", verify_key=verify_key)
+    assert out.getvalue() == before
@@ -0,0 +1,135 @@
+import json
+import os
+import sys
+import textwrap
+import time
+
+import pytest
+
+from signingscript.notarization import NotarizationScheduler
+from signingscript.rcodesign import RCodesignError
+
+# Notarizes each file in its delay in seconds, with its result, and logs
+# every call as a JSON line. notary-wait only polls once if it's given
+# --max-wait-seconds
+FAKE_RCODESIGN = """\
+    #!{python}
+    import json
+    import os
+    import sys
+    import time
+    import uuid
+
+    state_dir = os.environ["FAKE_RCODESIGN_DIR"]
+    notarizations = json.loads(os.environ["FAKE_RCODESIGN_NOTARIZATIONS"])
+    command, path = sys.argv[1], sys.argv[-1]
+    with open(os.path.join(state_dir, "calls.log"), "a") as fh:
+        fh.write(json.dumps([time.time(), command, os.path.basename(path)]) + "\\n")
+    if command == "notary-submit":
+        submission_id = str(uuid.uuid4())
+        with open(os.path.join(state_dir, submission_id), "w") as fh:
+            json.dump([os.path.basename(path), time.time()], fh)
+        print(f"created submission ID: {{submission_id}}")
+    elif command == "notary-wait":
+        with open(os.path.join(state_dir, path)) as fh:
+            name, submitted = json.load(fh)
+        delay, result = notarizations[name]
+        elapsed = time.time() - submitted
+        if "--max-wait-seconds" not in sys.argv:
+            # Wait until it's done, polling every second like rcodesign
+            while elapsed < delay:
+                time.sleep(min(1, delay - elapsed))
+                elapsed = time.time() - submitted
+        if elapsed < delay:
+            print(f"poll state after {{elapsed:.0f}}s: InProgress")
+            print("error: timed out waiting for notarization", file=sys.stderr)
+            sys.exit(1)
+        print(f"poll state after {{elapsed:.0f}}s: {{result}}")
+    elif command == "staple":
+        pass
+"""
+
+
+def make_fake_rcodesign(tmp_path, monkeypatch, notarizations):
+    """Put a fake rcodesign on the PATH, notarizing each file name in its ``(delay, result)``."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    state_dir = tmp_path / "rcodesign"
+    state_dir.mkdir()
+    rcodesign = bin_dir / "rcodesign"
+    rcodesign.write_text(textwrap.dedent(FAKE_RCODESIGN.format(python=sys.executable)))
+    rcodesign.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_RCODESIGN_DIR", str(state_dir))
+    monkeypatch.setenv("FAKE_RCODESIGN_NOTARIZATIONS", json.dumps(notarizations))
+    paths = []
+    for name in notarizations:
+        path = tmp_path / name
+        path.write_bytes(b"app")
+        paths.append(str(path))
+    return paths, state_dir / "calls.log"
+
+
+def read_calls(log_path):
+    with open(log_path) as fh:
+        return [json.loads(line) for line in fh]
+
+
+@pytest.mark.asyncio
+async def test_notarization_scheduler(tmp_path, monkeypatch):
+    paths, log_path = make_fake_rcodesign(
+        tmp_path,
+        monkeypatch,
+        {"slow.app": (1.5, "Accepted"), "fast.pkg": (0.2, "Accepted"), "medium.app": (0.6, "Accepted")},
+    )
+    scheduler = NotarizationScheduler("creds.json", poll_interval=0.1, max_poll_interval=0.3)
+    start = time.time()
+    await scheduler.notarize(paths)
+    elapsed = time.time() - start
+
+    calls = read_calls(log_path)
+    submits = [name for _, command, name in calls if command == "notary-submit"]
+    staples = [name for _, command, name in calls if command == "staple"]
+    assert sorted(submits) == sorted(["slow.app", "fast.pkg", "medium.app"])
+    # Stapled as each is accepted, not in submission order
+    assert staples == ["fast.pkg", "medium.app", "slow.app"]
+    # Waited for in parallel
+    assert elapsed < 1.5 + 0.2 + 0.6
+    assert not scheduler.pending
+
+
+@pytest.mark.asyncio
+async def test_notarization_scheduler_no_staple(tmp_path, monkeypatch):
+    paths, log_path = make_fake_rcodesign(tmp_path, monkeypatch, {"geckodriver.zip": (0, "Accepted")})
+    await NotarizationScheduler("creds.json", poll_interval=0).notarize(paths, staple=False)
+    assert [command for _, command, _ in read_calls(log_path)] == ["notary-submit", "notary-wait"]
+
+
+@pytest.mark.asyncio
+async def test_notarization_scheduler_invalid(tmp_path, monkeypatch):
+    paths, log_path = make_fake_rcodesign(tmp_path, monkeypatch, {"bad.app": (0, "Invalid"), "slow.app": (60, "Accepted")})
+    scheduler = NotarizationScheduler("creds.json", poll_interval=0.1)
+    with pytest.raises(RCodesignError, match="bad.app is Invalid"):
+        await scheduler.notarize(paths)
+    # The other notarization isn't waited for
+    assert not scheduler.pending
+    assert "staple" not in [command for _, command, _ in read_calls(log_path)]
+
+
+@pytest.mark.asyncio
+async def test_notarization_scheduler_timeout(tmp_path, monkeypatch):
+    paths, _ = make_fake_rcodesign(tmp_path, monkeypatch, {"slow.app": (60, "Accepted")})
+    scheduler = NotarizationScheduler("creds.json", poll_interval=0.1, timeout=0.3)
+    with pytest.raises(RCodesignError, match="Timed out"):
+        await scheduler.notarize(paths)
+
+
+@pytest.mark.asyncio
+async def test_notarization_scheduler_backoff(tmp_path, monkeypatch):
+    paths, log_path = make_fake_rcodesign(tmp_path, monkeypatch, {"slow.app": (1.2, "Accepted")})
+    await NotarizationScheduler("creds.json", poll_interval=0.05, max_poll_interval=0.4).notarize(paths)
+    polls = [timestamp for timestamp, command, _ in read_calls(log_path) if command == "notary-wait"]
+    intervals = [b - a for a, b in zip(polls, polls[1:])]
+    # Polled less and less often, up to the maximum interval
+    assert len(polls) < 1.2 / 0.05
+    assert intervals[-1] > intervals[0]
@@ -114,6 +114,37 @@ async def test_rcodesign_notary_wait_check_fail(mocker):
         await rcodesign.rcodesign_notary_wait(submission_id, creds_path)
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "exitcode,logs,expected",
+    (
+        (0, ["poll state after 0s: Accepted"], "Accepted"),
+        (0, ["poll state after 0s: Invalid"], "Invalid"),
+        (1, ["poll state after 0s: InProgress", "error: timed out"], "InProgress"),
+    ),
+)
+async def test_rcodesign_notary_status(mocker, exitcode, logs, expected):
+    execute = mock.AsyncMock(return_value=(exitcode, logs))
+    mocker.patch.object(rcodesign, "_execute_command", execute)
+    assert await rcodesign.rcodesign_notary_status("123", "/foo/bar") == expected
+    execute.assert_awaited_once_with(["rcodesign", "notary-wait", "--max-wait-seconds", "0", "--api-key-path", "/foo/bar", "123"])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "exitcode,logs",
+    (
+        (1, ["error: authentication failed"]),
+        (0, ["weird logs, but no errors"]),
+        (1, ["poll state after 0s: Accepted", "error: something else"]),
+    ),
+)
+async def test_rcodesign_notary_status_fail(mocker, exitcode, logs):
+    mocker.patch.object(rcodesign, "_execute_command", mock.AsyncMock(return_value=(exitcode, logs)))
+    with pytest.raises(rcodesign.RCodesignError):
+        await rcodesign.rcodesign_notary_status("123", "/foo/bar")
+
+
 @pytest.mark.asyncio
 async def test_rcodesign_staple(mocker):
     execute = mock.AsyncMock()
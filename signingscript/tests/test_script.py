@@ -1,15 +1,18 @@
+import asyncio
 import builtins
 import os
 from unittest.mock import MagicMock, mock_open
 
+import aiohttp
 import mock
 import pytest
 import scriptworker.client
 from conftest import APPLE_CONFIG_PATH, BASE_DIR, TEST_CERT_TYPE, noop_sync
 
 from signingscript import script
+from signingscript.cache import SigningCache
 from signingscript.exceptions import SigningScriptError
-from signingscript.utils import AppleNotarization
+from signingscript.utils import AppleNotarization, Autograph
 
 # helper constants, fixtures, functions {{{1
 EXAMPLE_CONFIG = os.path.join(BASE_DIR, "config_example.json")
@@ -45,6 +48,7 @@ async def async_main_helper(tmpdir, mocker, formats, extra_config={}, server_typ
     context.config = {"work_dir": tmpdir, "artifact_dir": tmpdir, "autograph_configs": {}, "apple_notarization_configs": "fake"}
     context.config.update(extra_config)
     await script.async_main(context)
+    return context
 
 
 @pytest.mark.asyncio
@@ -93,7 +97,46 @@ async def test_async_main_multiple_formats(tmpdir, mocker):
 async def test_async_main_autograph(tmpdir, mocker):
     formats = ["autograph_mar"]
     mocker.patch.object(script, "copy_to_dir", new=noop_sync)
-    await async_main_helper(tmpdir, mocker, formats, {})
+    scheduler = mock.MagicMock()
+
+    async def fake_sign_filelist(context, *args):
+        context.authenticode_scheduler = scheduler
+
+    mocker.patch.object(script, "sign_filelist", new=fake_sign_filelist)
+    context = await async_main_helper(tmpdir, mocker, formats, {})
+    # The closed AutographClient isn't left behind, and the authenticode
+    # worker threads are shut down
+    assert context.autograph_client is None
+    scheduler.close.assert_called_once_with()
+    assert context.authenticode_scheduler is None
+
+
+@pytest.mark.asyncio
+async def test_async_main_autograph_client_reset_on_error(tmpdir, mocker):
+    async def fail(*args):
+        raise SigningScriptError("boom")
+
+    mocker.patch.object(script, "sign_filelist", new=fail)
+    context = mock.MagicMock()
+    context.config = {"work_dir": tmpdir, "artifact_dir": tmpdir, "autograph_configs": {}}
+    mocker.patch.object(script, "load_autograph_configs", new=noop_sync)
+    mocker.patch.object(script, "task_signing_formats", return_value=[])
+    mocker.patch.object(script, "build_filelist_dict", return_value={})
+    with pytest.raises(SigningScriptError, match="boom"):
+        await script.async_main(context)
+    assert context.autograph_client is None
+    assert context.authenticode_scheduler is None
+
+
+@pytest.mark.asyncio
+async def test_async_main_signing_cache(tmpdir, mocker):
+    formats = ["autograph_mar"]
+    mocker.patch.object(script, "copy_to_dir", new=noop_sync)
+    cache_dir = os.path.join(tmpdir, "cache")
+    context = await async_main_helper(tmpdir, mocker, formats, {"signing_cache_dir": cache_dir, "signing_cache_max_size": 1024})
+    assert isinstance(context.signing_cache, SigningCache)
+    assert context.signing_cache.max_size == 1024
+    assert os.path.isdir(cache_dir)
 
 
 @pytest.mark.asyncio
@@ -135,6 +178,110 @@ async def test_async_main_autograph_authenticode(tmpdir, mocker, use_comment):
     await async_main_helper(tmpdir, mocker, formats, {}, "autograph", use_comment=use_comment)
 
 
+# sign_filelist {{{1
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "formats,concurrency_limit,expected_max",
+    (
+        (["autograph_mar"], 3, 3),
+        (["autograph_mar", "autograph_gpg"], 10, 5),
+        (["autograph_mar"], 1, 1),
+        (["apple_notarization"], 3, 1),
+    ),
+)
+async def test_sign_filelist(tmpdir, mocker, formats, concurrency_limit, expected_max):
+    in_flight = 0
+    max_in_flight = 0
+    signed = []
+
+    async def fake_sign(_, path, signing_formats, **kwargs):
+        nonlocal in_flight, max_in_flight
+        assert signing_formats == formats
+        in_flight += 1
+        max_in_flight = max(in_flight, max_in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        signed.append(path)
+        return [path]
+
+    mocker.patch.object(script, "sign", new=fake_sign)
+    mocker.patch.object(script, "copy_to_dir", new=noop_sync)
+    context = mock.MagicMock()
+    context.config = {"work_dir": tmpdir, "artifact_dir": tmpdir, "gpg_pubkey": "KEY", "concurrency_limit": concurrency_limit}
+    filelist_dict = {f"path{i}": {"full_path": f"full_path{i}", "formats": formats} for i in range(5)}
+
+    timings = await script.sign_filelist(context, filelist_dict)
+    assert sorted(timings.keys()) == sorted(filelist_dict.keys())
+    assert sorted(signed) == sorted(os.path.join(tmpdir, path) for path in filelist_dict)
+    assert max_in_flight == expected_max
+
+
+@pytest.mark.asyncio
+async def test_sign_filelist_raises(tmpdir, mocker):
+    async def fake_sign(_, path, *args, **kwargs):
+        if path.endswith("path2"):
+            raise SigningScriptError("dying!")
+        return [path]
+
+    mocker.patch.object(script, "sign", new=fake_sign)
+    mocker.patch.object(script, "copy_to_dir", new=noop_sync)
+    context = mock.MagicMock()
+    context.config = {"work_dir": tmpdir, "artifact_dir": tmpdir}
+    filelist_dict = {f"path{i}": {"full_path": f"full_path{i}", "formats": ["autograph_mar"]} for i in range(5)}
+    with pytest.raises(SigningScriptError):
+        await script.sign_filelist(context, filelist_dict)
+
+
+@pytest.mark.asyncio
+async def test_sign_filelist_autograph(context, fake_autograph):
+    fake_autograph.latency = 0.05
+    # autograph_rsa only writes a detached signature
+    context.config["concurrency_limit"] = 1
+    context.config["detached_concurrency_limit"] = 4
+    context.autograph_configs = {TEST_CERT_TYPE: [Autograph(fake_autograph.url, "user", "secret", ["autograph_rsa"])]}
+    filelist_dict = {}
+    for i in range(8):
+        full_path = os.path.join(context.config["work_dir"], "cot", "taskid", f"public/file{i}")
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as fh:
+            fh.write(os.urandom(1024))
+        filelist_dict[f"public/file{i}"] = {"full_path": full_path, "formats": ["autograph_rsa"]}
+
+    async with aiohttp.ClientSession() as session:
+        context.session = session
+        await script.sign_filelist(context, filelist_dict)
+
+    assert fake_autograph.requests["hash"] == 8
+    assert 1 < fake_autograph.max_in_flight <= 4
+    for path in filelist_dict:
+        assert os.path.exists(os.path.join(context.config["artifact_dir"], f"{path}.sig"))
+
+
+@pytest.mark.asyncio
+async def test_sign_filelist_detached(tmpdir, mocker):
+    in_flight = {"detached": 0, "other": 0}
+    max_in_flight = {"detached": 0, "other": 0}
+
+    async def fake_sign(_, path, signing_formats, **kwargs):
+        kind = "detached" if signing_formats == ["autograph_gpg"] else "other"
+        in_flight[kind] += 1
+        max_in_flight[kind] = max(in_flight[kind], max_in_flight[kind])
+        await asyncio.sleep(0.01)
+        in_flight[kind] -= 1
+        return [path]
+
+    mocker.patch.object(script, "sign", new=fake_sign)
+    mocker.patch.object(script, "copy_to_dir", new=noop_sync)
+    context = mock.MagicMock()
+    context.config = {"work_dir": tmpdir, "artifact_dir": tmpdir, "gpg_pubkey": "KEY", "concurrency_limit": 2, "detached_concurrency_limit": 6}
+    filelist_dict = {f"path{i}": {"full_path": f"full_path{i}", "formats": ["autograph_mar"]} for i in range(4)}
+    filelist_dict.update({f"checksums{i}": {"full_path": f"checksums{i}", "formats": ["autograph_gpg"]} for i in range(10)})
+
+    timings = await script.sign_filelist(context, filelist_dict)
+    assert sorted(timings.keys()) == sorted(filelist_dict.keys())
+    assert max_in_flight == {"detached": 6, "other": 2}
+
+
 def test_get_default_config():
     parent_dir = os.path.dirname(os.getcwd())
     c = script.get_default_config()
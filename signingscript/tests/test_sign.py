@@ -1,6 +1,7 @@
 import asyncio
 import base64
 import json
+import lzma
 import os
 import os.path
 import re
@@ -9,6 +10,7 @@ import subprocess
 import sys
 import tarfile
 import tempfile
+import tracemalloc
 import zipfile
 from contextlib import contextmanager
 from hashlib import sha256
@@ -19,10 +21,18 @@ import aiohttp
 import pytest
 import winsign.sign
 from conftest import BASE_DIR, SERVER_CONFIG_PATH, TEST_CERT_TYPE, TEST_DATA_DIR, die, does_not_raise, noop_async, noop_sync
+from fake_autograph import FakeAutograph
+from mardor.reader import MarReader
+from mardor.signing import sign_hash as mar_sign_hash
 from scriptworker.utils import makedirs
+from test_mar import PRIVATE_KEY as MAR_PRIVATE_KEY
+from test_mar import PUBLIC_KEY as MAR_PUBLIC_KEY
+from test_mar import make_mar
 
+import signingscript.notarization as notarization
 import signingscript.sign as sign
 import signingscript.utils as utils
+from signingscript.cache import SigningCache
 from signingscript.exceptions import SigningScriptError
 from signingscript.utils import get_hash
 
@@ -210,8 +220,9 @@ async def test_sign_file_with_autograph_raises_http_error(context, mocker, to, e
 
 # sign_file_detached {{{1
 @pytest.mark.asyncio
-async def test_sign_file_detached(context, mocker):
-    path = "hello.txt"
+async def test_sign_file_detached(context, mocker, tmp_path):
+    (tmp_path / "build").mkdir()
+    path = str(tmp_path / "build" / "hello.txt")
     data = b"Hello there!"
 
     h = sha256()
@@ -219,8 +230,8 @@ async def test_sign_file_detached(context, mocker):
     expected_hash = base64.b64encode(h.digest()).decode("ascii")
     expected_signature = b"0" * 512
 
-    open_mock = mocker.mock_open(read_data=data)
-    mocker.patch("builtins.open", open_mock, create=True)
+    with open(path, "wb") as fh:
+        fh.write(data)
 
     mocked_session = MockedSession(signature=base64.b64encode(expected_signature))
     mocker.patch.object(context, "session", new=mocked_session)
@@ -233,15 +244,15 @@ async def test_sign_file_detached(context, mocker):
 
     result = await sign.sign_file_detached(context, path, "autograph_rsa")
     assert result == [path, f"{path}.sig"]
+    with open(f"{path}.sig", "rb") as fh:
+        assert fh.read() == expected_signature
+    # No temporary files left behind
+    assert sorted(os.listdir(tmp_path / "build")) == ["hello.txt", "hello.txt.sig"]
 
     mocked_session.post.assert_called_with("https://autograph-hsm.dev.mozaws.net/sign/hash", headers=mocker.ANY, data=mocker.ANY)
     called_with_data = mocked_session.post.call_args[1]["data"]
     assert json.loads(called_with_data.read())[0]["input"] == expected_hash
 
-    open_mock.assert_called_with(f"{path}.sig", "wb")
-    fh_mock = open_mock.return_value.__enter__.return_value
-    fh_mock.write.assert_called_with(expected_signature)
-
 
 # get_mar_verification_key {{{1
 @pytest.mark.parametrize(
@@ -346,6 +357,63 @@ async def test_sign_mar384_with_autograph_hash_keyid(context, mocker):
     fake_sign_hash.assert_called_with(mocker.ANY, mocker.ANY, "autograph_hash_only_mar384", "keyid1")
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("to", (None, "to.mar", "from.mar"))
+async def test_sign_mar384_with_autograph_hash_single_pass(context, mocker, tmp_path, to):
+    context.config["mar_single_pass"] = True
+    context.autograph_configs = {
+        TEST_CERT_TYPE: [utils.Autograph("https://autograph-hsm.dev.mozaws.net", "alice", "secret", ["autograph_hash_only_mar384"], "autograph")]
+    }
+    key_path = tmp_path / "key.pem"
+    key_path.write_bytes(MAR_PUBLIC_KEY)
+    mocker.patch.object(sign, "get_mar_verification_key", return_value=str(key_path))
+    mocker.patch.object(sign, "verify_mar_signature", new=die)
+
+    async def fake_sign_hash(context, h, fmt, keyid):
+        assert (fmt, keyid) == ("autograph_hash_only_mar384", "keyid1")
+        return mar_sign_hash(MAR_PRIVATE_KEY, h, "sha384")
+
+    mocker.patch.object(sign, "sign_hash_with_autograph", new=fake_sign_hash)
+    mar_dir = tmp_path / "mars"
+    mar_dir.mkdir()
+    from_ = mar_dir / "from.mar"
+    data = make_mar(tmp_path)
+    from_.write_bytes(data)
+    to = str(mar_dir / to) if to else None
+
+    assert await sign.sign_mar384_with_autograph_hash(context, str(from_), "autograph_hash_only_mar384:keyid1", to=to) == (to or str(from_))
+    with open(to or from_, "rb") as fh:
+        with MarReader(fh) as m:
+            assert m.verify(MAR_PUBLIC_KEY)
+    if to and to != str(from_):
+        assert from_.read_bytes() == data
+    assert sorted(os.listdir(mar_dir)) == sorted({"from.mar", os.path.basename(to or from_)})
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("signature", (b"0" * 512, b"0" * 511), ids=("invalid", "short"))
+async def test_sign_mar384_with_autograph_hash_single_pass_bad_signature(context, mocker, tmp_path, signature):
+    context.config["mar_single_pass"] = True
+    context.autograph_configs = {TEST_CERT_TYPE: [utils.Autograph("https://autograph-hsm.dev.mozaws.net", "alice", "secret", ["autograph_hash_only_mar384"])]}
+    key_path = tmp_path / "key.pem"
+    key_path.write_bytes(MAR_PUBLIC_KEY)
+    mocker.patch.object(sign, "get_mar_verification_key", return_value=str(key_path))
+
+    async def fake_sign_hash(*args):
+        return signature
+
+    mocker.patch.object(sign, "sign_hash_with_autograph", new=fake_sign_hash)
+    mar_dir = tmp_path / "mars"
+    mar_dir.mkdir()
+    from_ = mar_dir / "from.mar"
+    data = make_mar(tmp_path)
+    from_.write_bytes(data)
+    with pytest.raises(SigningScriptError):
+        await sign.sign_mar384_with_autograph_hash(context, str(from_), "autograph_hash_only_mar384")
+    assert from_.read_bytes() == data
+    assert os.listdir(mar_dir) == ["from.mar"]
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("to,expected", ((None, "from"), ("to", "to")))
 async def test_sign_mar384_with_autograph_hash_invalid_format_errors(context, mocker, to, expected):
@@ -522,7 +590,6 @@ async def test_sign_widevine(context, mocker, filename, fmt, raises, should_sign
     mocker.patch.object(sign, "sign_file", new=noop_async)
     mocker.patch.object(sign, "sign_widevine_with_autograph", new=noop_async)
     mocker.patch.object(sign, "makedirs", new=noop_sync)
-    mocker.patch.object(sign, "generate_precomplete", new=noop_sync)
     mocker.patch.object(sign, "_create_tarfile", new=noop_async)
     mocker.patch.object(sign, "_create_zipfile", new=noop_async)
     mocker.patch.object(sign, "_run_generate_precomplete", new=noop_sync)
@@ -535,6 +602,205 @@ async def test_sign_widevine(context, mocker, filename, fmt, raises, should_sign
         await sign.sign_widevine(context, filename, fmt)
 
 
+def make_widevine_zip(path):
+    members = {
+        "firefox/firefox.exe": b"firefox" * 1000,
+        "firefox/xul.dll": bytes(range(256)) * 256,
+        "firefox/plugin-container.exe": b"plugin-container",
+        "firefox/browser/omni.ja": b"omni" * 1000,
+        "firefox/defaults/pref/channel-prefs.js": b"prefs",
+        "firefox/distribution/policies.json": b"{}",
+    }
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr("firefox/empty/", b"")
+        z.writestr("firefox/precomplete", b'remove "firefox.exe"\n')
+        for name, data in members.items():
+            z.writestr(name, data)
+
+
+@pytest.mark.asyncio
+async def test_sign_widevine_zip_append(context, mocker, tmp_path):
+    async def fake_sign_widevine_with_autograph(_, from_, blessed, fmt, to=None):
+        with open(to, "w") as fh:
+            fh.write(f"{os.path.basename(from_)} blessed={blessed}")
+
+    mocker.patch.object(sign, "sign_widevine_with_autograph", new=fake_sign_widevine_with_autograph)
+    results = {}
+    for append in (False, True):
+        context.config["widevine_zip_append"] = append
+        path = tmp_path / f"target{append}.zip"
+        make_widevine_zip(path)
+        with zipfile.ZipFile(path) as z:
+            orig_offsets = {info.filename: info.header_offset for info in z.infolist()}
+        assert await sign.sign_widevine_zip(context, str(path), "autograph_widevine") == str(path)
+        with zipfile.ZipFile(path) as z:
+            assert z.testzip() is None
+            results[append] = {name: z.read(name) for name in z.namelist() if not name.endswith("/")}
+            if append:
+                # Existing members weren't moved or rewritten
+                for info in z.infolist():
+                    if info.filename in orig_offsets and info.filename != "firefox/precomplete":
+                        assert info.header_offset == orig_offsets[info.filename]
+        with open(os.path.join(context.config["artifact_dir"], "public/logs/precomplete.diff")) as fh:
+            results[append]["diff"] = fh.read()
+
+    assert sorted(results[True]) == sorted(results[False])
+    for name in results[True]:
+        assert results[True][name] == results[False][name], name
+    assert results[True]["firefox/plugin-container.exe.sig"] == b"plugin-container.exe blessed=True"
+    assert results[True]["firefox/firefox.exe.sig"] == b"firefox.exe blessed=False"
+    precomplete = results[True]["firefox/precomplete"].decode("utf-8").splitlines()
+    assert 'remove "xul.dll.sig"' in precomplete
+    assert 'rmdir "empty/"' in precomplete
+    assert 'remove "defaults/pref/channel-prefs.js"' not in precomplete
+
+
+@pytest.mark.asyncio
+async def test_sign_widevine_zip_append_no_precomplete(context, mocker, tmp_path):
+    mocker.patch.object(sign, "sign_widevine_with_autograph", new=noop_async)
+    context.config["widevine_zip_append"] = True
+    path = tmp_path / "target.zip"
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("firefox/firefox.exe", b"firefox")
+    mocker.patch.object(sign, "_extract_zipfile", new=noop_async)
+    with pytest.raises(SigningScriptError):
+        await sign.sign_widevine_zip(context, str(path), "autograph_widevine")
+
+
+def make_widevine_tar(path, compression):
+    members = {
+        "./firefox/firefox": b"firefox" * 1000,
+        "./firefox/libxul.so": bytes(range(256)) * 256,
+        "./firefox/plugin-container": b"plugin-container",
+        "./firefox/precomplete": b'remove "firefox"\n',
+        "./firefox/browser/omni.ja": b"browser omni" * 1000,
+        "./firefox/omni.ja": b"omni" * 1000,
+        "./firefox/defaults/pref/channel-prefs.js": b"prefs",
+    }
+    with tarfile.open(path, f"w:{compression}") as t:
+        for name in ("./firefox", "./firefox/empty"):
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            t.addfile(info)
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o755
+            info.uid = info.gid = 1000
+            info.uname = info.gname = "builder"
+            t.addfile(info, BytesIO(data))
+        info = tarfile.TarInfo("./firefox/link")
+        info.type = tarfile.SYMTYPE
+        info.linkname = "firefox"
+        t.addfile(info)
+
+
+def read_tar(path):
+    with tarfile.open(path) as t:
+        members = t.getmembers()
+        for member in members:
+            assert (member.uid, member.gid, member.uname, member.gname) == (0, 0, "", "")
+        # Recreated tarballs drop the leading "./"
+        return {os.path.normpath(m.name): t.extractfile(m).read() for m in members if m.isfile()}, {m.name for m in members if not m.isfile()}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("compression", ("gz", "bz2", "xz"))
+async def test_sign_widevine_tar_streaming(context, mocker, tmp_path, compression):
+    async def fake_sign_widevine_with_autograph(_, from_, blessed, fmt, to=None):
+        with open(to, "w") as fh:
+            fh.write(f"{os.path.basename(from_)} blessed={blessed}")
+
+    mocker.patch.object(sign, "sign_widevine_with_autograph", new=fake_sign_widevine_with_autograph)
+    context.config["xz_preset"] = 0
+    archive_dir = tmp_path / "archives"
+    archive_dir.mkdir()
+    results = {}
+    for streaming in (False, True):
+        context.config["tar_streaming"] = streaming
+        path = archive_dir / f"target{streaming}.tar.{compression}"
+        make_widevine_tar(path, compression)
+        assert await sign.sign_widevine_tar(context, str(path), "autograph_widevine") == str(path)
+        results[streaming], others = read_tar(path)
+        with open(os.path.join(context.config["artifact_dir"], "public/logs/precomplete.diff")) as fh:
+            results[streaming]["diff"] = fh.read()
+
+    # Only streaming keeps the non-file members
+    assert others == {"./firefox", "./firefox/empty", "./firefox/link"}
+    assert sorted(results[True]) == sorted(results[False])
+    for name in results[True]:
+        assert results[True][name] == results[False][name], name
+    assert results[True]["firefox/plugin-container.sig"] == b"plugin-container blessed=True"
+    assert results[True]["firefox/libxul.so.sig"] == b"libxul.so blessed=False"
+    precomplete = results[True]["firefox/precomplete"].decode("utf-8").splitlines()
+    assert 'remove "libxul.so.sig"' in precomplete
+    assert 'rmdir "empty/"' in precomplete
+    assert sorted(os.listdir(archive_dir)) == [f"targetFalse.tar.{compression}", f"targetTrue.tar.{compression}"]
+
+
+@pytest.mark.asyncio
+async def test_sign_omnija_tar_streaming(context, mocker, tmp_path):
+    signing = []
+    peak = []
+
+    async def fake_sign_omnija_with_autograph(_, from_, fmt):
+        signing.append(from_)
+        peak.append(len(signing))
+        await asyncio.sleep(0.05)
+        signing.remove(from_)
+        with open(from_, "ab") as fh:
+            fh.write(b" signed")
+
+    mocker.patch.object(sign, "sign_omnija_with_autograph", new=fake_sign_omnija_with_autograph)
+    context.config["tar_streaming"] = True
+    path = tmp_path / "target.tar.bz2"
+    make_widevine_tar(path, "bz2")
+    await sign.sign_omnija_tar(context, str(path), "autograph_omnija")
+    files, others = read_tar(path)
+    assert files["firefox/omni.ja"] == b"omni" * 1000 + b" signed"
+    assert files["firefox/browser/omni.ja"] == b"browser omni" * 1000 + b" signed"
+    assert files["firefox/firefox"] == b"firefox" * 1000
+    assert files["firefox/precomplete"] == b'remove "firefox"\n'
+    assert others == {"./firefox", "./firefox/empty", "./firefox/link"}
+    # The omni.ja files are signed concurrently, and written after the
+    # other members in their original order
+    assert max(peak) == 2
+    with tarfile.open(path) as t:
+        names = [os.path.normpath(name) for name in t.getnames()]
+    assert names[-2:] == ["firefox/browser/omni.ja", "firefox/omni.ja"]
+    assert not os.path.exists(os.path.join(context.config["artifact_dir"], "public/logs/precomplete.diff"))
+
+
+@pytest.mark.asyncio
+async def test_stream_resign_tarfile_errors(context, tmp_path):
+    archive_dir = tmp_path / "archives"
+    archive_dir.mkdir()
+    path = archive_dir / "target.tar.gz"
+    with tarfile.open(path, "w:gz") as t:
+        info = tarfile.TarInfo("firefox/firefox")
+        t.addfile(info, BytesIO(b""))
+    with open(path, "rb") as fh:
+        orig = fh.read()
+    tmp_dir = context.config["work_dir"]
+
+    async def sign_member(name, path):
+        return {}
+
+    # No precomplete
+    with pytest.raises(SigningScriptError):
+        await sign._stream_resign_tarfile(context, str(path), ".gz", tmp_dir, {"firefox/firefox"}, sign_member, precomplete=True)
+    # Signing failure
+    with pytest.raises(SigningScriptError):
+        await sign._stream_resign_tarfile(context, str(path), ".gz", tmp_dir, {"firefox/firefox"}, die)
+
+    # The original is untouched, and nothing is left behind
+    with open(path, "rb") as fh:
+        assert fh.read() == orig
+    assert os.listdir(archive_dir) == ["target.tar.gz"]
+    assert os.listdir(tmp_dir) == []
+
+
 # _should_sign_windows {{{1
 @pytest.mark.parametrize(
     "filenames,expected", ((("firefox", "libclearkey.dylib", "D3DCompiler_42.dll", "msvcblah.dll"), False), (("firefox.dll", "foo.exe"), True))
@@ -546,8 +812,7 @@ def test_should_sign_windows(filenames, expected):
 
 # _run_generate_precomplete {{{1
 @pytest.mark.parametrize("num_precomplete,raises", ((1, False), (0, True), (2, True)))
-def test_run_generate_precomplete(context, num_precomplete, raises, mocker):
-    mocker.patch.object(sign, "generate_precomplete", new=noop_sync)
+def test_run_generate_precomplete(context, num_precomplete, raises):
     work_dir = context.config["work_dir"]
     for i in range(0, num_precomplete):
         path = os.path.join(work_dir, "foo", str(i))
@@ -561,6 +826,37 @@ def test_run_generate_precomplete(context, num_precomplete, raises, mocker):
         sign._run_generate_precomplete(context, work_dir)
 
 
+@pytest.mark.parametrize("bundle", (False, True))
+def test_run_generate_precomplete_contents(context, bundle):
+    work_dir = context.config["work_dir"]
+    root = os.path.join(work_dir, "Firefox.app") if bundle else os.path.join(work_dir, "firefox")
+    precomplete_dir = os.path.join(root, "Contents", "Resources") if bundle else root
+    makedirs(precomplete_dir)
+    with open(os.path.join(precomplete_dir, "precomplete"), "w") as fh:
+        fh.write('remove "gone"\nremove "libxul.so"\n')
+    for name in ("libxul.so", "libxul.so.sig", "defaults/pref/channel-prefs.js"):
+        makedirs(os.path.dirname(os.path.join(root, name)))
+        with open(os.path.join(root, name), "w") as fh:
+            fh.write(name)
+
+    sign._run_generate_precomplete(context, work_dir)
+
+    with open(os.path.join(precomplete_dir, "precomplete")) as fh:
+        precomplete = fh.read().splitlines()
+    assert 'remove "libxul.so.sig"' in precomplete
+    assert 'remove "defaults/pref/channel-prefs.js"' not in precomplete
+    assert 'rmdir "defaults/pref/"' in precomplete
+    with open(os.path.join(context.config["artifact_dir"], "public/logs/precomplete-diff.json")) as fh:
+        summary = json.load(fh)
+    assert summary["removed"] == ['remove "gone"']
+    assert 'remove "libxul.so.sig"' in summary["added"]
+    assert summary["unchanged"] == 1
+    with open(os.path.join(context.config["artifact_dir"], "public/logs/precomplete.diff")) as fh:
+        diff = fh.read().splitlines()
+    assert diff[0] == '- remove "gone"'
+    assert sorted(diff[1:]) == sorted(f"+ {line}" for line in summary["added"])
+
+
 # remove_extra_files {{{1
 def test_remove_extra_files(context):
     extra = ["a", "b/c"]
@@ -696,6 +992,33 @@ async def test_working_tarfile(context):
     await helper_archive(context, "foo.tar.gz", sign._create_tarfile, sign._extract_tarfile, "gz")
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("xz_config", ({}, {"xz_preset": 1, "xz_extreme": False}, {"xz_preset": 1, "xz_threads": 3, "xz_block_size": 4096}))
+async def test_create_xz_tarfile(context, tmp_path, xz_config):
+    context.config.update(xz_config)
+    top_dir = os.path.dirname(os.path.dirname(__file__))
+    rel_files = ["tests/test_script.py", "tests/test_sign.py"]
+    abs_files = [os.path.join(top_dir, f) for f in rel_files]
+    to = str(tmp_path / "test.tar.xz")
+    assert await sign._create_tarfile(context, to, abs_files, "xz", tmp_dir=top_dir) == to
+    with tarfile.open(to, mode="r:xz") as t:
+        assert sorted(t.getnames()) == rel_files
+        for rel_file, abs_file in zip(rel_files, abs_files):
+            member = t.getmember(rel_file)
+            assert (member.uid, member.gid, member.uname, member.gname) == (0, 0, "", "")
+            with open(abs_file, "rb") as fh:
+                assert t.extractfile(member).read() == fh.read()
+
+
+def test_get_xz_tarfile_kwargs():
+    assert sign._get_xz_tarfile_kwargs({}) == {"preset": 9 | lzma.PRESET_EXTREME, "threads": 1, "block_size": sign.DEFAULT_XZ_BLOCK_SIZE}
+    assert sign._get_xz_tarfile_kwargs({"xz_preset": 6, "xz_extreme": False, "xz_threads": 4, "xz_block_size": 1024}) == {
+        "preset": 6,
+        "threads": 4,
+        "block_size": 1024,
+    }
+
+
 @pytest.mark.asyncio
 async def test_bad_create_tarfile(context, mocker):
     mocker.patch.object(tarfile, "open", new=context_die)
@@ -827,6 +1150,8 @@ async def test_gpg_autograph(context, mocker, tmp_path):
     result = await sign.sign_gpg_with_autograph(context, tmp, "autograph_gpg")
 
     assert result == [tmp, f"{tmp}.asc"]
+    with open(f"{tmp}.asc") as fh:
+        assert fh.read() == "--- FAKE SIG ---"
 
     with pytest.raises(SigningScriptError):
         result = await sign.sign_gpg_with_autograph(context, tmp, "gpg")
@@ -941,6 +1266,96 @@ async def test_omnija_sign(tmpdir, mocker, context, orig, signed, sha256_expecte
     assert sha256_actual == sha256_expected
 
 
+def mozjar_merge_omnija_files(orig, signed, to):
+    """The JarWriter based merge_omnija_files, that the raw copying one must match."""
+    orig_jarreader = sign.mozjar.JarReader(orig)
+    with sign.mozjar.JarWriter(to, compress=orig_jarreader.compression) as to_writer:
+        for origjarfile in orig_jarreader:
+            to_writer.add(origjarfile.filename, origjarfile, compress=origjarfile.compress)
+        signed_zip = zipfile.ZipFile(signed, "r")
+        for fname in signed_zip.namelist():
+            if fname.startswith("META-INF"):
+                to_writer.add(fname, signed_zip.open(fname, "r"))
+        if orig_jarreader.last_preloaded:
+            jarlog = list(orig_jarreader.entries.keys())
+            preloads = jarlog[: jarlog.index(orig_jarreader.last_preloaded) + 1]
+            to_writer.preload(preloads)
+
+
+def make_omnija(path, num_files=20, preload=True, compress=True):
+    members = {f"chrome/file{i}.js": (f"// file {i}\n" * i).encode() + os.urandom(i % 3) for i in range(num_files)}
+    with sign.mozjar.JarWriter(str(path), compress=compress) as writer:
+        for name, data in members.items():
+            writer.add(name, data)
+        if preload:
+            writer.preload(list(members)[num_files // 2 :])
+    return members
+
+
+def make_signed_omnija(path, orig):
+    # Like Autograph, write a standard zip, without the preload optimization
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as signed:
+        for member in sign.mozjar.JarReader(str(orig)):
+            signed.writestr(member.filename, member.read())
+        signed.writestr("META-INF/manifest.mf", b"Manifest-Version: 1.0\n" * 10)
+        signed.writestr("META-INF/cose.sig", os.urandom(512))
+        signed.writestr("META-INF/mozilla.rsa", os.urandom(64))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("preload", (True, False))
+@pytest.mark.parametrize("compress", (True, False))
+@pytest.mark.parametrize("copy_file_range", (True, False))
+async def test_merge_omnija_files(tmp_path, mocker, preload, compress, copy_file_range):
+    if not copy_file_range:
+        mocker.patch.object(os, "copy_file_range", side_effect=OSError("nope"), create=True)
+    orig = tmp_path / "omni.ja"
+    members = make_omnija(orig, preload=preload, compress=compress)
+    signed = tmp_path / "signed.ja"
+    make_signed_omnija(signed, orig)
+    expected = tmp_path / "expected.ja"
+    mozjar_merge_omnija_files(str(orig), str(signed), str(expected))
+    copy_ranges = mocker.spy(sign, "_copy_file_range")
+
+    assert await sign.merge_omnija_files(str(orig), str(signed), str(tmp_path / "merged.ja"))
+    assert (tmp_path / "merged.ja").read_bytes() == expected.read_bytes()
+    # All the original members are copied in one go
+    assert copy_ranges.call_count == 1
+    reader = sign.mozjar.JarReader(str(tmp_path / "merged.ja"))
+    for name, data in members.items():
+        assert reader[name].read() == data
+    assert reader.is_optimized == preload
+
+
+@pytest.mark.asyncio
+async def test_merge_omnija_files_rewritten_headers(tmp_path):
+    # Members with headers that mozjar wouldn't have written, and a directory
+    orig = tmp_path / "omni.ja"
+    with zipfile.ZipFile(orig, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr("chrome/", b"")
+        for i in range(5):
+            z.writestr(f"chrome/file{i}.js", b"x" * 100 * i)
+    signed = tmp_path / "signed.ja"
+    make_signed_omnija(signed, orig)
+    expected = tmp_path / "expected.ja"
+    mozjar_merge_omnija_files(str(orig), str(signed), str(expected))
+
+    assert await sign.merge_omnija_files(str(orig), str(signed), str(tmp_path / "merged.ja"))
+    assert (tmp_path / "merged.ja").read_bytes() == expected.read_bytes()
+
+
+@pytest.mark.asyncio
+async def test_merge_omnija_files_duplicate(tmp_path):
+    orig = tmp_path / "omni.ja"
+    with sign.mozjar.JarWriter(str(orig)) as writer:
+        writer.add("META-INF/manifest.mf", b"old")
+    signed = tmp_path / "signed.ja"
+    with zipfile.ZipFile(signed, "w") as z:
+        z.writestr("META-INF/manifest.mf", b"new")
+    with pytest.raises(sign.mozjar.JarWriterError):
+        await sign.merge_omnija_files(str(orig), str(signed), str(tmp_path / "merged.ja"))
+
+
 def test_langpack_id_regex():
     assert sign.LANGPACK_RE.match("langpack-en-CA@firefox.mozilla.org") is not None
     assert sign.LANGPACK_RE.match("langpack-ja-JP-mac@devedition.mozilla.org") is not None
@@ -1316,6 +1731,73 @@ async def test_authenticode_sign_ev(tmpdir, mocker, context, keyid):
     assert os.path.exists(result)
 
 
+def set_authenticode_config(context):
+    for key in ("authenticode_cert", "authenticode_cert_ev", "authenticode_cert_202404", "authenticode_cert_ev_foo", "authenticode_ca_timestamp"):
+        context.config[key] = os.path.join(TEST_DATA_DIR, "windows.crt")
+    for key in ("authenticode_ca", "authenticode_ca_ev", "authenticode_ca_202404", "authenticode_cross_cert"):
+        context.config[key] = f"{key}.crt"
+    context.config["authenticode_url"] = "https://example.com"
+    context.config["authenticode_timestamp_style"] = "old"
+    context.config["authenticode_timestamp_url"] = "https://timestamp.example.com"
+
+
+@pytest.mark.parametrize(
+    "fmt,expected",
+    (
+        ("autograph_authenticode_sha2", ("autograph_authenticode_sha2", None, "authenticode_ca.crt", None, "old")),
+        ("autograph_authenticode_sha2_stub", ("autograph_authenticode_sha2_stub", None, "authenticode_ca.crt", "authenticode_cross_cert.crt", "old")),
+        ("autograph_authenticode_sha2_rfc3161_stub", ("autograph_authenticode_sha2", None, "authenticode_ca.crt", None, "rfc3161")),
+        (
+            "autograph_authenticode_202404_stub",
+            ("autograph_authenticode_202404_stub", None, "authenticode_ca_202404.crt", "authenticode_cross_cert.crt", "old"),
+        ),
+        ("autograph_authenticode_ev:foo", ("autograph_authenticode_ev", "foo", "authenticode_ca_ev.crt", None, "old")),
+    ),
+)
+def test_get_authenticode_signer(context, mocker, fmt, expected):
+    set_authenticode_config(context)
+    load_pem_certs = mocker.spy(sign.winsign_crypto, "load_pem_certs")
+    signer = sign.get_authenticode_signer(context, fmt)
+    assert (signer.fmt, signer.keyid, signer.cafile, signer.crosscert, signer.timestamp_style) == expected
+    assert len(signer.certs) == 1
+    assert sign.get_authenticode_signer(context, fmt) is signer
+    assert load_pem_certs.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_authenticode_sign_zip_shares_signer(tmp_path, mocker, context):
+    set_authenticode_config(context)
+    archive_dir = tmp_path / "archives"
+    archive_dir.mkdir()
+    test_file = str(archive_dir / "windows.zip")
+    with zipfile.ZipFile(test_file, "w") as z:
+        for i in range(5):
+            z.writestr(f"lib{i}.dll", b"MZ" + os.urandom(100))
+    signed = []
+
+    async def mocked_winsign(infile, outfile, digest_algo, certs, signer, cafile, crosscert=None, **kwargs):
+        assert len(certs) == 1
+        # Like winsign does
+        certs.extend(certs)
+        assert await signer(b"digest", digest_algo) == b"signature"
+        shutil.copyfile(infile, outfile)
+        signed.append(os.path.basename(infile))
+        return True
+
+    async def mocked_autograph(context, digest, fmt, keyid):
+        assert (fmt, keyid) == ("autograph_authenticode_sha2", None)
+        return b"signature"
+
+    mocker.patch.object(winsign.sign, "sign_file", mocked_winsign)
+    mocker.patch.object(winsign.osslsigncode, "is_signed", return_value=False)
+    mocker.patch.object(sign, "sign_hash_with_autograph", mocked_autograph)
+    from_config = mocker.spy(sign.AuthenticodeSigner, "from_config")
+
+    assert await sign.sign_authenticode(context, test_file, "autograph_authenticode_sha2_rfc3161_stub") == test_file
+    assert sorted(signed) == [f"lib{i}.dll" for i in range(5)]
+    assert from_config.call_count == 1
+
+
 def test_encode_single_file(tmpdir, mocker, context):
     output_file = tempfile.TemporaryFile("w+b")
     signing_req = {"keyid": "rvkgu", "options": {"zip": "passthrough"}, "input": BufferedRandom(BytesIO(b"RmUOX3AesiyzSlh"))}
@@ -1326,6 +1808,161 @@ def test_encode_single_file(tmpdir, mocker, context):
     assert result == expected
 
 
+def test_hashing_writer():
+    output_file = BytesIO()
+    h = sha256()
+    writer = sign.HashingWriter(output_file, h)
+    writer.write(b"foo")
+    writer.write(b"bar")
+    assert output_file.getvalue() == b"foobar"
+    assert h.hexdigest() == sha256(b"foobar").hexdigest()
+
+
+def test_get_hawk_content_hash_matches_hashing_writer():
+    signing_req = {"input": BytesIO(os.urandom(1000)), "keyid": "foo", "options": {"zip": "passthrough"}}
+    h = sign._new_hawk_content_hash("application/json")
+    request_body = BytesIO()
+    sign.write_signing_req_to_disk(sign.HashingWriter(request_body, h), signing_req)
+    request_body.seek(0)
+    assert sign.get_hawk_content_hash(request_body, "application/json") == sign._finish_hawk_content_hash(h)
+
+
+# AutographResponseDecoder {{{1
+@pytest.mark.parametrize("chunk_size", (1, 3, 7, 1024))
+@pytest.mark.parametrize(
+    "payload_key,escape_slashes,extra",
+    (
+        ("signed_file", False, {}),
+        ("signature", True, {"public_key": 'a\\"b', "options": {"nested": [1, 2, None]}}),
+        ("signed_file", True, {"x5u": "https://example.com/chain.pem", "signature": ""}),
+    ),
+)
+def test_autograph_response_decoder(chunk_size, payload_key, escape_slashes, extra):
+    payload = bytes(range(256)) * 5
+    response = [{"ref": "abc", **extra, payload_key: base64.b64encode(payload).decode("ascii"), "signer_id": "foo"}]
+    body = json.dumps(response).encode("utf8")
+    if escape_slashes:
+        body = body.replace(b"/", b"\\/").replace(b"+", b"\\u002b")
+    output_file = BytesIO()
+    decoder = sign.AutographResponseDecoder(output_file, payload_key)
+    for i in range(0, len(body), chunk_size):
+        decoder.feed(body[i : i + chunk_size])
+    result = decoder.finish()
+    assert output_file.getvalue() == payload
+    assert decoder.payload_found
+    assert decoder.payload_size == len(payload)
+    expected = dict(response[0])
+    expected[payload_key] = ""
+    assert result == [expected]
+
+
+@pytest.mark.parametrize(
+    "body",
+    (
+        b'[{"ref": "abc"}]',
+        b'[{"signed_file": "AAAA',
+        b'[{"signed_file": "AAAAA"}]',
+    ),
+)
+def test_autograph_response_decoder_errors(body):
+    decoder = sign.AutographResponseDecoder(BytesIO(), "signed_file")
+    with pytest.raises(SigningScriptError):
+        decoder.feed(body)
+        decoder.finish()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("streaming", (True, False))
+async def test_sign_file_with_autograph_fake_server(context, fake_autograph, tmp_path, streaming):
+    fake_autograph.streaming = streaming
+    context.config["autograph_streaming"] = streaming
+    context.autograph_configs = {TEST_CERT_TYPE: [utils.Autograph(fake_autograph.url, "alice", "secret", ["autograph_mar"])]}
+    tmp_path = tmp_path / "upstream"
+    tmp_path.mkdir()
+    from_ = tmp_path / "target.bin"
+    data = os.urandom(3 * 1024 * 1024 + 7)
+    from_.write_bytes(data)
+    async with aiohttp.ClientSession() as session:
+        context.session = session
+        assert await sign.sign_file_with_autograph(context, str(from_), "autograph_mar") == str(from_)
+    assert from_.read_bytes() == data
+    assert os.listdir(tmp_path) == ["target.bin"]
+
+
+@pytest.mark.asyncio
+async def test_sign_file_with_autograph_streaming_error(context, fake_autograph, tmp_path, mocker):
+    mocker.patch.object(sign, "retry_async", new=fake_retry_async)
+    fake_autograph.error_rate = 1
+    context.config["autograph_streaming"] = True
+    context.autograph_configs = {TEST_CERT_TYPE: [utils.Autograph(fake_autograph.url, "alice", "secret", ["autograph_mar"])]}
+    tmp_path = tmp_path / "upstream"
+    tmp_path.mkdir()
+    from_ = tmp_path / "target.bin"
+    from_.write_bytes(b"unsigned")
+    async with aiohttp.ClientSession() as session:
+        context.session = session
+        with pytest.raises(aiohttp.ClientResponseError):
+            await sign.sign_file_with_autograph(context, str(from_), "autograph_mar")
+    assert from_.read_bytes() == b"unsigned"
+    assert os.listdir(tmp_path) == ["target.bin"]
+
+
+@pytest.mark.asyncio
+async def test_sign_file_with_autograph_streaming_memory(context, tmp_path):
+    """Signing a large file in streaming mode shouldn't allocate memory proportional to its size."""
+    context.config["autograph_streaming"] = True
+    from_ = tmp_path / "target.bin"
+    size = 32 * 1024 * 1024
+    with open(from_, "wb") as fh:
+        for _ in range(size // (1024 * 1024)):
+            fh.write(os.urandom(1024 * 1024))
+    async with FakeAutograph(streaming=True) as server, aiohttp.ClientSession() as session:
+        context.session = session
+        context.autograph_configs = {TEST_CERT_TYPE: [utils.Autograph(server.url, "alice", "secret", ["autograph_mar"])]}
+        tracemalloc.start()
+        try:
+            await sign.sign_file_with_autograph(context, str(from_), "autograph_mar", to=str(tmp_path / "signed.bin"))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    assert get_hash(str(from_)) == get_hash(str(tmp_path / "signed.bin"))
+    assert peak < size / 4
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("streaming", (True, False))
+async def test_sign_file_with_autograph_cache(context, fake_autograph, tmp_path, streaming):
+    context.config["autograph_streaming"] = streaming
+    context.signing_cache = SigningCache(str(tmp_path / "cache"), 1024 * 1024)
+    context.autograph_configs = {TEST_CERT_TYPE: [utils.Autograph(fake_autograph.url, "alice", "secret", ["autograph_mar"])]}
+    from_ = tmp_path / "target.bin"
+    from_.write_bytes(b"unsigned")
+    async with aiohttp.ClientSession() as session:
+        context.session = session
+        for i in range(3):
+            to = tmp_path / f"signed{i}.bin"
+            assert await sign.sign_file_with_autograph(context, str(from_), "autograph_mar", to=str(to)) == str(to)
+            assert to.read_bytes() == b"unsigned"
+        # A different extension id means a different signed file
+        await sign.sign_file_with_autograph(context, str(from_), "autograph_mar", to=str(tmp_path / "signed.xpi"), extension_id="foo")
+    assert fake_autograph.requests["file"] == 2
+    assert context.signing_cache.stats() == {"hits": 2, "misses": 2, "corrupt": 0, "evictions": 0}
+
+
+@pytest.mark.asyncio
+async def test_sign_hash_with_autograph_cache(context, fake_autograph, tmp_path):
+    context.signing_cache = SigningCache(str(tmp_path / "cache"), 1024 * 1024)
+    context.autograph_configs = {TEST_CERT_TYPE: [utils.Autograph(fake_autograph.url, "alice", "secret", ["autograph_hash_only_mar384"])]}
+    async with aiohttp.ClientSession() as session:
+        context.session = session
+        signatures = [await sign.sign_hash_with_autograph(context, b"hash", "autograph_hash_only_mar384") for _ in range(3)]
+        signatures.append(await sign.sign_hash_with_autograph(context, b"hash", "autograph_hash_only_mar384", keyid="other"))
+    assert len(signatures[0]) == 512
+    assert signatures[:3] == [signatures[0]] * 3
+    assert fake_autograph.requests["hash"] == 2
+    assert context.signing_cache.stats() == {"hits": 2, "misses": 2, "corrupt": 0, "evictions": 0}
+
+
 @pytest.mark.asyncio
 async def test_notarize_single(mocker):
     retry_mock = mock.AsyncMock()
@@ -1358,9 +1995,11 @@ async def test_notarize_pkg_fail(mocker, context):
 async def test_notarize_all(mocker, context):
     mocker.patch.object(sign, "_extract_tarfile", noop_async)
     mocker.patch.object(sign.os, "listdir", lambda *_: ["/foo.app"])
-    mocker.patch.object(sign, "_notarize_single", noop_async)
+    notarize_paths = mock.AsyncMock()
+    mocker.patch.object(sign, "_notarize_paths", notarize_paths)
     mocker.patch.object(sign, "_create_tarfile", noop_async)
     await sign._notarize_all(context, "/foo/bar", "/baz")
+    notarize_paths.assert_awaited_once_with(context, ["/foo.app"])
 
 
 @pytest.mark.asyncio
@@ -1417,12 +2056,13 @@ async def test_apple_notarize_geckodriver(mocker, context):
 
 @pytest.mark.asyncio
 async def test_apple_notarize_stacked(mocker, context):
-    notarize = mock.AsyncMock()
-    mocker.patch.object(sign, "rcodesign_notarize", notarize)
-    wait = mock.AsyncMock()
-    mocker.patch.object(sign, "rcodesign_notary_wait", wait)
+    context.config["apple_notarization_poll_interval"] = 0
+    notarize = mock.AsyncMock(side_effect=["id1", "id2", "id3"])
+    mocker.patch.object(notarization, "rcodesign_notarize", notarize)
+    status = mock.AsyncMock(return_value="Accepted")
+    mocker.patch.object(notarization, "rcodesign_notary_status", status)
     staple = mock.AsyncMock()
-    mocker.patch.object(sign, "rcodesign_staple", staple)
+    mocker.patch.object(notarization, "rcodesign_staple", staple)
 
     mocker.patch.object(sign, "_extract_tarfile", noop_async)
     mocker.patch.object(sign, "_create_tarfile", noop_async)
@@ -1441,7 +2081,7 @@ async def test_apple_notarize_stacked(mocker, context):
     )
     # one for each file format
     assert notarize.await_count == 3
-    assert wait.await_count == 3
+    assert status.await_count == 3
     assert staple.await_count == 3
 
 
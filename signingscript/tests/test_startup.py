@@ -0,0 +1,85 @@
+"""Check the time importing signingscript's entry point takes.
+
+``python -X importtime`` logs how long each module takes to import;
+``import_time_report`` summarizes that per top-level package. The import
+budget is wall-clock time, so like the benchmarks it only runs with
+``SIGNINGSCRIPT_BENCHMARK=true``; run it with ``pytest -s`` to see the report.
+"""
+
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from conftest import skip_unless_benchmark
+
+# Imported when a task first needs them, not at startup
+DEFERRED_MODULES = ("mozbuild.action.tooltool", "mozpack.mozjar", "winsign.sign", "winsign.timestamp")
+# What signingscript may add to the import time of scriptworker and aiohttp,
+# which every script needs. Deferring the modules above cut it from ~365ms to
+# ~145ms on a developer machine.
+IMPORT_BUDGET_MS = float(os.environ.get("SIGNINGSCRIPT_IMPORT_BUDGET_MS", 250))
+RUNS = 3
+
+
+def parse_importtime(stderr):
+    """Parse ``-X importtime`` output into ``(module, self_us, cumulative_us)`` tuples."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def import_times(statement):
+    """Run ``statement`` in a new interpreter, and parse its import times."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True, check=True)
+    return parse_importtime(result.stderr)
+
+
+def total_ms(entries):
+    return sum(self_us for _, self_us, _ in entries) / 1000
+
+
+def import_time_report(entries, top=10):
+    """Summarize import times per top-level package, slowest first."""
+    per_package = defaultdict(int)
+    for name, self_us, _ in entries:
+        per_package[name.split(".")[0]] += self_us
+    lines = [f"{len(entries)} modules imported in {total_ms(entries):.0f}ms"]
+    for package, self_us in sorted(per_package.items(), key=lambda item: -item[1])[:top]:
+        lines.append(f"{self_us / 1000:8.1f}ms {package}")
+    return "\n".join(lines)
+
+
+def test_parse_importtime():
+    stderr = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        120 |   winsign",
+            "import time:       300 |        300 |     winsign.crypto",
+            "import time:        50 |        470 |   winsign.sign",
+            "some other output",
+        ]
+    )
+    entries = parse_importtime(stderr)
+    assert entries == [("winsign", 120, 120), ("winsign.crypto", 300, 300), ("winsign.sign", 50, 470)]
+    assert import_time_report(entries) == "3 modules imported in 0ms\n     0.5ms winsign"
+
+
+def test_deferred_imports():
+    imported = {name for name, _, _ in import_times("import signingscript.script")}
+    assert "signingscript.sign" in imported
+    assert not imported.intersection(DEFERRED_MODULES)
+
+
+@skip_unless_benchmark
+def test_import_budget():
+    baseline = min((import_times("import aiohttp, scriptworker.client") for _ in range(RUNS)), key=total_ms)
+    entries = min((import_times("import signingscript.script") for _ in range(RUNS)), key=total_ms)
+    report = import_time_report(entries)
+    print(f"\n{report}")
+    extra_ms = total_ms(entries) - total_ms(baseline)
+    assert extra_ms < IMPORT_BUDGET_MS, f"signingscript adds {extra_ms:.0f}ms to startup, over the {IMPORT_BUDGET_MS:.0f}ms budget\n{report}"
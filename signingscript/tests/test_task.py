@@ -181,6 +181,44 @@ def test_get_signing_function_from_format(format, expected):
     assert stask._get_signing_function_from_format(format) == expected
 
 
+# build_signing_pipeline {{{1
+def test_build_signing_pipeline():
+    formats = stask._sort_formats(["autograph_gpg", "autograph_widevine", "autograph_hash_only_mar384"])
+    assert stask.build_signing_pipeline(formats) == [
+        ("autograph_hash_only_mar384", stask.sign_mar384_with_autograph_hash),
+        ("autograph_widevine", stask.sign_widevine),
+        ("autograph_gpg", stask.sign_gpg_with_autograph),
+    ]
+
+
+@pytest.mark.parametrize(
+    "formats, expected",
+    (
+        (["autograph_gpg", "autograph_hash_only_mar384"], True),
+        (["autograph_authenticode_sha2"], True),
+        (["apple_notarization"], False),
+        (["stage_apple_notarization_geckodriver"], False),
+        (["autograph_widevine", "apple_notarization"], False),
+    ),
+)
+def test_can_sign_concurrently(formats, expected):
+    assert stask.can_sign_concurrently(formats) is expected
+
+
+@pytest.mark.parametrize(
+    "formats, expected",
+    (
+        (["autograph_gpg"], True),
+        (["autograph_rsa", "stage_autograph_gpg"], True),
+        (["autograph_gpg", "autograph_hash_only_mar384"], False),
+        (["autograph_authenticode_sha2"], False),
+        ([], False),
+    ),
+)
+def test_signs_detached_only(formats, expected):
+    assert stask.signs_detached_only(formats) is expected
+
+
 # build_filelist_dict {{{1
 def test_build_filelist_dict(context, task_defn):
     full_path = os.path.join(context.config["work_dir"], "cot", "VALID_TASK_ID", "public/build/firefox-52.0a1.en-US.win64.installer.exe")
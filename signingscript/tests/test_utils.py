@@ -1,5 +1,8 @@
 import json
 import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import mock
 import pytest
@@ -38,6 +41,64 @@ def test_mkdir_mutes_os_errors(mocker):
     m.assert_called_with("/dummy/dir")
 
 
+# lazy_import {{{1
+def test_lazy_import(tmp_path, monkeypatch):
+    package = tmp_path / "lazy_pkg"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "heavy.py").write_text("import sys\nsys.lazy_pkg_imports = getattr(sys, 'lazy_pkg_imports', 0) + 1\nVALUE = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delattr(sys, "lazy_pkg_imports", raising=False)
+    for name in ("lazy_pkg", "lazy_pkg.heavy"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+
+    module = utils.lazy_import("lazy_pkg.heavy")
+    assert not hasattr(sys, "lazy_pkg_imports")
+    assert utils.lazy_import("lazy_pkg.heavy") is module
+    import lazy_pkg.heavy
+
+    assert lazy_pkg.heavy is module
+    assert module.VALUE == 42
+    assert sys.lazy_pkg_imports == 1
+
+
+def test_lazy_import_threads(tmp_path, monkeypatch):
+    """Threads that use a lazy module at once all wait for it to finish executing."""
+    package = tmp_path / "lazy_slow_pkg"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "helper.py").write_text("HELPER = 1\n")
+    (package / "slow.py").write_text(
+        "import sys\n"
+        "import time\n"
+        "from lazy_slow_pkg import helper\n"
+        "sys.lazy_slow_pkg_imports = getattr(sys, 'lazy_slow_pkg_imports', 0) + 1\n"
+        "time.sleep(0.2)\n"
+        "def sign_file():\n"
+        "    return helper.HELPER\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delattr(sys, "lazy_slow_pkg_imports", raising=False)
+    for name in ("lazy_slow_pkg", "lazy_slow_pkg.helper", "lazy_slow_pkg.slow"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+
+    module = utils.lazy_import("lazy_slow_pkg.slow")
+    barrier = threading.Barrier(4)
+
+    def use_module():
+        barrier.wait()
+        return module.sign_file()
+
+    with ThreadPoolExecutor(4) as executor:
+        assert list(executor.map(lambda _: use_module(), range(4))) == [1] * 4
+    assert sys.lazy_slow_pkg_imports == 1
+
+
+def test_lazy_import_missing():
+    with pytest.raises(ModuleNotFoundError):
+        utils.lazy_import("signingscript.nonexistent")
+
+
 # get_hash {{{1
 def test_get_hash():
     assert utils.get_hash(PUB_KEY_PATH, hash_type="sha512") == ID_RSA_PUB_HASH
@@ -0,0 +1,51 @@
+import io
+import lzma
+import os
+import subprocess
+
+import pytest
+
+from signingscript.xz import ParallelXZWriter
+
+FILTERS = [{"id": lzma.FILTER_LZMA2, "preset": 1}]
+
+
+@pytest.mark.parametrize("size", (0, 1, 999, 1000, 1001, 12345))
+@pytest.mark.parametrize("threads", (1, 2, 4))
+def test_parallel_xz_writer(size, threads):
+    data = os.urandom(size // 2) + bytes(size - size // 2)
+    out = io.BytesIO()
+    with ParallelXZWriter(out, FILTERS, threads, block_size=1000) as writer:
+        # Uneven writes, so blocks span several of them
+        for i in range(0, size, 333):
+            assert writer.write(data[i : i + 333]) == len(data[i : i + 333])
+    assert lzma.decompress(out.getvalue()) == data
+    assert lzma.LZMAFile(io.BytesIO(out.getvalue())).read() == data
+
+
+def test_parallel_xz_writer_xz_cli(tmp_path):
+    data = bytes(range(256)) * 1000
+    path = tmp_path / "data.xz"
+    with open(path, "wb") as fh, ParallelXZWriter(fh, FILTERS, 3, block_size=10000) as writer:
+        writer.write(data)
+    try:
+        assert subprocess.run(["xz", "-dc", str(path)], check=True, capture_output=True).stdout == data
+    except FileNotFoundError:
+        pytest.skip("xz is not installed")
+
+
+def test_parallel_xz_writer_closed():
+    writer = ParallelXZWriter(io.BytesIO(), FILTERS, 2)
+    writer.close()
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.write(b"data")
+
+
+def test_parallel_xz_writer_error():
+    out = io.BytesIO()
+    with pytest.raises(RuntimeError):
+        with ParallelXZWriter(out, FILTERS, 2, block_size=10) as writer:
+            writer.write(b"x" * 100)
+            raise RuntimeError("boom")
+    assert writer.closed